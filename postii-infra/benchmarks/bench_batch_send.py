@@ -0,0 +1,104 @@
+"""
+Sending one postcard to N recipients: N single sends vs. one batch send.
+
+Compares POST /v1/postcards called once per recipient with a single
+POST /v1/postcards carrying recipientIds. Each handler call stands in
+for an API Gateway request and Lambda invocation. --unprocessed-rate
+makes the DynamoDB stand-in leave that fraction of batch writes
+unprocessed, to exercise the retry path. The sender's postcardsCount is
+checked once the streams handler has caught up.
+
+Usage:
+    python benchmarks/bench_batch_send.py --recipients 10 50 100 --rtt-ms 3
+"""
+import argparse
+import time
+
+import harness
+
+SENDER_ID = 'user-sender'
+
+
+def seed(stats):
+    """Create the sender and their uploaded image; returns the image key"""
+    harness.table('USERS_TABLE').put_item(Item={
+        'userId': SENDER_ID, 'username': 'sender', 'email': 'sender@example.com', 'postcardsCount': 0
+    })
+    return harness.upload_image(stats, SENDER_ID)
+
+
+def send_body(image_key, **recipients):
+    return {'imageKey': image_key, 'message': 'Happy holidays!', **recipients}
+
+
+def run(recipient_counts, iterations, rtt_ms, unprocessed_rate):
+    rows = []
+    for count in recipient_counts:
+        recipient_ids = [f'friend-{i:04d}' for i in range(count)]
+        with harness.local_aws(rtt_ms=rtt_ms, unprocessed_rate=unprocessed_rate) as stats:
+            image_key = seed(stats)
+            postcards = harness.load_handler('postcards')
+            streams = harness.load_handler('streams')
+
+            def single_sends(i):
+                for recipient_id in recipient_ids:
+                    event = harness.api_event('POST', '/v1/postcards', SENDER_ID,
+                                              body=send_body(image_key, recipientId=recipient_id))
+                    assert postcards.lambda_handler(event, None)['statusCode'] == 200
+
+            sent = {'count': 0}
+
+            def batch_send(i):
+                event = harness.api_event('POST', '/v1/postcards', SENDER_ID,
+                                          body=send_body(image_key, recipientIds=recipient_ids))
+                response = postcards.lambda_handler(event, None)
+                assert response['statusCode'] == 200, response
+                sent['count'] += harness.json_body(response)['sentCount']
+
+            stats.reset()
+            start = time.perf_counter()
+            single_samples = harness.timed(single_sends, iterations)
+            single_rate = count * iterations / (time.perf_counter() - start)
+            single_calls = stats.calls / iterations
+
+            stats.reset()
+            start = time.perf_counter()
+            batch_samples = harness.timed(batch_send, iterations)
+            batch_rate = sent['count'] / (time.perf_counter() - start)
+            batch_calls = stats.calls / iterations
+
+            harness.drain_streams(stats, streams)
+            stored = harness.table('USERS_TABLE').get_item(Key={'userId': SENDER_ID})['Item']['postcardsCount']
+            assert stored == count * iterations + sent['count'], stored
+
+        single_summary = harness.summarize(single_samples)
+        batch_summary = harness.summarize(batch_samples)
+        rows.append([
+            count,
+            f"{single_summary['p50']:.1f}",
+            f'{single_calls:.1f}',
+            f'{single_rate:.0f}',
+            f"{batch_summary['p50']:.1f}",
+            f'{batch_calls:.1f}',
+            f'{batch_rate:.0f}',
+        ])
+
+    harness.print_table(
+        ['recipients', 'singles p50 ms', 'singles DDB calls', 'singles cards/s',
+         'batch p50 ms', 'batch DDB calls', 'batch cards/s'],
+        rows
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--recipients', type=int, nargs='+', default=[10, 50, 100])
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--rtt-ms', type=float, default=0.0)
+    parser.add_argument('--unprocessed-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    run(args.recipients, args.iterations, args.rtt_ms, args.unprocessed_rate)
+
+
+if __name__ == '__main__':
+    main()
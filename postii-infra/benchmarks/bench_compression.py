@@ -0,0 +1,129 @@
+"""
+Response compression: bytes saved vs. CPU spent.
+
+Builds realistic response bodies with the postcards handler's own
+formatters (full format_postcard pages with varied messages, and feed
+summary pages) and runs them through responses.compress at several
+gzip levels and brotli qualities. Reports wire size, the CPU cost per
+response, and the time to transfer the body over a slow mobile link,
+so the trade-off is visible. Also sends one real GET /v1/postcards/received
+through the handler with Accept-Encoding and checks the body round-trips.
+
+Usage:
+    python benchmarks/bench_compression.py --items 20 100 --link-kbps 1000
+"""
+import argparse
+import base64
+import gzip
+import json
+import random
+from datetime import datetime, timedelta, timezone
+
+import harness
+from postii_common import responses
+
+WORDS = ('sunny', 'beach', 'mountains', 'coffee', 'museum', 'train', 'harbor', 'market', 'tram',
+         'sunset', 'postcard', 'wish', 'you', 'were', 'here', 'love', 'from', 'the', 'city', 'old',
+         'town', 'castle', 'river', 'bridge', 'night', 'festival', 'pastry', 'tiles', 'ocean', 'hills')
+CITIES = (('Lisbon, Portugal', '38.7223', '-9.1393'), ('Kyoto, Japan', '35.0116', '135.7681'),
+          ('Oaxaca, Mexico', '17.0732', '-96.7266'), ('Tromsø, Norway', '69.6492', '18.9553'))
+
+# (label, Content-Encoding, level/quality)
+SETTINGS = [('identity', None, None), ('gzip 1', 'gzip', 1), ('gzip 6', 'gzip', 6), ('gzip 9', 'gzip', 9)]
+if responses.brotli:
+    SETTINGS += [('br 1', 'br', 1), ('br 4', 'br', 4), ('br 6', 'br', 6)]
+
+
+def page_bodies(postcards, item_count, rng):
+    """{label: body} for full and summary pages of item_count postcards"""
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    items = []
+    for i in range(item_count):
+        city, latitude, longitude = rng.choice(CITIES)
+        timestamp = (start + timedelta(minutes=rng.randrange(500000))).isoformat()
+        message = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 80))).capitalize() + '!'
+        items.append(postcards.build_postcard_item(
+            f'user-{rng.randrange(10 ** 6):07d}', 'user-0000001', f'https://cdn.example.com/postcards/{i}.jpg',
+            message, {'name': city, 'latitude': latitude, 'longitude': longitude}, timestamp
+        ))
+    return {
+        f'{item_count} full postcards': {'postcards': [postcards.format_postcard(item) for item in items],
+                                         'count': item_count},
+        f'{item_count} feed summaries': {'postcards': [postcards.format_postcard_summary(item) for item in items],
+                                         'count': item_count},
+    }
+
+
+def compressed_response(body, coding, level):
+    """responses.compress at a given setting; returns (response, wire bytes)"""
+    responses.GZIP_LEVEL = level if coding == 'gzip' else responses.GZIP_LEVEL
+    responses.BROTLI_QUALITY = level if coding == 'br' else responses.BROTLI_QUALITY
+    response = responses.compress(responses.success_response(body), coding or 'identity')
+    if response.get('isBase64Encoded'):
+        return response, len(base64.b64decode(response['body']))
+    return response, len(response['body'].encode())
+
+
+def check_handler_round_trip():
+    """A real handler response decodes back to the uncompressed body"""
+    with harness.local_aws():
+        postcards = harness.load_handler('postcards')
+        postcards_table = harness.table('POSTCARDS_TABLE')
+        with postcards_table.batch_writer() as batch:
+            for i in range(50):
+                batch.put_item(Item=postcards.build_postcard_item(
+                    f'user-{i}', 'user-reader', f'https://cdn.example.com/{i}.jpg', 'Hello!', {},
+                    f'2024-01-01T00:{i:02d}:00+00:00'))
+        event = harness.api_event('GET', '/v1/postcards/received', 'user-reader', query={'limit': '50'},
+                                  headers={'accept-encoding': 'gzip, deflate'})
+        response = postcards.lambda_handler(event, None)
+        assert response['isBase64Encoded'] and response['headers']['Content-Encoding'] == 'gzip', response['headers']
+        body = json.loads(gzip.decompress(base64.b64decode(response['body'])))
+        assert body['count'] == 50, body['count']
+
+
+def run(item_counts, iterations, link_kbps, min_bytes):
+    responses.COMPRESSION_MIN_BYTES = min_bytes
+    postcards = None
+    with harness.local_aws():
+        postcards = harness.load_handler('postcards')
+    rng = random.Random(7)
+
+    rows = []
+    for item_count in item_counts:
+        for page_label, body in page_bodies(postcards, item_count, rng).items():
+            raw_size = None
+            for label, coding, level in SETTINGS:
+                response, wire_size = compressed_response(body, coding, level)
+                raw_size = raw_size or wire_size
+                samples = harness.timed(lambda i: compressed_response(body, coding, level), iterations)
+                rows.append([
+                    page_label,
+                    label,
+                    f'{wire_size / 1024:.1f}',
+                    f'{100.0 * (1 - wire_size / raw_size):.0f}%',
+                    f"{harness.summarize(samples)['p50'] * 1000:.0f}",
+                    f'{wire_size * 8 / link_kbps:.0f}',
+                ])
+
+    harness.print_table(['page', 'encoding', 'wire KiB', 'saved', 'build+compress us',
+                         f'transfer ms @ {link_kbps:g} kbps'], rows)
+    if not responses.brotli:
+        print('\nbrotli is not installed; only gzip was measured')
+
+    check_handler_round_trip()
+    print('\nHandler round trip: gzip body decodes to the same JSON page.')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, nargs='+', default=[20, 100])
+    parser.add_argument('--iterations', type=int, default=300)
+    parser.add_argument('--link-kbps', type=float, default=1000.0, help='client link speed for transfer time')
+    parser.add_argument('--min-bytes', type=int, default=1024, help='COMPRESSION_MIN_BYTES to apply')
+    args = parser.parse_args()
+    run(args.items, args.iterations, args.link_kbps, args.min_bytes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Repeated polls with and without If-None-Match.
+
+Seeds a reader with a profile and a received feed, then polls
+GET /v1/users and GET /v1/postcards/received (with and without
+expand=profiles) the way the app does: once sending no validator, so
+every poll returns the full body, and once echoing the ETag from the
+first response, so unchanged polls get a 304 with an empty body. Reports
+latency, body bytes and DynamoDB calls per poll, then checks that a new
+postcard or a profile edit changes the tag.
+
+Usage:
+    python benchmarks/bench_conditional_get.py --postcards 200 --limit 20 --iterations 500
+"""
+import argparse
+
+import harness
+
+READER = 'user-reader'
+
+
+def seed(local_dynamodb, postcards, postcard_count, sender_count):
+    users = [{
+        'userId': user_id,
+        'username': user_id.replace('-', ''),
+        'email': f'{user_id}@example.com',
+        'fullName': f'Traveller {user_id}',
+        'bio': 'Collecting postcards from everywhere',
+        'profilePictureUrl': f'https://cdn.example.com/avatars/{user_id}.jpg',
+        'isActive': True,
+        'postcardsCount': 0,
+        'friendsCount': sender_count,
+        'createdAt': '2024-01-01T00:00:00+00:00',
+        'updatedAt': '2024-01-01T00:00:00+00:00',
+    } for user_id in [READER] + [f'user-{i:04d}' for i in range(sender_count)]]
+    harness.load(local_dynamodb, 'USERS_TABLE', users)
+    harness.load(local_dynamodb, 'POSTCARDS_TABLE', [
+        postcards.build_postcard_item(
+            f'user-{i % sender_count:04d}', READER, f'https://cdn.example.com/postcards/{i}.jpg',
+            'Wish you were here!', {}, f'2024-01-01T{i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}+00:00')
+        for i in range(postcard_count)
+    ])
+
+
+def routes(handlers, limit):
+    """(name, handler, event factory taking the headers to send)"""
+    return [
+        ('GET /v1/users', handlers['users'],
+         lambda headers: harness.api_event('GET', '/v1/users', READER, headers=headers)),
+        (f'GET /v1/postcards/received?limit={limit}', handlers['postcards'],
+         lambda headers: harness.api_event('GET', '/v1/postcards/received', READER,
+                                           query={'limit': str(limit)}, headers=headers)),
+        (f'GET /v1/postcards/received?limit={limit}&expand=profiles', handlers['postcards'],
+         lambda headers: harness.api_event('GET', '/v1/postcards/received', READER,
+                                           query={'limit': str(limit), 'expand': 'profiles'}, headers=headers)),
+    ]
+
+
+def poll(stats, handler, make_event, headers, expected_status, iterations):
+    """Latency samples, body bytes and DynamoDB calls per poll"""
+    def call(i):
+        response = handler.lambda_handler(make_event(headers), None)
+        assert response['statusCode'] == expected_status, (response['statusCode'], response['body'][:200])
+        sizes.append(len(response['body'].encode()))
+
+    sizes = []
+    stats.reset()
+    samples = harness.timed(call, iterations)
+    return samples, sum(sizes) / iterations, stats.calls / iterations
+
+
+def check_invalidation(stats, handlers, make_feed_event, make_profile_event):
+    """A new postcard changes the feed tag and a profile edit changes the profile tag"""
+    feed_tag = handlers['postcards'].lambda_handler(make_feed_event({}), None)['headers']['ETag']
+    response = handlers['postcards'].lambda_handler(harness.api_event(
+        'POST', '/v1/postcards', 'user-0000', body={
+            'recipientId': READER, 'imageKey': harness.upload_image(stats, 'user-0000'), 'message': 'New!'
+        }), None)
+    assert response['statusCode'] == 200, response['body']
+    response = handlers['postcards'].lambda_handler(make_feed_event({'If-None-Match': feed_tag}), None)
+    assert response['statusCode'] == 200 and response['headers']['ETag'] != feed_tag
+
+    profile_tag = handlers['users'].lambda_handler(make_profile_event({}), None)['headers']['ETag']
+    response = handlers['users'].lambda_handler(harness.api_event(
+        'PUT', '/v1/users', READER, body={'bio': 'Back from Lisbon'}), None)
+    assert response['statusCode'] == 200, response['body']
+    response = handlers['users'].lambda_handler(make_profile_event({'If-None-Match': profile_tag}), None)
+    assert response['statusCode'] == 200 and response['headers']['ETag'] != profile_tag
+
+
+def run(postcard_count, sender_count, limit, iterations, rtt_ms):
+    rows = []
+    with harness.local_aws(rtt_ms=rtt_ms) as stats:
+        handlers = {name: harness.load_handler(name) for name in ('users', 'postcards')}
+        seed(stats, handlers['postcards'], postcard_count, sender_count)
+        route_list = routes(handlers, limit)
+
+        for name, handler, make_event in route_list:
+            first = handler.lambda_handler(make_event({}), None)
+            assert first['statusCode'] == 200, first['body']
+            validator = {'If-None-Match': first['headers']['ETag']}
+            for mode, headers, status in (('no validator', {}, 200), ('If-None-Match', validator, 304)):
+                samples, body_bytes, calls = poll(stats, handler, make_event, headers, status, iterations)
+                summary = harness.summarize(samples)
+                rows.append([name, mode, status, f"{summary['p50'] * 1000:.0f}", f"{summary['p95'] * 1000:.0f}",
+                             f'{body_bytes:.0f}', f'{calls:.1f}'])
+
+        check_invalidation(stats, handlers, route_list[1][2], route_list[0][2])
+
+    harness.print_table(['route', 'request', 'status', 'p50 us', 'p95 us', 'body bytes', 'DynamoDB calls'], rows)
+    print('\nA new postcard and a profile edit both change the ETag (200 with a new tag).')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--postcards', type=int, default=200, help='postcards in the reader\'s received feed')
+    parser.add_argument('--senders', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=20, help='feed page size')
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--rtt-ms', type=float, default=0.0)
+    args = parser.parse_args()
+    run(args.postcards, args.senders, args.limit, args.iterations, args.rtt_ms)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""
+Content-addressed image deduplication.
+
+Replays the same stream of single sends twice against LocalS3: --senders
+users sending --sends postcards, drawn from --photos distinct photos
+(synthetic JPEGs of about --megapixels), so the same photo is sent
+again and again, by its owner to one friend at a time and by friends
+who forward it. Each send is what the app does: hash the file
+(streaming SHA-256, for the content-addressed run), POST
+/v1/postcards/uploads for a ticket, PUT the bytes if the ticket asks
+for them, run the images lambda for the ObjectCreated event the PUT
+would fire, then POST /v1/postcards with the key. The streams handler
+catches up between sends, as it does within a second in production.
+
+- per-upload: tickets without sha256, one uploads/<user>/<uuid> key per send
+- content-addressed: tickets with sha256; an image already in the
+  Images table is not uploaded, stored or rendered again
+
+Reports bytes uploaded and stored, variant renders and their CPU time,
+distinct image URLs (CDN cache entries), API-side S3 and DynamoDB calls
+per send and ticket+send p50. Then checks that every Images refCount
+equals the postcards pointing at it (a batch send included), that feed
+variant URLs point at the shared derived/images/ keys, and that S3
+rejects a body that doesn't match its signed hash.
+
+Usage:
+    python benchmarks/bench_dedupe.py --sends 200 --photos 10 --senders 20 --rtt-ms 2
+"""
+import argparse
+import collections
+import hashlib
+import io
+import random
+import time
+
+from PIL import Image
+
+import harness
+
+HASH_CHUNK_BYTES = 256 * 1024
+
+
+def synthesize(count, megapixels):
+    """count distinct JPEGs as bytes"""
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = width * 3 // 4
+    photos = []
+    for i in range(count):
+        image = Image.merge('RGB', [Image.effect_noise((width, height), 10 + i * 3 + band) for band in range(3)])
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=85)
+        photos.append(output.getvalue())
+    return photos
+
+
+def sha256_hex(data):
+    """What the app does with the picked file: hash it in chunks as it is read"""
+    digest = hashlib.sha256()
+    with memoryview(data) as view:
+        for start in range(0, len(view), HASH_CHUNK_BYTES):
+            digest.update(view[start:start + HASH_CHUNK_BYTES])
+    return digest.hexdigest()
+
+
+def plan(sends, photos, senders, seed):
+    """(sender, recipient, photo index) per send; photos are Zipf-ish popular"""
+    rng = random.Random(seed)
+    users = [f'user-{i:03d}' for i in range(senders)]
+    weights = [1 / (rank + 1) for rank in range(photos)]
+    return users, [
+        (sender, rng.choice([user for user in users if user != sender]), rng.choices(range(photos), weights)[0])
+        for sender in (rng.choice(users) for _ in range(sends))
+    ]
+
+
+def call(handler, event):
+    response = handler.lambda_handler(event, None)
+    return response, harness.json_body(response)
+
+
+def send_one(stats, postcards, images, sender, recipient, data, content_addressed):
+    """One send as the app makes it; returns (API ms, S3 calls, DynamoDB calls, render seconds, uploaded)"""
+    local_s3 = stats.s3
+    ticket_body = {'contentType': 'image/jpeg', 'size': len(data)}
+    if content_addressed:
+        ticket_body['sha256'] = sha256_hex(data)
+
+    api_ms = s3_calls = dynamodb_calls = 0
+    stats.reset()
+    local_s3.reset()
+    start = time.perf_counter()
+    response, ticket = call(postcards, harness.api_event('POST', '/v1/postcards/uploads', sender, body=ticket_body))
+    api_ms += (time.perf_counter() - start) * 1000.0
+    assert response['statusCode'] == 201, ticket
+    s3_calls += local_s3.calls
+    dynamodb_calls += stats.calls
+
+    render_seconds, uploaded = 0.0, False
+    if not ticket['exists']:
+        status, _, _ = local_s3.request('PUT', ticket['url'], data, ticket['headers'])
+        assert status == 200, status
+        uploaded = True
+        record = {'s3': {'bucket': {'name': harness.BUCKET_NAME}, 'object': {'key': ticket['key']}}}
+        start = time.process_time()
+        assert images.lambda_handler({'Records': [record]}, None)['processed'] == 1
+        render_seconds = time.process_time() - start
+
+    stats.reset()
+    local_s3.reset()
+    start = time.perf_counter()
+    response, body = call(postcards, harness.api_event('POST', '/v1/postcards', sender, body={
+        'recipientId': recipient, 'imageKey': ticket['key'], 'message': 'Look at this!'
+    }))
+    api_ms += (time.perf_counter() - start) * 1000.0
+    assert response['statusCode'] == 200, body
+    s3_calls += local_s3.calls
+    dynamodb_calls += stats.calls
+    return api_ms, s3_calls, dynamodb_calls, render_seconds, uploaded, ticket['key']
+
+
+def stored(local_s3):
+    """(original objects, their bytes, derived objects, their bytes)"""
+    objects = local_s3.buckets[harness.BUCKET_NAME]
+    originals = [obj for key, obj in objects.items() if not key.startswith('derived/')]
+    derived = [obj for key, obj in objects.items() if key.startswith('derived/')]
+    return len(originals), sum(len(obj.data) for obj in originals), \
+        len(derived), sum(len(obj.data) for obj in derived)
+
+
+def run_mode(photos, users, sends, content_addressed, rtt_ms):
+    with harness.local_aws(rtt_ms=rtt_ms) as stats:
+        harness.load(stats, 'USERS_TABLE', [
+            {'userId': user_id, 'username': user_id.replace('-', ''), 'postcardsCount': 0} for user_id in users
+        ])
+        postcards = harness.load_handler('postcards')
+        images = harness.load_handler('images')
+        streams = harness.load_handler('streams')
+
+        latencies, renders, uploaded_bytes = [], 0, 0
+        s3_calls = dynamodb_calls = 0
+        render_seconds = 0.0
+        keys = collections.Counter()
+        for sender, recipient, photo in sends:
+            data = photos[photo]
+            api_ms, s3, dynamodb, render, uploaded, key = send_one(
+                stats, postcards, images, sender, recipient, data, content_addressed)
+            latencies.append(api_ms)
+            s3_calls += s3
+            dynamodb_calls += dynamodb
+            render_seconds += render
+            renders += uploaded
+            uploaded_bytes += len(data) if uploaded else 0
+            keys[key] += 1
+            harness.drain_streams(stats, streams)
+
+        originals, original_bytes, derived, derived_bytes = stored(stats.s3)
+        if content_addressed:
+            check_content_addressed(stats, postcards, streams, users, photos, keys)
+
+    return {
+        'uploaded_mib': uploaded_bytes / 2 ** 20,
+        'stored_mib': (original_bytes + derived_bytes) / 2 ** 20,
+        'objects': originals + derived,
+        'renders': renders,
+        'render_seconds': render_seconds,
+        # Each original is cached with its thumb and display variants
+        'cdn_urls': len(keys) * 3,
+        's3_calls': s3_calls / len(sends),
+        'dynamodb_calls': dynamodb_calls / len(sends),
+        'p50_ms': harness.percentile(latencies, 50),
+    }
+
+
+def check_content_addressed(stats, postcards, streams, users, photos, keys):
+    """refCounts match the postcards, feeds name shared variants, S3 checks the hash"""
+    sender, recipients = users[0], users[1:4]
+    key = next(iter(keys))
+    response, body = call(postcards, harness.api_event('POST', '/v1/postcards', sender, body={
+        'recipientIds': recipients, 'imageKey': key, 'message': 'To everyone'
+    }))
+    assert response['statusCode'] == 200 and body['sentCount'] == len(recipients), body
+    keys[key] += len(recipients)
+    harness.drain_streams(stats, streams)
+
+    images_table = harness.table('IMAGES_TABLE')
+    for image_key, count in keys.items():
+        item = images_table.get_item(Key={'imageHash': image_key.split('/')[1].split('.')[0]})['Item']
+        assert item['refCount'] == count and item['imageKey'] == image_key, (item, count)
+
+    response, feed = call(postcards, harness.api_event('GET', '/v1/postcards/received', recipients[0]))
+    assert response['statusCode'] == 200, feed
+    for postcard in feed['postcards']:
+        assert '/derived/images/' in postcard['thumbnailUrl'], postcard
+        assert stats.s3.get(harness.BUCKET_NAME, postcard['thumbnailUrl'].split('/', 3)[3])
+
+    data = photos[0] + b'new bytes'
+    response, ticket = call(postcards, harness.api_event('POST', '/v1/postcards/uploads', sender, body={
+        'contentType': 'image/jpeg', 'size': len(data), 'sha256': sha256_hex(data)
+    }))
+    assert not ticket['exists'], ticket
+    tampered = data[:-1] + b'?'
+    status, _, error = stats.s3.request('PUT', ticket['url'], tampered, ticket['headers'])
+    assert status == 400 and b'BadDigest' in error, (status, error)
+
+
+def run(args):
+    photos = synthesize(args.photos, args.megapixels)
+    users, sends = plan(args.sends, args.photos, args.senders, args.seed)
+    hashing_start = time.perf_counter()
+    for data in photos:
+        sha256_hex(data)
+    hashing_mib_s = sum(len(data) for data in photos) / 2 ** 20 / (time.perf_counter() - hashing_start)
+
+    rows = []
+    for label, content_addressed in (('per-upload', False), ('content-addressed', True)):
+        result = run_mode(photos, users, sends, content_addressed, args.rtt_ms)
+        rows.append([
+            label,
+            f"{result['uploaded_mib']:.1f}",
+            f"{result['stored_mib']:.1f}",
+            f"{result['objects']}",
+            f"{result['renders']}",
+            f"{result['render_seconds']:.1f}",
+            f"{result['cdn_urls']}",
+            f"{result['s3_calls']:.2f}",
+            f"{result['dynamodb_calls']:.2f}",
+            f"{result['p50_ms']:.2f}",
+        ])
+
+    harness.print_table(['mode', 'MiB uploaded', 'MiB stored', 'objects', 'variant renders', 'render CPU s',
+                         'CDN URLs', 'API S3 calls/send', 'DynamoDB calls/send', 'ticket+send p50 ms'], rows)
+    print(f'\n{len(sends)} sends by {len(users)} users of {len(photos)} photos '
+          f'({sum(map(len, photos)) / len(photos) / 1024:.0f} KiB average). '
+          f'Client-side streaming SHA-256: {hashing_mib_s:.0f} MiB/s.')
+    print('Checked: refCount per image equals its postcards (batch send included), feed thumbnails are the '
+          'shared derived/images/ variants, and a body not matching its signed SHA-256 is rejected (BadDigest).')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sends', type=int, default=200)
+    parser.add_argument('--photos', type=int, default=10, help='distinct photos in the stream')
+    parser.add_argument('--senders', type=int, default=20)
+    parser.add_argument('--megapixels', type=float, default=2.0)
+    parser.add_argument('--rtt-ms', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
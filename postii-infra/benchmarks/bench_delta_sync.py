@@ -0,0 +1,139 @@
+"""
+Polling the received feed: head page vs. delta sync.
+
+Seeds a reader's received feed, then polls it three ways: re-fetching
+the head page, re-fetching it with If-None-Match, and delta sync with
+GET /v1/postcards/received?since=<watermark>. Each strategy is run on an
+idle inbox and on one that gets a new postcard every --new-every polls.
+Reports latency, DynamoDB calls, read capacity and body bytes per poll,
+and checks that delta sync saw every new postcard.
+
+Polls here are microseconds apart, so every new postcard would stay
+inside the handler's WATERMARK_LAG_SECONDS window and be returned by
+every later poll. --watermark-lag defaults to 0 to model the real case
+of polls spaced further apart than the lag.
+
+Usage:
+    python benchmarks/bench_delta_sync.py --postcards 500 --limit 20 --polls 500 --new-every 10
+"""
+import argparse
+import time
+
+import harness
+
+READER = 'user-reader'
+SENDERS = 20
+
+
+def seed(local_dynamodb, postcards, postcard_count):
+    harness.load(local_dynamodb, 'USERS_TABLE', [
+        {'userId': user_id, 'username': user_id.replace('-', '')}
+        for user_id in [READER] + [f'user-{i:04d}' for i in range(SENDERS)]
+    ])
+    harness.load(local_dynamodb, 'POSTCARDS_TABLE', [
+        postcards.build_postcard_item(
+            f'user-{i % SENDERS:04d}', READER, f'https://cdn.example.com/postcards/{i}.jpg', 'Wish you were here!',
+            {}, f'2024-01-01T{i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}+00:00')
+        for i in range(postcard_count)
+    ])
+
+
+def send(stats, postcards, i):
+    sender_id = f'user-{i % SENDERS:04d}'
+    response = postcards.lambda_handler(harness.api_event('POST', '/v1/postcards', sender_id, body={
+        'recipientId': READER, 'imageKey': harness.upload_image(stats, sender_id), 'message': 'New!'
+    }), None)
+    assert response['statusCode'] == 200, response['body']
+    return harness.json_body(response)['postcardId']
+
+
+class HeadPage:
+    """Re-fetch the first page every poll, optionally with If-None-Match"""
+
+    def __init__(self, limit, conditional):
+        self.limit = limit
+        self.conditional = conditional
+        self.tag = None
+
+    def poll(self, postcards):
+        headers = {'If-None-Match': self.tag} if self.conditional and self.tag else {}
+        response = postcards.lambda_handler(harness.api_event(
+            'GET', '/v1/postcards/received', READER, query={'limit': str(self.limit)}, headers=headers), None)
+        assert response['statusCode'] in (200, 304), response['body']
+        self.tag = response['headers']['ETag']
+        return response, []
+
+
+class DeltaSync:
+    """Fetch the head page once, then poll with since=<watermark>"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.watermark = None
+
+    def poll(self, postcards):
+        query = {'limit': str(self.limit)}
+        if self.watermark:
+            query['since'] = self.watermark
+        response = postcards.lambda_handler(harness.api_event(
+            'GET', '/v1/postcards/received', READER, query=query), None)
+        assert response['statusCode'] == 200, response['body']
+        body = harness.json_body(response)
+        self.watermark = body['watermark']
+        return response, [postcard['postcardId'] for postcard in body['postcards']]
+
+
+def measure(stats, postcards, strategy, polls, new_every):
+    """Per-poll latency samples and averages; sends happen outside the counters"""
+    strategy.poll(postcards)
+    sent, seen = set(), set()
+    samples, calls, read_units, body_bytes = [], 0, 0.0, 0
+    for i in range(polls):
+        if new_every and i % new_every == 0:
+            sent.add(send(stats, postcards, i))
+        stats.reset()
+        start = time.perf_counter()
+        response, postcard_ids = strategy.poll(postcards)
+        samples.append((time.perf_counter() - start) * 1000.0)
+        calls += stats.calls
+        read_units += stats.read_units
+        body_bytes += len(response['body'].encode())
+        seen.update(postcard_ids)
+    return samples, calls / polls, read_units / polls, body_bytes / polls, sent, seen
+
+
+def run(postcard_count, limit, polls, new_every, rtt_ms, watermark_lag):
+    rows = []
+    with harness.local_aws(rtt_ms=rtt_ms) as stats:
+        postcards = harness.load_handler('postcards')
+        postcards.WATERMARK_LAG_SECONDS = watermark_lag
+        seed(stats, postcards, postcard_count)
+        for inbox, every in (('idle', 0), (f'new every {new_every} polls', new_every)):
+            for name, strategy in (('head page', HeadPage(limit, conditional=False)),
+                                   ('head page + If-None-Match', HeadPage(limit, conditional=True)),
+                                   ('since=<watermark>', DeltaSync(limit))):
+                samples, calls, read_units, body_bytes, sent, seen = measure(stats, postcards, strategy, polls, every)
+                if isinstance(strategy, DeltaSync):
+                    assert sent <= seen, f'delta sync missed {len(sent - seen)} postcards'
+                summary = harness.summarize(samples)
+                rows.append([inbox, name, f"{summary['p50'] * 1000:.0f}", f'{calls:.2f}', f'{read_units:.2f}',
+                             f'{body_bytes:.0f}'])
+
+    harness.print_table(['inbox', 'poll', 'p50 us', 'DynamoDB calls', 'RCU', 'body bytes'], rows)
+    print('\nDelta sync returned every postcard sent during the run.')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--postcards', type=int, default=500, help='postcards already in the received feed')
+    parser.add_argument('--limit', type=int, default=20, help='page size')
+    parser.add_argument('--polls', type=int, default=500)
+    parser.add_argument('--new-every', type=int, default=10, help='polls between new postcards in the busy run')
+    parser.add_argument('--rtt-ms', type=float, default=0.0)
+    parser.add_argument('--watermark-lag', type=float, default=0.0, help='WATERMARK_LAG_SECONDS to apply')
+    args = parser.parse_args()
+    run(args.postcards, args.limit, args.polls, args.new_every, args.rtt_ms, args.watermark_lag)
+
+
+if __name__ == '__main__':
+    main()
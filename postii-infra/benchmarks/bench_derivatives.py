@@ -0,0 +1,168 @@
+"""
+Image variant throughput: images/sec per core for the images lambda.
+
+Runs lambda/images render_variants over image files on disk (--input,
+any format Pillow can open) or, without --input, over synthetic camera
+photos written to a temporary directory: noisy 4:3 JPEGs at
+--megapixels with an EXIF orientation tag and GPS block. Each worker
+process is one core. Every mode is run in fresh worker processes so its
+peak memory can be read: draft decoding (what the lambda does) and a
+full-resolution decode for comparison. --output writes the variants
+next to each other so they can be inspected.
+
+Checks that every variant has the expected size and no EXIF, and sends
+one upload through lambda_handler against LocalS3.
+
+Usage:
+    python benchmarks/bench_derivatives.py --images 48 --megapixels 12 --workers 4
+    python benchmarks/bench_derivatives.py --input ~/Pictures/trip --output /tmp/variants
+"""
+import argparse
+import io
+import os
+import resource
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+import harness
+
+EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.heic')
+
+_images = None
+
+
+def _init_worker():
+    global _images
+    _images = harness.load_handler('images')
+
+
+def _render(job):
+    """Worker: render one file; returns (seconds, {variant: bytes}, {variant: (w, h)}, peak RSS in KiB)"""
+    path, variant_format, draft, output_dir = job
+    start = time.perf_counter()
+    with open(path, 'rb') as source:
+        variants = _images.render_variants(source, variant_format=variant_format, draft=draft)
+    elapsed = time.perf_counter() - start
+    if output_dir:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        for variant, data in variants.items():
+            with open(os.path.join(output_dir, f'{stem}.{variant}.{variant_format}'), 'wb') as output:
+                output.write(data)
+    return elapsed, {variant: len(data) for variant, data in variants.items()}, _check(variants), \
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _check(variants):
+    """Dimensions of each variant; asserts EXIF was stripped"""
+    sizes = {}
+    for variant, data in variants.items():
+        with Image.open(io.BytesIO(data)) as image:
+            assert not image.getexif(), f'{variant} still has EXIF'
+            sizes[variant] = image.size
+    return sizes
+
+
+def synthesize(directory, count, megapixels):
+    """count distinct camera-like JPEGs; returns their paths"""
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = width * 3 // 4
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotate 90 on display, as phone photos do
+    exif[0x010F] = 'Postii Bench Camera'
+    exif.get_ifd(0x8825).update({1: 'N', 2: (38.0, 43.0, 20.0), 3: 'W', 4: (9.0, 8.0, 21.0)})
+    paths = []
+    for i in range(count):
+        noise = Image.effect_noise((width, height), 20 + i * 5)
+        gradient = Image.linear_gradient('L').resize((width, height))
+        image = Image.merge('RGB', (noise, gradient, gradient.rotate(90 * (i % 4)).resize((width, height))))
+        path = os.path.join(directory, f'synthetic-{i:02d}.jpg')
+        image.save(path, 'JPEG', quality=90, exif=exif.tobytes())
+        paths.append(path)
+    return paths
+
+
+def run_mode(paths, total, workers, variant_format, draft, output_dir):
+    jobs = [(paths[i % len(paths)], variant_format, draft, output_dir) for i in range(total)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        # Warm each worker (imports, codec init) before timing
+        list(pool.map(_render, jobs[:workers]))
+        start = time.perf_counter()
+        results = list(pool.map(_render, jobs))
+        wall = time.perf_counter() - start
+    latencies = [elapsed for elapsed, _, _, _ in results]
+    return {
+        'images_per_sec': total / wall,
+        'p50_ms': harness.percentile(latencies, 50) * 1000,
+        'peak_rss_mib': max(rss for _, _, _, rss in results) / 1024,
+        'variant_kib': {variant: statistics.fmean(sizes[variant] for _, sizes, _, _ in results) / 1024
+                        for variant in results[0][1]},
+        'dimensions': results[0][2],
+    }
+
+
+def check_handler(path):
+    """One upload through the S3-triggered handler against LocalS3"""
+    with harness.local_aws() as stats:
+        images = harness.load_handler('images')
+        with open(path, 'rb') as source:
+            key = harness.upload_image(stats, 'user-bench', source.read())
+        event = {'Records': [{'s3': {'bucket': {'name': harness.BUCKET_NAME}, 'object': {'key': key}}}]}
+        assert images.lambda_handler(event, None) == {'processed': 1, 'skipped': 0}
+        for variant in images.VARIANT_SIZES:
+            assert stats.s3.get(harness.BUCKET_NAME, images.uploads.derived_key(key, variant)), variant
+
+
+def run(args):
+    workers = args.workers or os.cpu_count()
+    with tempfile.TemporaryDirectory() as scratch:
+        if args.input:
+            paths = sorted(os.path.join(args.input, name) for name in os.listdir(args.input)
+                           if name.lower().endswith(EXTENSIONS))
+            if not paths:
+                raise SystemExit(f'No images in {args.input}')
+        else:
+            paths = synthesize(scratch, min(args.images, 8), args.megapixels)
+            print(f'Synthesized {len(paths)} {args.megapixels:g} MP JPEGs with EXIF orientation and GPS')
+        if args.output:
+            os.makedirs(args.output, exist_ok=True)
+
+        rows = []
+        for label, draft in (('draft decode', True), ('full decode', False)):
+            result = run_mode(paths, args.images, workers, args.format, draft, args.output if draft else None)
+            rows.append([
+                label,
+                f"{result['images_per_sec']:.1f}",
+                f"{result['images_per_sec'] / workers:.1f}",
+                f"{result['p50_ms']:.0f}",
+                f"{result['peak_rss_mib']:.0f}",
+                ', '.join(f'{variant} {kib:.1f}' for variant, kib in result['variant_kib'].items()),
+            ])
+            dimensions = result['dimensions']
+
+        check_handler(paths[0])
+
+    harness.print_table(['mode', 'images/s', 'images/s per core', 'p50 ms/image', 'peak RSS MiB',
+                         f'{args.format} KiB'], rows)
+    print(f'\n{workers} worker process(es), {args.images} images each mode. First image variants: '
+          + ', '.join(f'{variant} {width}x{height}' for variant, (width, height) in dimensions.items()))
+    print('No variant carries EXIF; lambda_handler wrote every variant to LocalS3.')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input', help='directory of images to process (default: synthesize)')
+    parser.add_argument('--images', type=int, default=48, help='images to process per mode')
+    parser.add_argument('--megapixels', type=float, default=12.0, help='size of synthetic images')
+    parser.add_argument('--workers', type=int, default=0, help='worker processes (default: one per core)')
+    parser.add_argument('--format', choices=('webp', 'jpeg'), default='webp')
+    parser.add_argument('--output', help='write the draft-mode variants here')
+    args = parser.parse_args()
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
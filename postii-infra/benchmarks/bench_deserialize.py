@@ -0,0 +1,144 @@
+"""
+Converting a 100-item Query page: resource-layer types vs. dal.
+
+Builds pages in the wire format botocore hands back (feed summary rows,
+friendship rows, public profiles with counters, full postcards with a
+nested location) and converts each one two ways: boto3's resource
+transform (TypeDeserializer, Decimal numbers, then json.dumps with
+default=str) and dal.deserialize_item straight to JSON-ready dicts.
+No DynamoDB calls are made; this is CPU only.
+
+Usage:
+    python benchmarks/bench_deserialize.py --items 100 --iterations 2000
+"""
+import argparse
+import copy
+import json
+import time
+
+import boto3
+from boto3.dynamodb.transform import TransformationInjector
+from boto3.dynamodb.types import TypeDeserializer
+
+import harness
+from postii_common import dal
+
+
+def summary_row(i):
+    postcard_id = f'{i:08x}-2f1c-4c3e-9a57-4d1f0e6b{i:04x}'
+    return {
+        'postcardId': {'S': postcard_id},
+        'senderId': {'S': f'user-{i % 40:07d}'},
+        'recipientId': {'S': 'user-0000001'},
+        'imageUrl': {'S': f'https://cdn.example.com/postcards/{i}.jpg'},
+        'sentAt': {'S': f'2024-03-{i % 28 + 1:02d}T12:00:00+00:00'},
+        'status': {'S': 'sent'},
+        'recipientPK': {'S': 'USER#user-0000001'},
+        'receivedSK': {'S': f'RECEIVED#2024-03-{i % 28 + 1:02d}T12:00:00+00:00#{postcard_id}'},
+    }
+
+
+def friendship_row(i):
+    return {
+        'friendshipId': {'S': f'user-0000001#user-{i:07d}'},
+        'requesterId': {'S': 'user-0000001'},
+        'addresseeId': {'S': f'user-{i:07d}'},
+        'status': {'S': 'accepted'},
+        'createdAt': {'S': '2024-01-01T00:00:00'},
+        'statusSK': {'S': 'accepted#2024-01-01T00:00:00'},
+    }
+
+
+def profile_row(i):
+    return {
+        'userId': {'S': f'user-{i:07d}'},
+        'username': {'S': f'traveller{i}'},
+        'fullName': {'S': f'Traveller {i}'},
+        'bio': {'S': 'Collecting postcards from everywhere'},
+        'profilePictureUrl': {'S': f'https://cdn.example.com/avatars/{i}.jpg'},
+        'isActive': {'BOOL': True},
+        'createdAt': {'S': '2024-01-01T00:00:00+00:00'},
+        'postcardsCount': {'N': str(i * 7)},
+        'friendsCount': {'N': str(i % 150)},
+    }
+
+
+def full_postcard(i):
+    return {
+        **summary_row(i),
+        'message': {'S': 'Wish you were here! ' * 10},
+        'location': {'M': {
+            'name': {'S': 'Lisbon, Portugal'},
+            'latitude': {'N': '38.7223'},
+            'longitude': {'N': '-9.1393'},
+        }},
+        'createdAt': {'S': '2024-03-01T12:00:00+00:00'},
+        'updatedAt': {'S': '2024-03-01T12:00:00+00:00'},
+    }
+
+
+PAGES = {
+    'feed summaries': summary_row,
+    'friendships': friendship_row,
+    'public profiles': profile_row,
+    'full postcards': full_postcard,
+}
+
+
+def resource_path(injector, operation_model):
+    """What Table.query does to a parsed response, then the friends-style dumps"""
+    def convert(parsed):
+        injector.inject_attribute_value_output(parsed, operation_model)
+        return json.dumps(parsed['Items'], default=str)
+    return convert
+
+
+def dal_path(parsed):
+    return json.dumps([dal.deserialize_item(item) for item in parsed['Items']])
+
+
+def check(page, injector, operation_model):
+    """Both paths must produce the same JSON, Decimals aside"""
+    parsed = copy.deepcopy(page)
+    injector.inject_attribute_value_output(parsed, operation_model)
+    expected = json.dumps(parsed['Items'], default=lambda d: int(d) if d == d.to_integral_value() else float(d))
+    assert json.loads(expected) == json.loads(dal_path(page))
+
+
+def measure(convert, pages):
+    """Mean microseconds per page; pages are consumed (converted in place)"""
+    start = time.perf_counter()
+    for page in pages:
+        convert(page)
+    return (time.perf_counter() - start) / len(pages) * 1e6
+
+
+def run(item_count, iterations):
+    operation_model = boto3.session.Session(region_name=harness.REGION).client(
+        'dynamodb', aws_access_key_id='bench', aws_secret_access_key='bench'
+    ).meta.service_model.operation_model('Query')
+    injector = TransformationInjector(deserializer=TypeDeserializer())
+
+    rows = []
+    for name, make_row in PAGES.items():
+        page = {'Items': [make_row(i) for i in range(item_count)], 'Count': item_count}
+        # The resource transform rewrites the response in place, so every
+        # run gets its own copy (made outside the timed loop)
+        old_us = measure(resource_path(injector, operation_model), [copy.deepcopy(page) for _ in range(iterations)])
+        new_us = measure(dal_path, [page] * iterations)
+        check(page, injector, operation_model)
+        rows.append([name, f'{old_us:.0f}', f'{new_us:.0f}', f'{old_us / new_us:.1f}x'])
+
+    harness.print_table([f'{item_count}-item page', 'resource us/page', 'dal us/page', 'speedup'], rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=100)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+    run(args.items, args.iterations)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Friend list cost as a user's friend count grows.
+
+Seeds a user with N friendships (split between sent and received, with a
+slice still pending) and fetches the first page of GET /v1/friends.
+Compared against the old implementation, which read every friendship
+the user has from requester-index and addressee-index on each request.
+The paginated path reads at most one page per status stream, so its
+latency and capacity stay flat once N passes the page size.
+
+Every run also walks all pages once and checks that each friendship is
+returned exactly once, and so does a small walk where one stream's rows
+are all older than the other's, so whole pages come from one stream.
+
+Usage:
+    python benchmarks/bench_friend_list.py --friends 10 100 1000 5000 --rtt-ms 2
+"""
+import argparse
+from datetime import datetime, timedelta
+
+from boto3.dynamodb.conditions import Key
+
+import harness
+from postii_common.friendships import pair_key, status_sort_key, STATUS_ACCEPTED, STATUS_PENDING
+
+USER_ID = 'user-lister'
+
+
+def seed(friend_count):
+    """Create friend_count friendships for USER_ID; every tenth is pending"""
+    seed_rows([
+        (i, i % 2 == 1, STATUS_PENDING if i % 10 == 0 else STATUS_ACCEPTED)
+        for i in range(friend_count)
+    ])
+
+
+def seed_rows(rows):
+    """Create USER_ID's friendships from (minute, sent by USER_ID, status) rows"""
+    friendships_table = harness.table('FRIENDSHIPS_TABLE')
+    start = datetime(2024, 1, 1)
+
+    with friendships_table.batch_writer() as friendships:
+        for minute, sent, status in rows:
+            created_at = (start + timedelta(minutes=minute)).isoformat()
+            other_id = f'friend-{minute:06d}'
+            requester_id, addressee_id = (USER_ID, other_id) if sent else (other_id, USER_ID)
+            friendships.put_item(Item={
+                'friendshipId': pair_key(USER_ID, other_id),
+                'requesterId': requester_id,
+                'addresseeId': addressee_id,
+                'status': status,
+                'statusSK': status_sort_key(status, created_at),
+                'createdAt': created_at,
+                'updatedAt': created_at,
+            })
+
+
+def check_skewed_walk():
+    """
+    4 sent friendships at t0, t1, t20, t21 and 14 received at t2-t15,
+    walked 2 at a time: the sent stream contributes nothing to the
+    middle pages and must resume where it was, not from the start.
+    """
+    with harness.local_aws():
+        rows = [(minute, True, STATUS_ACCEPTED) for minute in (0, 1, 20, 21)]
+        rows += [(minute, False, STATUS_ACCEPTED) for minute in range(2, 16)]
+        seed_rows(rows)
+        friends = harness.load_handler('friends')
+        seen = walk_all_pages(friends, 2, query={'type': 'friends'}, max_pages=len(rows))
+        assert len(seen) == len(set(seen)) == len(rows), seen
+
+
+def legacy_list(friendships_table, user_id):
+    """The pre-pagination handler: read both GSIs in full"""
+    for index_name, partition_key in (('requester-index', 'requesterId'), ('addressee-index', 'addresseeId')):
+        friendships_table.query(
+            IndexName=index_name,
+            KeyConditionExpression=Key(partition_key).eq(user_id)
+        )
+
+
+def walk_all_pages(friends, limit, query=None, max_pages=None):
+    """Follow nextToken to the end (at most max_pages); returns every friendshipId seen"""
+    seen = []
+    base_query = {'limit': str(limit), **(query or {})}
+    query = base_query
+    pages = 0
+    while True:
+        pages += 1
+        assert max_pages is None or pages <= max_pages, f'still paging after {max_pages} pages'
+        response = friends.lambda_handler(harness.api_event('GET', '/v1/friends', USER_ID, query=query), None)
+        assert response['statusCode'] == 200, response
+        body = harness.json_body(response)
+        for section in ('friends', 'pendingSent', 'pendingReceived'):
+            seen.extend(entry['friendshipId'] for entry in body[section])
+        if 'nextToken' not in body:
+            return seen
+        query = {**base_query, 'nextToken': body['nextToken']}
+
+
+def run(friend_counts, iterations, limit, rtt_ms):
+    check_skewed_walk()
+    rows = []
+    for friend_count in friend_counts:
+        with harness.local_aws(rtt_ms=rtt_ms) as stats:
+            seed(friend_count)
+            friends = harness.load_handler('friends')
+            friendships_table = harness.table('FRIENDSHIPS_TABLE')
+
+            seen = walk_all_pages(friends, limit)
+            assert len(seen) == len(set(seen)) == friend_count, (len(seen), len(set(seen)), friend_count)
+
+            def first_page(i):
+                event = harness.api_event('GET', '/v1/friends', USER_ID, query={'limit': str(limit)})
+                response = friends.lambda_handler(event, None)
+                assert response['statusCode'] == 200, response
+
+            stats.reset()
+            samples = harness.timed(first_page, iterations)
+            page_stats = stats.snapshot()
+
+            stats.reset()
+            legacy_samples = harness.timed(lambda i: legacy_list(friendships_table, USER_ID), iterations)
+            legacy_stats = stats.snapshot()
+
+        summary = harness.summarize(samples)
+        legacy_summary = harness.summarize(legacy_samples)
+        rows.append([
+            friend_count,
+            f"{summary['p50']:.2f}",
+            f"{summary['p95']:.2f}",
+            f"{page_stats['read_units'] / iterations:.1f}",
+            f"{legacy_summary['p50']:.2f}",
+            f"{legacy_summary['p95']:.2f}",
+            f"{legacy_stats['read_units'] / iterations:.1f}",
+        ])
+
+    harness.print_table(
+        ['friendships', 'page p50 ms', 'page p95 ms', 'page RCU', 'old p50 ms', 'old p95 ms', 'old RCU'],
+        rows
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--friends', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--rtt-ms', type=float, default=0.0)
+    args = parser.parse_args()
+    run(args.friends, args.iterations, args.limit, args.rtt_ms)
+
+
+if __name__ == '__main__':
+    main()
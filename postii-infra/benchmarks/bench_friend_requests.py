@@ -0,0 +1,111 @@
+"""
+Send-friend-request cost as the sender's friend count grows.
+
+Seeds a sender with N existing friendships, then sends requests to new
+users through POST /v1/friends/send-request. Compared against the old
+existence check (two requester-index queries filtered on addresseeId),
+whose reads grow with N; the pair-key path is one conditional PutItem
+no matter how many friends the sender has.
+
+Usage:
+    python benchmarks/bench_friend_requests.py --friends 10 100 1000 5000
+"""
+import argparse
+from datetime import datetime, timedelta
+
+from boto3.dynamodb.conditions import Key, Attr
+
+import harness
+from postii_common.friendships import pair_key
+
+SENDER_ID = 'user-sender'
+
+
+def seed(friend_count, recipients):
+    """Create the sender, friend_count accepted friendships and recipient users"""
+    users_table = harness.table('USERS_TABLE')
+    friendships_table = harness.table('FRIENDSHIPS_TABLE')
+    start = datetime(2024, 1, 1)
+
+    with users_table.batch_writer() as users:
+        users.put_item(Item={'userId': SENDER_ID, 'username': 'sender', 'email': 'sender@example.com'})
+        for i in range(recipients):
+            users.put_item(Item={'userId': f'recipient-{i}', 'username': f'recipient{i}',
+                                 'email': f'recipient{i}@example.com'})
+
+    with friendships_table.batch_writer() as friendships:
+        for i in range(friend_count):
+            created_at = (start + timedelta(minutes=i)).isoformat()
+            friend_id = f'friend-{i:06d}'
+            friendships.put_item(Item={
+                'friendshipId': pair_key(SENDER_ID, friend_id),
+                'requesterId': SENDER_ID,
+                'addresseeId': friend_id,
+                'status': 'accepted',
+                'createdAt': created_at,
+                'updatedAt': created_at,
+            })
+
+
+def legacy_existence_check(friendships_table, user_id_1, user_id_2):
+    """The pre-pair-key check: two filtered queries on requester-index"""
+    for requester, addressee in ((user_id_1, user_id_2), (user_id_2, user_id_1)):
+        friendships_table.query(
+            IndexName='requester-index',
+            KeyConditionExpression=Key('requesterId').eq(requester),
+            FilterExpression=Attr('addresseeId').eq(addressee)
+        )
+
+
+def run(friend_counts, iterations, rtt_ms):
+    rows = []
+    for friend_count in friend_counts:
+        with harness.local_aws(rtt_ms=rtt_ms) as stats:
+            seed(friend_count, iterations)
+            friends = harness.load_handler('friends')
+            friendships_table = harness.table('FRIENDSHIPS_TABLE')
+
+            def send_request(i):
+                event = harness.api_event('POST', '/v1/friends/send-request', SENDER_ID,
+                                          body={'username': f'recipient{i}'})
+                response = friends.lambda_handler(event, None)
+                assert response['statusCode'] == 201, response
+
+            stats.reset()
+            samples = harness.timed(send_request, iterations)
+            new_stats = stats.snapshot()
+
+            stats.reset()
+            legacy_samples = harness.timed(
+                lambda i: legacy_existence_check(friendships_table, SENDER_ID, f'recipient-{i}'), iterations
+            )
+            legacy_stats = stats.snapshot()
+
+        summary = harness.summarize(samples)
+        legacy_summary = harness.summarize(legacy_samples)
+        rows.append([
+            friend_count,
+            f"{summary['p50']:.2f}",
+            f"{new_stats['calls'] / iterations:.1f}",
+            f"{new_stats['read_units'] / iterations:.1f}",
+            f"{legacy_summary['p50']:.2f}",
+            f"{legacy_stats['read_units'] / iterations:.1f}",
+        ])
+
+    harness.print_table(
+        ['friends', 'send p50 ms', 'send calls', 'send RCU', 'old check p50 ms', 'old check RCU'],
+        rows
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--friends', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--rtt-ms', type=float, default=0.0)
+    args = parser.parse_args()
+    run(args.friends, args.iterations, args.rtt_ms)
+
+
+if __name__ == '__main__':
+    main()
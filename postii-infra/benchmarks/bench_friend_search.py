@@ -0,0 +1,147 @@
+"""
+Friend search latency as the Users table grows.
+
+Compares GET /v1/friends/search served from the search index with the
+old implementation (two filtered scans of the Users table) at several
+table sizes. The index path should stay flat; the scan path grows
+linearly with the number of users.
+
+Also checks that a substring match is found however many users share
+the query's first trigram (200 smithN users and one mr_smithjohnson).
+
+Usage:
+    python benchmarks/bench_friend_search.py --sizes 500 2000 8000 --rtt-ms 2
+"""
+import argparse
+import random
+
+from boto3.dynamodb.conditions import Attr
+
+import harness
+from postii_common import search_index
+
+WORDS = [
+    'amber', 'bright', 'cedar', 'dusty', 'ember', 'frost', 'glade', 'harbor',
+    'ivory', 'juniper', 'kestrel', 'lunar', 'maple', 'north', 'olive', 'pebble',
+    'quartz', 'raven', 'sierra', 'tidal', 'umber', 'velvet', 'willow', 'zephyr',
+]
+
+
+def seed_users(count, rng):
+    """Write count users plus their search index rows; returns usernames"""
+    users_table = harness.table('USERS_TABLE')
+    index_table = harness.table('SEARCH_INDEX_TABLE')
+    usernames = []
+
+    with users_table.batch_writer() as users, index_table.batch_writer() as index:
+        for i in range(count):
+            username = f'{rng.choice(WORDS)}{rng.choice(WORDS)}{i}'
+            user = {
+                'userId': f'user-{i:07d}',
+                'username': username,
+                'email': f'{username}@example.com',
+                'fullName': username.title(),
+            }
+            users.put_item(Item=user)
+            for term in search_index.index_terms(user):
+                index.put_item(Item=search_index.index_row(term, user))
+            usernames.append(username)
+
+    return usernames
+
+
+def check_common_first_gram(rtt_ms):
+    """q=smithjohnson finds mr_smithjohnson among 200 users whose names start smith"""
+    with harness.local_aws(rtt_ms=rtt_ms) as stats:
+        users = [{'userId': f'user-{i:07d}', 'username': f'smith{i}', 'email': f'smith{i}@example.com',
+                  'fullName': f'Smith {i}'} for i in range(200)]
+        users.append({'userId': 'user-mrsmith', 'username': 'mr_smithjohnson', 'email': 'mr@example.com',
+                      'fullName': 'Mr Smithjohnson'})
+        harness.load(stats, 'SEARCH_INDEX_TABLE', [
+            search_index.index_row(term, user) for user in users for term in search_index.index_terms(user)
+        ])
+        friends = harness.load_handler('friends')
+        response = friends.lambda_handler(harness.api_event('GET', '/v1/friends/search', 'user-searcher',
+                                                            query={'q': 'smithjohnson', 'limit': '20'}), None)
+        assert response['statusCode'] == 200, response
+        found = [user['userId'] for user in harness.json_body(response)['results']]
+        assert found == ['user-mrsmith'], found
+
+
+def legacy_scan_search(users_table, query):
+    """The pre-index implementation: two unpaginated contains() scans"""
+    for field in ('username', 'email'):
+        users_table.scan(
+            FilterExpression=Attr(field).contains(query),
+            ProjectionExpression='userId, username, email, #name',
+            ExpressionAttributeNames={'#name': 'name'}
+        )
+
+
+def run(sizes, iterations, rtt_ms, seed):
+    rows = []
+    for size in sizes:
+        rng = random.Random(seed)
+        with harness.local_aws(rtt_ms=rtt_ms) as stats:
+            usernames = seed_users(size, rng)
+            friends = harness.load_handler('friends')
+            users_table = harness.table('USERS_TABLE')
+
+            queries = []
+            for _ in range(iterations):
+                username = rng.choice(usernames)
+                start = rng.randrange(0, max(1, len(username) - 4))
+                queries.append(username[start:start + 4])
+
+            def index_search(i):
+                event = harness.api_event('GET', '/v1/friends/search', 'user-searcher',
+                                          query={'q': queries[i], 'limit': '20'})
+                response = friends.lambda_handler(event, None)
+                assert response['statusCode'] == 200, response
+
+            stats.reset()
+            index_samples = harness.timed(index_search, iterations)
+            index_calls = stats.calls / iterations
+            index_rcu = stats.read_units / iterations
+
+            stats.reset()
+            scan_samples = harness.timed(lambda i: legacy_scan_search(users_table, queries[i]), iterations)
+            scan_calls = stats.calls / iterations
+            scan_rcu = stats.read_units / iterations
+
+        index_summary = harness.summarize(index_samples)
+        scan_summary = harness.summarize(scan_samples)
+        rows.append([
+            size,
+            f"{index_summary['p50']:.2f}",
+            f"{index_summary['p95']:.2f}",
+            f'{index_calls:.1f}',
+            f'{index_rcu:.1f}',
+            f"{scan_summary['p50']:.2f}",
+            f"{scan_summary['p95']:.2f}",
+            f'{scan_calls:.1f}',
+            f'{scan_rcu:.1f}',
+        ])
+
+    harness.print_table(
+        ['users', 'index p50 ms', 'index p95 ms', 'index calls', 'index RCU',
+         'scan p50 ms', 'scan p95 ms', 'scan calls', 'scan RCU'],
+        rows
+    )
+
+    check_common_first_gram(rtt_ms)
+    print('\nChecked: q=smithjohnson finds mr_smithjohnson among 200 smithN users.')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 2000, 8000])
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--rtt-ms', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    run(args.sizes, args.iterations, args.rtt_ms, args.seed)
+
+
+if __name__ == '__main__':
+    main()
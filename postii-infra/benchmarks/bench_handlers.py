@@ -0,0 +1,271 @@
+"""
+Per-route baseline for every Lambda handler.
+
+Seeds the local tables with a synthetic data set (profiles with their
+username/email reservations and search index rows, friendships and
+postcards) and drives each route of the auth, users, friends and
+postcards handlers through lambda_handler, with API Gateway events that
+carry Cognito claims, paths and query strings. Every request acts as a
+randomly chosen seeded user, so reads land on partitions of realistic
+size rather than one hot user. For each route it reports p50/p95/p99
+latency, DynamoDB calls, and read/write capacity units per request; any
+non-2xx response aborts the run.
+
+Data sizes are configurable. The stand-in keeps everything in memory:
+the defaults need about 1.5 GB, and the full production-shaped run
+(10k users, 100k friendships, 1M postcards) roughly 7 GB.
+
+Usage:
+    python benchmarks/bench_handlers.py
+    python benchmarks/bench_handlers.py --users 10000 --friendships 100000 --postcards 1000000
+    python benchmarks/bench_handlers.py --routes friends --iterations 500 --rtt-ms 3 --json baseline.json
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+import harness
+from postii_common import reservations, search_index
+from postii_common.friendships import pair_key, status_sort_key, STATUS_ACCEPTED, STATUS_PENDING
+
+WORDS = (
+    'amber', 'bright', 'cedar', 'dusty', 'ember', 'frost', 'glade', 'harbor',
+    'ivory', 'juniper', 'kestrel', 'lunar', 'maple', 'north', 'olive', 'pebble',
+    'quartz', 'raven', 'sierra', 'tidal', 'umber', 'velvet', 'willow', 'zephyr',
+)
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+class Dataset:
+    """What was seeded, so routes can build events that hit real data"""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.user_ids = []
+        self.usernames = []
+        self.pairs = set()
+        self.pending = []
+        self.postcards = []
+
+    def user(self):
+        return self.rng.randrange(len(self.user_ids))
+
+    def stranger_pair(self):
+        """Two users who have no friendship yet"""
+        while True:
+            a, b = self.user(), self.user()
+            if a != b and frozenset((a, b)) not in self.pairs:
+                self.pairs.add(frozenset((a, b)))
+                return a, b
+
+
+def timestamp(rng):
+    return (START + timedelta(seconds=rng.randrange(365 * 24 * 3600))).isoformat()
+
+
+def seed_users(local_dynamodb, data, count):
+    profiles, index_rows = [], []
+    for i in range(count):
+        user_id = f'user-{i:07d}'
+        username = f'{data.rng.choice(WORDS)}{data.rng.choice(WORDS)}{i}'
+        created_at = timestamp(data.rng)
+        profile = {
+            'userId': user_id,
+            'username': username,
+            'email': f'{username}@example.com',
+            'fullName': username.title(),
+            'bio': '',
+            'profilePictureUrl': '',
+            'postcardsCount': 0,
+            'friendsCount': 0,
+            'createdAt': created_at,
+            'updatedAt': created_at,
+        }
+        profiles.append(profile)
+        profiles.append({**reservations.username_key(username), 'ownerId': user_id})
+        profiles.append({**reservations.email_key(profile['email']), 'ownerId': user_id})
+        index_rows.extend(search_index.index_row(term, profile) for term in search_index.index_terms(profile))
+        data.user_ids.append(user_id)
+        data.usernames.append(username)
+    harness.load(local_dynamodb, 'USERS_TABLE', profiles)
+    harness.load(local_dynamodb, 'SEARCH_INDEX_TABLE', index_rows)
+
+
+def seed_friendships(local_dynamodb, data, count):
+    """count friendships between random users; every tenth is still pending"""
+    items = []
+    for i in range(count):
+        requester, addressee = data.stranger_pair()
+        status = STATUS_PENDING if i % 10 == 0 else STATUS_ACCEPTED
+        created_at = timestamp(data.rng)
+        requester_id, addressee_id = data.user_ids[requester], data.user_ids[addressee]
+        friendship_id = pair_key(requester_id, addressee_id)
+        items.append({
+            'friendshipId': friendship_id,
+            'requesterId': requester_id,
+            'addresseeId': addressee_id,
+            'status': status,
+            'statusSK': status_sort_key(status, created_at),
+            'createdAt': created_at,
+            'updatedAt': created_at,
+        })
+        if status == STATUS_PENDING:
+            data.pending.append((addressee_id, friendship_id))
+    data.rng.shuffle(data.pending)
+    harness.load(local_dynamodb, 'FRIENDSHIPS_TABLE', items)
+
+
+def seed_postcards(local_dynamodb, data, postcards_handler, count):
+    def items():
+        for i in range(count):
+            sender, recipient = data.user(), data.user()
+            item = postcards_handler.build_postcard_item(
+                data.user_ids[sender], data.user_ids[recipient], f'https://cdn.example.com/postcards/{i}.jpg',
+                'Wish you were here!', {'name': 'Lisbon, Portugal'}, timestamp(data.rng)
+            )
+            data.postcards.append((item['postcardId'], item['senderId']))
+            yield item
+    harness.load(local_dynamodb, 'POSTCARDS_TABLE', items())
+
+
+def routes(stats, data, handlers):
+    """(name, handler, event factory) for every route the API exposes"""
+    def user_id():
+        return data.user_ids[data.user()]
+
+    def search_query():
+        return data.rng.choice(WORDS)[:data.rng.randint(2, 5)]
+
+    def users_get_by_id(i):
+        return harness.api_event('GET', '/v1/users/x', user_id(), resource='/v1/users/{userId}',
+                                 path_parameters={'userId': user_id()})
+
+    def users_search(i):
+        return harness.api_event('GET', '/v1/users/search', user_id(),
+                                 query={'q': data.usernames[data.user()], 'type': 'username'})
+
+    def users_update(i):
+        return harness.api_event('PUT', '/v1/users', user_id(), body={'fullName': f'Renamed {i}'})
+
+    def users_create(i):
+        username = f'newcomer{i}'
+        return harness.api_event('POST', '/v1/users', f'signup-{i:07d}',
+                                 body={'username': username, 'email': f'{username}@example.com'})
+
+    def friends_send(i):
+        requester, addressee = data.stranger_pair()
+        return harness.api_event('POST', '/v1/friends/send-request', data.user_ids[requester],
+                                 resource='/v1/friends/{proxy+}', body={'username': data.usernames[addressee]})
+
+    def friends_accept(i):
+        addressee_id, friendship_id = data.pending.pop()
+        return harness.api_event('POST', '/v1/friends/accept-request', addressee_id,
+                                 resource='/v1/friends/{proxy+}', body={'friendshipId': friendship_id})
+
+    def postcards_get(i):
+        postcard_id, sender_id = data.rng.choice(data.postcards)
+        return harness.api_event('GET', f'/v1/postcards/{postcard_id}', sender_id,
+                                 resource='/v1/postcards/{postcardId}', path_parameters={'postcardId': postcard_id})
+
+    def postcards_send(i):
+        # The upload itself goes straight to S3; seed it outside the handler
+        sender_id = user_id()
+        return harness.api_event('POST', '/v1/postcards', sender_id, body={
+            'recipientId': user_id(), 'imageKey': harness.upload_image(stats, sender_id), 'message': 'Hello!'})
+
+    def get(handler, path, query=None):
+        return handler, lambda i: harness.api_event('GET', path, user_id(), query=query)
+
+    users, friends, postcards, auth = handlers['users'], handlers['friends'], handlers['postcards'], handlers['auth']
+    return [
+        ('POST /v1/auth', auth, lambda i: harness.api_event('POST', '/v1/auth', user_id())),
+        ('GET /v1/users', *get(users, '/v1/users')),
+        ('GET /v1/users/{userId}', users, users_get_by_id),
+        ('GET /v1/users/search', users, users_search),
+        ('PUT /v1/users', users, users_update),
+        ('POST /v1/users', users, users_create),
+        ('GET /v1/friends', *get(friends, '/v1/friends')),
+        ('GET /v1/friends?expand=profiles', *get(friends, '/v1/friends', {'expand': 'profiles'})),
+        ('GET /v1/friends/search', friends,
+         lambda i: harness.api_event('GET', '/v1/friends/search', user_id(), query={'q': search_query()})),
+        ('POST /v1/friends/send-request', friends, friends_send),
+        ('POST /v1/friends/accept-request', friends, friends_accept),
+        ('GET /v1/postcards/sent', *get(postcards, '/v1/postcards/sent')),
+        ('GET /v1/postcards/received', *get(postcards, '/v1/postcards/received')),
+        ('GET /v1/postcards/inbox', *get(postcards, '/v1/postcards/inbox')),
+        ('GET /v1/postcards/{postcardId}', postcards, postcards_get),
+        ('POST /v1/postcards', postcards, postcards_send),
+    ]
+
+
+def bench_route(stats, handler, make_event, iterations, warmup):
+    """Run one route; returns latency samples and per-request DynamoDB cost"""
+    def call(i):
+        response = handler.lambda_handler(make_event(i), None)
+        if not 200 <= response['statusCode'] < 300:
+            raise AssertionError(f"{response['statusCode']}: {response['body']}")
+
+    harness.timed(lambda i: call(iterations + i), warmup)
+    stats.reset()
+    samples = harness.timed(call, iterations)
+    return samples, {
+        'calls': stats.calls / iterations,
+        'read_units': stats.read_units / iterations,
+        'write_units': stats.write_units / iterations,
+    }
+
+
+def run(args):
+    data = Dataset(random.Random(args.seed))
+    results = []
+    with harness.local_aws(rtt_ms=args.rtt_ms) as stats:
+        handlers = {name: harness.load_handler(name) for name in ('auth', 'users', 'friends', 'postcards')}
+
+        start = time.perf_counter()
+        seed_users(stats, data, args.users)
+        seed_friendships(stats, data, args.friendships)
+        seed_postcards(stats, data, handlers['postcards'], args.postcards)
+        print(f'Seeded {args.users} users, {args.friendships} friendships and {args.postcards} postcards '
+              f'in {time.perf_counter() - start:.1f}s\n')
+
+        for name, handler, make_event in routes(stats, data, handlers):
+            if args.routes and not any(pattern in name for pattern in args.routes):
+                continue
+            iterations = args.iterations
+            if name.endswith('accept-request'):
+                iterations = min(iterations, len(data.pending) - args.warmup)
+            try:
+                samples, cost = bench_route(stats, handler, make_event, iterations, args.warmup)
+            except AssertionError as e:
+                raise SystemExit(f'{name} failed: {e}')
+            results.append({'route': name, **harness.summarize(samples), **cost})
+
+    harness.print_table(
+        ['route', 'p50 ms', 'p95 ms', 'p99 ms', 'DDB calls', 'RCU', 'WCU'],
+        [[r['route'], f"{r['p50']:.2f}", f"{r['p95']:.2f}", f"{r['p99']:.2f}",
+          f"{r['calls']:.1f}", f"{r['read_units']:.1f}", f"{r['write_units']:.1f}"] for r in results]
+    )
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'parameters': vars(args), 'routes': results}, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--friendships', type=int, default=100000)
+    parser.add_argument('--postcards', type=int, default=100000)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--routes', nargs='+', help='only run routes whose name contains one of these')
+    parser.add_argument('--rtt-ms', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
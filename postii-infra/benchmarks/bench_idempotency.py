@@ -0,0 +1,220 @@
+"""
+Duplicate writes from client retries, with and without Idempotency-Key.
+
+--sends postcard sends and --requests friend requests are each
+delivered --copies times at the same moment, as when a client retries
+while its first attempt is still in flight. Without a key every copy of
+a send is a new postcard, and all but one copy of a friend request come
+back 409 although the request went through. With a key (the same for
+every copy) the first copy runs; the others get 409 + Retry-After while
+it runs, retry after --retry-ms, and get its response replayed.
+
+Reports rows written per logical request, copies whose client saw the
+first copy's answer, in-progress retries, and DynamoDB calls per copy.
+Then, serially: p50 and calls of a send without a key, with a new key
+(claim + send + stored response), and of a replay; and checks that a
+key reused for a different body is a 422 and that a failed request
+frees its key for the retry.
+
+Usage:
+    python benchmarks/bench_idempotency.py --sends 100 --requests 50 --copies 4 --rtt-ms 3
+"""
+import argparse
+import threading
+import time
+import uuid
+
+import harness
+from postii_common import idempotency
+
+MESSAGE = 'Wish you were here!'
+
+
+def seed(stats, count):
+    users = [f'user-{i:04d}' for i in range(count)]
+    harness.load(stats, 'USERS_TABLE', [
+        {'userId': user_id, 'username': user_id.replace('-', ''), 'email': f'{user_id}@example.com'}
+        for user_id in users
+    ])
+    return users, {user_id: harness.upload_image(stats, user_id) for user_id in users}
+
+
+def count_rows(env_name):
+    """Items in one of the harness tables"""
+    table = harness.table(env_name)
+    count, kwargs = 0, {'Select': 'COUNT'}
+    while True:
+        page = table.scan(**kwargs)
+        count += page['Count']
+        if 'LastEvaluatedKey' not in page:
+            return count
+        kwargs['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+
+def deliver(handler, event, retry_ms):
+    """One copy of a request as the client sends it; returns (response, in-progress retries)"""
+    retries = 0
+    while True:
+        response = handler.lambda_handler(dict(event), None)
+        if response['statusCode'] != 409 or 'Retry-After' not in response['headers']:
+            return response, retries
+        retries += 1
+        time.sleep(retry_ms / 1000.0)
+
+
+def race(handler, events, copies, retry_ms):
+    """Deliver copies of each event simultaneously; returns the responses per event and the retries"""
+    outcomes, retries = [], 0
+    for event in events:
+        barrier = threading.Barrier(copies)
+        responses = []
+        lock = threading.Lock()
+
+        def copy():
+            barrier.wait()
+            response, copy_retries = deliver(handler, event, retry_ms)
+            with lock:
+                nonlocal retries
+                responses.append(response)
+                retries += copy_retries
+
+        threads = [threading.Thread(target=copy) for _ in range(copies)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        outcomes.append(responses)
+    return outcomes, retries
+
+
+def answered(outcomes, id_field):
+    """Copies that got a success carrying the same id as the other successful copies of their request"""
+    count = 0
+    for responses in outcomes:
+        ids = [harness.json_body(r).get(id_field) for r in responses if r['statusCode'] in (200, 201)]
+        if len(set(ids)) == 1:
+            count += len(ids)
+    return count
+
+
+def with_key(event, keyed):
+    if keyed:
+        event['headers'] = {idempotency.HEADER: str(uuid.uuid4())}
+    return event
+
+
+def run_mode(args, keyed):
+    with harness.local_aws(rtt_ms=args.rtt_ms) as stats:
+        users, images = seed(stats, max(args.requests + 1, 20))
+        postcards, friends = harness.load_handler('postcards'), harness.load_handler('friends')
+        copies = args.copies
+
+        send_events = [
+            with_key(harness.api_event('POST', '/v1/postcards', users[i % len(users)], body={
+                'recipientId': users[(i + 1) % len(users)], 'imageKey': images[users[i % len(users)]],
+                'message': MESSAGE}), keyed)
+            for i in range(args.sends)
+        ]
+        stats.reset()
+        send_outcomes, send_retries = race(postcards, send_events, copies, args.retry_ms)
+        send_calls = stats.calls / (args.sends * copies)
+
+        # users[0] asks everyone else, so every pair is new
+        request_events = [
+            with_key(harness.api_event('POST', '/v1/friends/send-request', users[0],
+                                       body={'username': users[i + 1].replace('-', '')}), keyed)
+            for i in range(args.requests)
+        ]
+        stats.reset()
+        request_outcomes, request_retries = race(friends, request_events, copies, args.retry_ms)
+        request_calls = stats.calls / (args.requests * copies)
+
+        rows = count_rows('POSTCARDS_TABLE') / args.sends, count_rows('FRIENDSHIPS_TABLE') / args.requests
+    label = 'Idempotency-Key' if keyed else 'no key'
+    return [
+        [f'send postcard, {label}', f'{rows[0]:.2f}', f"{answered(send_outcomes, 'postcardId')}/{args.sends * copies}",
+         f'{send_retries}', f'{send_calls:.2f}'],
+        [f'friend request, {label}', f'{rows[1]:.2f}',
+         f"{answered(request_outcomes, 'friendshipId')}/{args.requests * copies}", f'{request_retries}',
+         f'{request_calls:.2f}'],
+    ]
+
+
+def overhead(args):
+    """p50 and calls of single sends: no key, new key, replayed key"""
+    with harness.local_aws(rtt_ms=args.rtt_ms) as stats:
+        users, images = seed(stats, 20)
+        postcards = harness.load_handler('postcards')
+
+        def event(i, key=None):
+            sender = users[i % len(users)]
+            return harness.api_event('POST', '/v1/postcards', sender, body={
+                'recipientId': users[(i + 1) % len(users)], 'imageKey': images[sender], 'message': MESSAGE},
+                headers={idempotency.HEADER: key} if key else None)
+
+        keys = [str(uuid.uuid4()) for _ in range(args.iterations)]
+        rows = []
+        for label, make in (('no key', lambda i: event(i)),
+                            ('new key', lambda i: event(i, keys[i])),
+                            ('replayed key', lambda i: event(i, keys[i]))):
+            stats.reset()
+            samples = harness.timed(lambda i: check_send(postcards, make(i)), args.iterations)
+            rows.append([label, f'{stats.calls / args.iterations:.1f}',
+                         f'{stats.write_units / args.iterations:.1f}', f"{harness.summarize(samples)['p50']:.2f}"])
+
+        check_key_rules(postcards, users, images)
+    return rows
+
+
+def check_send(postcards, event):
+    response = postcards.lambda_handler(event, None)
+    assert response['statusCode'] == 200, response
+    return response
+
+
+def check_key_rules(postcards, users, images):
+    """Reusing a key for another body is a 422; a failed request frees its key"""
+    sender, recipient, key = users[0], users[1], str(uuid.uuid4())
+    headers = {idempotency.HEADER: key}
+    missing_image = f'uploads/{sender}/not-uploaded-yet.jpg'
+
+    def send(image_key, message=MESSAGE):
+        return postcards.lambda_handler(harness.api_event('POST', '/v1/postcards', sender, headers=headers, body={
+            'recipientId': recipient, 'imageKey': image_key, 'message': message}), None)
+
+    assert send(missing_image)['statusCode'] == 400
+    # The retry names an image that has been uploaded
+    first = send(images[sender])
+    assert first['statusCode'] == 200, first
+    replayed = send(images[sender])
+    assert replayed['headers'].get(idempotency.REPLAYED_HEADER) == 'true', replayed
+    assert replayed['body'] == first['body']
+    assert send(images[sender], 'Something else')['statusCode'] == 422
+
+
+def run(args):
+    rows = run_mode(args, False) + run_mode(args, True)
+    print(f'{args.copies} simultaneous copies of each request')
+    harness.print_table(['request', 'rows written per request', "copies with the first copy's answer",
+                         'in-progress retries', 'DynamoDB calls/copy'], rows)
+
+    print('\nOne send at a time')
+    harness.print_table(['send', 'DynamoDB calls', 'WCU', 'p50 ms'], overhead(args))
+    print('\nChecked: a key reused with a different body is a 422, and a request that failed (400) '
+          'leaves its key free for the retry.')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sends', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--copies', type=int, default=4)
+    parser.add_argument('--retry-ms', type=float, default=5.0)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--rtt-ms', type=float, default=3.0)
+    args = parser.parse_args()
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
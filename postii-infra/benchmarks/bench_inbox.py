@@ -0,0 +1,122 @@
+"""
+Unified inbox vs. fetching both feeds and merging on the client.
+
+Seeds a user who has exchanged postcards with a set of friends, then
+loads the first page of a conversation view two ways: GET
+/v1/postcards/sent plus GET /v1/postcards/received merged on the client,
+and one GET /v1/postcards/inbox. Also walks every inbox page (with and
+without withUser, and with limit=1) and checks that each postcard comes
+back exactly once, newest first. A few postcards are sent to the user
+themselves, so they sit in both feeds.
+
+Usage:
+    python benchmarks/bench_inbox.py --postcards 1000 --limit 20 --rtt-ms 3
+"""
+import argparse
+import random
+from datetime import datetime, timedelta, timezone
+
+import harness
+
+USER_ID = 'user-inbox'
+
+
+def seed(count, friends, rng):
+    """Write count postcards between USER_ID and friends, in both directions, and a few to USER_ID itself"""
+    postcards_table = harness.table('POSTCARDS_TABLE')
+    postcards = harness.load_handler('postcards')
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    expected = {}
+    with postcards_table.batch_writer() as batch:
+        for i in range(count):
+            friend_id = f'friend-{rng.randrange(friends)}' if rng.random() >= 0.05 else USER_ID
+            sender_id, recipient_id = (USER_ID, friend_id) if rng.random() < 0.5 else (friend_id, USER_ID)
+            timestamp = (start + timedelta(seconds=rng.randrange(10 ** 7))).isoformat()
+            item = postcards.build_postcard_item(sender_id, recipient_id, f'https://cdn.example.com/{i}.jpg',
+                                                 'Greetings!', {}, timestamp)
+            batch.put_item(Item=item)
+            expected[item['postcardId']] = (timestamp, friend_id)
+    return postcards, expected
+
+
+def get(postcards, path, query):
+    event = harness.api_event('GET', path, USER_ID, resource=path, query=query)
+    response = postcards.lambda_handler(event, None)
+    assert response['statusCode'] == 200, response
+    return harness.json_body(response)
+
+
+def walk_inbox(postcards, limit, with_user=None):
+    """Every inbox page in order; returns the postcards seen"""
+    seen = []
+    query = {'limit': str(limit)}
+    if with_user:
+        query['withUser'] = with_user
+    while True:
+        body = get(postcards, '/v1/postcards/inbox', query)
+        seen.extend(body['postcards'])
+        if 'lastKey' not in body:
+            return seen
+        query = {**query, 'lastKey': body['lastKey']}
+
+
+def check(seen, expected_ids, expected):
+    ids = [postcard['postcardId'] for postcard in seen]
+    assert len(ids) == len(set(ids)) == len(expected_ids), (len(ids), len(set(ids)), len(expected_ids))
+    assert set(ids) == set(expected_ids)
+    order = [(expected[postcard_id][0], postcard_id) for postcard_id in ids]
+    assert order == sorted(order, reverse=True), 'inbox is not newest first'
+
+
+def run(postcard_count, friends, limit, iterations, rtt_ms, seed_value):
+    rng = random.Random(seed_value)
+    with harness.local_aws(rtt_ms=rtt_ms) as stats:
+        postcards, expected = seed(postcard_count, friends, rng)
+
+        check(walk_inbox(postcards, limit), list(expected), expected)
+        thread_ids = [postcard_id for postcard_id, (_, friend) in expected.items() if friend == 'friend-0']
+        check(walk_inbox(postcards, limit, with_user='friend-0'), thread_ids, expected)
+        # A page can end between the two copies of a postcard to yourself
+        check(walk_inbox(postcards, 1), list(expected), expected)
+        self_ids = [postcard_id for postcard_id, (_, friend) in expected.items() if friend == USER_ID]
+        check(walk_inbox(postcards, limit, with_user=USER_ID), self_ids, expected)
+
+        def two_calls(i):
+            sent = get(postcards, '/v1/postcards/sent', {'limit': str(limit)})['postcards']
+            received = get(postcards, '/v1/postcards/received', {'limit': str(limit)})['postcards']
+            sorted(sent + received, key=lambda postcard: postcard['sentAt'], reverse=True)[:limit]
+
+        def inbox(i):
+            get(postcards, '/v1/postcards/inbox', {'limit': str(limit)})
+
+        stats.reset()
+        old_samples = harness.timed(two_calls, iterations)
+        old_calls = stats.calls / iterations
+        stats.reset()
+        new_samples = harness.timed(inbox, iterations)
+        new_calls = stats.calls / iterations
+
+    rows = []
+    for label, requests, samples, calls in (('sent + received, client merge', 2, old_samples, old_calls),
+                                            ('inbox', 1, new_samples, new_calls)):
+        summary = harness.summarize(samples)
+        rows.append([label, requests, f'{calls:.1f}', f"{summary['p50']:.2f}", f"{summary['p95']:.2f}"])
+    harness.print_table(['first page', 'API requests', 'DDB calls', 'p50 ms', 'p95 ms'], rows)
+    print('\nAll inbox pages checked: every postcard exactly once, newest first (also with withUser, limit=1 '
+          'and postcards to yourself).')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--postcards', type=int, default=1000)
+    parser.add_argument('--friends', type=int, default=10)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--rtt-ms', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    run(args.postcards, args.friends, args.limit, args.iterations, args.rtt_ms, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Postcard feed page cost: summary projection vs. full items.
+
+Seeds a recipient with postcards carrying realistic messages and
+locations, then reads pages of GET /v1/postcards/received through the
+handler (summary GSI plus ProjectionExpression) and through the old
+path (full items from the ALL-projected recipient-received-index,
+formatted with format_postcard). Reports read capacity and response
+body size per page; the detail read a client makes when opening one
+postcard is reported separately.
+
+Usage:
+    python benchmarks/bench_postcard_feed.py --postcards 500 --limit 20 50 100
+"""
+import argparse
+import json
+import random
+from datetime import datetime, timedelta, timezone
+
+import harness
+
+RECIPIENT_ID = 'user-recipient'
+WORDS = ('sunny', 'beach', 'mountains', 'coffee', 'museum', 'train', 'harbor', 'market',
+         'sunset', 'postcard', 'wish', 'you', 'were', 'here', 'love', 'from', 'the', 'city')
+
+
+def seed(count, rng):
+    """Write count postcards to RECIPIENT_ID from a handful of senders"""
+    postcards_table = harness.table('POSTCARDS_TABLE')
+    postcards = harness.load_handler('postcards')
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    with postcards_table.batch_writer() as batch:
+        for i in range(count):
+            timestamp = (start + timedelta(minutes=i)).isoformat()
+            message = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(40, 120)))
+            location = {'name': 'Lisbon, Portugal', 'latitude': '38.7223', 'longitude': '-9.1393'}
+            batch.put_item(Item=postcards.build_postcard_item(
+                f'sender-{i % 20}', RECIPIENT_ID, f'https://cdn.example.com/postcards/{i}.jpg',
+                message, location, timestamp
+            ))
+    return postcards
+
+
+def legacy_page(postcards_table, postcards, limit):
+    """The old feed read: full items from the ALL-projected GSI"""
+    response = postcards_table.query(
+        IndexName='recipient-received-index',
+        KeyConditionExpression='recipientPK = :recipient_pk',
+        ExpressionAttributeValues={':recipient_pk': f'USER#{RECIPIENT_ID}'},
+        ScanIndexForward=False,
+        Limit=limit
+    )
+    body = {'postcards': [postcards.format_postcard(item) for item in response['Items']]}
+    return len(json.dumps(body, default=str))
+
+
+def run(postcard_count, limits, iterations, seed_value):
+    rows = []
+    with harness.local_aws() as stats:
+        postcards = seed(postcard_count, random.Random(seed_value))
+        postcards_table = harness.table('POSTCARDS_TABLE')
+
+        for limit in limits:
+            sizes = []
+
+            def summary_page(i):
+                event = harness.api_event('GET', '/v1/postcards/received', RECIPIENT_ID,
+                                          resource='/v1/postcards/received', query={'limit': str(limit)})
+                response = postcards.lambda_handler(event, None)
+                assert response['statusCode'] == 200, response
+                sizes.append(len(response['body']))
+
+            stats.reset()
+            new_samples = harness.timed(summary_page, iterations)
+            new_rcu = stats.read_units / iterations
+
+            legacy_sizes = []
+            stats.reset()
+            old_samples = harness.timed(
+                lambda i: legacy_sizes.append(legacy_page(postcards_table, postcards, limit)), iterations)
+            old_rcu = stats.read_units / iterations
+
+            rows.append([
+                limit,
+                f'{old_rcu:.1f}',
+                f'{new_rcu:.1f}',
+                f'{legacy_sizes[0] / 1024:.1f}',
+                f'{sizes[0] / 1024:.1f}',
+                f"{harness.summarize(old_samples)['p50']:.2f}",
+                f"{harness.summarize(new_samples)['p50']:.2f}",
+            ])
+
+        first = postcards_table.query(
+            IndexName='recipient-summary-index',
+            KeyConditionExpression='recipientPK = :recipient_pk',
+            ExpressionAttributeValues={':recipient_pk': f'USER#{RECIPIENT_ID}'},
+            Limit=1
+        )['Items'][0]
+        stats.reset()
+        event = harness.api_event('GET', f"/v1/postcards/{first['postcardId']}", RECIPIENT_ID,
+                                  resource='/v1/postcards/{postcardId}',
+                                  path_parameters={'postcardId': first['postcardId']})
+        detail = postcards.lambda_handler(event, None)
+        assert detail['statusCode'] == 200, detail
+        detail_rcu = stats.read_units
+
+    harness.print_table(
+        ['page size', 'old RCU', 'summary RCU', 'old KiB', 'summary KiB', 'old p50 ms', 'summary p50 ms'],
+        rows
+    )
+    print(f"\nGET /v1/postcards/{{postcardId}} detail read: {detail_rcu:.1f} RCU, "
+          f"{len(detail['body']) / 1024:.1f} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--postcards', type=int, default=500)
+    parser.add_argument('--limit', type=int, nargs='+', default=[20, 50, 100])
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    run(args.postcards, args.limit, args.iterations, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Repeated profile reads with and without the warm-container profile cache.
+
+Seeds a set of users and replays the same skewed stream of
+GET /v1/users/{userId} and GET /v1/users requests through one loaded
+users handler (one warm container), first with the cache disabled and
+then enabled. A few hot accounts take most of the reads, as on a real
+friend feed. Use --rtt-ms to stand in for the DynamoDB round trip that
+a cache hit skips.
+
+Usage:
+    python benchmarks/bench_profile_cache.py --users 1000 --requests 2000 --rtt-ms 3
+"""
+import argparse
+import random
+
+import harness
+
+
+def seed(user_count):
+    """Create user_count users; returns their IDs"""
+    users_table = harness.table('USERS_TABLE')
+    user_ids = [f'user-{i:06d}' for i in range(user_count)]
+    with users_table.batch_writer() as users:
+        for i, user_id in enumerate(user_ids):
+            users.put_item(Item={
+                'userId': user_id,
+                'username': f'user{i}',
+                'email': f'user{i}@example.com',
+                'fullName': f'User {i}',
+                'bio': 'Sends postcards from wherever they happen to be.',
+                'createdAt': '2024-01-01T00:00:00',
+                'postcardsCount': i % 40,
+                'friendsCount': i % 25,
+            })
+    return user_ids
+
+
+def build_requests(user_ids, count, skew, rng):
+    """Requests as (viewer, target) pairs; target None means GET /v1/users"""
+    weights = [1.0 / (rank + 1) ** skew for rank in range(len(user_ids))]
+    viewers = rng.choices(user_ids, weights=weights, k=count)
+    targets = rng.choices(user_ids, weights=weights, k=count)
+    return [(viewer, None if rng.random() < 0.2 else target) for viewer, target in zip(viewers, targets)]
+
+
+def replay(users, requests):
+    def request(i):
+        viewer, target = requests[i]
+        if target is None:
+            event = harness.api_event('GET', '/v1/users', viewer)
+        else:
+            event = harness.api_event('GET', f'/v1/users/{target}', viewer, resource='/v1/users/{userId}',
+                                      path_parameters={'userId': target})
+        response = users.lambda_handler(event, None)
+        assert response['statusCode'] == 200, response
+    return request
+
+
+def run(user_count, request_count, skew, ttl_seconds, rtt_ms, seed_value):
+    rng = random.Random(seed_value)
+    with harness.local_aws(rtt_ms=rtt_ms) as stats:
+        user_ids = seed(user_count)
+        users = harness.load_handler('users')
+        requests = build_requests(user_ids, request_count, skew, rng)
+        cache = users.profile_cache
+        max_size = cache.max_size
+        rows = []
+
+        for label, size in (('disabled', 0), ('enabled', max_size)):
+            cache.clear()
+            cache.max_size = size
+            cache.ttl_seconds = ttl_seconds
+            stats.reset()
+            summary = harness.summarize(harness.timed(replay(users, requests), request_count))
+            cache_stats = cache.stats()
+            rows.append([
+                label,
+                f"{summary['p50']:.3f}",
+                f"{summary['p95']:.3f}",
+                f"{summary['p99']:.3f}",
+                f"{stats.calls / request_count:.2f}",
+                f"{cache_stats['hitRate']:.1%}" if size else '-',
+            ])
+
+    harness.print_table(['cache', 'p50 ms', 'p95 ms', 'p99 ms', 'DDB calls/req', 'hit rate'], rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent for picking users')
+    parser.add_argument('--ttl-seconds', type=float, default=30.0)
+    parser.add_argument('--rtt-ms', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    run(args.users, args.requests, args.skew, args.ttl_seconds, args.rtt_ms, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Friend screen cost: expand=profiles vs. one profile fetch per friend.
+
+Seeds a user with N accepted friends and loads a friend screen two ways:
+GET /v1/friends followed by GET /v1/users/{userId} for every friend (what
+clients did before), and a single GET /v1/friends?expand=profiles. Each
+handler call stands in for an API Gateway request and Lambda invocation.
+
+Usage:
+    python benchmarks/bench_profile_expansion.py --friends 10 50 100 --rtt-ms 2
+"""
+import argparse
+from datetime import datetime, timedelta
+
+import harness
+from postii_common.friendships import pair_key, status_sort_key, STATUS_ACCEPTED
+
+USER_ID = 'user-viewer'
+
+
+def seed(friend_count):
+    """Create the viewer, friend_count friends and their friendships"""
+    users_table = harness.table('USERS_TABLE')
+    friendships_table = harness.table('FRIENDSHIPS_TABLE')
+    start = datetime(2024, 1, 1)
+
+    with users_table.batch_writer() as users, friendships_table.batch_writer() as friendships:
+        users.put_item(Item={'userId': USER_ID, 'username': 'viewer', 'email': 'viewer@example.com'})
+        for i in range(friend_count):
+            friend_id = f'friend-{i:06d}'
+            created_at = (start + timedelta(minutes=i)).isoformat()
+            users.put_item(Item={
+                'userId': friend_id,
+                'username': f'friend{i}',
+                'email': f'friend{i}@example.com',
+                'fullName': f'Friend {i}',
+                'bio': 'Collects postcards from everywhere.',
+                'createdAt': created_at,
+            })
+            friendships.put_item(Item={
+                'friendshipId': pair_key(USER_ID, friend_id),
+                'requesterId': USER_ID,
+                'addresseeId': friend_id,
+                'status': STATUS_ACCEPTED,
+                'statusSK': status_sort_key(STATUS_ACCEPTED, created_at),
+                'createdAt': created_at,
+                'updatedAt': created_at,
+            })
+
+
+def run(friend_counts, iterations, rtt_ms):
+    rows = []
+    for friend_count in friend_counts:
+        with harness.local_aws(rtt_ms=rtt_ms) as stats:
+            seed(friend_count)
+            friends = harness.load_handler('friends')
+            users = harness.load_handler('users')
+            invocations = {'n_plus_one': 0, 'expanded': 0}
+
+            def n_plus_one(i):
+                response = friends.lambda_handler(
+                    harness.api_event('GET', '/v1/friends', USER_ID, query={'limit': '100'}), None)
+                invocations['n_plus_one'] += 1
+                for entry in harness.json_body(response)['friends']:
+                    event = harness.api_event('GET', f"/v1/users/{entry['friendId']}", USER_ID,
+                                              resource='/v1/users/{userId}',
+                                              path_parameters={'userId': entry['friendId']})
+                    assert users.lambda_handler(event, None)['statusCode'] == 200
+                    invocations['n_plus_one'] += 1
+
+            def expanded(i):
+                event = harness.api_event('GET', '/v1/friends', USER_ID,
+                                          query={'limit': '100', 'expand': 'profiles'})
+                response = friends.lambda_handler(event, None)
+                invocations['expanded'] += 1
+                assert len(harness.json_body(response)['profiles']) == min(friend_count, 100)
+
+            stats.reset()
+            old_samples = harness.timed(n_plus_one, iterations)
+            old_stats = stats.snapshot()
+
+            stats.reset()
+            new_samples = harness.timed(expanded, iterations)
+            new_stats = stats.snapshot()
+
+        old_summary = harness.summarize(old_samples)
+        new_summary = harness.summarize(new_samples)
+        rows.append([
+            friend_count,
+            f"{invocations['n_plus_one'] / iterations:.0f}",
+            f"{old_stats['calls'] / iterations:.1f}",
+            f"{old_summary['p50']:.2f}",
+            f"{invocations['expanded'] / iterations:.0f}",
+            f"{new_stats['calls'] / iterations:.1f}",
+            f"{new_summary['p50']:.2f}",
+        ])
+
+    harness.print_table(
+        ['friends', 'N+1 requests', 'N+1 DDB calls', 'N+1 p50 ms',
+         'expand requests', 'expand DDB calls', 'expand p50 ms'],
+        rows
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--friends', type=int, nargs='+', default=[10, 50, 100])
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--rtt-ms', type=float, default=0.0)
+    args = parser.parse_args()
+    run(args.friends, args.iterations, args.rtt_ms)
+
+
+if __name__ == '__main__':
+    main()
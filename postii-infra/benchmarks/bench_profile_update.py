@@ -0,0 +1,126 @@
+"""
+Profile edit latency before and after dropping the read-after-write.
+
+Replays PUT /v1/users edits through the users handler and through the
+old call sequence (GetItem, username-index query on renames, UpdateItem,
+GetItem again, search index sync), for plain field edits and for
+username changes. Run with --rtt-ms to see what the saved round trips
+are worth on a real network.
+
+Usage:
+    python benchmarks/bench_profile_update.py --rtt-ms 3
+"""
+import argparse
+from datetime import datetime, timezone
+
+import harness
+from postii_common import reservations, search_index
+
+USER_COUNT = 50
+
+
+def seed():
+    """Create USER_COUNT users with their username reservations"""
+    users_table = harness.table('USERS_TABLE')
+    with users_table.batch_writer() as users:
+        for i in range(USER_COUNT):
+            user_id = f'user-{i:04d}'
+            users.put_item(Item={
+                'userId': user_id,
+                'username': f'user{i}',
+                'email': f'user{i}@example.com',
+                'fullName': f'User {i}',
+                'bio': '',
+                'createdAt': '2024-01-01T00:00:00',
+                'postcardsCount': 0,
+                'friendsCount': 0,
+            })
+            users.put_item(Item={**reservations.username_key(f'user{i}'), 'ownerId': user_id})
+
+
+def legacy_update(users_table, index_table, user_id, fields):
+    """The old update_user_profile call sequence, including the search index sync"""
+    current_user = users_table.get_item(Key={'userId': user_id})['Item']
+    if 'username' in fields and fields['username'] != current_user.get('username'):
+        users_table.query(
+            IndexName='username-index',
+            KeyConditionExpression='username = :username',
+            ExpressionAttributeValues={':username': fields['username']}
+        )
+    update_expression = 'SET updatedAt = :updated_at'
+    values = {':updated_at': datetime.now(timezone.utc).isoformat()}
+    for field, value in fields.items():
+        update_expression += f', {field} = :{field}'
+        values[f':{field}'] = value
+    users_table.update_item(Key={'userId': user_id}, UpdateExpression=update_expression,
+                            ExpressionAttributeValues=values)
+    updated_user = users_table.get_item(Key={'userId': user_id})['Item']
+    search_index.sync_user(index_table, current_user, updated_user)
+
+
+def edits(kind, iterations):
+    """(userId, fields) per iteration; renames give every user a fresh name"""
+    result = []
+    for i in range(iterations):
+        user_id = f'user-{i % USER_COUNT:04d}'
+        if kind == 'bio':
+            result.append((user_id, {'bio': f'Edit number {i}'}))
+        else:
+            result.append((user_id, {'username': f'renamed{i}'}))
+    return result
+
+
+def run(iterations, rtt_ms):
+    rows = []
+    for kind in ('bio', 'username'):
+        with harness.local_aws(rtt_ms=rtt_ms) as stats:
+            seed()
+            users = harness.load_handler('users')
+            requests = edits(kind, iterations)
+
+            def handler_update(i):
+                user_id, fields = requests[i]
+                response = users.lambda_handler(harness.api_event('PUT', '/v1/users', user_id, body=fields), None)
+                assert response['statusCode'] == 200, response
+
+            stats.reset()
+            new_samples = harness.timed(handler_update, iterations)
+            new_calls = stats.calls / iterations
+
+        with harness.local_aws(rtt_ms=rtt_ms) as stats:
+            seed()
+            users_table = harness.table('USERS_TABLE')
+            index_table = harness.table('SEARCH_INDEX_TABLE')
+            requests = edits(kind, iterations)
+            stats.reset()
+            old_samples = harness.timed(lambda i: legacy_update(users_table, index_table, *requests[i]), iterations)
+            old_calls = stats.calls / iterations
+
+        old_summary = harness.summarize(old_samples)
+        new_summary = harness.summarize(new_samples)
+        rows.append([
+            kind,
+            f'{old_calls:.1f}',
+            f"{old_summary['p50']:.2f}",
+            f"{old_summary['p95']:.2f}",
+            f'{new_calls:.1f}',
+            f"{new_summary['p50']:.2f}",
+            f"{new_summary['p95']:.2f}",
+        ])
+
+    harness.print_table(
+        ['edit', 'old calls', 'old p50 ms', 'old p95 ms', 'new calls', 'new p50 ms', 'new p95 ms'],
+        rows
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--rtt-ms', type=float, default=0.0)
+    args = parser.parse_args()
+    run(args.iterations, args.rtt_ms)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+"""
+Per-user token buckets: overhead on allowed requests, and abuse.
+
+Overhead: --iterations friend searches and postcard sends spread over
+--users users (a few requests each, never limited), with
+- off: RATE_LIMITS_TABLE unset
+- no local state: a fresh TokenBuckets per request and no leases, so
+  every request does the conditional UpdateItem (two when the bucket
+  exists and the container hasn't seen it)
+- warm: one TokenBuckets per container, as deployed; leases from
+  well-stocked buckets cover most requests
+Reports p50/p95 and DynamoDB calls per request, in total and to the
+RateLimits table.
+
+Abuse: one user searches as fast as it can for --seconds, round robin
+over --containers containers (TokenBuckets instances) sharing the
+bucket. Reports requests, allowed and 429s, limiter calls per request,
+and checks that allowed never exceeds capacity + rate * elapsed and
+that every 429 carries a Retry-After.
+
+Batch burst: one user sends --batch-recipients-recipient batch sends
+as fast as it can for --seconds. A send costs a token per recipient, so
+the postcards written (not just the requests allowed) must stay within
+capacity + rate * elapsed, and the first full batch leaves too few
+tokens for even a single send.
+
+Replays: a postcard send and a friend request made with an
+Idempotency-Key are retried after the user has emptied the route's
+bucket; the retries must get the stored response, not a 429.
+
+Usage:
+    python benchmarks/bench_rate_limit.py --iterations 500 --users 100 --seconds 3 --containers 4 \
+        --batch-recipients 100 --rtt-ms 2
+"""
+import argparse
+import os
+import time
+import uuid
+
+import harness
+from postii_common import idempotency, rate_limits
+
+# Not in harness.TABLES: other benchmarks send far more than a user may
+RATE_LIMITS_TABLE = {
+    'TableName': 'postii-rate-limits-bench',
+    'KeySchema': [{'AttributeName': 'bucketKey', 'KeyType': 'HASH'}],
+}
+MESSAGE = 'Wish you were here!'
+
+
+def seed(stats, count):
+    users = [f'user-{i:04d}' for i in range(count)]
+    harness.load(stats, 'USERS_TABLE', [
+        {'userId': user_id, 'username': user_id.replace('-', ''), 'email': f'{user_id}@example.com'}
+        for user_id in users
+    ])
+    return users, {user_id: harness.upload_image(stats, user_id) for user_id in users}
+
+
+def enable(stats):
+    stats.create_table(RATE_LIMITS_TABLE)
+    os.environ['RATE_LIMITS_TABLE'] = RATE_LIMITS_TABLE['TableName']
+
+
+def search_event(user_id, i):
+    return harness.api_event('GET', '/v1/friends/search', user_id, query={'q': f'user{i % 100:02d}', 'limit': '20'})
+
+
+def send_event(users, images, i):
+    sender = users[i % len(users)]
+    return harness.api_event('POST', '/v1/postcards', sender, body={
+        'recipientId': users[(i + 1) % len(users)], 'imageKey': images[sender], 'message': MESSAGE})
+
+
+def measure(stats, handler, make_event, iterations, fresh_limiter):
+    """Latency summary, DynamoDB calls and limiter calls per request"""
+    def request(i):
+        if fresh_limiter:
+            handler.rate_limiter = rate_limits.TokenBuckets()
+        response = handler.lambda_handler(make_event(i), None)
+        assert response['statusCode'] == 200, response
+
+    stats.reset()
+    samples = harness.timed(request, iterations)
+    limiter_calls = stats.by_table.get(RATE_LIMITS_TABLE['TableName'], 0)
+    return harness.summarize(samples), stats.calls / iterations, limiter_calls / iterations
+
+
+def overhead(args):
+    rows = []
+    saved_lease_tokens = rate_limits.LEASE_TOKENS
+    for label in ('off', 'no local state', 'warm'):
+        with harness.local_aws(rtt_ms=args.rtt_ms) as stats:
+            users, images = seed(stats, args.users)
+            if label != 'off':
+                enable(stats)
+            fresh = label == 'no local state'
+            rate_limits.LEASE_TOKENS = 1 if fresh else saved_lease_tokens
+            try:
+                friends, postcards = harness.load_handler('friends'), harness.load_handler('postcards')
+                for route, handler, make_event in (
+                        ('search', friends, lambda i: search_event(users[i % len(users)], i)),
+                        ('send', postcards, lambda i: send_event(users, images, i))):
+                    summary, calls, limiter_calls = measure(stats, handler, make_event, args.iterations, fresh)
+                    rows.append([route, label, f"{summary['p50']:.2f}", f"{summary['p95']:.2f}",
+                                 f'{calls:.2f}', f'{limiter_calls:.2f}'])
+            finally:
+                rate_limits.LEASE_TOKENS = saved_lease_tokens
+    rows.sort(key=lambda row: row[0], reverse=True)
+    return rows
+
+
+def abuse(args):
+    capacity, rate = rate_limits.ROUTE_LIMITS['search-friends']
+    rows = []
+    for label in ('off', 'limited'):
+        with harness.local_aws(rtt_ms=args.rtt_ms) as stats:
+            users, _ = seed(stats, 2)
+            if label == 'limited':
+                enable(stats)
+            friends = harness.load_handler('friends')
+            containers = [rate_limits.TokenBuckets() for _ in range(args.containers)]
+
+            statuses = {}
+            stats.reset()
+            start = time.time()
+            i = 0
+            while time.time() - start < args.seconds:
+                friends.rate_limiter = containers[i % len(containers)]
+                response = friends.lambda_handler(search_event(users[0], i), None)
+                status = response['statusCode']
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 429:
+                    assert int(response['headers']['Retry-After']) >= 1, response
+                else:
+                    assert status == 200, response
+                i += 1
+            elapsed = time.time() - start
+
+            allowed = statuses.get(200, 0)
+            if label == 'limited':
+                bound = capacity + rate * elapsed
+                assert allowed <= bound, (allowed, bound)
+            limiter_calls = stats.by_table.get(RATE_LIMITS_TABLE['TableName'], 0)
+            rows.append([label, f'{i}', f'{allowed}', f'{statuses.get(429, 0)}',
+                         f'{capacity + rate * elapsed:.0f}' if label == 'limited' else '-',
+                         f'{limiter_calls / i:.3f}', f'{stats.calls / elapsed:,.0f}'])
+    return rows
+
+
+def batch_burst(args):
+    """Batch sends back to back: requests, 429s and postcards written, off and limited"""
+    capacity, rate = rate_limits.ROUTE_LIMITS['send-postcard']
+    rows = []
+    for label in ('off', 'limited'):
+        with harness.local_aws(rtt_ms=args.rtt_ms) as stats:
+            users, images = seed(stats, args.batch_recipients + 1)
+            if label == 'limited':
+                enable(stats)
+            postcards = harness.load_handler('postcards')
+            sender, recipients = users[0], users[1:]
+
+            def send(body):
+                return postcards.lambda_handler(harness.api_event('POST', '/v1/postcards', sender, body={
+                    'imageKey': images[sender], 'message': MESSAGE, **body}), None)
+
+            statuses, written = {}, 0
+            start = time.time()
+            requests = 0
+            while time.time() - start < args.seconds:
+                response = send({'recipientIds': recipients})
+                status = response['statusCode']
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    written += harness.json_body(response)['sentCount']
+                else:
+                    assert status == 429, response
+                requests += 1
+            elapsed = time.time() - start
+
+            if label == 'limited':
+                bound = capacity + rate * elapsed
+                assert written <= bound, (written, bound)
+                # The first batch took the bucket below a single send
+                single = send({'recipientId': recipients[0]})
+                assert single['statusCode'] == 429, single
+            rows.append([label, f'{requests}', f'{statuses.get(200, 0)}', f'{statuses.get(429, 0)}', f'{written}',
+                         f'{capacity + rate * elapsed:.0f}' if label == 'limited' else '-'])
+    return rows
+
+
+def check_replays(rtt_ms):
+    """Keyed retries get their stored response even once the bucket is empty"""
+    with harness.local_aws(rtt_ms=rtt_ms) as stats:
+        capacity = max(rate_limits.ROUTE_LIMITS[route][0] for route in ('send-postcard', 'send-friend-request'))
+        users, images = seed(stats, capacity + 2)
+        enable(stats)
+        friends, postcards = harness.load_handler('friends'), harness.load_handler('postcards')
+        sender = users[0]
+
+        def request_event(i, key=None):
+            return harness.api_event('POST', '/v1/friends/send-request', sender,
+                                     body={'username': users[i + 1].replace('-', '')},
+                                     headers={idempotency.HEADER: key} if key else None)
+
+        for handler, make_event in (
+                (postcards, lambda i, key=None: harness.api_event('POST', '/v1/postcards', sender, body={
+                    'recipientId': users[1], 'imageKey': images[sender], 'message': f'{MESSAGE} {i}'},
+                    headers={idempotency.HEADER: key} if key else None)),
+                (friends, request_event)):
+            key = str(uuid.uuid4())
+            first = handler.lambda_handler(make_event(0, key), None)
+            assert first['statusCode'] in (200, 201), first
+            i = 1
+            while handler.lambda_handler(make_event(i), None)['statusCode'] != 429:
+                i += 1
+                assert i <= capacity + 1, 'bucket never ran out'
+            for _ in range(3):
+                replayed = handler.lambda_handler(make_event(0, key), None)
+                assert replayed['statusCode'] == first['statusCode'], replayed
+                assert replayed['headers'].get(idempotency.REPLAYED_HEADER) == 'true', replayed
+                assert replayed['body'] == first['body']
+
+
+def run(args):
+    print(f'Allowed requests ({args.iterations} per route over {args.users} users)')
+    harness.print_table(['route', 'limiter', 'p50 ms', 'p95 ms', 'DynamoDB calls/request', 'limiter calls/request'],
+                        overhead(args))
+
+    capacity, rate = rate_limits.ROUTE_LIMITS['search-friends']
+    print(f'\nOne user searching for {args.seconds:g}s over {args.containers} containers '
+          f'(bucket of {capacity}, {rate:g}/s)')
+    harness.print_table(['limiter', 'requests', 'allowed', '429s', 'allowed at most', 'limiter calls/request',
+                         'DynamoDB calls/s'], abuse(args))
+
+    print(f'\nOne user sending {args.batch_recipients}-recipient batches for {args.seconds:g}s '
+          f'(bucket of {rate_limits.ROUTE_LIMITS["send-postcard"][0]} postcards)')
+    harness.print_table(['limiter', 'requests', 'allowed', '429s', 'postcards written', 'postcards at most'],
+                        batch_burst(args))
+
+    check_replays(args.rtt_ms)
+    print('\nChecked: retries with an Idempotency-Key get the stored response after the bucket ran out.')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--containers', type=int, default=4)
+    parser.add_argument('--batch-recipients', type=int, default=100)
+    parser.add_argument('--rtt-ms', type=float, default=2.0)
+    args = parser.parse_args()
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
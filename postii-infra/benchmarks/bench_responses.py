@@ -0,0 +1,114 @@
+"""
+Response building cost for 100-postcard pages.
+
+Builds the proxy response for a page of full postcards (as the resource
+API returns them, with Decimal coordinates) and a page of feed
+summaries, three ways: the per-lambda helpers this replaced (headers
+dict literal, json.dumps with default=str), postii_common.responses on
+the stdlib encoder, and postii_common.responses with orjson (skipped
+if orjson isn't installed). Reports time and body size per response.
+
+Usage:
+    python benchmarks/bench_responses.py --postcards 100 --iterations 5000
+"""
+import argparse
+import importlib.util
+import json
+import sys
+from decimal import Decimal
+
+import harness
+
+
+def legacy_response(status_code, body):
+    """The helper each lambda used to carry"""
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
+            'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+        },
+        'body': json.dumps(body, default=str)
+    }
+
+
+def load_responses(with_orjson):
+    """A private copy of postii_common.responses, with or without orjson"""
+    saved = sys.modules.get('orjson')
+    if not with_orjson:
+        # A None entry makes `import orjson` raise ImportError
+        sys.modules['orjson'] = None
+    try:
+        spec = importlib.util.find_spec('postii_common.responses')
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        if saved is None:
+            sys.modules.pop('orjson', None)
+        else:
+            sys.modules['orjson'] = saved
+    return module
+
+
+def pages(count):
+    full, summaries = [], []
+    for i in range(count):
+        summary = {
+            'postcardId': f'{i:08x}-2f1c-4c3e-9a57-4d1f0e6b{i:04x}',
+            'senderId': f'user-{i % 40:07d}',
+            'recipientId': 'user-0000001',
+            'imageUrl': f'https://cdn.example.com/postcards/{i}.jpg',
+            'sentAt': f'2024-03-{i % 28 + 1:02d}T12:00:00+00:00',
+            'status': 'sent',
+        }
+        summaries.append(summary)
+        full.append({
+            **summary,
+            'message': 'Greetings from Lisbon! The trams, the tiles, the custard tarts. ' * 4,
+            'location': {'name': 'Lisboa, Portugal', 'latitude': Decimal('38.7223'), 'longitude': Decimal('-9.1393')},
+            'createdAt': summary['sentAt'],
+            'updatedAt': summary['sentAt'],
+        })
+    return {
+        'full postcards': {'postcards': full, 'count': count},
+        'feed summaries': {'postcards': summaries, 'count': count, 'lastKey': 'x' * 60},
+    }
+
+
+def run(count, iterations):
+    builders = {'per-lambda helper': legacy_response}
+    stdlib = load_responses(with_orjson=False)
+    builders[f'responses ({stdlib.ENCODER})'] = stdlib.json_response
+    fast = load_responses(with_orjson=True)
+    if fast.ENCODER == 'orjson':
+        builders['responses (orjson)'] = fast.json_response
+    else:
+        print('orjson is not installed; only the stdlib fallback is measured\n')
+
+    rows = []
+    for page_name, body in pages(count).items():
+        for builder_name, build in builders.items():
+            response = build(200, body)
+            samples = harness.timed(lambda i: build(200, body), iterations)
+            rows.append([
+                page_name,
+                builder_name,
+                f"{harness.summarize(samples)['mean'] * 1000:.0f}",
+                f"{len(response['body'].encode()) / 1024:.1f}",
+            ])
+
+    harness.print_table([f'{count}-postcard page', 'builder', 'us/response', 'body KiB'], rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--postcards', type=int, default=100)
+    parser.add_argument('--iterations', type=int, default=5000)
+    args = parser.parse_args()
+    run(args.postcards, args.iterations)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Signup cost and duplicate usernames under concurrent signups.
+
+Latency: POST /v1/users through the users handler (one transactional
+write) vs. the old sequence of GetItem, username-index query,
+email-index query and PutItem. The old sequence then wrote the user's
+search index rows inline; the handler leaves them to the streams
+handler, off the request path.
+
+Races: --racers threads sign up at the same moment with the same
+username, --rounds times. The old check-then-write sequence lets
+several of them through whenever their checks overlap; the reservation
+transaction admits exactly one per round. Needs --rtt-ms > 0 for the
+old sequence's window to be realistic.
+
+Usage:
+    python benchmarks/bench_signup.py --rtt-ms 3 --racers 8 --rounds 20
+"""
+import argparse
+import threading
+import uuid
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+import harness
+from postii_common import search_index
+
+
+def legacy_signup(users_table, index_table, user_id, username, email):
+    """The old create_user_profile call sequence; False if a check rejected it"""
+    if 'Item' in users_table.get_item(Key={'userId': user_id}):
+        return False
+    for index_name, field, value in (('username-index', 'username', username), ('email-index', 'email', email)):
+        response = users_table.query(
+            IndexName=index_name,
+            KeyConditionExpression=f'{field} = :value',
+            ExpressionAttributeValues={':value': value}
+        )
+        if response.get('Items'):
+            return False
+    current_time = datetime.now(timezone.utc).isoformat()
+    user_item = {
+        'userId': user_id,
+        'username': username,
+        'email': email,
+        'createdAt': current_time,
+        'updatedAt': current_time,
+    }
+    users_table.put_item(Item=user_item)
+    search_index.sync_user(index_table, None, user_item)
+    return True
+
+
+def handler_signup(users, user_id, username, email):
+    """Sign up through the users handler; False on a 409"""
+    event = harness.api_event('POST', '/v1/users', user_id, body={'username': username, 'email': email})
+    status = users.lambda_handler(event, None)['statusCode']
+    assert status in (200, 409), status
+    return status == 200
+
+
+def race(signup, racers, rounds):
+    """Run rounds of simultaneous same-username signups; returns winners per round"""
+    winners = []
+    for round_number in range(rounds):
+        barrier = threading.Barrier(racers)
+        results = []
+
+        def racer(i):
+            barrier.wait()
+            try:
+                results.append(signup(f'racer-{uuid.uuid4()}', f'taken{round_number}', f'r{round_number}-{i}@example.com'))
+            except ClientError:
+                results.append(False)
+
+        threads = [threading.Thread(target=racer, args=(i,)) for i in range(racers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        winners.append(sum(results))
+    return winners
+
+
+def run(iterations, racers, rounds, rtt_ms):
+    with harness.local_aws(rtt_ms=rtt_ms) as stats:
+        users = harness.load_handler('users')
+        stats.reset()
+        new_samples = harness.timed(
+            lambda i: handler_signup(users, f'new-{i}', f'newuser{i}', f'new{i}@example.com'), iterations)
+        new_calls = stats.calls / iterations
+        new_winners = race(lambda *args: handler_signup(users, *args), racers, rounds)
+
+    with harness.local_aws(rtt_ms=rtt_ms) as stats:
+        users_table = harness.table('USERS_TABLE')
+        index_table = harness.table('SEARCH_INDEX_TABLE')
+        stats.reset()
+        old_samples = harness.timed(
+            lambda i: legacy_signup(users_table, index_table, f'old-{i}', f'olduser{i}', f'old{i}@example.com'), iterations)
+        old_calls = stats.calls / iterations
+        old_winners = race(lambda *args: legacy_signup(users_table, index_table, *args), racers, rounds)
+
+    rows = []
+    for label, samples, calls, winners in (('old', old_samples, old_calls, old_winners),
+                                           ('new', new_samples, new_calls, new_winners)):
+        summary = harness.summarize(samples)
+        rows.append([
+            label,
+            f'{calls:.1f}',
+            f"{summary['p50']:.2f}",
+            f"{summary['p95']:.2f}",
+            sum(1 for count in winners if count > 1),
+            sum(count - 1 for count in winners if count > 1),
+        ])
+
+    harness.print_table(
+        ['create', 'calls', 'p50 ms', 'p95 ms', f'rounds with dupes (of {rounds})', 'duplicate accounts'],
+        rows
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--racers', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--rtt-ms', type=float, default=3.0)
+    args = parser.parse_args()
+    run(args.iterations, args.racers, args.rounds, args.rtt_ms)
+
+
+if __name__ == '__main__':
+    main()
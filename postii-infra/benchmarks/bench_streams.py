@@ -0,0 +1,342 @@
+"""
+Side effects from DynamoDB Streams instead of the request path.
+
+Write path: POST /v1/postcards and POST /v1/friends/accept-request
+through the handlers (one PutItem / UpdateItem each) against the
+transactions they used to run inline (the write plus one or two profile
+counter ADDs), by calls and write units.
+
+Processor: --senders users send --postcards postcards (half as batch
+sends of --batch-recipients, half one at a time) and make and accept
+--friendships friend requests. The table streams (see LocalDynamoDB)
+are then fed to the streams handler --batch-size records at a time.
+Reports records/s and the transactions, SNS calls and DynamoDB calls
+per record, and checks that every counter matches and every
+notification went out once.
+
+Then the same records are delivered again (nothing changes, nothing is
+re-sent) and the run is repeated with LocalSNS failing --fail-rate of
+publishes: the failed records come back as batchItemFailures, are
+redelivered from the first of them, and still end up applied once with
+their notification published.
+
+Last, legacy friendship rows are re-keyed by
+scripts/migrate_friendship_keys.py and its stream records processed:
+the alias items and migrated copies it writes change no counter and
+send no notification.
+
+Usage:
+    python benchmarks/bench_streams.py --postcards 1000 --friendships 200 --batch-size 100 --rtt-ms 2
+"""
+import argparse
+import collections
+import copy
+import importlib.util
+import json
+import os
+import random
+import time
+
+import harness
+from postii_common import counters
+from postii_common.friendships import pair_key, status_sort_key
+
+MESSAGE = 'Wish you were here!'
+
+
+def seed(stats, senders):
+    users = [f'user-{i:04d}' for i in range(senders)]
+    harness.load(stats, 'USERS_TABLE', [
+        {'userId': user_id, 'username': user_id.replace('-', ''), 'email': f'{user_id}@example.com',
+         'fullName': f'User {user_id[-4:]}', 'postcardsCount': 0, 'friendsCount': 0}
+        for user_id in users
+    ])
+    return users, {user_id: harness.upload_image(stats, user_id) for user_id in users}
+
+
+def call(handler, event, status=200):
+    response = handler.lambda_handler(event, None)
+    assert response['statusCode'] == status, response
+    return harness.json_body(response)
+
+
+def write(stats, users, images, postcards, friends, postcard_total, batch_recipients, friendship_total, seed_value):
+    """Drive the API; returns (expected postcardsCount, expected friendsCount, expected notifications)"""
+    rng = random.Random(seed_value)
+    sent = collections.Counter()
+    friends_count = collections.Counter()
+    notifications = collections.Counter()
+
+    remaining = postcard_total
+    while remaining:
+        sender = rng.choice(users)
+        others = [user for user in users if user != sender]
+        if remaining > postcard_total // 2 and remaining >= batch_recipients:
+            recipients = rng.sample(others, min(batch_recipients, len(others)))
+            body = call(postcards, harness.api_event('POST', '/v1/postcards', sender, body={
+                'recipientIds': recipients, 'imageKey': images[sender], 'message': MESSAGE}))
+            assert body['sentCount'] == len(recipients), body
+        else:
+            recipients = [rng.choice(others)]
+            call(postcards, harness.api_event('POST', '/v1/postcards', sender, body={
+                'recipientId': recipients[0], 'imageKey': images[sender], 'message': MESSAGE}))
+        sent[sender] += len(recipients)
+        notifications['postcard_received'] += len(recipients)
+        remaining -= len(recipients)
+
+    pairs = set()
+    while len(pairs) < friendship_total:
+        requester, addressee = rng.sample(users, 2)
+        if frozenset((requester, addressee)) in pairs:
+            continue
+        pairs.add(frozenset((requester, addressee)))
+        body = call(friends, harness.api_event('POST', '/v1/friends/send-request', requester,
+                                               body={'username': addressee.replace('-', '')}), 201)
+        call(friends, harness.api_event('POST', '/v1/friends/accept-request', addressee,
+                                        body={'friendshipId': body['friendshipId']}))
+        friends_count[requester] += 1
+        friends_count[addressee] += 1
+        notifications['friend_request'] += 1
+        notifications['friend_accepted'] += 1
+    return sent, friends_count, notifications
+
+
+def read_all(stats):
+    """Every unread stream record, per table"""
+    return {env_name: harness.read_stream(stats, env_name)
+            for env_name, spec in harness.TABLES.items() if spec.get('StreamSpecification')}
+
+
+def process(streams, records, batch_size):
+    """Deliver records once, batch_size at a time; returns (seconds, failed sequence numbers)"""
+    failed = []
+    start = time.perf_counter()
+    for position in range(0, len(records), batch_size):
+        batch = copy.deepcopy(records[position:position + batch_size])
+        result = streams.lambda_handler({'Records': batch}, None)
+        failed.extend(failure['itemIdentifier'] for failure in result['batchItemFailures'])
+    return time.perf_counter() - start, failed
+
+
+def check(stats, users, sent, friends_count, notifications):
+    """Counters match, and each notification was published exactly once"""
+    users_table = harness.table('USERS_TABLE')
+    for user_id in users:
+        item = users_table.get_item(Key={'userId': user_id})['Item']
+        assert item[counters.POSTCARDS_COUNT] == sent[user_id], (user_id, item, sent[user_id])
+        assert item[counters.FRIENDS_COUNT] == friends_count[user_id], (user_id, item, friends_count[user_id])
+
+    messages = [json.loads(entry['Message']) for entry in stats.sns.published]
+    by_type = collections.Counter(message['type'] for message in messages)
+    assert by_type == notifications, (by_type, notifications)
+    identities = [(message['type'], message.get('postcardId') or message.get('friendshipId')) for message in messages]
+    assert len(identities) == len(set(identities)), 'a notification was published twice'
+    assert all(message['actor'].get('username') for message in messages), 'actor profile missing'
+
+
+def legacy_writes(stats, users, images, iterations):
+    """Calls and write units of the old inline transactions, on the tables directly"""
+    postcards_table = harness.table('POSTCARDS_TABLE')
+    users_table_name = harness.TABLES['USERS_TABLE']['TableName']
+    client = postcards_table.meta.client
+
+    def send(i):
+        sender = users[i % len(users)]
+        client.transact_write_items(TransactItems=[
+            {'Put': {'TableName': postcards_table.name, 'Item': {
+                'postcardId': f'legacy-{i}', 'senderId': sender, 'recipientId': users[(i + 1) % len(users)],
+                'imageKey': images[sender], 'message': MESSAGE},
+                'ConditionExpression': 'attribute_not_exists(postcardId)'}},
+            counters.increment(users_table_name, sender, counters.POSTCARDS_COUNT),
+        ])
+
+    def accept(i):
+        requester, addressee = users[i % len(users)], users[(i + 1) % len(users)]
+        client.transact_write_items(TransactItems=[
+            {'Update': {'TableName': harness.TABLES['FRIENDSHIPS_TABLE']['TableName'],
+                        'Key': {'friendshipId': f'legacy-{i}'},
+                        'UpdateExpression': 'SET #status = :status',
+                        'ExpressionAttributeNames': {'#status': 'status'},
+                        'ExpressionAttributeValues': {':status': 'accepted'}}},
+            counters.increment(users_table_name, requester, counters.FRIENDS_COUNT),
+            counters.increment(users_table_name, addressee, counters.FRIENDS_COUNT),
+        ])
+
+    rows = {}
+    for name, fn in (('send', send), ('accept', accept)):
+        stats.reset()
+        harness.timed(fn, iterations)
+        rows[name] = (stats.calls / iterations, stats.write_units / iterations)
+    return rows
+
+
+def handler_writes(stats, users, images, postcards, friends, iterations):
+    """Write calls and write units of the handlers' single writes"""
+    rows = {}
+
+    def send(i):
+        sender = users[i % len(users)]
+        call(postcards, harness.api_event('POST', '/v1/postcards', sender, body={
+            'recipientId': users[(i + 1) % len(users)], 'imageKey': images[sender], 'message': MESSAGE}))
+
+    stats.reset()
+    harness.timed(send, iterations)
+    rows['send'] = (stats.by_operation.get('PutItem', 0) / iterations, stats.write_units / iterations)
+
+    # Pending requests to accept, made outside the measurement
+    friendship_ids = []
+    for i in range(iterations):
+        requester, addressee = users[i % len(users)], users[(i + 7) % len(users)]
+        body = call(friends, harness.api_event('POST', '/v1/friends/send-request', requester,
+                                               body={'username': addressee.replace('-', '')}), 201)
+        friendship_ids.append((addressee, body['friendshipId']))
+
+    def accept(i):
+        addressee, friendship_id = friendship_ids[i]
+        call(friends, harness.api_event('POST', '/v1/friends/accept-request', addressee,
+                                        body={'friendshipId': friendship_id}))
+
+    stats.reset()
+    harness.timed(accept, iterations)
+    rows['accept'] = (stats.by_operation.get('UpdateItem', 0) / iterations, stats.write_units / iterations)
+    return rows
+
+
+def load_migration():
+    """scripts/migrate_friendship_keys.py as a module"""
+    path = os.path.join(harness.INFRA_ROOT, 'scripts', 'migrate_friendship_keys.py')
+    spec = importlib.util.spec_from_file_location('migrate_friendship_keys', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def check_migration(rtt_ms):
+    """Re-keying legacy rows streams INSERTs and alias writes that must have no effect"""
+    with harness.local_aws(rtt_ms=rtt_ms) as stats:
+        users, _ = seed(stats, 12)
+        rows = []
+        for i in range(10):
+            requester, addressee = users[i], users[i + 1]
+            status = 'pending' if i % 2 else 'accepted'
+            created_at = f'2024-01-01T00:{i:02d}:00+00:00'
+            rows.append({'friendshipId': f'legacy-{i:04d}', 'requesterId': requester, 'addresseeId': addressee,
+                         'status': status, 'createdAt': created_at, 'updatedAt': created_at})
+        # A pending pair-key row that an accepted legacy row replaces
+        existing_at = '2024-02-01T00:00:00+00:00'
+        rows.append({'friendshipId': pair_key(users[0], users[1]), 'requesterId': users[1],
+                     'addresseeId': users[0], 'status': 'pending', 'createdAt': existing_at,
+                     'updatedAt': existing_at, 'statusSK': status_sort_key('pending', existing_at)})
+        harness.load(stats, 'FRIENDSHIPS_TABLE', rows)
+
+        counts = load_migration().migrate(harness.table('FRIENDSHIPS_TABLE'))
+        assert counts['migrated'] == 10, counts
+        records = harness.read_stream(stats, 'FRIENDSHIPS_TABLE')
+        assert len(records) == 20, len(records)
+        _, failed = process(harness.load_handler('streams'), records, 100)
+        assert not failed, failed
+        assert not stats.sns.published, stats.sns.published
+        users_table = harness.table('USERS_TABLE')
+        for user_id in users:
+            assert users_table.get_item(Key={'userId': user_id})['Item'][counters.FRIENDS_COUNT] == 0, user_id
+
+
+def run(args):
+    # Write path ---------------------------------------------------------
+    with harness.local_aws(rtt_ms=args.rtt_ms) as stats:
+        # Enough users that every (i, i + 7) pair is a new friendship
+        users, images = seed(stats, max(args.senders, args.iterations + 8))
+        before = legacy_writes(stats, users, images, args.iterations)
+        after = handler_writes(stats, users, images, harness.load_handler('postcards'),
+                               harness.load_handler('friends'), args.iterations)
+    write_rows = [
+        [name, f'{before[name][0]:.0f} TransactWriteItems', f'{before[name][1]:.1f}',
+         f"{after[name][0]:.0f} {'PutItem' if name == 'send' else 'UpdateItem'}", f'{after[name][1]:.1f}']
+        for name in ('send', 'accept')
+    ]
+
+    # Processor ----------------------------------------------------------
+    process_rows = []
+    for label, fail_rate in (('clean', 0.0), (f'SNS failing {args.fail_rate:.0%}', args.fail_rate)):
+        with harness.local_aws(rtt_ms=args.rtt_ms) as stats:
+            users, images = seed(stats, args.senders)
+            postcards, friends = harness.load_handler('postcards'), harness.load_handler('friends')
+            streams = harness.load_handler('streams')
+            sent, friends_count, notifications = write(stats, users, images, postcards, friends, args.postcards,
+                                                       args.batch_recipients, args.friendships, args.seed)
+            records = read_all(stats)
+            stats.sns.fail_rate = fail_rate
+
+            stats.reset()
+            stats.sns.reset()
+            seconds, failed = 0.0, []
+            delivered = 0
+            for env_name in ('POSTCARDS_TABLE', 'FRIENDSHIPS_TABLE'):
+                elapsed, table_failed = process(streams, records[env_name], args.batch_size)
+                seconds += elapsed
+                failed.extend(table_failed)
+                delivered += len(records[env_name])
+            transactions = stats.by_operation.get('TransactWriteItems', 0)
+            dynamodb_calls, sns_calls = stats.calls, stats.sns.calls
+
+            # Failed records are redelivered from the first failure on
+            stats.sns.fail_rate = 0.0
+            for env_name in ('POSTCARDS_TABLE', 'FRIENDSHIPS_TABLE'):
+                table_failed = [int(sequence) for sequence in failed
+                                if any(r['dynamodb']['SequenceNumber'] == sequence for r in records[env_name])]
+                if table_failed:
+                    retry = [r for r in records[env_name] if int(r['dynamodb']['SequenceNumber']) >= min(table_failed)]
+                    _, still_failed = process(streams, retry, args.batch_size)
+                    assert not still_failed, still_failed
+            # Counter writes streamed users records; the search index ignores them
+            harness.drain_streams(stats, streams)
+            check(stats, users, sent, friends_count, notifications)
+
+            # Redeliver everything: nothing may change
+            published = len(stats.sns.published)
+            for env_name in ('POSTCARDS_TABLE', 'FRIENDSHIPS_TABLE'):
+                _, redelivery_failed = process(streams, records[env_name], args.batch_size)
+                assert not redelivery_failed, redelivery_failed
+            assert len(stats.sns.published) == published
+            check(stats, users, sent, friends_count, notifications)
+
+        process_rows.append([
+            label,
+            f'{delivered}',
+            f'{delivered / seconds:,.0f}',
+            f'{transactions / delivered:.3f}',
+            f'{dynamodb_calls / delivered:.3f}',
+            f'{sns_calls / delivered:.3f}',
+            f'{len(failed)}',
+        ])
+
+    print('Write path (per request)')
+    harness.print_table(['write', 'inline before', 'WCU', 'now', 'WCU'], write_rows)
+    print(f'\nStreams handler, {args.batch_size} records per batch')
+    harness.print_table(['run', 'records', 'records/s', 'transactions/record', 'DynamoDB calls/record',
+                         'SNS calls/record', 'batchItemFailures'], process_rows)
+    print('\nCounters matched and every notification was published exactly once in both runs, including after '
+          'redelivering every record; failed records were retried from the first failure.')
+
+    check_migration(args.rtt_ms)
+    print('Re-keying legacy friendships (alias items and migrated copies) changed no counter and sent no '
+          'notification.')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--postcards', type=int, default=1000)
+    parser.add_argument('--friendships', type=int, default=200)
+    parser.add_argument('--senders', type=int, default=50)
+    parser.add_argument('--batch-recipients', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--fail-rate', type=float, default=0.2)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--rtt-ms', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=11)
+    args = parser.parse_args()
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
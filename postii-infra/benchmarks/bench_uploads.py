@@ -0,0 +1,149 @@
+"""
+Direct-to-S3 postcard image uploads.
+
+Runs the whole flow against LocalS3 for a range of image sizes: POST
+/v1/postcards/uploads for a ticket, PUT the bytes to the presigned
+URL(s) (one PUT, or parts plus CompleteMultipartUpload above the
+multipart threshold), then POST /v1/postcards with the imageKey, which
+HeadObjects the upload. Reports ticket and send latency, S3 calls, and
+the bytes that went through the API (request bodies) vs. straight to S3.
+Then checks the rejections: a body that doesn't match the signed size,
+an unfinished upload, and another user's key.
+
+Usage:
+    python benchmarks/bench_uploads.py --sizes-kib 300 4096 20480 --iterations 20 --rtt-ms 3
+"""
+import argparse
+import time
+
+import harness
+
+SENDER_ID = 'user-sender'
+RECIPIENT_ID = 'user-recipient'
+
+
+def seed(stats):
+    harness.load(stats, 'USERS_TABLE', [
+        {'userId': user_id, 'username': user_id.replace('-', ''), 'postcardsCount': 0}
+        for user_id in (SENDER_ID, RECIPIENT_ID)
+    ])
+
+
+def call(postcards, event):
+    response = postcards.lambda_handler(event, None)
+    return response, harness.json_body(response)
+
+
+def request_ticket(postcards, size, content_type='image/jpeg', user_id=SENDER_ID):
+    event = harness.api_event('POST', '/v1/postcards/uploads', user_id,
+                              body={'contentType': content_type, 'size': size})
+    response, ticket = call(postcards, event)
+    assert response['statusCode'] == 201, ticket
+    return ticket, len(event['body'])
+
+
+def upload(local_s3, ticket, data):
+    """What the app does with a ticket; returns the number of presigned requests"""
+    if 'url' in ticket:
+        status, _, _ = local_s3.request('PUT', ticket['url'], data, ticket['headers'])
+        assert status == 200, status
+        return 1
+
+    etags = []
+    for part in ticket['parts']:
+        start = (part['partNumber'] - 1) * ticket['partSize']
+        status, headers, _ = local_s3.request('PUT', part['url'], data[start:start + part['size']])
+        assert status == 200, status
+        etags.append((part['partNumber'], headers['ETag']))
+    manifest = ''.join(f'<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>' for number, etag in etags)
+    status, _, _ = local_s3.request('POST', ticket['completeUrl'],
+                                    f'<CompleteMultipartUpload>{manifest}</CompleteMultipartUpload>'.encode())
+    assert status == 200, status
+    return len(etags) + 1
+
+
+def send(postcards, image_key):
+    event = harness.api_event('POST', '/v1/postcards', SENDER_ID, body={
+        'recipientId': RECIPIENT_ID, 'imageKey': image_key, 'message': 'Greetings from Lisbon!'
+    })
+    response, body = call(postcards, event)
+    return response, body, len(event['body'])
+
+
+def check_rejections(stats, postcards):
+    local_s3 = stats.s3
+    ticket, _ = request_ticket(postcards, 1000)
+    status, _, _ = local_s3.request('PUT', ticket['url'], b'x' * 1001, ticket['headers'])
+    assert status == 403, f'oversized body accepted: {status}'
+
+    response, body, _ = send(postcards, ticket['key'])
+    assert response['statusCode'] == 400 and 'not been uploaded' in body['error'], body
+
+    other_key = harness.upload_image(stats, RECIPIENT_ID)
+    response, body, _ = send(postcards, other_key)
+    assert response['statusCode'] == 400 and 'your uploads' in body['error'], body
+
+    event = harness.api_event('POST', '/v1/postcards/uploads', SENDER_ID, body={'contentType': 'text/html', 'size': 10})
+    assert postcards.lambda_handler(event, None)['statusCode'] == 400
+
+
+def run(sizes_kib, iterations, rtt_ms):
+    rows = []
+    with harness.local_aws(rtt_ms=rtt_ms) as stats:
+        seed(stats)
+        postcards = harness.load_handler('postcards')
+        local_s3 = stats.s3
+
+        for size_kib in sizes_kib:
+            data = bytes(range(256)) * (size_kib * 4)
+            ticket_samples, send_samples = [], []
+            ticket_calls = send_calls = presigned = api_bytes = 0
+            for _ in range(iterations):
+                local_s3.reset()
+                start = time.perf_counter()
+                ticket, ticket_bytes = request_ticket(postcards, len(data))
+                ticket_samples.append((time.perf_counter() - start) * 1000.0)
+                ticket_calls += local_s3.calls
+
+                presigned += upload(local_s3, ticket, data)
+
+                local_s3.reset()
+                start = time.perf_counter()
+                response, body, send_bytes = send(postcards, ticket['key'])
+                send_samples.append((time.perf_counter() - start) * 1000.0)
+                assert response['statusCode'] == 200, body
+                send_calls += local_s3.calls
+                api_bytes += ticket_bytes + send_bytes
+                assert local_s3.get(harness.BUCKET_NAME, ticket['key']) == data
+
+            rows.append([
+                f'{size_kib:,}',
+                'multipart' if 'parts' in ticket else 'single PUT',
+                f"{harness.summarize(ticket_samples)['p50']:.2f}",
+                f'{ticket_calls / iterations:.0f}',
+                f'{presigned / iterations:.0f}',
+                f"{harness.summarize(send_samples)['p50']:.2f}",
+                f'{send_calls / iterations:.0f}',
+                f'{api_bytes / iterations:.0f}',
+                f'{len(data):,}',
+            ])
+
+        check_rejections(stats, postcards)
+
+    harness.print_table(['image KiB', 'upload', 'ticket p50 ms', 'ticket S3 calls', 'presigned requests',
+                         'send p50 ms', 'send S3 calls', 'bytes via API', 'bytes to S3'], rows)
+    print('\nRejected: a body larger than signed (403 from S3), an unfinished upload, '
+          "another user's key and a non-image content type (400).")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes-kib', type=int, nargs='+', default=[300, 4096, 20480])
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--rtt-ms', type=float, default=0.0)
+    args = parser.parse_args()
+    run(args.sizes_kib, args.iterations, args.rtt_ms)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""
+Shared plumbing for the local benchmarks.
+
+Runs the Lambda handlers in-process against LocalDynamoDB (see
+local_dynamodb.py), with tables created to match lib/database-stack.ts.
+Every DynamoDB call made through boto3 is counted and costed, and can
+optionally be delayed by a fixed round-trip time so that results reflect
+the number of network hops a request would make against the real service.
+S3 calls go to a LocalS3 (see local_s3.py) holding ASSETS_BUCKET, and
+SNS calls to a LocalSNS (see local_sns.py).
+"""
+import contextlib
+import importlib.util
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+
+import boto3
+
+from local_dynamodb import LocalDynamoDB
+from local_s3 import LocalS3
+from local_sns import LocalSNS
+
+INFRA_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+LAMBDA_ROOT = os.path.join(INFRA_ROOT, 'lambda')
+SHARED_LAYER_PATH = os.path.join(LAMBDA_ROOT, 'shared', 'python')
+
+if SHARED_LAYER_PATH not in sys.path:
+    sys.path.insert(0, SHARED_LAYER_PATH)
+
+from postii_common import aws  # noqa: E402
+
+REGION = 'us-east-1'
+BUCKET_NAME = 'postii-assets-bench'
+NOTIFICATIONS_TOPIC_ARN = f'arn:aws:sns:{REGION}:000000000000:postii-notifications-bench'
+STREAM = {'StreamEnabled': True, 'StreamViewType': 'NEW_AND_OLD_IMAGES'}
+
+
+def _gsi(name, partition_key, sort_key=None, projection=None):
+    key_schema = [{'AttributeName': partition_key, 'KeyType': 'HASH'}]
+    if sort_key:
+        key_schema.append({'AttributeName': sort_key, 'KeyType': 'RANGE'})
+    return {'IndexName': name, 'KeySchema': key_schema, 'Projection': projection or {'ProjectionType': 'ALL'}}
+
+
+# Keep in step with lib/database-stack.ts
+TABLES = {
+    'USERS_TABLE': {
+        'TableName': 'postii-users-bench',
+        'KeySchema': [{'AttributeName': 'userId', 'KeyType': 'HASH'}],
+        'GlobalSecondaryIndexes': [
+            _gsi('email-index', 'email'),
+            _gsi('username-index', 'username'),
+        ],
+        'StreamSpecification': STREAM,
+    },
+    'FRIENDSHIPS_TABLE': {
+        'TableName': 'postii-friendships-bench',
+        'KeySchema': [{'AttributeName': 'friendshipId', 'KeyType': 'HASH'}],
+        'GlobalSecondaryIndexes': [
+            _gsi('requester-index', 'requesterId', 'createdAt'),
+            _gsi('addressee-index', 'addresseeId', 'createdAt'),
+            _gsi('requester-status-index', 'requesterId', 'statusSK', {
+                'ProjectionType': 'INCLUDE', 'NonKeyAttributes': ['addresseeId', 'status', 'createdAt']}),
+            _gsi('addressee-status-index', 'addresseeId', 'statusSK', {
+                'ProjectionType': 'INCLUDE', 'NonKeyAttributes': ['requesterId', 'status', 'createdAt']}),
+        ],
+        'StreamSpecification': STREAM,
+    },
+    'POSTCARDS_TABLE': {
+        'TableName': 'postii-postcards-bench',
+        'KeySchema': [{'AttributeName': 'postcardId', 'KeyType': 'HASH'}],
+        'GlobalSecondaryIndexes': [
+            _gsi('sender-sent-index', 'senderPK', 'sentSK'),
+            _gsi('recipient-received-index', 'recipientPK', 'receivedSK'),
+            _gsi('sender-summary-index', 'senderPK', 'sentSK', {
+                'ProjectionType': 'INCLUDE',
+                'NonKeyAttributes': ['senderId', 'recipientId', 'imageUrl', 'sentAt', 'status']}),
+            _gsi('recipient-summary-index', 'recipientPK', 'receivedSK', {
+                'ProjectionType': 'INCLUDE',
+                'NonKeyAttributes': ['senderId', 'recipientId', 'imageUrl', 'sentAt', 'status']}),
+        ],
+        'StreamSpecification': STREAM,
+    },
+    'SEARCH_INDEX_TABLE': {
+        'TableName': 'postii-search-index-bench',
+        'KeySchema': [
+            {'AttributeName': 'term', 'KeyType': 'HASH'},
+            {'AttributeName': 'userId', 'KeyType': 'RANGE'},
+        ],
+    },
+    'IMAGES_TABLE': {
+        'TableName': 'postii-images-bench',
+        'KeySchema': [{'AttributeName': 'imageHash', 'KeyType': 'HASH'}],
+    },
+    'EVENT_LEDGER_TABLE': {
+        'TableName': 'postii-event-ledger-bench',
+        'KeySchema': [{'AttributeName': 'eventId', 'KeyType': 'HASH'}],
+    },
+    'IDEMPOTENCY_TABLE': {
+        'TableName': 'postii-idempotency-bench',
+        'KeySchema': [{'AttributeName': 'idempotencyKey', 'KeyType': 'HASH'}],
+    },
+}
+
+
+@contextlib.contextmanager
+def local_aws(rtt_ms=0.0, unprocessed_rate=0.0):
+    """
+    Point boto3 at a fresh LocalDynamoDB with the Postii tables created
+    and their names exported the way the Lambda environment does. Yields
+    the LocalDynamoDB so callers can read call counts and capacity; its
+    s3 attribute is the LocalS3 serving ASSETS_BUCKET and its sns
+    attribute the LocalSNS behind NOTIFICATIONS_TOPIC_ARN.
+    """
+    saved_environ = dict(os.environ)
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+    os.environ['AWS_DEFAULT_REGION'] = REGION
+    os.environ['ASSETS_BUCKET'] = BUCKET_NAME
+    os.environ['NOTIFICATIONS_TOPIC_ARN'] = NOTIFICATIONS_TOPIC_ARN
+    os.environ['CURSOR_SIGNING_KEY'] = 'bench-cursor-signing-key'
+
+    local_dynamodb = LocalDynamoDB(rtt_ms=rtt_ms, unprocessed_rate=unprocessed_rate)
+    for env_name, spec in TABLES.items():
+        local_dynamodb.create_table(spec)
+        os.environ[env_name] = spec['TableName']
+    local_dynamodb.s3 = LocalS3(os.environ['AWS_SECRET_ACCESS_KEY'], rtt_ms=rtt_ms)
+    local_dynamodb.s3.create_bucket(BUCKET_NAME)
+    local_dynamodb.sns = LocalSNS(rtt_ms=rtt_ms)
+
+    # Installed on the default session so that clients the handlers create
+    # later (including lazily) are answered locally as well.
+    boto3.setup_default_session(region_name=REGION)
+    local_dynamodb.install(boto3.DEFAULT_SESSION)
+    local_dynamodb.s3.install(boto3.DEFAULT_SESSION)
+    local_dynamodb.sns.install(boto3.DEFAULT_SESSION)
+    # Handles the handlers cached under an earlier session would bypass it
+    aws.reset()
+    try:
+        yield local_dynamodb
+    finally:
+        boto3.DEFAULT_SESSION = None
+        aws.reset()
+        os.environ.clear()
+        os.environ.update(saved_environ)
+
+
+def table(env_name):
+    """Return a boto3 Table for one of the TABLES entries"""
+    return boto3.resource('dynamodb').Table(TABLES[env_name]['TableName'])
+
+
+def load(local_dynamodb, env_name, items):
+    """Seed one of the TABLES entries directly, bypassing boto3 (see LocalDynamoDB.load)"""
+    local_dynamodb.load(TABLES[env_name]['TableName'], items)
+
+
+def read_stream(local_dynamodb, env_name, limit=None):
+    """Take the oldest unread stream records of one of the TABLES entries"""
+    return local_dynamodb.read_stream(TABLES[env_name]['TableName'], limit)
+
+
+def drain_streams(local_dynamodb, streams, batch_size=100, max_attempts=3):
+    """
+    Deliver every unread stream record to the streams handler module the
+    way Lambda's event source mapping does: up to batch_size records of
+    one table per invocation and, when batchItemFailures come back, the
+    batch again from the first failed record. Repeats until no table has
+    records left (applying them writes more). Returns the invocations.
+    """
+    invocations = 0
+    while True:
+        delivered = 0
+        for env_name, spec in TABLES.items():
+            if not spec.get('StreamSpecification'):
+                continue
+            pending, attempts = read_stream(local_dynamodb, env_name), 0
+            delivered += len(pending)
+            while pending:
+                batch = pending[:batch_size]
+                failures = streams.lambda_handler({'Records': batch}, None)['batchItemFailures']
+                invocations += 1
+                if not failures:
+                    pending, attempts = pending[len(batch):], 0
+                    continue
+                attempts += 1
+                if attempts >= max_attempts:
+                    raise RuntimeError(f'{env_name} stream records still failing after {attempts} attempts')
+                first = min(int(failure['itemIdentifier']) for failure in failures)
+                pending = [record for record in pending if int(record['dynamodb']['SequenceNumber']) >= first]
+        if not delivered:
+            return invocations
+
+
+def upload_image(local_dynamodb, user_id, data=b'\xff\xd8\xff\xe0 bench image', content_type='image/jpeg'):
+    """Put an image in user_id's upload prefix (as an upload ticket would); returns its key"""
+    key = f'uploads/{user_id}/{uuid.uuid4().hex}.jpg'
+    local_dynamodb.s3.put(BUCKET_NAME, key, data, content_type)
+    return key
+
+
+def load_handler(name):
+    """Import lambda/<name>/lambda_function.py under a unique module name"""
+    path = os.path.join(LAMBDA_ROOT, name, 'lambda_function.py')
+    module_name = f'postii_{name}_handler'
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def api_event(method, path, user_id, resource=None, query=None, body=None,
+              path_parameters=None, headers=None):
+    """Build an API Gateway proxy event with Cognito claims"""
+    return {
+        'httpMethod': method,
+        'path': path,
+        'resource': resource or path,
+        'pathParameters': path_parameters,
+        'queryStringParameters': query,
+        'headers': headers or {},
+        'body': json.dumps(body) if body is not None else None,
+        'requestContext': {
+            'requestId': str(uuid.uuid4()),
+            'authorizer': {'claims': {'sub': user_id}},
+        },
+    }
+
+
+def json_body(response):
+    """Parse the JSON body of a handler response"""
+    return json.loads(response['body'])
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples"""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def timed(fn, iterations):
+    """Call fn() iterations times; returns per-call latencies in ms"""
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return samples
+
+
+def summarize(samples):
+    """p50/p95/p99/mean summary of latency samples in ms"""
+    return {
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95),
+        'p99': percentile(samples, 99),
+        'mean': statistics.fmean(samples) if samples else 0.0,
+    }
+
+
+def print_table(headers, rows):
+    """Print rows as a fixed-width table"""
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(headers)]
+    print('  '.join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    print('  '.join('-' * w for w in widths))
+    for row in rows:
+        print('  '.join(str(c).ljust(w) for c, w in zip(row, widths)))
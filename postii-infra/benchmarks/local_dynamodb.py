@@ -0,0 +1,1244 @@
+"""
+In-process DynamoDB stand-in for the local benchmarks.
+
+Installed as a botocore ``before-call`` hook, so the handlers run their
+real boto3 code (resource or client API) and every request is answered
+from memory instead of going over the network. Partitions are kept in
+sorted order and GSIs are maintained on write, so Query/GetItem cost
+depends on the partition being read, not on the table size - the same
+scaling behaviour as the real service. Scan remains proportional to the
+table.
+
+Supported: GetItem, PutItem, UpdateItem, DeleteItem, Query, Scan,
+BatchGetItem, BatchWriteItem, TransactGetItems, TransactWriteItems with
+key/filter/condition/update/projection expressions, Limit and
+ExclusiveStartKey pagination (including the 1 MB page cap), ReturnValues,
+ReturnValuesOnConditionCheckFailure and ReturnConsumedCapacity. Capacity
+units are estimated from item sizes using the published DynamoDB rules.
+
+Tables created with a StreamSpecification record every change (not
+writes that leave an item as it was) as a DynamoDB Streams record in
+the shape Lambda delivers them; read_stream hands them out in order.
+"""
+import base64
+import bisect
+import copy
+import json
+import math
+import random
+import re
+import threading
+import time
+from decimal import Decimal
+
+from boto3.dynamodb.types import TypeSerializer
+
+PAGE_SIZE_LIMIT = 1024 * 1024
+READ_UNIT_BYTES = 4096
+WRITE_UNIT_BYTES = 1024
+
+
+class DynamoDBError(Exception):
+    """An error returned to the caller as a DynamoDB error response"""
+
+    def __init__(self, code, message, **extra):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.extra = extra
+
+
+class _HttpResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+        self.content = b''
+        self.text = ''
+        self.raw = None
+
+
+# ---------------------------------------------------------------------------
+# Attribute values
+# ---------------------------------------------------------------------------
+
+def _decode_request_value(value):
+    """Turn JSON wire values into stored values (base64 binaries -> bytes)"""
+    if 'B' in value:
+        return {'B': base64.b64decode(value['B'])}
+    if 'BS' in value:
+        return {'BS': [base64.b64decode(v) for v in value['BS']]}
+    if 'L' in value:
+        return {'L': [_decode_request_value(v) for v in value['L']]}
+    if 'M' in value:
+        return {'M': {k: _decode_request_value(v) for k, v in value['M'].items()}}
+    return value
+
+
+def _decode_item(item):
+    return {name: _decode_request_value(value) for name, value in item.items()}
+
+
+def _scalar(value):
+    """Comparable Python value for a scalar attribute value"""
+    if 'S' in value:
+        return value['S']
+    if 'N' in value:
+        return Decimal(value['N'])
+    if 'B' in value:
+        return value['B']
+    raise DynamoDBError('ValidationException', 'Key attributes must be scalars')
+
+
+def _type_of(value):
+    return next(iter(value))
+
+
+def _values_equal(left, right):
+    if left is None or right is None:
+        return left is right
+    left_type, right_type = _type_of(left), _type_of(right)
+    if left_type != right_type:
+        return False
+    if left_type == 'N':
+        return Decimal(left['N']) == Decimal(right['N'])
+    if left_type == 'NS':
+        return {Decimal(v) for v in left['NS']} == {Decimal(v) for v in right['NS']}
+    if left_type in ('SS', 'BS'):
+        return set(left[left_type]) == set(right[right_type])
+    if left_type == 'L':
+        return len(left['L']) == len(right['L']) and all(
+            _values_equal(a, b) for a, b in zip(left['L'], right['L'])
+        )
+    if left_type == 'M':
+        return left['M'].keys() == right['M'].keys() and all(
+            _values_equal(v, right['M'][k]) for k, v in left['M'].items()
+        )
+    return left[left_type] == right[right_type]
+
+
+def _number(decimal_value):
+    text = format(decimal_value.normalize(), 'f') if decimal_value == decimal_value.to_integral() else str(decimal_value)
+    return {'N': text}
+
+
+def _value_size(value):
+    value_type = _type_of(value)
+    payload = value[value_type]
+    if value_type == 'S':
+        return len(payload.encode('utf-8'))
+    if value_type == 'N':
+        return len(payload.lstrip('-').replace('.', '')) // 2 + 1
+    if value_type == 'B':
+        return len(payload)
+    if value_type in ('BOOL', 'NULL'):
+        return 1
+    if value_type == 'SS':
+        return sum(len(v.encode('utf-8')) for v in payload)
+    if value_type == 'NS':
+        return sum(len(v) // 2 + 1 for v in payload)
+    if value_type == 'BS':
+        return sum(len(v) for v in payload)
+    if value_type == 'L':
+        return 3 + sum(_value_size(v) + 1 for v in payload)
+    if value_type == 'M':
+        return 3 + sum(len(k.encode('utf-8')) + _value_size(v) + 1 for k, v in payload.items())
+    return 0
+
+
+def item_size(item):
+    """Approximate stored size of an item in bytes"""
+    if not item:
+        return 0
+    return sum(len(name.encode('utf-8')) + _value_size(value) for name, value in item.items())
+
+
+# ---------------------------------------------------------------------------
+# Expressions
+# ---------------------------------------------------------------------------
+
+_TOKEN_RE = re.compile(r'\s*(?:(?P<op><>|<=|>=|[=<>(),.\[\]+\-])|(?P<name>#[A-Za-z0-9_]+)'
+                       r'|(?P<value>:[A-Za-z0-9_]+)|(?P<number>\d+)|(?P<ident>[A-Za-z_][A-Za-z0-9_]*))')
+
+_KEYWORDS = {'AND', 'OR', 'NOT', 'BETWEEN', 'IN', 'SET', 'REMOVE', 'ADD', 'DELETE'}
+_CONDITION_FUNCTIONS = {'attribute_exists', 'attribute_not_exists', 'attribute_type', 'begins_with', 'contains'}
+
+
+def _tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = _TOKEN_RE.match(expression, position)
+        if not match or match.end() == position:
+            raise DynamoDBError('ValidationException', f'Invalid expression near: {expression[position:]}')
+        position = match.end()
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == 'ident' and text.upper() in _KEYWORDS:
+            tokens.append(('kw', text.upper()))
+        else:
+            tokens.append((kind, text))
+    tokens.append(('end', None))
+    return tokens
+
+
+class _Parser:
+    def __init__(self, expression, names, values):
+        self.tokens = _tokenize(expression)
+        self.position = 0
+        self.names = names or {}
+        self.values = values or {}
+        self.used_names = set()
+        self.used_values = set()
+
+    def peek(self, offset=0):
+        return self.tokens[self.position + offset]
+
+    def take(self, kind=None, text=None):
+        token = self.tokens[self.position]
+        if (kind and token[0] != kind) or (text and token[1] != text):
+            raise DynamoDBError('ValidationException', f'Unexpected token {token[1]!r}')
+        self.position += 1
+        return token
+
+    def accept(self, kind, text=None):
+        token = self.peek()
+        if token[0] == kind and (text is None or token[1] == text):
+            self.position += 1
+            return True
+        return False
+
+    # Paths and operands -------------------------------------------------
+
+    def path(self):
+        elements = [self.path_name()]
+        while True:
+            if self.accept('op', '.'):
+                elements.append(self.path_name())
+            elif self.accept('op', '['):
+                elements.append(int(self.take('number')[1]))
+                self.take('op', ']')
+            else:
+                return ('path', tuple(elements))
+
+    def path_name(self):
+        kind, text = self.take()
+        if kind == 'name':
+            if text not in self.names:
+                raise DynamoDBError('ValidationException', f'Undefined attribute name {text}')
+            self.used_names.add(text)
+            return self.names[text]
+        if kind in ('ident', 'kw'):
+            return text
+        raise DynamoDBError('ValidationException', f'Expected attribute name, got {text!r}')
+
+    def value(self):
+        text = self.take('value')[1]
+        if text not in self.values:
+            raise DynamoDBError('ValidationException', f'Undefined attribute value {text}')
+        self.used_values.add(text)
+        return ('value', self.values[text])
+
+    def operand(self):
+        kind, text = self.peek()
+        if kind == 'value':
+            return self.value()
+        if kind == 'ident' and text == 'size' and self.peek(1) == ('op', '('):
+            self.take()
+            self.take('op', '(')
+            path = self.path()
+            self.take('op', ')')
+            return ('size', path)
+        return self.path()
+
+    # Conditions ---------------------------------------------------------
+
+    def condition(self):
+        node = self.and_condition()
+        while self.accept('kw', 'OR'):
+            node = ('or', node, self.and_condition())
+        return node
+
+    def and_condition(self):
+        node = self.not_condition()
+        while self.accept('kw', 'AND'):
+            node = ('and', node, self.not_condition())
+        return node
+
+    def not_condition(self):
+        if self.accept('kw', 'NOT'):
+            return ('not', self.not_condition())
+        return self.primary_condition()
+
+    def primary_condition(self):
+        if self.accept('op', '('):
+            node = self.condition()
+            self.take('op', ')')
+            return node
+        kind, text = self.peek()
+        if kind == 'ident' and text in _CONDITION_FUNCTIONS and self.peek(1) == ('op', '('):
+            self.take()
+            self.take('op', '(')
+            arguments = [self.path()]
+            while self.accept('op', ','):
+                arguments.append(self.operand())
+            self.take('op', ')')
+            return ('func', text, arguments)
+        left = self.operand()
+        if self.accept('kw', 'BETWEEN'):
+            low = self.operand()
+            self.take('kw', 'AND')
+            return ('between', left, low, self.operand())
+        if self.accept('kw', 'IN'):
+            self.take('op', '(')
+            options = [self.operand()]
+            while self.accept('op', ','):
+                options.append(self.operand())
+            self.take('op', ')')
+            return ('in', left, options)
+        comparator = self.take('op')[1]
+        if comparator not in ('=', '<>', '<', '<=', '>', '>='):
+            raise DynamoDBError('ValidationException', f'Invalid comparator {comparator}')
+        return ('compare', comparator, left, self.operand())
+
+    def parse_condition(self):
+        node = self.condition()
+        self.take('end')
+        return node
+
+    # Updates ------------------------------------------------------------
+
+    def parse_update(self):
+        actions = []
+        while self.peek()[0] != 'end':
+            clause = self.take('kw')[1]
+            while True:
+                if clause == 'SET':
+                    path = self.path()
+                    self.take('op', '=')
+                    actions.append(('SET', path, self.set_value()))
+                elif clause == 'REMOVE':
+                    actions.append(('REMOVE', self.path(), None))
+                elif clause in ('ADD', 'DELETE'):
+                    path = self.path()
+                    actions.append((clause, path, self.value()))
+                else:
+                    raise DynamoDBError('ValidationException', f'Invalid update clause {clause}')
+                if not self.accept('op', ','):
+                    break
+        return actions
+
+    def set_value(self):
+        left = self.set_operand()
+        if self.accept('op', '+'):
+            return ('plus', left, self.set_operand())
+        if self.accept('op', '-'):
+            return ('minus', left, self.set_operand())
+        return left
+
+    def set_operand(self):
+        kind, text = self.peek()
+        if kind == 'ident' and text in ('if_not_exists', 'list_append') and self.peek(1) == ('op', '('):
+            self.take()
+            self.take('op', '(')
+            first = self.path() if text == 'if_not_exists' else self.set_operand()
+            self.take('op', ',')
+            second = self.set_operand()
+            self.take('op', ')')
+            return (text, first, second)
+        return self.operand()
+
+    # Projections --------------------------------------------------------
+
+    def parse_projection(self):
+        paths = [self.path()]
+        while self.accept('op', ','):
+            paths.append(self.path())
+        self.take('end')
+        return paths
+
+
+def _get_path(item, path):
+    current = {'M': item}
+    for element in path[1]:
+        if isinstance(element, int):
+            if 'L' not in current or element >= len(current['L']):
+                return None
+            current = current['L'][element]
+        else:
+            if 'M' not in current or element not in current['M']:
+                return None
+            current = current['M'][element]
+    return current
+
+
+def _set_path(item, path, value):
+    elements = path[1]
+    container = {'M': item}
+    for element in elements[:-1]:
+        container = container['L'][element] if isinstance(element, int) else container['M'].setdefault(element, {'M': {}})
+    last = elements[-1]
+    if isinstance(last, int):
+        values = container['L']
+        if last >= len(values):
+            values.append(value)
+        else:
+            values[last] = value
+    else:
+        container['M'][last] = value
+
+
+def _remove_path(item, path):
+    elements = path[1]
+    container = _get_path(item, ('path', elements[:-1])) if len(elements) > 1 else {'M': item}
+    if container is None:
+        return
+    last = elements[-1]
+    if isinstance(last, int):
+        if 'L' in container and last < len(container['L']):
+            del container['L'][last]
+    elif 'M' in container:
+        container['M'].pop(last, None)
+
+
+def _evaluate_operand(item, operand):
+    kind = operand[0]
+    if kind == 'value':
+        return operand[1]
+    if kind == 'path':
+        return _get_path(item, operand)
+    if kind == 'size':
+        value = _get_path(item, operand[1])
+        if value is None:
+            return None
+        value_type = _type_of(value)
+        if value_type == 'S':
+            return {'N': str(len(value['S']))}
+        if value_type == 'B':
+            return {'N': str(len(value['B']))}
+        return {'N': str(len(value[value_type]))}
+    raise DynamoDBError('ValidationException', f'Unsupported operand {kind}')
+
+
+def _compare(comparator, left, right):
+    if comparator == '=':
+        return _values_equal(left, right)
+    if comparator == '<>':
+        return not _values_equal(left, right)
+    if left is None or right is None or _type_of(left) != _type_of(right) or _type_of(left) not in ('S', 'N', 'B'):
+        return False
+    left_value, right_value = _scalar(left), _scalar(right)
+    if comparator == '<':
+        return left_value < right_value
+    if comparator == '<=':
+        return left_value <= right_value
+    if comparator == '>':
+        return left_value > right_value
+    return left_value >= right_value
+
+
+def _evaluate_condition(item, node):
+    kind = node[0]
+    if kind == 'and':
+        return _evaluate_condition(item, node[1]) and _evaluate_condition(item, node[2])
+    if kind == 'or':
+        return _evaluate_condition(item, node[1]) or _evaluate_condition(item, node[2])
+    if kind == 'not':
+        return not _evaluate_condition(item, node[1])
+    if kind == 'compare':
+        return _compare(node[1], _evaluate_operand(item, node[2]), _evaluate_operand(item, node[3]))
+    if kind == 'between':
+        value = _evaluate_operand(item, node[1])
+        return _compare('>=', value, _evaluate_operand(item, node[2])) and \
+            _compare('<=', value, _evaluate_operand(item, node[3]))
+    if kind == 'in':
+        value = _evaluate_operand(item, node[1])
+        return any(_values_equal(value, _evaluate_operand(item, option)) for option in node[2])
+    if kind == 'func':
+        name, arguments = node[1], node[2]
+        value = _get_path(item, arguments[0])
+        if name == 'attribute_exists':
+            return value is not None
+        if name == 'attribute_not_exists':
+            return value is None
+        operand = _evaluate_operand(item, arguments[1])
+        if value is None or operand is None:
+            return False
+        if name == 'attribute_type':
+            return _type_of(value) == operand['S']
+        if name == 'begins_with':
+            value_type = _type_of(value)
+            return value_type in ('S', 'B') and _type_of(operand) == value_type and \
+                value[value_type].startswith(operand[value_type])
+        if name == 'contains':
+            value_type = _type_of(value)
+            if value_type == 'S':
+                return 'S' in operand and operand['S'] in value['S']
+            if value_type in ('SS', 'NS', 'BS'):
+                return next(iter(operand.values())) in value[value_type]
+            if value_type == 'L':
+                return any(_values_equal(element, operand) for element in value['L'])
+            return False
+    raise DynamoDBError('ValidationException', f'Unsupported condition {kind}')
+
+
+def _check_unused(parser, names, values):
+    unused_names = set(names or {}) - parser.used_names
+    unused_values = set(values or {}) - parser.used_values
+    if unused_names or unused_values:
+        raise DynamoDBError(
+            'ValidationException',
+            f'Value provided in ExpressionAttributeNames/Values unused in expressions: '
+            f'{sorted(unused_names | unused_values)}'
+        )
+
+
+# ---------------------------------------------------------------------------
+# Tables and indexes
+# ---------------------------------------------------------------------------
+
+class _Partition:
+    """Items of one partition key, kept sorted by sort key"""
+
+    __slots__ = ('keys', 'entries')
+
+    def __init__(self):
+        self.keys = []
+        self.entries = {}
+
+    def put(self, sort_key, entry):
+        if sort_key not in self.entries:
+            bisect.insort(self.keys, sort_key)
+        self.entries[sort_key] = entry
+
+    def delete(self, sort_key):
+        if sort_key in self.entries:
+            del self.entries[sort_key]
+            del self.keys[bisect.bisect_left(self.keys, sort_key)]
+
+
+class _Index:
+    def __init__(self, name, hash_key, range_key, projection):
+        self.name = name
+        self.hash_key = hash_key
+        self.range_key = range_key
+        self.projection_type = projection.get('ProjectionType', 'ALL')
+        self.non_key_attributes = set(projection.get('NonKeyAttributes', []))
+        self.partitions = {}
+
+
+class _Table:
+    def __init__(self, spec):
+        self.name = spec['TableName']
+        stream_spec = spec.get('StreamSpecification') or {}
+        self.stream_view_type = stream_spec.get('StreamViewType') if stream_spec.get('StreamEnabled') else None
+        self.stream = []
+        self.sequence_number = 0
+        self.hash_key = next(k['AttributeName'] for k in spec['KeySchema'] if k['KeyType'] == 'HASH')
+        self.range_key = next((k['AttributeName'] for k in spec['KeySchema'] if k['KeyType'] == 'RANGE'), None)
+        self.partitions = {}
+        self.item_count = 0
+        self._scan_order = None
+        self.indexes = {}
+        for index_spec in spec.get('GlobalSecondaryIndexes', []) + spec.get('LocalSecondaryIndexes', []):
+            index_hash = next(k['AttributeName'] for k in index_spec['KeySchema'] if k['KeyType'] == 'HASH')
+            index_range = next((k['AttributeName'] for k in index_spec['KeySchema'] if k['KeyType'] == 'RANGE'), None)
+            self.indexes[index_spec['IndexName']] = _Index(
+                index_spec['IndexName'], index_hash, index_range, index_spec.get('Projection', {})
+            )
+
+    # Keys ---------------------------------------------------------------
+
+    def key_attributes(self):
+        return (self.hash_key,) + ((self.range_key,) if self.range_key else ())
+
+    def primary_key(self, item):
+        try:
+            hash_value = _scalar(item[self.hash_key])
+            range_value = (_scalar(item[self.range_key]),) if self.range_key else ()
+        except KeyError:
+            raise DynamoDBError('ValidationException', 'One of the required keys was not given a value')
+        return hash_value, range_value
+
+    def key_of(self, item):
+        return {name: item[name] for name in self.key_attributes()}
+
+    def _index_entry_key(self, index, item):
+        if index.hash_key not in item or (index.range_key and index.range_key not in item):
+            return None
+        hash_value, table_range = self.primary_key(item)
+        index_range = (_scalar(item[index.range_key]),) if index.range_key else ()
+        return _scalar(item[index.hash_key]), index_range + (hash_value,) + table_range
+
+    # Storage ------------------------------------------------------------
+
+    def get(self, key):
+        hash_value, range_value = self.primary_key(key)
+        partition = self.partitions.get(hash_value)
+        return partition.entries.get(range_value) if partition else None
+
+    def put(self, item, record=True):
+        old_item = self.get(item)
+        if record:
+            self._record(old_item, item)
+        if old_item is not None:
+            self._unindex(old_item)
+        else:
+            self.item_count += 1
+        hash_value, range_value = self.primary_key(item)
+        partition = self.partitions.get(hash_value)
+        if partition is None:
+            partition = self.partitions[hash_value] = _Partition()
+            self._scan_order = None
+        partition.put(range_value, item)
+        for index in self.indexes.values():
+            entry_key = self._index_entry_key(index, item)
+            if entry_key:
+                index.partitions.setdefault(entry_key[0], _Partition()).put(entry_key[1], (hash_value, range_value))
+        return old_item
+
+    def delete(self, key):
+        old_item = self.get(key)
+        if old_item is None:
+            return None
+        self._record(old_item, None)
+        self._unindex(old_item)
+        hash_value, range_value = self.primary_key(key)
+        self.partitions[hash_value].delete(range_value)
+        self.item_count -= 1
+        return old_item
+
+    def _record(self, old_item, new_item):
+        """Append a stream record for one change, if the table has a stream"""
+        if not self.stream_view_type or old_item == new_item:
+            return
+        self.sequence_number += 1
+        change = {
+            'Keys': copy.deepcopy(self.key_of(new_item or old_item)),
+            'SequenceNumber': f'{self.sequence_number:021d}',
+            'SizeBytes': item_size(new_item or old_item),
+            'StreamViewType': self.stream_view_type,
+        }
+        if new_item is not None and self.stream_view_type in ('NEW_IMAGE', 'NEW_AND_OLD_IMAGES'):
+            change['NewImage'] = copy.deepcopy(new_item)
+        if old_item is not None and self.stream_view_type in ('OLD_IMAGE', 'NEW_AND_OLD_IMAGES'):
+            change['OldImage'] = copy.deepcopy(old_item)
+        self.stream.append({
+            'eventID': f'{self.sequence_number:032x}',
+            'eventName': 'INSERT' if old_item is None else 'REMOVE' if new_item is None else 'MODIFY',
+            'eventVersion': '1.1',
+            'eventSource': 'aws:dynamodb',
+            'eventSourceARN': f'arn:aws:dynamodb:local:000000000000:table/{self.name}/stream/local',
+            'dynamodb': change,
+        })
+
+    def _unindex(self, item):
+        for index in self.indexes.values():
+            entry_key = self._index_entry_key(index, item)
+            if entry_key and entry_key[0] in index.partitions:
+                index.partitions[entry_key[0]].delete(entry_key[1])
+
+    def scan_order(self):
+        if self._scan_order is None:
+            self._scan_order = sorted(self.partitions)
+        return self._scan_order
+
+    def project_for_index(self, index, item):
+        if index.projection_type == 'ALL':
+            return item
+        keep = set(self.key_attributes()) | {index.hash_key}
+        if index.range_key:
+            keep.add(index.range_key)
+        if index.projection_type == 'INCLUDE':
+            keep |= index.non_key_attributes
+        return {name: value for name, value in item.items() if name in keep}
+
+
+# ---------------------------------------------------------------------------
+# The service
+# ---------------------------------------------------------------------------
+
+class LocalDynamoDB:
+    """
+    In-memory DynamoDB that answers boto3 calls via a botocore hook.
+
+    rtt_ms adds a fixed sleep per call (outside the lock, so concurrent
+    callers overlap as they would over the network). unprocessed_rate
+    makes BatchGetItem/BatchWriteItem return that fraction of requests as
+    unprocessed so retry paths can be exercised.
+    """
+
+    def __init__(self, rtt_ms=0.0, unprocessed_rate=0.0, seed=0):
+        self.rtt_ms = rtt_ms
+        self.unprocessed_rate = unprocessed_rate
+        self.tables = {}
+        self._lock = threading.RLock()
+        self._random = random.Random(seed)
+        self.reset()
+
+    # Bookkeeping --------------------------------------------------------
+
+    def reset(self):
+        """Clear the call and capacity counters"""
+        self.calls = 0
+        self.by_operation = {}
+        self.by_table = {}
+        self.read_units = 0.0
+        self.write_units = 0.0
+
+    def snapshot(self):
+        return {
+            'calls': self.calls,
+            'read_units': self.read_units,
+            'write_units': self.write_units,
+            'by_operation': dict(self.by_operation),
+            'by_table': dict(self.by_table),
+        }
+
+    def create_table(self, spec):
+        self.tables[spec['TableName']] = _Table(spec)
+
+    def load(self, table_name, items):
+        """
+        Bulk-insert plain Python items (as boto3's resource layer takes
+        them) without going through botocore, for seeding large data
+        sets. Not counted in calls or capacity.
+        """
+        serializer = TypeSerializer()
+        table = self._table(table_name)
+        with self._lock:
+            for item in items:
+                table.put({name: serializer.serialize(value) for name, value in item.items()}, record=False)
+
+    def read_stream(self, table_name, limit=None):
+        """Take up to limit of the oldest unread stream records of table_name"""
+        table = self._table(table_name)
+        with self._lock:
+            records = table.stream[:limit] if limit else table.stream[:]
+            del table.stream[:len(records)]
+        return records
+
+    def install(self, session):
+        """Answer every DynamoDB call made through clients of session"""
+        session.events.register('before-call.dynamodb', self._before_call)
+
+    def _table(self, name):
+        table = self.tables.get(name)
+        if table is None:
+            raise DynamoDBError('ResourceNotFoundException', f'Requested resource not found: Table: {name} not found')
+        return table
+
+    def _before_call(self, model, params, **kwargs):
+        operation = model.name
+        request = json.loads(params['body'] or b'{}') if params.get('body') else {}
+        if self.rtt_ms:
+            time.sleep(self.rtt_ms / 1000.0)
+
+        handler = getattr(self, f'_op_{operation}', None)
+        with self._lock:
+            self.calls += 1
+            self.by_operation[operation] = self.by_operation.get(operation, 0) + 1
+            # Single-table operations only; batches and transactions name several
+            table_name = request.get('TableName')
+            if table_name:
+                self.by_table[table_name] = self.by_table.get(table_name, 0) + 1
+            try:
+                if handler is None:
+                    raise DynamoDBError('UnknownOperationException', f'{operation} is not supported locally')
+                response = handler(request)
+
+                # Callers (boto3's resource layer) transform responses in
+                # place, so never hand out the stored items themselves.
+                response = copy.deepcopy(response)
+            except DynamoDBError as error:
+                body = {'Error': {'Code': error.code, 'Message': error.message}, **copy.deepcopy(error.extra)}
+                body['ResponseMetadata'] = {'HTTPStatusCode': 400, 'RetryAttempts': 0}
+                return _HttpResponse(400), body
+
+        response['ResponseMetadata'] = {'HTTPStatusCode': 200, 'RetryAttempts': 0}
+        return _HttpResponse(200), response
+
+    def _consumed(self, request, table_name, read_units=0.0, write_units=0.0):
+        self.read_units += read_units
+        self.write_units += write_units
+        if request.get('ReturnConsumedCapacity', 'NONE') == 'NONE':
+            return {}
+        return {'ConsumedCapacity': {
+            'TableName': table_name,
+            'CapacityUnits': read_units + write_units,
+            'ReadCapacityUnits': read_units,
+            'WriteCapacityUnits': write_units,
+        }}
+
+    @staticmethod
+    def _read_units(size, consistent):
+        units = max(1, math.ceil(size / READ_UNIT_BYTES))
+        return float(units) if consistent else units / 2.0
+
+    @staticmethod
+    def _write_units(*items):
+        return float(max(1, math.ceil(max(item_size(item) for item in items) / WRITE_UNIT_BYTES)))
+
+    # Expression helpers -------------------------------------------------
+
+    @staticmethod
+    def _values(request):
+        return {name: _decode_request_value(value)
+                for name, value in (request.get('ExpressionAttributeValues') or {}).items()}
+
+    def _condition(self, request, field):
+        expression = request.get(field)
+        if not expression:
+            return None
+        parser = _Parser(expression, request.get('ExpressionAttributeNames'), self._values(request))
+        return parser.parse_condition(), parser
+
+    def _projection(self, request):
+        expression = request.get('ProjectionExpression')
+        if not expression:
+            return None, None
+        parser = _Parser(expression, request.get('ExpressionAttributeNames'), {})
+        return parser.parse_projection(), parser
+
+    @staticmethod
+    def _project(item, paths):
+        if paths is None or item is None:
+            return item
+        projected = {}
+        for path in paths:
+            value = _get_path(item, path)
+            if value is not None:
+                _set_path(projected, path, value)
+        return projected
+
+    def _check_condition(self, request, item, return_old_on_failure=True):
+        parsed = self._condition(request, 'ConditionExpression')
+        if parsed and not _evaluate_condition(item or {}, parsed[0]):
+            extra = {}
+            if return_old_on_failure and request.get('ReturnValuesOnConditionCheckFailure') == 'ALL_OLD' and item:
+                extra['Item'] = item
+            raise DynamoDBError('ConditionalCheckFailedException', 'The conditional request failed', **extra)
+        return parsed[1] if parsed else None
+
+    # Single-item operations --------------------------------------------
+
+    def _op_GetItem(self, request):
+        table = self._table(request['TableName'])
+        item = table.get(_decode_item(request['Key']))
+        paths, _ = self._projection(request)
+        response = self._consumed(request, table.name,
+                                  read_units=self._read_units(item_size(item), request.get('ConsistentRead')))
+        if item is not None:
+            response['Item'] = self._project(item, paths)
+        return response
+
+    def _op_PutItem(self, request):
+        table = self._table(request['TableName'])
+        item = _decode_item(request['Item'])
+        old_item = table.get(item)
+        parser = self._check_condition(request, old_item)
+        if parser:
+            _check_unused(parser, request.get('ExpressionAttributeNames'), request.get('ExpressionAttributeValues'))
+        table.put(item)
+        response = self._consumed(request, table.name, write_units=self._write_units(item, old_item or {}))
+        if request.get('ReturnValues') == 'ALL_OLD' and old_item:
+            response['Attributes'] = old_item
+        return response
+
+    def _op_DeleteItem(self, request):
+        table = self._table(request['TableName'])
+        key = _decode_item(request['Key'])
+        old_item = table.get(key)
+        self._check_condition(request, old_item)
+        table.delete(key)
+        response = self._consumed(request, table.name, write_units=self._write_units(old_item or {}))
+        if request.get('ReturnValues') == 'ALL_OLD' and old_item:
+            response['Attributes'] = old_item
+        return response
+
+    def _op_UpdateItem(self, request):
+        table = self._table(request['TableName'])
+        key = _decode_item(request['Key'])
+        old_item = table.get(key)
+        self._check_condition(request, old_item)
+        new_item, updated = self._apply_update(table, request, key, old_item)
+        table.put(new_item)
+
+        response = self._consumed(request, table.name, write_units=self._write_units(new_item, old_item or {}))
+        return_values = request.get('ReturnValues', 'NONE')
+        if return_values == 'ALL_NEW':
+            response['Attributes'] = new_item
+        elif return_values == 'ALL_OLD' and old_item:
+            response['Attributes'] = old_item
+        elif return_values == 'UPDATED_NEW':
+            response['Attributes'] = {name: new_item[name] for name in updated if name in new_item}
+        elif return_values == 'UPDATED_OLD' and old_item:
+            response['Attributes'] = {name: old_item[name] for name in updated if name in old_item}
+        return response
+
+    def _apply_update(self, table, request, key, old_item):
+        new_item = copy.deepcopy(old_item) if old_item else {}
+        new_item.update(key)
+        expression = request.get('UpdateExpression')
+        if not expression:
+            return new_item, set()
+
+        values = self._values(request)
+        parser = _Parser(expression, request.get('ExpressionAttributeNames'), values)
+        actions = parser.parse_update()
+        condition = self._condition(request, 'ConditionExpression')
+        if condition:
+            parser.used_names |= condition[1].used_names
+            parser.used_values |= condition[1].used_values
+        _check_unused(parser, request.get('ExpressionAttributeNames'), request.get('ExpressionAttributeValues'))
+
+        updated = set()
+        for action, path, operand in actions:
+            if path[1][0] in table.key_attributes():
+                raise DynamoDBError('ValidationException', 'Cannot update attribute that is part of the key')
+            updated.add(path[1][0])
+            if action == 'SET':
+                _set_path(new_item, path, self._set_value(new_item, old_item or {}, operand))
+            elif action == 'REMOVE':
+                _remove_path(new_item, path)
+            elif action == 'ADD':
+                current = _get_path(new_item, path)
+                addition = operand[1]
+                if current is None:
+                    _set_path(new_item, path, addition)
+                elif 'N' in current and 'N' in addition:
+                    _set_path(new_item, path, _number(Decimal(current['N']) + Decimal(addition['N'])))
+                else:
+                    set_type = _type_of(addition)
+                    merged = list(current[set_type]) + [v for v in addition[set_type] if v not in current[set_type]]
+                    _set_path(new_item, path, {set_type: merged})
+            elif action == 'DELETE':
+                current = _get_path(new_item, path)
+                if current is not None:
+                    set_type = _type_of(operand[1])
+                    remaining = [v for v in current[set_type] if v not in operand[1][set_type]]
+                    if remaining:
+                        _set_path(new_item, path, {set_type: remaining})
+                    else:
+                        _remove_path(new_item, path)
+        return new_item, updated
+
+    def _set_value(self, item, old_item, operand):
+        kind = operand[0]
+        if kind in ('plus', 'minus'):
+            left = self._set_value(item, old_item, operand[1])
+            right = self._set_value(item, old_item, operand[2])
+            if left is None or right is None or 'N' not in left or 'N' not in right:
+                raise DynamoDBError('ValidationException', 'An operand in the update expression has an incorrect data type')
+            result = Decimal(left['N']) + Decimal(right['N']) if kind == 'plus' else Decimal(left['N']) - Decimal(right['N'])
+            return _number(result)
+        if kind == 'if_not_exists':
+            existing = _get_path(old_item, operand[1])
+            return existing if existing is not None else self._set_value(item, old_item, operand[2])
+        if kind == 'list_append':
+            first = self._set_value(item, old_item, operand[1])
+            second = self._set_value(item, old_item, operand[2])
+            return {'L': list(first['L']) + list(second['L'])}
+        if kind == 'path':
+            value = _get_path(old_item, operand)
+            if value is None:
+                raise DynamoDBError('ValidationException',
+                                    'The provided expression refers to an attribute that does not exist in the item')
+            return value
+        return _evaluate_operand(item, operand)
+
+    # Query and Scan ----------------------------------------------------
+
+    def _op_Query(self, request):
+        table = self._table(request['TableName'])
+        index = table.indexes.get(request['IndexName']) if request.get('IndexName') else None
+        if request.get('IndexName') and index is None:
+            raise DynamoDBError('ValidationException', 'The table does not have the specified index')
+        hash_name = index.hash_key if index else table.hash_key
+        range_name = index.range_key if index else table.range_key
+
+        values = self._values(request)
+        key_parser = _Parser(request['KeyConditionExpression'], request.get('ExpressionAttributeNames'), values)
+        key_condition = key_parser.parse_condition()
+        hash_value, range_condition = self._split_key_condition(key_condition, hash_name, range_name)
+
+        filter_parsed = self._condition(request, 'FilterExpression')
+        paths, projection_parser = self._projection(request)
+        used = _Parser('', {}, {})
+        for parser in (key_parser, filter_parsed[1] if filter_parsed else None, projection_parser):
+            if parser:
+                used.used_names |= parser.used_names
+                used.used_values |= parser.used_values
+        _check_unused(used, request.get('ExpressionAttributeNames'), request.get('ExpressionAttributeValues'))
+
+        partition = (index.partitions if index else table.partitions).get(hash_value)
+        sort_keys = partition.keys if partition else []
+        low, high = self._range_bounds(sort_keys, range_condition)
+        forward = request.get('ScanIndexForward', True)
+        positions = range(low, high) if forward else range(high - 1, low - 1, -1)
+
+        start_key = request.get('ExclusiveStartKey')
+        if start_key:
+            start_item = _decode_item(start_key)
+            if index:
+                start_sort = table._index_entry_key(index, start_item)[1]
+            else:
+                start_sort = table.primary_key(start_item)[1]
+            if forward:
+                positions = range(max(low, bisect.bisect_right(sort_keys, start_sort)), high)
+            else:
+                positions = range(min(high, bisect.bisect_left(sort_keys, start_sort)) - 1, low - 1, -1)
+
+        def resolve(position):
+            entry = partition.entries[sort_keys[position]]
+            if index is None:
+                return entry
+            item = table.partitions[entry[0]].entries[entry[1]]
+            return table.project_for_index(index, item)
+
+        return self._read_page(request, table, index, (resolve(p) for p in positions), filter_parsed, paths)
+
+    def _split_key_condition(self, node, hash_name, range_name):
+        conditions = []
+
+        def flatten(part):
+            if part[0] == 'and':
+                flatten(part[1])
+                flatten(part[2])
+            else:
+                conditions.append(part)
+
+        flatten(node)
+        hash_value = None
+        range_condition = None
+        for condition in conditions:
+            if condition[0] == 'compare' and condition[1] == '=' and condition[2] == ('path', (hash_name,)):
+                hash_value = _scalar(condition[3][1])
+            elif range_name and self._condition_path(condition) == range_name:
+                range_condition = condition
+            else:
+                raise DynamoDBError('ValidationException', 'Query key condition not supported')
+        if hash_value is None:
+            raise DynamoDBError('ValidationException', 'Query condition missed key schema element')
+        return hash_value, range_condition
+
+    @staticmethod
+    def _condition_path(condition):
+        if condition[0] in ('compare', 'between'):
+            path = condition[2] if condition[0] == 'compare' else condition[1]
+        elif condition[0] == 'func' and condition[1] == 'begins_with':
+            path = condition[2][0]
+        else:
+            return None
+        return path[1][0] if path[0] == 'path' and len(path[1]) == 1 else None
+
+    @staticmethod
+    def _range_bounds(sort_keys, condition):
+        if condition is None:
+            return 0, len(sort_keys)
+        if condition[0] == 'func':
+            prefix = _scalar(condition[2][1][1])
+            low = bisect.bisect_left(sort_keys, (prefix,))
+            high = low
+            while high < len(sort_keys) and sort_keys[high][0][:len(prefix)] == prefix:
+                high += 1
+            return low, high
+        if condition[0] == 'between':
+            low_value, high_value = _scalar(condition[2][1]), _scalar(condition[3][1])
+            return bisect.bisect_left(sort_keys, (low_value,)), _bisect_after(sort_keys, high_value)
+        comparator, value = condition[1], _scalar(condition[3][1])
+        if comparator == '=':
+            return bisect.bisect_left(sort_keys, (value,)), _bisect_after(sort_keys, value)
+        if comparator == '<':
+            return 0, bisect.bisect_left(sort_keys, (value,))
+        if comparator == '<=':
+            return 0, _bisect_after(sort_keys, value)
+        if comparator == '>':
+            return _bisect_after(sort_keys, value), len(sort_keys)
+        return bisect.bisect_left(sort_keys, (value,)), len(sort_keys)
+
+    def _op_Scan(self, request):
+        table = self._table(request['TableName'])
+        filter_parsed = self._condition(request, 'FilterExpression')
+        paths, _ = self._projection(request)
+        start_key = request.get('ExclusiveStartKey')
+
+        def items():
+            order = table.scan_order()
+            start_hash, start_range = table.primary_key(_decode_item(start_key)) if start_key else (None, None)
+            first = bisect.bisect_left(order, start_hash) if start_key else 0
+            for position in range(first, len(order)):
+                partition = table.partitions[order[position]]
+                for sort_key in list(partition.keys):
+                    if start_key and position == first and sort_key <= start_range:
+                        continue
+                    yield partition.entries[sort_key]
+
+        return self._read_page(request, table, None, items(), filter_parsed, paths)
+
+    def _read_page(self, request, table, index, candidates, filter_parsed, paths):
+        limit = request.get('Limit')
+        consistent = request.get('ConsistentRead', False)
+        results = []
+        evaluated = 0
+        size_read = 0
+        last_item = None
+        more = False
+
+        for item in candidates:
+            if (limit is not None and evaluated >= limit) or size_read >= PAGE_SIZE_LIMIT:
+                more = True
+                break
+            evaluated += 1
+            size_read += item_size(item)
+            last_item = item
+            if filter_parsed is None or _evaluate_condition(item, filter_parsed[0]):
+                results.append(item)
+
+        response = {'Count': len(results), 'ScannedCount': evaluated}
+        if request.get('Select') != 'COUNT':
+            response['Items'] = [self._project(item, paths) for item in results]
+        if more and last_item is not None:
+            key_names = set(table.key_attributes())
+            if index:
+                key_names.add(index.hash_key)
+                if index.range_key:
+                    key_names.add(index.range_key)
+            response['LastEvaluatedKey'] = {name: last_item[name] for name in key_names}
+        response.update(self._consumed(request, table.name, read_units=self._read_units(size_read, consistent)))
+        return response
+
+    # Batches and transactions ------------------------------------------
+
+    def _unprocessed(self):
+        return self.unprocessed_rate and self._random.random() < self.unprocessed_rate
+
+    def _op_BatchGetItem(self, request):
+        responses, unprocessed, consumed = {}, {}, []
+        requested = sum(len(spec['Keys']) for spec in request['RequestItems'].values())
+        if requested > 100:
+            raise DynamoDBError('ValidationException', 'Too many items requested for the BatchGetItem call')
+        for table_name, spec in request['RequestItems'].items():
+            table = self._table(table_name)
+            paths, _ = self._projection(spec)
+            units = 0.0
+            for key in spec['Keys']:
+                if self._unprocessed():
+                    unprocessed.setdefault(table_name, {k: v for k, v in spec.items() if k != 'Keys'})
+                    unprocessed[table_name].setdefault('Keys', []).append(key)
+                    continue
+                item = table.get(_decode_item(key))
+                units += self._read_units(item_size(item), spec.get('ConsistentRead'))
+                if item is not None:
+                    responses.setdefault(table_name, []).append(self._project(item, paths))
+            capacity = self._consumed(request, table_name, read_units=units)
+            if capacity:
+                consumed.append(capacity['ConsumedCapacity'])
+        response = {'Responses': responses, 'UnprocessedKeys': unprocessed}
+        if consumed:
+            response['ConsumedCapacity'] = consumed
+        return response
+
+    def _op_BatchWriteItem(self, request):
+        unprocessed, consumed = {}, []
+        requested = sum(len(writes) for writes in request['RequestItems'].values())
+        if requested > 25:
+            raise DynamoDBError('ValidationException', 'Too many items requested for the BatchWriteItem call')
+        for table_name, writes in request['RequestItems'].items():
+            table = self._table(table_name)
+            units = 0.0
+            for write in writes:
+                if self._unprocessed():
+                    unprocessed.setdefault(table_name, []).append(write)
+                    continue
+                if 'PutRequest' in write:
+                    item = _decode_item(write['PutRequest']['Item'])
+                    old_item = table.put(item)
+                    units += self._write_units(item, old_item or {})
+                else:
+                    old_item = table.delete(_decode_item(write['DeleteRequest']['Key']))
+                    units += self._write_units(old_item or {})
+            capacity = self._consumed(request, table_name, write_units=units)
+            if capacity:
+                consumed.append(capacity['ConsumedCapacity'])
+        response = {'UnprocessedItems': unprocessed}
+        if consumed:
+            response['ConsumedCapacity'] = consumed
+        return response
+
+    def _op_TransactGetItems(self, request):
+        responses = []
+        for entry in request['TransactItems']:
+            spec = entry['Get']
+            table = self._table(spec['TableName'])
+            item = table.get(_decode_item(spec['Key']))
+            paths, _ = self._projection(spec)
+            self._consumed(request, table.name, read_units=2 * self._read_units(item_size(item), True))
+            responses.append({'Item': self._project(item, paths)} if item is not None else {})
+        return {'Responses': responses}
+
+    def _op_TransactWriteItems(self, request):
+        entries = request['TransactItems']
+        if len(entries) > 100:
+            raise DynamoDBError('ValidationException', 'Member must have length less than or equal to 100')
+
+        planned, reasons, failed = [], [], False
+        seen_keys = set()
+        for entry in entries:
+            action, spec = next(iter(entry.items()))
+            table = self._table(spec['TableName'])
+            key_source = spec.get('Key') or spec.get('Item')
+            key = _decode_item({name: key_source[name] for name in table.key_attributes()})
+            identity = (table.name, table.primary_key(key))
+            if identity in seen_keys:
+                raise DynamoDBError('ValidationException',
+                                    'Transaction request cannot include multiple operations on one item')
+            seen_keys.add(identity)
+            old_item = table.get(key)
+            try:
+                self._check_condition(spec, old_item, return_old_on_failure=False)
+                reasons.append({'Code': 'None'})
+            except DynamoDBError:
+                failed = True
+                reason = {'Code': 'ConditionalCheckFailed', 'Message': 'The conditional request failed'}
+                if spec.get('ReturnValuesOnConditionCheckFailure') == 'ALL_OLD' and old_item:
+                    reason['Item'] = old_item
+                reasons.append(reason)
+            planned.append((action, spec, table, key, old_item))
+
+        if failed:
+            codes = ', '.join(reason['Code'] for reason in reasons)
+            raise DynamoDBError(
+                'TransactionCanceledException',
+                f'Transaction cancelled, please refer cancellation reasons for specific reasons [{codes}]',
+                CancellationReasons=reasons
+            )
+
+        for action, spec, table, key, old_item in planned:
+            if action == 'Put':
+                item = _decode_item(spec['Item'])
+                table.put(item)
+                self._consumed(request, table.name, write_units=2 * self._write_units(item, old_item or {}))
+            elif action == 'Update':
+                new_item, _ = self._apply_update(table, spec, key, old_item)
+                table.put(new_item)
+                self._consumed(request, table.name, write_units=2 * self._write_units(new_item, old_item or {}))
+            elif action == 'Delete':
+                table.delete(key)
+                self._consumed(request, table.name, write_units=2 * self._write_units(old_item or {}))
+            else:
+                self._consumed(request, table.name, read_units=2.0)
+        return {}
+
+
+def _bisect_after(sort_keys, value):
+    """Index of the first sort key whose leading element is > value"""
+    low, high = 0, len(sort_keys)
+    while low < high:
+        middle = (low + high) // 2
+        if sort_keys[middle][0] <= value:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
@@ -0,0 +1,356 @@
+"""
+In-process S3 stand-in for the local benchmarks.
+
+Like local_dynamodb, it is installed as a botocore ``before-call`` hook,
+so handler code using a real boto3 S3 client (HeadObject, GetObject,
+PutObject, DeleteObject, CopyObject and the multipart calls) is answered
+from memory. Presigned URLs are never seen by botocore, so request()
+plays the part of a client sending HTTP to one: it verifies the SigV4
+query signature (including signed Content-Type/Content-Length headers)
+and expiry the way S3 does, checks x-amz-checksum-sha256 against the
+body when one is sent, then applies the PUT, UploadPart,
+CompleteMultipartUpload or AbortMultipartUpload.
+"""
+import base64
+import copy
+import datetime
+import hashlib
+import hmac
+import io
+import re
+import threading
+import time
+import uuid
+from urllib.parse import parse_qsl, quote, unquote, urlsplit
+
+from botocore.response import StreamingBody
+
+MIN_PART_BYTES = 5 * 1024 * 1024
+
+
+class S3Error(Exception):
+    """An error returned to the caller as an S3 error response"""
+
+    def __init__(self, status_code, code, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.code = code
+        self.message = message
+
+
+def _check_sha256(data, checksum):
+    """S3's full-object checksum validation: BadDigest unless data hashes to checksum (base64)"""
+    if checksum is not None and base64.b64encode(hashlib.sha256(data).digest()).decode('ascii') != checksum:
+        raise S3Error(400, 'BadDigest', 'The SHA256 you specified did not match the calculated checksum')
+
+
+class _HttpResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+        self.content = b''
+        self.text = ''
+        self.raw = None
+
+
+class _Object:
+    def __init__(self, data, content_type, etag=None, metadata=None):
+        self.data = data
+        self.content_type = content_type
+        self.etag = etag or f'"{hashlib.md5(data).hexdigest()}"'
+        self.metadata = dict(metadata or {})
+        self.last_modified = datetime.datetime.now(datetime.timezone.utc)
+
+
+def _read_body(body):
+    if body is None:
+        return b''
+    if isinstance(body, (bytes, bytearray)):
+        return bytes(body)
+    if isinstance(body, str):
+        return body.encode()
+    return body.read()
+
+
+def _sign(key, message):
+    return hmac.new(key, message.encode('utf-8'), hashlib.sha256).digest()
+
+
+class LocalS3:
+    """
+    In-memory S3 that answers boto3 calls via botocore hooks and
+    presigned-URL requests via request().
+
+    secret_key must be the secret the clients sign with, so presigned
+    URL signatures can be checked. rtt_ms adds a fixed sleep per call.
+    """
+
+    def __init__(self, secret_key, rtt_ms=0.0):
+        self.secret_key = secret_key
+        self.rtt_ms = rtt_ms
+        self.buckets = {}
+        self.uploads = {}
+        self._lock = threading.RLock()
+        self.reset()
+
+    # Bookkeeping --------------------------------------------------------
+
+    def reset(self):
+        """Clear the call and byte counters"""
+        self.calls = 0
+        self.by_operation = {}
+        self.presigned_requests = 0
+        self.bytes_uploaded = 0
+
+    def create_bucket(self, name):
+        self.buckets.setdefault(name, {})
+
+    def put(self, bucket, key, data, content_type='application/octet-stream'):
+        """Store an object directly, for seeding; not counted"""
+        with self._lock:
+            self._bucket(bucket)[key] = _Object(data, content_type)
+
+    def get(self, bucket, key):
+        """Stored bytes of an object, or None"""
+        obj = self._bucket(bucket).get(key)
+        return obj.data if obj else None
+
+    def install(self, session_or_meta):
+        """Answer every S3 call made through clients of a session (or one client's meta)"""
+        session_or_meta.events.register('before-parameter-build.s3', self._capture_params)
+        session_or_meta.events.register('before-call.s3', self._before_call)
+
+    def _bucket(self, name):
+        bucket = self.buckets.get(name)
+        if bucket is None:
+            raise S3Error(404, 'NoSuchBucket', f'The specified bucket does not exist: {name}')
+        return bucket
+
+    def _object(self, bucket, key):
+        obj = self._bucket(bucket).get(key)
+        if obj is None:
+            raise S3Error(404, 'NoSuchKey', 'The specified key does not exist.')
+        return obj
+
+    # botocore hooks -----------------------------------------------------
+
+    @staticmethod
+    def _capture_params(params, context, **kwargs):
+        # before-call only sees the serialized request; keep the API params
+        context['local_s3_params'] = dict(params)
+
+    def _before_call(self, model, context, **kwargs):
+        operation = model.name
+        params = context.get('local_s3_params', {})
+        if self.rtt_ms:
+            time.sleep(self.rtt_ms / 1000.0)
+
+        handler = getattr(self, f'_op_{operation}', None)
+        with self._lock:
+            self.calls += 1
+            self.by_operation[operation] = self.by_operation.get(operation, 0) + 1
+            try:
+                if handler is None:
+                    raise S3Error(400, 'NotImplemented', f'{operation} is not supported locally')
+                response = handler(params)
+            except S3Error as error:
+                # HEAD responses have no body, so S3 reports only the status
+                code = str(error.status_code) if operation == 'HeadObject' else error.code
+                body = {'Error': {'Code': code, 'Message': error.message},
+                        'ResponseMetadata': {'HTTPStatusCode': error.status_code, 'RetryAttempts': 0}}
+                return _HttpResponse(error.status_code), body
+
+        response['ResponseMetadata'] = {'HTTPStatusCode': 200, 'RetryAttempts': 0}
+        return _HttpResponse(200), response
+
+    # Operations ---------------------------------------------------------
+
+    @staticmethod
+    def _describe(obj):
+        return {
+            'ContentLength': len(obj.data),
+            'ContentType': obj.content_type,
+            'ETag': obj.etag,
+            'LastModified': obj.last_modified,
+            'Metadata': copy.deepcopy(obj.metadata),
+        }
+
+    def _op_HeadObject(self, params):
+        return self._describe(self._object(params['Bucket'], params['Key']))
+
+    def _op_GetObject(self, params):
+        obj = self._object(params['Bucket'], params['Key'])
+        return {**self._describe(obj), 'Body': StreamingBody(io.BytesIO(obj.data), len(obj.data))}
+
+    def _op_PutObject(self, params):
+        data = _read_body(params.get('Body'))
+        _check_sha256(data, params.get('ChecksumSHA256'))
+        obj = _Object(data, params.get('ContentType', 'binary/octet-stream'), metadata=params.get('Metadata'))
+        self._bucket(params['Bucket'])[params['Key']] = obj
+        return {'ETag': obj.etag}
+
+    def _op_DeleteObject(self, params):
+        self._bucket(params['Bucket']).pop(params['Key'], None)
+        return {}
+
+    def _op_CopyObject(self, params):
+        source = params['CopySource']
+        if isinstance(source, str):
+            source_bucket, _, source_key = unquote(source).lstrip('/').partition('/')
+        else:
+            source_bucket, source_key = source['Bucket'], source['Key']
+        original = self._object(source_bucket, source_key)
+        replace = params.get('MetadataDirective') == 'REPLACE'
+        obj = _Object(original.data, params.get('ContentType', original.content_type) if replace else original.content_type,
+                      metadata=params.get('Metadata') if replace else original.metadata)
+        self._bucket(params['Bucket'])[params['Key']] = obj
+        return {'CopyObjectResult': {'ETag': obj.etag, 'LastModified': obj.last_modified}}
+
+    def _op_CreateMultipartUpload(self, params):
+        self._bucket(params['Bucket'])
+        upload_id = uuid.uuid4().hex
+        self.uploads[upload_id] = {
+            'bucket': params['Bucket'],
+            'key': params['Key'],
+            'content_type': params.get('ContentType', 'binary/octet-stream'),
+            'parts': {},
+        }
+        return {'Bucket': params['Bucket'], 'Key': params['Key'], 'UploadId': upload_id}
+
+    def _upload(self, bucket, key, upload_id):
+        upload = self.uploads.get(upload_id)
+        if upload is None or upload['bucket'] != bucket or upload['key'] != key:
+            raise S3Error(404, 'NoSuchUpload', 'The specified upload does not exist.')
+        return upload
+
+    def _op_UploadPart(self, params):
+        return self._upload_part(params['Bucket'], params['Key'], params['UploadId'], int(params['PartNumber']),
+                                 _read_body(params.get('Body')))
+
+    def _upload_part(self, bucket, key, upload_id, part_number, data):
+        upload = self._upload(bucket, key, upload_id)
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+        upload['parts'][part_number] = (etag, data)
+        return {'ETag': etag}
+
+    def _op_CompleteMultipartUpload(self, params):
+        parts = [(part['PartNumber'], part['ETag']) for part in params.get('MultipartUpload', {}).get('Parts', [])]
+        return self._complete(params['Bucket'], params['Key'], params['UploadId'], parts)
+
+    def _complete(self, bucket, key, upload_id, parts):
+        upload = self._upload(bucket, key, upload_id)
+        if not parts or [number for number, _ in parts] != sorted({number for number, _ in parts}):
+            raise S3Error(400, 'InvalidPartOrder', 'The list of parts was not in ascending order.')
+        chunks, digests = [], b''
+        for index, (number, etag) in enumerate(parts):
+            stored = upload['parts'].get(number)
+            if stored is None or stored[0] != etag:
+                raise S3Error(400, 'InvalidPart', f'Part {number} was not uploaded or its ETag does not match.')
+            if index < len(parts) - 1 and len(stored[1]) < MIN_PART_BYTES:
+                raise S3Error(400, 'EntityTooSmall', 'Your proposed upload is smaller than the minimum allowed size')
+            chunks.append(stored[1])
+            digests += bytes.fromhex(etag.strip('"'))
+        obj = _Object(b''.join(chunks), upload['content_type'],
+                      etag=f'"{hashlib.md5(digests).hexdigest()}-{len(parts)}"')
+        self._bucket(bucket)[key] = obj
+        del self.uploads[upload_id]
+        return {'Bucket': bucket, 'Key': key, 'ETag': obj.etag}
+
+    def _op_AbortMultipartUpload(self, params):
+        self._upload(params['Bucket'], params['Key'], params['UploadId'])
+        del self.uploads[params['UploadId']]
+        return {}
+
+    # Presigned URLs -----------------------------------------------------
+
+    def request(self, method, url, body=b'', headers=None):
+        """
+        Send an HTTP request to a presigned URL. Returns (status, headers,
+        body); S3 errors come back as status codes, as they would over HTTP.
+        """
+        headers = {name.lower(): value for name, value in (headers or {}).items()}
+        if method in ('PUT', 'POST'):
+            headers['content-length'] = str(len(body))
+        parts = urlsplit(url)
+        query = dict(parse_qsl(parts.query, keep_blank_values=True))
+        bucket, key = self._address(parts)
+        if self.rtt_ms:
+            time.sleep(self.rtt_ms / 1000.0)
+
+        with self._lock:
+            self.presigned_requests += 1
+            try:
+                self._verify(method, parts, query, headers)
+                if method == 'PUT' and 'uploadId' in query:
+                    result = self._upload_part(bucket, key, query['uploadId'], int(query['partNumber']), body)
+                    self.bytes_uploaded += len(body)
+                    return 200, {'ETag': result['ETag']}, b''
+                if method == 'PUT':
+                    _check_sha256(body, headers.get('x-amz-checksum-sha256'))
+                    obj = _Object(body, headers.get('content-type', 'binary/octet-stream'))
+                    self._bucket(bucket)[key] = obj
+                    self.bytes_uploaded += len(body)
+                    return 200, {'ETag': obj.etag}, b''
+                if method == 'POST' and 'uploadId' in query:
+                    parts_xml = re.findall(r'<Part>\s*<PartNumber>(\d+)</PartNumber>\s*<ETag>([^<]+)</ETag>\s*</Part>',
+                                           body.decode())
+                    result = self._complete(bucket, key, query['uploadId'],
+                                            [(int(number), etag.replace('&quot;', '"')) for number, etag in parts_xml])
+                    return 200, {}, f"<CompleteMultipartUploadResult><ETag>{result['ETag']}</ETag>" \
+                                    f"</CompleteMultipartUploadResult>".encode()
+                if method == 'DELETE' and 'uploadId' in query:
+                    self._op_AbortMultipartUpload({'Bucket': bucket, 'Key': key, 'UploadId': query['uploadId']})
+                    return 204, {}, b''
+                raise S3Error(405, 'MethodNotAllowed', f'{method} is not supported locally')
+            except S3Error as error:
+                return error.status_code, {}, f'<Error><Code>{error.code}</Code></Error>'.encode()
+
+    @staticmethod
+    def _address(parts):
+        """(bucket, key) from a virtual-hosted or path-style URL"""
+        host = parts.hostname or ''
+        path = unquote(parts.path)
+        if host.startswith('s3.') or host.startswith('s3-') or not host.endswith('amazonaws.com'):
+            bucket, _, key = path.lstrip('/').partition('/')
+            return bucket, key
+        return host.split('.s3', 1)[0], path.lstrip('/')
+
+    def _verify(self, method, parts, query, headers):
+        """SigV4 query-string authentication, as S3 checks it"""
+        try:
+            signature = query['X-Amz-Signature']
+            credential = query['X-Amz-Credential']
+            amz_date = query['X-Amz-Date']
+            expires = int(query['X-Amz-Expires'])
+            signed_headers = query['X-Amz-SignedHeaders'].split(';')
+        except (KeyError, ValueError):
+            raise S3Error(403, 'AccessDenied', 'Query-string authentication requires a signed URL')
+
+        signed_at = datetime.datetime.strptime(amz_date, '%Y%m%dT%H%M%SZ').replace(tzinfo=datetime.timezone.utc)
+        if datetime.datetime.now(datetime.timezone.utc) > signed_at + datetime.timedelta(seconds=expires):
+            raise S3Error(403, 'AccessDenied', 'Request has expired')
+
+        headers = {**headers, 'host': parts.netloc}
+        if any(name not in headers for name in signed_headers):
+            raise S3Error(403, 'SignatureDoesNotMatch', 'A signed header is missing')
+        canonical_query = '&'.join(
+            f"{quote(name, safe='-_.~')}={quote(value, safe='-_.~')}"
+            for name, value in sorted(query.items()) if name != 'X-Amz-Signature'
+        )
+        canonical_request = '\n'.join([
+            method,
+            quote(unquote(parts.path), safe='/~'),
+            canonical_query,
+            ''.join(f'{name}:{str(headers[name]).strip()}\n' for name in signed_headers),
+            ';'.join(signed_headers),
+            'UNSIGNED-PAYLOAD',
+        ])
+        _, date, region, service, terminator = credential.split('/')
+        string_to_sign = '\n'.join([
+            'AWS4-HMAC-SHA256', amz_date, f'{date}/{region}/{service}/{terminator}',
+            hashlib.sha256(canonical_request.encode()).hexdigest(),
+        ])
+        key = _sign(_sign(_sign(_sign(f'AWS4{self.secret_key}'.encode(), date), region), service), terminator)
+        expected = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected, signature):
+            raise S3Error(403, 'SignatureDoesNotMatch', 'The request signature does not match')
@@ -0,0 +1,92 @@
+"""
+In-process SNS stand-in for the local benchmarks.
+
+Installed as a botocore ``before-call`` hook like local_s3, it answers
+Publish and PublishBatch for any topic and keeps every published
+message (with its attributes) in ``published``. fail_rate makes that
+fraction of PublishBatch entries come back under Failed, as throttled
+entries do, so retry paths can be exercised.
+"""
+import random
+import threading
+import time
+import uuid
+
+
+class _HttpResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+        self.content = b''
+        self.text = ''
+        self.raw = None
+
+
+class LocalSNS:
+    """In-memory SNS topics; rtt_ms adds a fixed sleep per call"""
+
+    def __init__(self, rtt_ms=0.0, fail_rate=0.0, seed=0):
+        self.rtt_ms = rtt_ms
+        self.fail_rate = fail_rate
+        self.published = []
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        """Clear the call counters (not the published messages)"""
+        self.calls = 0
+        self.by_operation = {}
+
+    def install(self, session):
+        """Answer every SNS call made through clients of session"""
+        session.events.register('before-parameter-build.sns', self._capture_params)
+        session.events.register('before-call.sns', self._before_call)
+
+    @staticmethod
+    def _capture_params(params, context, **kwargs):
+        # SNS requests are form-encoded by the time before-call sees them
+        context['local_sns_params'] = dict(params)
+
+    def _before_call(self, model, context, **kwargs):
+        operation = model.name
+        params = context.get('local_sns_params', {})
+        if self.rtt_ms:
+            time.sleep(self.rtt_ms / 1000.0)
+
+        with self._lock:
+            self.calls += 1
+            self.by_operation[operation] = self.by_operation.get(operation, 0) + 1
+            handler = getattr(self, f'_op_{operation}', None)
+            if handler is None:
+                body = {'Error': {'Code': 'InvalidAction', 'Message': f'{operation} is not supported locally'},
+                        'ResponseMetadata': {'HTTPStatusCode': 400, 'RetryAttempts': 0}}
+                return _HttpResponse(400), body
+            response = handler(params)
+
+        response['ResponseMetadata'] = {'HTTPStatusCode': 200, 'RetryAttempts': 0}
+        return _HttpResponse(200), response
+
+    def _store(self, topic_arn, entry):
+        message_id = str(uuid.uuid4())
+        self.published.append({
+            'TopicArn': topic_arn,
+            'MessageId': message_id,
+            'Message': entry['Message'],
+            'MessageAttributes': {name: value.get('StringValue')
+                                  for name, value in (entry.get('MessageAttributes') or {}).items()},
+        })
+        return message_id
+
+    def _op_Publish(self, params):
+        return {'MessageId': self._store(params['TopicArn'], params)}
+
+    def _op_PublishBatch(self, params):
+        successful, failed = [], []
+        for entry in params['PublishBatchRequestEntries']:
+            if self.fail_rate and self._random.random() < self.fail_rate:
+                failed.append({'Id': entry['Id'], 'Code': 'Throttled', 'SenderFault': False,
+                               'Message': 'Rate exceeded'})
+            else:
+                successful.append({'Id': entry['Id'], 'MessageId': self._store(params['TopicArn'], entry)})
+        return {'Successful': successful, 'Failed': failed}
@@ -0,0 +1,138 @@
+"""
+Cold-start profile of each Lambda handler.
+
+Every handler is imported in a fresh interpreter started with
+python -X importtime, the way the Lambda runtime imports it during the
+init phase, and then invoked twice against LocalDynamoDB: the first
+request pays for anything created lazily (boto3 resources, tables), the
+second is a warm invocation. Reports init (import) time, first and warm
+request time, and the modules that dominate the import graph.
+
+Usage:
+    python benchmarks/profile_startup.py [--handlers users friends] [--runs 5] [--top 8]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HANDLERS = ('auth', 'users', 'friends', 'postcards')
+# Written to stderr by the child around the handler import, so only the
+# init phase is attributed (not this script or the benchmark harness)
+INIT_START = '--- init start'
+INIT_DONE = '--- init done'
+
+# A cheap authenticated request per handler: (method, path, resource)
+FIRST_REQUEST = {
+    'auth': ('POST', '/v1/auth', '/v1/auth'),
+    'users': ('GET', '/v1/users', '/v1/users'),
+    'friends': ('GET', '/v1/friends', '/v1/friends'),
+    'postcards': ('GET', '/v1/postcards/received', '/v1/postcards/received'),
+}
+
+
+def child(name):
+    """Runs inside the profiled interpreter; prints timings as JSON"""
+    benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+    lambda_root = os.path.join(benchmarks_dir, '..', 'lambda')
+    # The Lambda runtime puts the function and its layers on sys.path
+    sys.path[:0] = [os.path.join(lambda_root, name), os.path.join(lambda_root, 'shared', 'python')]
+
+    import importlib.util
+    sys.stderr.write(f'{INIT_START}\n')
+    start = time.perf_counter()
+    spec = importlib.util.spec_from_file_location('lambda_function', os.path.join(lambda_root, name, 'lambda_function.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    init_ms = (time.perf_counter() - start) * 1000.0
+    sys.stderr.write(f'{INIT_DONE}\n')
+
+    sys.path.insert(0, benchmarks_dir)
+    import harness
+
+    method, path, resource = FIRST_REQUEST[name]
+    timings = []
+    from botocore.client import BaseClient
+
+    with harness.local_aws() as local_dynamodb:
+        # Clients created at import time copied their event hooks before
+        # the stand-in existed; hook them directly
+        for value in vars(module).values():
+            client = getattr(getattr(value, 'meta', None), 'client', value)
+            if isinstance(client, BaseClient):
+                local_dynamodb.install(client.meta)
+        for _ in range(2):
+            event = harness.api_event(method, path, 'user-profile-startup', resource=resource)
+            start = time.perf_counter()
+            response = module.lambda_handler(event, None)
+            timings.append((time.perf_counter() - start) * 1000.0)
+    assert response['statusCode'] < 500, response
+    print(json.dumps({'init_ms': init_ms, 'first_ms': timings[0], 'warm_ms': timings[1]}))
+
+
+def parse_importtime(stderr):
+    """{module: cumulative_us} for the top-level imports of the init phase"""
+    modules = {}
+    in_init = False
+    for line in stderr.splitlines():
+        if line in (INIT_START, INIT_DONE):
+            in_init = line == INIT_START
+            continue
+        if not in_init or not line.startswith('import time:'):
+            continue
+        _, cumulative_us, module = line[len('import time:'):].split('|')
+        # Nested imports are indented two spaces per level
+        if not module[1:].startswith(' '):
+            modules[module.strip()] = int(cumulative_us)
+    return modules
+
+
+def profile(name, runs):
+    results, imports = [], None
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', os.path.abspath(__file__), '--child', name],
+            capture_output=True, text=True, check=True,
+            # Lambda provides credentials and region in the environment
+            env={'AWS_ACCESS_KEY_ID': 'profile', 'AWS_SECRET_ACCESS_KEY': 'profile', **os.environ,
+                 'AWS_DEFAULT_REGION': 'us-east-1'}
+        )
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+        imports = parse_importtime(completed.stderr)
+    return {key: statistics.median(r[key] for r in results) for key in results[0]}, imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--handlers', nargs='+', choices=HANDLERS, default=list(HANDLERS))
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=8, help='heaviest top-level imports to list per handler')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import harness
+
+    rows, heaviest = [], {}
+    for name in args.handlers:
+        timings, imports = profile(name, args.runs)
+        rows.append([name, f"{timings['init_ms']:.1f}", f"{timings['first_ms']:.1f}", f"{timings['warm_ms']:.2f}"])
+        heaviest[name] = sorted(imports.items(), key=lambda entry: entry[1], reverse=True)[:args.top]
+
+    print(f'Median of {args.runs} fresh interpreters per handler\n')
+    harness.print_table(['handler', 'init ms', 'first request ms', 'warm request ms'], rows)
+    for name, modules in heaviest.items():
+        print(f'\n{name}: heaviest imports (cumulative ms)')
+        for module, cumulative_us in modules:
+            print(f'  {module:<40} {cumulative_us / 1000.0:8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -36,7 +36,13 @@ const devApiStack = new ApiStack(app, 'PostiiApiDev', {
   usersTable: devDatabaseStack.usersTable,
   friendshipsTable: devDatabaseStack.friendshipsTable,
   postcardsTable: devDatabaseStack.postcardsTable,
+  searchIndexTable: devDatabaseStack.searchIndexTable,
+  imagesTable: devDatabaseStack.imagesTable,
+  eventLedgerTable: devDatabaseStack.eventLedgerTable,
+  idempotencyTable: devDatabaseStack.idempotencyTable,
+  rateLimitsTable: devDatabaseStack.rateLimitsTable,
   assetsBucket: devStorageStack.assetsBucket,
+  assetsDomain: devStorageStack.distribution.distributionDomainName,
 });
 
 // Add dependencies for proper deployment order
@@ -72,7 +78,13 @@ const prodApiStack = new ApiStack(app, 'PostiiApiProd', {
   usersTable: prodDatabaseStack.usersTable,
   friendshipsTable: prodDatabaseStack.friendshipsTable,
   postcardsTable: prodDatabaseStack.postcardsTable,
+  searchIndexTable: prodDatabaseStack.searchIndexTable,
+  imagesTable: prodDatabaseStack.imagesTable,
+  eventLedgerTable: prodDatabaseStack.eventLedgerTable,
+  idempotencyTable: prodDatabaseStack.idempotencyTable,
+  rateLimitsTable: prodDatabaseStack.rateLimitsTable,
   assetsBucket: prodStorageStack.assetsBucket,
+  assetsDomain: prodStorageStack.distribution.distributionDomainName,
 });
 
 // Add dependencies for proper deployment order
@@ -1,26 +1,19 @@
 import json
 import logging
+from postii_common.responses import compressible, json_response
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+@compressible
 def lambda_handler(event, context):
     """
     Postii Auth handler - implementation needed
     """
     logger.info(f'Auth handler called: {json.dumps(event)}')
     
-    return {
-        'statusCode': 200,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-            'Access-Control-Allow-Headers': 'Content-Type, Authorization',
-        },
-        'body': json.dumps({
-            'message': 'Postii Auth handler - implementation needed',
-            'path': event.get('path'),
-            'httpMethod': event.get('httpMethod'),
-        })
-    }
\ No newline at end of file
+    return json_response(200, {
+        'message': 'Postii Auth handler - implementation needed',
+        'path': event.get('path'),
+        'httpMethod': event.get('httpMethod'),
+    })
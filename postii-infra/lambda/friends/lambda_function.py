@@ -1,18 +1,46 @@
+import heapq
+import itertools
 import json
-import boto3
 import logging
 import os
-import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from boto3.dynamodb.conditions import Key, Attr
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+from postii_common import aws, cursors, dal, events, idempotency, profiles, rate_limits, search_index
+from postii_common.friendships import pair_key, status_sort_key, STATUS_ACCEPTED, STATUS_PENDING
+from postii_common.responses import compressible, json_response
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Initialize AWS clients
-dynamodb = boto3.resource('dynamodb')
+# Reused across warm invocations to run GSI queries concurrently
+query_executor = ThreadPoolExecutor(max_workers=4)
 
+# Per-user request and search limits; this container's view of the
+# buckets is kept across warm invocations
+rate_limiter = rate_limits.TokenBuckets()
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+# Friend list streams: (GSI, partition key, status prefix of statusSK)
+FRIEND_LIST_STREAMS = {
+    'acceptedSent': ('requester-status-index', 'requesterId', STATUS_ACCEPTED),
+    'acceptedReceived': ('addressee-status-index', 'addresseeId', STATUS_ACCEPTED),
+    'pendingSent': ('requester-status-index', 'requesterId', STATUS_PENDING),
+    'pendingReceived': ('addressee-status-index', 'addresseeId', STATUS_PENDING),
+}
+
+# Sections of the friend list and the streams merged into each
+FRIEND_LIST_SECTIONS = {
+    'friends': ('acceptedSent', 'acceptedReceived'),
+    'sent': ('pendingSent',),
+    'received': ('pendingReceived',),
+}
+
+@compressible
 def lambda_handler(event, context):
     """
     Postii Friends Lambda Handler
@@ -21,19 +49,25 @@ def lambda_handler(event, context):
     1. Send friend request
     2. Accept friend request  
     3. Search for friends
+    4. List friends and pending requests (expand=profiles adds public profiles)
     """
     
     try:
         # Get environment variables
         users_table_name = os.environ.get('USERS_TABLE')
         friendships_table_name = os.environ.get('FRIENDSHIPS_TABLE')
+        search_index_table_name = os.environ.get('SEARCH_INDEX_TABLE')
+        idempotency_table_name = os.environ.get('IDEMPOTENCY_TABLE')
+        rate_limits_table_name = os.environ.get('RATE_LIMITS_TABLE')  # Optional: unset turns limits off
         
-        if not users_table_name or not friendships_table_name:
+        if (not users_table_name or not friendships_table_name or not search_index_table_name
+                or not idempotency_table_name):
             logger.error("Missing required environment variables")
-            return create_response(500, {'error': 'Configuration error'})
+            return json_response(500, {'error': 'Configuration error'})
             
-        users_table = dynamodb.Table(users_table_name)
-        friendships_table = dynamodb.Table(friendships_table_name)
+        users_table = aws.table(users_table_name)
+        friendships_table = aws.table(friendships_table_name)
+        search_index_table = aws.table(search_index_table_name)
         
         # Extract route information
         http_method = event.get('httpMethod', '')
@@ -43,36 +77,46 @@ def lambda_handler(event, context):
         
         # Parse request body if present
         body = {}
-        if event.get('body'):
+        body_text = events.body_text(event)
+        if body_text:
             try:
-                body = json.loads(event['body'])
+                body = json.loads(body_text)
             except json.JSONDecodeError:
-                return create_response(400, {'error': 'Invalid JSON in request body'})
+                return json_response(400, {'error': 'Invalid JSON in request body'})
         
         # Extract user ID from Cognito claims
         claims = event.get('requestContext', {}).get('authorizer', {}).get('claims', {})
         current_user_id = claims.get('sub')
         
         if not current_user_id:
-            return create_response(401, {'error': 'Unauthorized - missing user ID'})
+            return json_response(401, {'error': 'Unauthorized - missing user ID'})
             
         logger.info(f'Processing {http_method} request for user {current_user_id}')
         
         # Route to appropriate handler based on path and method
         if 'send-request' in path and http_method == 'POST':
-            return handle_send_friend_request(friendships_table, users_table, current_user_id, body)
+            # Retries carrying the same Idempotency-Key get the first response
+            # back before the limiter is asked, so a replay spends no token
+            return idempotency.run(idempotency_table_name, event, current_user_id, 'send-friend-request',
+                                   lambda: rate_limiter.check(rate_limits_table_name, current_user_id,
+                                                              'send-friend-request')
+                                   or handle_send_friend_request(friendships_table, users_table,
+                                                                 current_user_id, body))
         elif 'accept-request' in path and http_method == 'POST':
             return handle_accept_friend_request(friendships_table, current_user_id, body)
         elif 'search' in path and http_method == 'GET':
-            return handle_search_friends(users_table, current_user_id, query_parameters)
+            throttled = rate_limiter.check(rate_limits_table_name, current_user_id, 'search-friends')
+            if throttled:
+                return throttled
+            return handle_search_friends(search_index_table, current_user_id, query_parameters)
         elif http_method == 'GET':
-            return handle_get_friends(friendships_table, current_user_id, query_parameters)
+            return handle_get_friends(friendships_table, users_table, current_user_id, query_parameters)
         else:
-            return create_response(404, {'error': 'Endpoint not found'})
+            return json_response(404, {'error': 'Endpoint not found'})
             
     except Exception as e:
         logger.error(f'Unexpected error: {str(e)}', exc_info=True)
-        return create_response(500, {'error': 'Internal server error'})
+        return json_response(500, {'error': 'Internal server error'})
 
 
 def handle_send_friend_request(friendships_table, users_table, requester_id, body):
@@ -82,7 +126,7 @@ def handle_send_friend_request(friendships_table, users_table, requester_id, bod
         # Validate input
         addressee_username = body.get('username')
         if not addressee_username:
-            return create_response(400, {'error': 'Username is required'})
+            return json_response(400, {'error': 'Username is required'})
             
         # Find the addressee user by username
         response = users_table.query(
@@ -91,50 +135,65 @@ def handle_send_friend_request(friendships_table, users_table, requester_id, bod
         )
         
         if not response['Items']:
-            return create_response(404, {'error': 'User not found'})
+            return json_response(404, {'error': 'User not found'})
             
         addressee_user = response['Items'][0]
         addressee_id = addressee_user['userId']
         
         # Check if user is trying to send request to themselves
         if requester_id == addressee_id:
-            return create_response(400, {'error': 'Cannot send friend request to yourself'})
+            return json_response(400, {'error': 'Cannot send friend request to yourself'})
             
-        # Check if friendship already exists
-        existing_friendship = check_existing_friendship(friendships_table, requester_id, addressee_id)
-        if existing_friendship:
-            status = existing_friendship.get('status')
-            if status == 'accepted':
-                return create_response(409, {'error': 'Already friends'})
-            elif status == 'pending':
-                return create_response(409, {'error': 'Friend request already sent'})
-                
-        # Create friend request
-        friendship_id = str(uuid.uuid4())
+        # Create the friend request under the pair's key. The condition
+        # makes the write itself the existence check: it only succeeds if
+        # the pair has no row yet, or its last request was not kept.
+        friendship_id = pair_key(requester_id, addressee_id)
         current_time = datetime.utcnow().isoformat()
         
         friendship_item = {
             'friendshipId': friendship_id,
             'requesterId': requester_id,
             'addresseeId': addressee_id,
-            'status': 'pending',
+            'status': STATUS_PENDING,
+            'statusSK': status_sort_key(STATUS_PENDING, current_time),
             'createdAt': current_time,
             'updatedAt': current_time
         }
         
-        friendships_table.put_item(Item=friendship_item)
+        try:
+            friendships_table.put_item(
+                Item=friendship_item,
+                ConditionExpression='attribute_not_exists(friendshipId) OR NOT #status IN (:accepted, :pending)',
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={
+                    ':accepted': STATUS_ACCEPTED,
+                    ':pending': STATUS_PENDING
+                },
+                ReturnValuesOnConditionCheckFailure='ALL_OLD'
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            # The old item comes back in low-level attribute-value form
+            status = e.response.get('Item', {}).get('status', {}).get('S')
+            if status is None:
+                existing_friendship = check_existing_friendship(friendships_table, requester_id, addressee_id)
+                status = (existing_friendship or {}).get('status')
+            if status == STATUS_ACCEPTED:
+                return json_response(409, {'error': 'Already friends'})
+            return json_response(409, {'error': 'Friend request already sent'})
         
         logger.info(f'Friend request sent from {requester_id} to {addressee_id}')
         
-        return create_response(201, {
+        return json_response(201, {
             'message': 'Friend request sent successfully',
             'friendshipId': friendship_id,
-            'status': 'pending'
+            'status': STATUS_PENDING
         })
         
     except Exception as e:
         logger.error(f'Error sending friend request: {str(e)}')
-        return create_response(500, {'error': 'Failed to send friend request'})
+        return json_response(500, {'error': 'Failed to send friend request'})
 
 
 def handle_accept_friend_request(friendships_table, current_user_id, body):
@@ -144,182 +203,164 @@ def handle_accept_friend_request(friendships_table, current_user_id, body):
         # Validate input
         friendship_id = body.get('friendshipId')
         if not friendship_id:
-            return create_response(400, {'error': 'Friendship ID is required'})
+            return json_response(400, {'error': 'Friendship ID is required'})
             
         # Get the friendship record
-        response = friendships_table.get_item(
-            Key={'friendshipId': friendship_id}
-        )
+        friendship = get_friendship(friendships_table, friendship_id)
         
-        if 'Item' not in response:
-            return create_response(404, {'error': 'Friend request not found'})
+        if not friendship:
+            return json_response(404, {'error': 'Friend request not found'})
             
-        friendship = response['Item']
+        # Legacy IDs resolve to the pair-keyed row
+        friendship_id = friendship['friendshipId']
         
         # Verify the current user is the addressee
         if friendship['addresseeId'] != current_user_id:
-            return create_response(403, {'error': 'Unauthorized to accept this friend request'})
+            return json_response(403, {'error': 'Unauthorized to accept this friend request'})
             
         # Check if already accepted
-        if friendship['status'] == 'accepted':
-            return create_response(409, {'error': 'Friend request already accepted'})
+        if friendship['status'] == STATUS_ACCEPTED:
+            return json_response(409, {'error': 'Friend request already accepted'})
             
         # Check if the request is still pending
-        if friendship['status'] != 'pending':
-            return create_response(400, {'error': 'Friend request is no longer pending'})
+        if friendship['status'] != STATUS_PENDING:
+            return json_response(400, {'error': 'Friend request is no longer pending'})
             
         # Update the friendship status
         current_time = datetime.utcnow().isoformat()
         
-        friendships_table.update_item(
-            Key={'friendshipId': friendship_id},
-            UpdateExpression='SET #status = :status, updatedAt = :updated',
-            ExpressionAttributeNames={'#status': 'status'},
-            ExpressionAttributeValues={
-                ':status': 'accepted',
-                ':updated': current_time
-            }
-        )
+        # Accept; the status condition stops a concurrent accept from
+        # counting twice. Both friendsCounts and the requester's
+        # notification follow from the table stream (see lambda/streams)
+        try:
+            friendships_table.update_item(
+                Key={'friendshipId': friendship_id},
+                UpdateExpression='SET #status = :status, statusSK = :status_sk, updatedAt = :updated',
+                ConditionExpression='#status = :pending',
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={
+                    ':status': STATUS_ACCEPTED,
+                    ':status_sk': status_sort_key(STATUS_ACCEPTED, friendship['createdAt']),
+                    ':updated': current_time,
+                    ':pending': STATUS_PENDING
+                }
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return json_response(409, {'error': 'Friend request already accepted'})
+            raise
         
         logger.info(f'Friend request {friendship_id} accepted by {current_user_id}')
         
-        return create_response(200, {
+        return json_response(200, {
             'message': 'Friend request accepted successfully',
             'friendshipId': friendship_id,
-            'status': 'accepted'
+            'status': STATUS_ACCEPTED
         })
         
     except Exception as e:
         logger.error(f'Error accepting friend request: {str(e)}')
-        return create_response(500, {'error': 'Failed to accept friend request'})
+        return json_response(500, {'error': 'Failed to accept friend request'})
 
 
-def handle_search_friends(users_table, current_user_id, query_parameters):
+def handle_search_friends(search_index_table, current_user_id, query_parameters):
     """Search for users by username or email"""
     
     try:
         # Get search query
         query = query_parameters.get('q', '').strip()
         if not query:
-            return create_response(400, {'error': 'Search query is required'})
+            return json_response(400, {'error': 'Search query is required'})
             
         if len(query) < 2:
-            return create_response(400, {'error': 'Search query must be at least 2 characters'})
-            
-        # Search by username (using begins_with for partial matches)
-        username_results = []
-        try:
-            response = users_table.scan(
-                FilterExpression=Attr('username').contains(query),
-                ProjectionExpression='userId, username, email, #name',
-                ExpressionAttributeNames={'#name': 'name'}
-            )
-            username_results = response.get('Items', [])
-        except Exception as e:
-            logger.error(f'Error searching usernames: {str(e)}')
-            
-        # Search by email (using begins_with for partial matches)  
-        email_results = []
-        try:
-            response = users_table.scan(
-                FilterExpression=Attr('email').contains(query),
-                ProjectionExpression='userId, username, email, #name',
-                ExpressionAttributeNames={'#name': 'name'}
-            )
-            email_results = response.get('Items', [])
-        except Exception as e:
-            logger.error(f'Error searching emails: {str(e)}')
+            return json_response(400, {'error': 'Search query must be at least 2 characters'})
             
-        # Combine results and remove duplicates
-        all_results = username_results + email_results
-        unique_results = {}
-        
-        for user in all_results:
-            user_id = user['userId']
-            # Don't include the current user in search results
-            if user_id != current_user_id:
-                unique_results[user_id] = {
-                    'userId': user_id,
-                    'username': user.get('username', ''),
-                    'email': user.get('email', ''),
-                    'name': user.get('name', ''),
-                }
-        
-        results_list = list(unique_results.values())
+        # Look the query up in the search index instead of scanning Users
+        max_results = min(int(query_parameters.get('limit', 20)), 50)
+        matches = search_index.search(
+            search_index_table,
+            query,
+            max_results,
+            exclude_user_id=current_user_id
+        )
         
-        # Limit results to prevent large responses
-        max_results = int(query_parameters.get('limit', 20))
-        results_list = results_list[:max_results]
+        results_list = [
+            {
+                'userId': user['userId'],
+                'username': user.get('username', ''),
+                'email': user.get('email', ''),
+                'name': user.get('fullName', ''),
+            }
+            for user in matches
+        ]
         
         logger.info(f'Search for "{query}" returned {len(results_list)} results')
         
-        return create_response(200, {
+        return json_response(200, {
             'query': query,
             'results': results_list,
             'count': len(results_list)
         })
         
+    except ValueError:
+        return json_response(400, {'error': 'Invalid limit parameter'})
     except Exception as e:
         logger.error(f'Error searching for friends: {str(e)}')
-        return create_response(500, {'error': 'Failed to search for friends'})
+        return json_response(500, {'error': 'Failed to search for friends'})
 
 
-def handle_get_friends(friendships_table, current_user_id, query_parameters):
-    """Get user's friends and friend requests"""
+def handle_get_friends(friendships_table, users_table, current_user_id, query_parameters):
+    """Get a page of the user's friends and friend requests"""
     
     try:
-        # Get friends where user is the requester
-        sent_requests = friendships_table.query(
-            IndexName='requester-index',
-            KeyConditionExpression=Key('requesterId').eq(current_user_id)
-        ).get('Items', [])
-        
-        # Get friends where user is the addressee
-        received_requests = friendships_table.query(
-            IndexName='addressee-index', 
-            KeyConditionExpression=Key('addresseeId').eq(current_user_id)
-        ).get('Items', [])
-        
-        # Categorize friendships
-        friends = []
-        pending_sent = []
-        pending_received = []
-        
-        for friendship in sent_requests:
-            if friendship['status'] == 'accepted':
-                friends.append({
-                    'friendshipId': friendship['friendshipId'],
-                    'friendId': friendship['addresseeId'],
-                    'status': 'accepted',
-                    'createdAt': friendship['createdAt']
-                })
-            elif friendship['status'] == 'pending':
-                pending_sent.append({
-                    'friendshipId': friendship['friendshipId'],
-                    'userId': friendship['addresseeId'],
-                    'status': 'pending',
-                    'createdAt': friendship['createdAt']
-                })
-                
-        for friendship in received_requests:
-            if friendship['status'] == 'accepted':
-                friends.append({
-                    'friendshipId': friendship['friendshipId'],
-                    'friendId': friendship['requesterId'],
-                    'status': 'accepted',
-                    'createdAt': friendship['createdAt']
-                })
-            elif friendship['status'] == 'pending':
-                pending_received.append({
-                    'friendshipId': friendship['friendshipId'],
-                    'userId': friendship['requesterId'],
-                    'status': 'pending',
-                    'createdAt': friendship['createdAt']
-                })
+        section = query_parameters.get('type', 'all')
+        if section != 'all' and section not in FRIEND_LIST_SECTIONS:
+            return json_response(400, {'error': 'type must be one of: all, friends, sent, received'})
+            
+        limit = min(int(query_parameters.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        if limit < 1:
+            return json_response(400, {'error': 'limit must be positive'})
+            
+        # Each stream is one status-prefixed GSI query; the token maps the
+        # streams that still have rows to the key to resume them from
+        sections = FRIEND_LIST_SECTIONS if section == 'all' else {section: FRIEND_LIST_SECTIONS[section]}
+        next_token = query_parameters.get('nextToken')
+        if next_token:
+            try:
+                positions = decode_page_token(next_token, current_user_id)
+            except cursors.InvalidCursor:
+                return json_response(400, {'error': 'Invalid nextToken parameter'})
+        else:
+            positions = {stream: None for streams in sections.values() for stream in streams}
+            
+        active_streams = [
+            stream for streams in sections.values() for stream in streams if stream in positions
+        ]
+        
+        # Run the GSI queries concurrently
+        futures = {
+            stream: query_executor.submit(
+                query_friendship_stream, friendships_table, stream, current_user_id, limit, positions[stream]
+            )
+            for stream in active_streams
+        }
+        pages = {stream: future.result() for stream, future in futures.items()}
+        
+        results = {}
+        next_positions = {}
+        for name, streams in sections.items():
+            results[name], section_positions = merge_friendship_streams(
+                {stream: pages[stream] for stream in streams if stream in pages}, limit, positions
+            )
+            next_positions.update(section_positions)
+            
+        friends = [format_friendship(item, 'friendId', current_user_id) for item in results.get('friends', [])]
+        pending_sent = [format_friendship(item, 'userId', current_user_id) for item in results.get('sent', [])]
+        pending_received = [format_friendship(item, 'userId', current_user_id) for item in results.get('received', [])]
         
         logger.info(f'Retrieved friends for user {current_user_id}: {len(friends)} friends, {len(pending_sent)} sent, {len(pending_received)} received')
         
-        return create_response(200, {
+        response_body = {
             'friends': friends,
             'pendingSent': pending_sent,
             'pendingReceived': pending_received,
@@ -328,53 +369,149 @@ def handle_get_friends(friendships_table, current_user_id, query_parameters):
                 'pendingSent': len(pending_sent),
                 'pendingReceived': len(pending_received)
             }
-        })
+        }
+        
+        if next_positions:
+            response_body['nextToken'] = encode_page_token(next_positions, current_user_id)
+            
+        # One BatchGetItem instead of a GET /v1/users/{userId} per row
+        if profiles.wants_profiles(query_parameters):
+            user_ids = [entry['friendId'] for entry in friends]
+            user_ids += [entry['userId'] for entry in pending_sent + pending_received]
+            response_body['profiles'] = profiles.get_public_profiles(users_table, user_ids)
+            
+        return json_response(200, response_body)
         
+    except ValueError:
+        return json_response(400, {'error': 'Invalid limit parameter'})
     except Exception as e:
         logger.error(f'Error getting friends: {str(e)}')
-        return create_response(500, {'error': 'Failed to get friends'})
+        return json_response(500, {'error': 'Failed to get friends'})
+
+
+def query_friendship_stream(friendships_table, stream, user_id, limit, start_key):
+    """Query one status-prefixed GSI stream; returns (items, last_evaluated_key)"""
+    
+    index_name, partition_key, status = FRIEND_LIST_STREAMS[stream]
+    
+    # The plain client is thread-safe (Table resources are not), and its
+    # rows come back JSON-ready
+    return dal.query(
+        friendships_table.name,
+        IndexName=index_name,
+        KeyConditionExpression=f'{partition_key} = :user_id AND begins_with(statusSK, :status)',
+        ProjectionExpression='friendshipId, requesterId, addresseeId, #status, createdAt, statusSK',
+        ExpressionAttributeNames={'#status': 'status'},
+        ExpressionAttributeValues={':user_id': user_id, ':status': f'{status}#'},
+        ExclusiveStartKey=start_key,
+        Limit=limit
+    )
+
+
+def merge_friendship_streams(pages, limit, start_positions):
+    """
+    Merge already-sorted stream pages by statusSK and cut to limit.
+
+    Returns the merged items and, for every stream with rows left, the
+    key to resume it from: the last row taken from it if the page was
+    cut short (the key it was read from, in start_positions, if none
+    was taken), otherwise its LastEvaluatedKey.
+    """
+    
+    tagged = [
+        [(item['statusSK'], stream, item) for item in items]
+        for stream, (items, _) in pages.items()
+    ]
+    merged = list(itertools.islice(heapq.merge(*tagged, key=lambda entry: entry[0]), limit))
+    
+    taken = {}
+    for _, stream, item in merged:
+        taken[stream] = taken.get(stream, 0) + 1
+        
+    positions = {}
+    for stream, (items, last_evaluated_key) in pages.items():
+        count = taken.get(stream, 0)
+        if count < len(items):
+            _, partition_key, _ = FRIEND_LIST_STREAMS[stream]
+            if count:
+                positions[stream] = stream_position(items[count - 1], partition_key)
+            else:
+                positions[stream] = start_positions.get(stream)
+        elif last_evaluated_key:
+            positions[stream] = last_evaluated_key
+            
+    return [item for _, _, item in merged], positions
+
+
+def stream_position(item, partition_key):
+    """ExclusiveStartKey that resumes a status GSI query after item"""
+    return {
+        'friendshipId': item['friendshipId'],
+        partition_key: item[partition_key],
+        'statusSK': item['statusSK']
+    }
+
+
+def format_friendship(friendship, id_field, current_user_id):
+    """Format a friendship row from the current user's point of view"""
+    other_user_id = friendship['addresseeId'] if friendship['requesterId'] == current_user_id else friendship['requesterId']
+    return {
+        'friendshipId': friendship['friendshipId'],
+        id_field: other_user_id,
+        'status': friendship['status'],
+        'createdAt': friendship['createdAt']
+    }
+
+
+def encode_page_token(positions, user_id):
+    """Signed nextToken; each stream keeps just [friendshipId, statusSK]"""
+    compact = {
+        stream: [key['friendshipId'], key['statusSK']] if key else None
+        for stream, key in positions.items()
+    }
+    return cursors.encode(compact, f'friends:{user_id}')
+
+
+def decode_page_token(token, user_id):
+    """Stream positions for a nextToken; raises InvalidCursor"""
+    compact = cursors.decode(token, f'friends:{user_id}')
+    if not isinstance(compact, dict) or not set(compact) <= set(FRIEND_LIST_STREAMS):
+        raise cursors.InvalidCursor('Unexpected friends cursor payload')
+    
+    positions = {}
+    for stream, key in compact.items():
+        if key is None:
+            positions[stream] = None
+            continue
+        if not (isinstance(key, list) and len(key) == 2 and all(isinstance(part, str) for part in key)):
+            raise cursors.InvalidCursor('Unexpected friends cursor payload')
+        _, partition_key, _ = FRIEND_LIST_STREAMS[stream]
+        positions[stream] = {'friendshipId': key[0], partition_key: user_id, 'statusSK': key[1]}
+    return positions
 
 
 def check_existing_friendship(friendships_table, user_id_1, user_id_2):
     """Check if friendship exists between two users"""
     
     try:
-        # Check if user_id_1 sent request to user_id_2
-        response = friendships_table.query(
-            IndexName='requester-index',
-            KeyConditionExpression=Key('requesterId').eq(user_id_1),
-            FilterExpression=Attr('addresseeId').eq(user_id_2)
-        )
-        
-        if response['Items']:
-            return response['Items'][0]
-            
-        # Check if user_id_2 sent request to user_id_1
-        response = friendships_table.query(
-            IndexName='requester-index',
-            KeyConditionExpression=Key('requesterId').eq(user_id_2),
-            FilterExpression=Attr('addresseeId').eq(user_id_1)
+        response = friendships_table.get_item(
+            Key={'friendshipId': pair_key(user_id_1, user_id_2)}
         )
-        
-        if response['Items']:
-            return response['Items'][0]
-            
-        return None
+        return response.get('Item')
         
     except Exception as e:
         logger.error(f'Error checking existing friendship: {str(e)}')
         return None
 
 
-def create_response(status_code, body):
-    """Create a standardized HTTP response"""
-    return {
-        'statusCode': status_code,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-            'Access-Control-Allow-Headers': 'Content-Type, Authorization',
-        },
-        'body': json.dumps(body, default=str)
-    }
\ No newline at end of file
+def get_friendship(friendships_table, friendship_id):
+    """Get a friendship by pair key, following legacy UUID aliases"""
+    
+    item = friendships_table.get_item(Key={'friendshipId': friendship_id}).get('Item')
+    
+    # Rows migrated off UUID keys leave an alias behind so that request
+    # IDs already handed to clients keep working
+    if item and 'aliasOf' in item:
+        item = friendships_table.get_item(Key={'friendshipId': item['aliasOf']}).get('Item')
+        
+    return item
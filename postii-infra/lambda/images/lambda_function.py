@@ -0,0 +1,128 @@
+import io
+import logging
+import os
+import tempfile
+from urllib.parse import unquote_plus
+from PIL import Image, ImageOps, UnidentifiedImageError
+from postii_common import aws, uploads
+
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except ImportError:
+    pass
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Variant name: (width, height, mode). 'cover' crops to exactly that size
+# (grid cells), 'fit' scales down to fit inside it
+VARIANT_SIZES = {
+    'thumb': (320, 320, 'cover'),
+    'display': (1280, 1280, 'fit'),
+}
+VARIANT_QUALITY = int(os.environ.get('IMAGE_VARIANT_QUALITY', '80'))
+# Derived keys never change content, so CDNs and clients may keep them
+VARIANT_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Uploads are spooled to /tmp above this, instead of held in memory
+SPOOL_MEMORY_BYTES = 4 * 1024 * 1024
+# Refuse to decode anything bigger (decompression bombs)
+MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', str(64 * 1000 * 1000)))
+
+def lambda_handler(event, context):
+    """
+    Postii Images handler - writes thumbnail and display variants for
+    every stored image (S3 ObjectCreated events under uploads/ and images/)
+    """
+    processed, skipped = 0, 0
+    for record in event.get('Records', []):
+        bucket = record['s3']['bucket']['name']
+        # Keys in S3 events are URL-encoded
+        key = unquote_plus(record['s3']['object']['key'])
+        if not uploads.has_variants(key):
+            skipped += 1
+            continue
+
+        try:
+            write_variants(bucket, key)
+            processed += 1
+        except (UnidentifiedImageError, Image.DecompressionBombError, ValueError, OSError) as e:
+            # Not retryable: the feed keeps showing the original
+            logger.warning(f'Skipping {key}: {str(e)}')
+            skipped += 1
+
+    logger.info(f'Images handler: {processed} processed, {skipped} skipped')
+    return {'processed': processed, 'skipped': skipped}
+
+def write_variants(bucket, key):
+    """Read one image and write each of its variants next to the others under derived/"""
+    s3 = aws.s3()
+    response = s3.get_object(Bucket=bucket, Key=key)
+    if response['ContentLength'] > uploads.MAX_IMAGE_BYTES:
+        raise ValueError(f"{response['ContentLength']} bytes is over MAX_IMAGE_BYTES")
+
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES) as source:
+        for chunk in response['Body'].iter_chunks(1024 * 1024):
+            source.write(chunk)
+        source.seek(0)
+        variants = render_variants(source)
+
+    for variant, data in variants.items():
+        s3.put_object(
+            Bucket=bucket,
+            Key=uploads.derived_key(key, variant),
+            Body=data,
+            ContentType=variant_content_type(),
+            CacheControl=VARIANT_CACHE_CONTROL
+        )
+    logger.info(f'Wrote {len(variants)} variants of {key}')
+
+def render_variants(source, variant_format=None, draft=True):
+    """
+    {variant: encoded bytes} for an image file object.
+
+    With draft, JPEGs are decoded straight at the smallest DCT scale
+    (1/2 to 1/8) that still covers the largest variant, so a 12 MP
+    photo never exists in memory at full size. Orientation is applied
+    from EXIF, and the EXIF block itself (GPS, camera serials) isn't
+    copied into the variants.
+    """
+    variant_format = variant_format or uploads.VARIANT_FORMAT
+    with Image.open(source) as image:
+        if image.width * image.height > MAX_PIXELS:
+            raise Image.DecompressionBombError(f'{image.width}x{image.height} is over IMAGE_MAX_PIXELS')
+
+        largest = max(max(width, height) for width, height, _ in VARIANT_SIZES.values())
+        if draft:
+            image.draft('RGB', (largest, largest))
+        icc_profile = image.info.get('icc_profile')
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        image = image.convert('RGBA' if has_alpha and variant_format == 'webp' else 'RGB')
+
+        results = {}
+        # Largest first; each smaller variant is resized from the previous one
+        for variant, (width, height, mode) in sorted(VARIANT_SIZES.items(), key=lambda entry: -entry[1][0]):
+            if mode == 'cover':
+                image = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+            else:
+                image = image.copy()
+                image.thumbnail((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            results[variant] = encode(image, variant_format, icc_profile)
+        return results
+
+def encode(image, variant_format, icc_profile=None):
+    """Encoded bytes of image; only the ICC profile is carried over"""
+    output = io.BytesIO()
+    if variant_format == 'webp':
+        image.save(output, 'WEBP', quality=VARIANT_QUALITY, method=4, icc_profile=icc_profile)
+    else:
+        # Progressive, so the display variant renders coarse-to-fine on slow links
+        image.save(output, 'JPEG', quality=VARIANT_QUALITY, optimize=True, progressive=True,
+                   icc_profile=icc_profile)
+    return output.getvalue()
+
+def variant_content_type():
+    """Content-Type of the variants for the configured format"""
+    return 'image/webp' if uploads.VARIANT_FORMAT == 'webp' else 'image/jpeg'
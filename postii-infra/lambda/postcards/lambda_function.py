@@ -1,17 +1,63 @@
+import collections
+import heapq
 import json
 import logging
-import boto3
 import uuid
 import os
-from datetime import datetime, timezone
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from botocore.exceptions import ClientError
+from postii_common import aws, cursors, dal, events, idempotency, image_refs, profiles, rate_limits, uploads
+from postii_common.responses import compressible, error_response, etag, not_modified, success_response, with_etag
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-dynamodb = boto3.resource('dynamodb')
-s3_client = boto3.client('s3')
+# Batch sends: BatchWriteItem takes at most 25 puts per request
+MAX_BATCH_RECIPIENTS = 100
+BATCH_WRITE_CHUNK_SIZE = 25
+MAX_BATCH_WRITE_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 0.05
 
+# Reused across warm invocations for concurrent batch writes and feed queries
+executor = ThreadPoolExecutor(max_workers=4)
+
+# Feed pages read only what a list row shows; the summary GSIs project
+# just these attributes, and message/location come from GET /postcards/{id}
+SUMMARY_PROJECTION = 'postcardId, senderId, recipientId, imageUrl, sentAt, #status'
+
+# Feed GSIs: (partition key, sort key); sort keys end in the postcardId
+FEED_KEYS = {
+    'sent': ('senderPK', 'sentSK'),
+    'received': ('recipientPK', 'receivedSK'),
+}
+
+# Inbox streams: (summary GSI, attribute holding the other party)
+INBOX_STREAMS = {
+    'sent': ('sender-summary-index', 'recipientId'),
+    'received': ('recipient-summary-index', 'senderId'),
+}
+# Delta sync (received?since=<watermark>): watermarks stay this far behind
+# now, because the GSI is eventually consistent and concurrent sends can
+# become visible out of timestamp order. A postcard that shows up late is
+# returned by a later poll instead of being skipped; the price is that
+# postcards younger than this are returned again, so clients dedupe by
+# postcardId.
+WATERMARK_LAG_SECONDS = float(os.environ.get('WATERMARK_LAG_SECONDS', '5'))
+# Sorts before every receivedSK: the watermark of an empty feed
+EMPTY_WATERMARK = 'RECEIVED#'
+
+# Pages one inbox stream may read per request when withUser filters
+# most rows out; the page ends early rather than scanning a whole feed
+MAX_INBOX_FETCHES = 5
+
+# Per-user send limits; this container's view of the buckets is kept
+# across warm invocations
+rate_limiter = rate_limits.TokenBuckets()
+
+@compressible
 def lambda_handler(event, context):
     """
     Postii Postcards handler - handles sending and viewing postcards
@@ -21,12 +67,18 @@ def lambda_handler(event, context):
     try:
         # Get environment variables
         postcards_table_name = os.environ.get('POSTCARDS_TABLE')
+        users_table_name = os.environ.get('USERS_TABLE')
         assets_bucket = os.environ.get('ASSETS_BUCKET')
+        images_table_name = os.environ.get('IMAGES_TABLE')
+        idempotency_table_name = os.environ.get('IDEMPOTENCY_TABLE')
+        rate_limits_table_name = os.environ.get('RATE_LIMITS_TABLE')  # Optional: unset turns limits off
         
-        if not postcards_table_name or not assets_bucket:
+        if (not postcards_table_name or not users_table_name or not assets_bucket or not images_table_name
+                or not idempotency_table_name):
             return error_response(500, 'Missing environment variables')
         
-        postcards_table = dynamodb.Table(postcards_table_name)
+        postcards_table = aws.table(postcards_table_name)
+        users_table = aws.table(users_table_name)
         
         # Parse request
         http_method = event.get('httpMethod')
@@ -43,15 +95,28 @@ def lambda_handler(event, context):
             return error_response(401, 'User not authenticated')
         
         # Route requests
-        if http_method == 'POST' and '/postcards' in resource_path:
-            return send_postcard(postcards_table, event, user_id, assets_bucket)
+        if http_method == 'POST' and '/postcards/uploads' in resource_path:
+            return create_upload_ticket(event, user_id, assets_bucket, images_table_name)
+        elif http_method == 'POST' and '/postcards' in resource_path:
+            # Retries carrying the same Idempotency-Key get the first response
+            # back before the limiter is asked, so a replay spends no token
+            return idempotency.run(idempotency_table_name, event, user_id, 'send-postcard',
+                                   lambda: rate_limiter.check(rate_limits_table_name, user_id, 'send-postcard',
+                                                              send_cost(event))
+                                   or send_postcard(postcards_table, event, user_id, assets_bucket,
+                                                    images_table_name))
         elif http_method == 'GET' and '/postcards/sent' in resource_path:
-            return get_sent_postcards(postcards_table, user_id, event)
+            return get_sent_postcards(postcards_table, users_table, user_id, event)
         elif http_method == 'GET' and '/postcards/received' in resource_path:
-            return get_received_postcards(postcards_table, user_id, event)
+            return get_received_postcards(postcards_table, users_table, user_id, event)
+        elif http_method == 'GET' and '/postcards/inbox' in resource_path:
+            return get_inbox(postcards_table, users_table, user_id, event)
+        elif http_method == 'GET' and '/postcards/{postcardId}' in resource_path:
+            postcard_id = (event.get('pathParameters') or {}).get('postcardId')
+            return get_postcard(postcards_table, user_id, postcard_id)
         elif http_method == 'GET' and '/postcards' in resource_path:
             # Default to received postcards
-            return get_received_postcards(postcards_table, user_id, event)
+            return get_received_postcards(postcards_table, users_table, user_id, event)
         else:
             return error_response(404, 'Endpoint not found')
             
@@ -59,47 +124,56 @@ def lambda_handler(event, context):
         logger.error(f'Error in postcards handler: {str(e)}')
         return error_response(500, 'Internal server error')
 
-def send_postcard(table, event, sender_id, assets_bucket):
-    """Send a postcard to a recipient"""
+def send_cost(event):
+    """Rate limit tokens a send takes: one per postcard it writes"""
+    try:
+        recipient_ids = json.loads(events.body_text(event) or '{}').get('recipientIds')
+    except (json.JSONDecodeError, AttributeError):
+        return 1
+    if not isinstance(recipient_ids, list):
+        return 1
+    # Larger batches are refused, but not before they pay for the most
+    # a batch can write
+    distinct = len({r for r in recipient_ids if isinstance(r, str) and r})
+    return max(1, min(distinct, MAX_BATCH_RECIPIENTS))
+
+def send_postcard(table, event, sender_id, assets_bucket, images_table_name):
+    """Send a postcard to a recipient, or to every recipient in recipientIds"""
     try:
         # Parse request body
-        body = json.loads(event.get('body', '{}'))
+        body = json.loads(events.body_text(event) or '{}')
         
         recipient_id = body.get('recipientId')
-        image_url = body.get('imageUrl')  # URL to image in S3
+        recipient_ids = body.get('recipientIds')
+        image_key = body.get('imageKey')  # Key from an upload ticket
+        image_url = body.get('imageUrl')  # Older clients: URL of an uploaded image
         message = body.get('message', '')
         location = body.get('location', {})  # Optional location data
         
+        if recipient_ids is not None:
+            if recipient_id:
+                return error_response(400, 'Provide either recipientId or recipientIds, not both')
+            return send_postcard_batch(table, sender_id, recipient_ids, image_key, image_url,
+                                       message, location, assets_bucket, images_table_name)
+        
         # Validate required fields
-        if not recipient_id or not image_url:
-            return error_response(400, 'recipientId and imageUrl are required')
+        if not recipient_id or not (image_key or image_url):
+            return error_response(400, 'recipientId and imageKey are required')
         
-        # Generate postcard ID
-        postcard_id = str(uuid.uuid4())
-        current_time = datetime.now(timezone.utc)
-        timestamp = current_time.isoformat()
+        try:
+            image_key, image_url = resolve_image(assets_bucket, images_table_name, sender_id, image_key, image_url)
+        except uploads.InvalidUpload as e:
+            return error_response(400, str(e))
         
-        # Create postcard item
-        postcard_item = {
-            'postcardId': postcard_id,
-            'senderId': sender_id,
-            'recipientId': recipient_id,
-            'imageUrl': image_url,
-            'message': message,
-            'location': location,
-            'sentAt': timestamp,
-            'status': 'sent',
-            'createdAt': timestamp,
-            'updatedAt': timestamp,
-            # GSI attributes for efficient querying
-            'senderPK': f'USER#{sender_id}',
-            'sentSK': f'SENT#{timestamp}#{postcard_id}',
-            'recipientPK': f'USER#{recipient_id}',
-            'receivedSK': f'RECEIVED#{timestamp}#{postcard_id}'
-        }
+        timestamp = datetime.now(timezone.utc).isoformat()
+        postcard_item = build_postcard_item(sender_id, recipient_id, image_url, message, location, timestamp,
+                                            image_key)
+        postcard_id = postcard_item['postcardId']
         
-        # Save to DynamoDB
-        table.put_item(Item=postcard_item)
+        # The sender's postcardsCount, the image reference and the
+        # recipient's notification follow from the table stream (see
+        # lambda/streams), so sending is this one write
+        table.put_item(Item=postcard_item, ConditionExpression='attribute_not_exists(postcardId)')
         
         logger.info(f'Postcard {postcard_id} sent from {sender_id} to {recipient_id}')
         
@@ -116,7 +190,136 @@ def send_postcard(table, event, sender_id, assets_bucket):
         logger.error(f'Error sending postcard: {str(e)}')
         return error_response(500, 'Failed to send postcard')
 
-def get_sent_postcards(table, user_id, event):
+def create_upload_ticket(event, user_id, assets_bucket, images_table_name):
+    """Presigned URLs for uploading one postcard image straight to S3, unless it is already stored"""
+    try:
+        body = json.loads(events.body_text(event) or '{}')
+        ticket = uploads.create_ticket(assets_bucket, user_id, body.get('contentType'), body.get('size'),
+                                       body.get('sha256'), images_table_name)
+        return success_response(ticket, 201)
+        
+    except json.JSONDecodeError:
+        return error_response(400, 'Invalid JSON in request body')
+    except uploads.InvalidUpload as e:
+        return error_response(400, str(e))
+    except Exception as e:
+        logger.error(f'Error creating upload ticket: {str(e)}')
+        return error_response(500, 'Failed to create upload')
+
+def resolve_image(assets_bucket, images_table_name, sender_id, image_key, image_url):
+    """(key, URL) of an image the sender may use; raises InvalidUpload"""
+    key = uploads.key_from_reference(sender_id, image_key, image_url)
+    image_hash = uploads.content_hash(key)
+    
+    # A referenced image was checked by the first postcard that used it;
+    # its stored key wins over one with another extension
+    image_ref = image_refs.get(images_table_name, image_hash) if image_hash else None
+    if image_ref:
+        key = image_ref['imageKey']
+    else:
+        uploads.check_upload(assets_bucket, key)
+    return key, uploads.image_url(assets_bucket, key)
+
+def send_postcard_batch(table, sender_id, recipient_ids, image_key, image_url, message, location, assets_bucket,
+                        images_table_name):
+    """Send the same postcard to many recipients with chunked BatchWriteItem"""
+    if not isinstance(recipient_ids, list) or not all(isinstance(r, str) and r for r in recipient_ids):
+        return error_response(400, 'recipientIds must be a list of user IDs')
+    
+    # Drop duplicates, keeping the caller's order
+    recipient_ids = list(dict.fromkeys(recipient_ids))
+    if not recipient_ids or not (image_key or image_url):
+        return error_response(400, 'recipientIds and imageKey are required')
+    if len(recipient_ids) > MAX_BATCH_RECIPIENTS:
+        return error_response(400, f'At most {MAX_BATCH_RECIPIENTS} recipients per request')
+    
+    # One HeadObject (or image_refs lookup) covers every copy of the postcard
+    try:
+        image_key, image_url = resolve_image(assets_bucket, images_table_name, sender_id, image_key, image_url)
+    except uploads.InvalidUpload as e:
+        return error_response(400, str(e))
+    
+    timestamp = datetime.now(timezone.utc).isoformat()
+    postcard_items = [
+        build_postcard_item(sender_id, recipient_id, image_url, message, location, timestamp, image_key)
+        for recipient_id in recipient_ids
+    ]
+    
+    # Chunks are independent; write them concurrently. Counting and
+    # notifying happen per written postcard, from the table stream
+    chunks = [
+        postcard_items[start:start + BATCH_WRITE_CHUNK_SIZE]
+        for start in range(0, len(postcard_items), BATCH_WRITE_CHUNK_SIZE)
+    ]
+    failed_ids = set()
+    for chunk_failures in executor.map(lambda chunk: batch_write_postcards(table, chunk), chunks):
+        failed_ids.update(chunk_failures)
+    
+    results = []
+    for item in postcard_items:
+        if item['postcardId'] in failed_ids:
+            results.append({'recipientId': item['recipientId'], 'status': 'failed'})
+        else:
+            results.append({'recipientId': item['recipientId'], 'postcardId': item['postcardId'], 'status': 'sent'})
+    
+    sent_count = len(postcard_items) - len(failed_ids)
+    logger.info(f'Batch postcard from {sender_id}: {sent_count} sent, {len(failed_ids)} failed')
+    
+    if not sent_count:
+        return error_response(500, 'Failed to send postcards')
+    
+    return success_response({
+        'results': results,
+        'sentCount': sent_count,
+        'failedCount': len(failed_ids),
+        'sentAt': timestamp,
+        'message': 'Postcards sent successfully' if not failed_ids else 'Some postcards could not be sent'
+    })
+
+def batch_write_postcards(table, postcard_items):
+    """BatchWriteItem one chunk (up to 25), retrying unprocessed items; returns IDs never written"""
+    client = table.meta.client
+    request = {table.name: [{'PutRequest': {'Item': item}} for item in postcard_items]}
+    
+    for attempt in range(MAX_BATCH_WRITE_ATTEMPTS):
+        try:
+            response = client.batch_write_item(RequestItems=request)
+        except ClientError as e:
+            logger.error(f'Error writing postcard batch: {str(e)}')
+            break
+        request = response.get('UnprocessedItems') or {}
+        if not request:
+            return set()
+        # Throttled writes come back unprocessed; back off with full jitter
+        time.sleep(random.uniform(0, BACKOFF_BASE_SECONDS * 2 ** attempt))
+    
+    return {entry['PutRequest']['Item']['postcardId'] for entry in request.get(table.name, [])}
+
+def build_postcard_item(sender_id, recipient_id, image_url, message, location, timestamp, image_key=None):
+    """Postcard item with the GSI keys both feeds query on"""
+    postcard_id = str(uuid.uuid4())
+    item = {
+        'postcardId': postcard_id,
+        'senderId': sender_id,
+        'recipientId': recipient_id,
+        'imageUrl': image_url,
+        'message': message,
+        'location': location,
+        'sentAt': timestamp,
+        'status': 'sent',
+        'createdAt': timestamp,
+        'updatedAt': timestamp,
+        # GSI attributes for efficient querying
+        'senderPK': f'USER#{sender_id}',
+        'sentSK': f'SENT#{timestamp}#{postcard_id}',
+        'recipientPK': f'USER#{recipient_id}',
+        'receivedSK': f'RECEIVED#{timestamp}#{postcard_id}'
+    }
+    if image_key:
+        item['imageKey'] = image_key
+    return item
+
+def get_sent_postcards(table, users_table, user_id, event):
     """Get postcards sent by the user"""
     try:
         # Get query parameters
@@ -126,7 +329,9 @@ def get_sent_postcards(table, user_id, event):
         
         # Query using sender GSI
         query_params = {
-            'IndexName': 'sender-sent-index',
+            'IndexName': 'sender-summary-index',
+            'ProjectionExpression': SUMMARY_PROJECTION,
+            'ExpressionAttributeNames': {'#status': 'status'},
             'KeyConditionExpression': 'senderPK = :sender_pk',
             'ExpressionAttributeValues': {
                 ':sender_pk': f'USER#{user_id}'
@@ -137,16 +342,29 @@ def get_sent_postcards(table, user_id, event):
         
         if last_evaluated_key:
             try:
-                query_params['ExclusiveStartKey'] = json.loads(last_evaluated_key)
-            except json.JSONDecodeError:
+                query_params['ExclusiveStartKey'] = decode_feed_cursor('sent', user_id, last_evaluated_key)
+            except cursors.InvalidCursor:
                 return error_response(400, 'Invalid lastKey parameter')
         
-        response = table.query(**query_params)
+        # Plain client: rows come back JSON-ready, without Decimal conversion
+        items, last_evaluated_key = dal.query(table.name, **query_params)
+        
+        tag = feed_etag('sent', user_id, event, items, last_evaluated_key)
+        
+        # Sender/recipient profiles in one BatchGetItem
+        page_profiles = None
+        if profiles.wants_profiles(event.get('queryStringParameters')):
+            user_ids = [user for item in items for user in (item['senderId'], item['recipientId'])]
+            page_profiles = profiles.get_public_profiles(users_table, user_ids)
+            # Profiles change independently of the page
+            tag = etag(tag, json.dumps(page_profiles, sort_keys=True, default=str))
+        
+        unchanged = not_modified(event, tag)
+        if unchanged:
+            return unchanged
         
         # Format postcards for response
-        postcards = []
-        for item in response.get('Items', []):
-            postcards.append(format_postcard(item))
+        postcards = [format_postcard_summary(item) for item in items]
         
         result = {
             'postcards': postcards,
@@ -154,26 +372,34 @@ def get_sent_postcards(table, user_id, event):
         }
         
         # Include pagination token if there are more results
-        if 'LastEvaluatedKey' in response:
-            result['lastKey'] = json.dumps(response['LastEvaluatedKey'])
+        if last_evaluated_key:
+            result['lastKey'] = encode_feed_cursor('sent', user_id, last_evaluated_key)
         
-        return success_response(result)
+        if page_profiles is not None:
+            result['profiles'] = page_profiles
+        
+        return with_etag(success_response(result), tag)
         
     except Exception as e:
         logger.error(f'Error getting sent postcards: {str(e)}')
         return error_response(500, 'Failed to retrieve sent postcards')
 
-def get_received_postcards(table, user_id, event):
+def get_received_postcards(table, users_table, user_id, event):
     """Get postcards received by the user"""
     try:
         # Get query parameters
         query_params = event.get('queryStringParameters') or {}
+        if 'since' in query_params:
+            return get_received_since(table, users_table, user_id, event)
+        
         limit = int(query_params.get('limit', 20))
         last_evaluated_key = query_params.get('lastKey')
         
         # Query using recipient GSI
         query_params = {
-            'IndexName': 'recipient-received-index',
+            'IndexName': 'recipient-summary-index',
+            'ProjectionExpression': SUMMARY_PROJECTION,
+            'ExpressionAttributeNames': {'#status': 'status'},
             'KeyConditionExpression': 'recipientPK = :recipient_pk',
             'ExpressionAttributeValues': {
                 ':recipient_pk': f'USER#{user_id}'
@@ -184,16 +410,36 @@ def get_received_postcards(table, user_id, event):
         
         if last_evaluated_key:
             try:
-                query_params['ExclusiveStartKey'] = json.loads(last_evaluated_key)
-            except json.JSONDecodeError:
+                query_params['ExclusiveStartKey'] = decode_feed_cursor('received', user_id, last_evaluated_key)
+            except cursors.InvalidCursor:
                 return error_response(400, 'Invalid lastKey parameter')
         
-        response = table.query(**query_params)
+        # Plain client: rows come back JSON-ready, without Decimal conversion
+        items, last_evaluated_key = dal.query(table.name, **query_params)
+        
+        tag = feed_etag('received', user_id, event, items, last_evaluated_key)
+        
+        # The head page hands out the watermark to delta sync from
+        watermark = None
+        if not query_params.get('ExclusiveStartKey'):
+            newest = received_sort_key(items[0]) if items else EMPTY_WATERMARK
+            watermark = encode_watermark(user_id, hold_back(newest))
+            tag = etag(tag, watermark)
+        
+        # Sender/recipient profiles in one BatchGetItem
+        page_profiles = None
+        if profiles.wants_profiles(event.get('queryStringParameters')):
+            user_ids = [user for item in items for user in (item['senderId'], item['recipientId'])]
+            page_profiles = profiles.get_public_profiles(users_table, user_ids)
+            # Profiles change independently of the page
+            tag = etag(tag, json.dumps(page_profiles, sort_keys=True, default=str))
+        
+        unchanged = not_modified(event, tag)
+        if unchanged:
+            return unchanged
         
         # Format postcards for response
-        postcards = []
-        for item in response.get('Items', []):
-            postcards.append(format_postcard(item))
+        postcards = [format_postcard_summary(item) for item in items]
         
         result = {
             'postcards': postcards,
@@ -201,15 +447,299 @@ def get_received_postcards(table, user_id, event):
         }
         
         # Include pagination token if there are more results
-        if 'LastEvaluatedKey' in response:
-            result['lastKey'] = json.dumps(response['LastEvaluatedKey'])
+        if last_evaluated_key:
+            result['lastKey'] = encode_feed_cursor('received', user_id, last_evaluated_key)
         
-        return success_response(result)
+        if watermark:
+            result['watermark'] = watermark
+        
+        if page_profiles is not None:
+            result['profiles'] = page_profiles
+        
+        return with_etag(success_response(result), tag)
         
     except Exception as e:
         logger.error(f'Error getting received postcards: {str(e)}')
         return error_response(500, 'Failed to retrieve received postcards')
 
+def get_received_since(table, users_table, user_id, event):
+    """Postcards received after a watermark, oldest first, with the watermark to poll with next"""
+    try:
+        query_params = event.get('queryStringParameters') or {}
+        limit = int(query_params.get('limit', 20))
+        
+        try:
+            watermark = decode_watermark(user_id, query_params['since'])
+        except cursors.InvalidCursor:
+            return error_response(400, 'Invalid since parameter')
+        
+        # Oldest first, so each page moves the watermark forward; an idle
+        # inbox costs one empty Query
+        items, last_evaluated_key = dal.query(
+            table.name,
+            IndexName='recipient-summary-index',
+            ProjectionExpression=SUMMARY_PROJECTION,
+            ExpressionAttributeNames={'#status': 'status'},
+            KeyConditionExpression='recipientPK = :recipient_pk AND receivedSK > :watermark',
+            ExpressionAttributeValues={
+                ':recipient_pk': f'USER#{user_id}',
+                ':watermark': watermark
+            },
+            ScanIndexForward=True,
+            Limit=min(limit, 100)  # Cap at 100
+        )
+        
+        if items:
+            newest = received_sort_key(items[-1])
+            # A full page is continued right after its last row so the
+            # client always makes progress; otherwise hold back as usual
+            watermark = newest if last_evaluated_key else max(watermark, hold_back(newest))
+        
+        postcards = [format_postcard_summary(item) for item in items]
+        
+        result = {
+            'postcards': postcards,
+            'count': len(postcards),
+            'watermark': encode_watermark(user_id, watermark),
+            'hasMore': bool(last_evaluated_key)
+        }
+        
+        # Sender/recipient profiles in one BatchGetItem
+        if postcards and profiles.wants_profiles(query_params):
+            user_ids = [user for postcard in postcards for user in (postcard['senderId'], postcard['recipientId'])]
+            result['profiles'] = profiles.get_public_profiles(users_table, user_ids)
+        
+        return success_response(result)
+        
+    except Exception as e:
+        logger.error(f'Error getting received postcards since watermark: {str(e)}')
+        return error_response(500, 'Failed to retrieve received postcards')
+
+def get_inbox(table, users_table, user_id, event):
+    """Sent and received postcards as one newest-first timeline"""
+    try:
+        query_params = event.get('queryStringParameters') or {}
+        limit = min(int(query_params.get('limit', 20)), 100)
+        if limit < 1:
+            return error_response(400, 'limit must be positive')
+        with_user = query_params.get('withUser')
+        cursor_scope = f'postcards:inbox:{user_id}:{with_user or ""}'
+        
+        # Composite cursor: the last sort key read from each stream that
+        # still has rows (None if none of it has been read yet)
+        if query_params.get('lastKey'):
+            try:
+                positions = cursors.decode(query_params['lastKey'], cursor_scope)
+                if not isinstance(positions, dict) or not set(positions) <= set(INBOX_STREAMS) or not all(
+                        value is None or (isinstance(value, str) and '#' in value) for value in positions.values()):
+                    raise cursors.InvalidCursor('Unexpected inbox cursor payload')
+            except cursors.InvalidCursor:
+                return error_response(400, 'Invalid lastKey parameter')
+        else:
+            positions = {feed: None for feed in INBOX_STREAMS}
+        
+        streams = {
+            feed: InboxStream(table, feed, user_id, with_user, sort_value, limit)
+            for feed, sort_value in positions.items()
+        }
+        # First pages of both GSIs concurrently; later pages only on demand
+        list(executor.map(InboxStream.prime, streams.values()))
+        
+        # k-way merge on '<sentAt>#<postcardId>', newest first
+        merged = heapq.merge(*(stream.entries() for stream in streams.values()),
+                             key=lambda entry: entry[0], reverse=True)
+        postcards = []
+        try:
+            for _, feed, item in merged:
+                streams[feed].consume(item)
+                # A postcard to yourself is in both streams; the page can
+                # end between the copies, so only the sent one is output
+                if feed == 'received' and item['senderId'] == user_id:
+                    continue
+                postcards.append({**format_postcard_summary(item), 'direction': feed})
+                if len(postcards) == limit:
+                    break
+        except InboxFetchBudgetExceeded:
+            # Everything merged so far is in order; resume from here next time
+            pass
+        
+        result = {
+            'postcards': postcards,
+            'count': len(postcards)
+        }
+        
+        next_positions = {feed: stream.resume_position() for feed, stream in streams.items() if stream.has_more()}
+        if next_positions:
+            result['lastKey'] = cursors.encode(next_positions, cursor_scope)
+        
+        if profiles.wants_profiles(query_params):
+            user_ids = [user for postcard in postcards for user in (postcard['senderId'], postcard['recipientId'])]
+            result['profiles'] = profiles.get_public_profiles(users_table, user_ids)
+        
+        return success_response(result)
+        
+    except ValueError:
+        return error_response(400, 'Invalid limit parameter')
+    except Exception as e:
+        logger.error(f'Error getting inbox: {str(e)}')
+        return error_response(500, 'Failed to retrieve inbox')
+
+class InboxFetchBudgetExceeded(Exception):
+    """An inbox stream hit MAX_INBOX_FETCHES before filling the page"""
+
+class InboxStream:
+    """
+    One feed GSI read lazily, newest first, for the inbox merge.
+    
+    position is the sort key of the last row the merge consumed, so the
+    next request can resume right after it even though the merge reads
+    one row ahead of what it outputs. When every row read so far has
+    been consumed or filtered out, it resumes from LastEvaluatedKey
+    instead, so withUser pages always make progress.
+    """
+    
+    def __init__(self, table, feed, user_id, with_user, position, page_size):
+        self.table = table
+        self.feed = feed
+        self.user_id = user_id
+        self.with_user = with_user
+        self.position = position
+        self.page_size = page_size
+        self.buffer = collections.deque()
+        self.next_key = decode_sort_value(feed, user_id, position) if position else None
+        self.fetches = 0
+        self.finished = False
+        self.unconsumed = 0
+    
+    def prime(self):
+        """Fetch the first page"""
+        if not self.buffer and not self.finished:
+            self.fetch()
+    
+    def fetch(self):
+        if self.fetches >= MAX_INBOX_FETCHES:
+            raise InboxFetchBudgetExceeded()
+        index_name, other_party = INBOX_STREAMS[self.feed]
+        partition_key, _ = FEED_KEYS[self.feed]
+        query_kwargs = {
+            'IndexName': index_name,
+            'KeyConditionExpression': f'{partition_key} = :pk',
+            'ProjectionExpression': SUMMARY_PROJECTION + ', ' + FEED_KEYS[self.feed][1],
+            'ExpressionAttributeNames': {'#status': 'status'},
+            'ExpressionAttributeValues': {':pk': f'USER#{self.user_id}'},
+            'ScanIndexForward': False,
+            'Limit': self.page_size
+        }
+        if self.with_user:
+            query_kwargs['FilterExpression'] = f'{other_party} = :other'
+            query_kwargs['ExpressionAttributeValues'][':other'] = self.with_user
+        if self.next_key:
+            query_kwargs['ExclusiveStartKey'] = self.next_key
+        
+        # The plain client is thread-safe; Table resources are not
+        items, self.next_key = dal.query(self.table.name, **query_kwargs)
+        self.fetches += 1
+        self.buffer.extend(items)
+        self.finished = self.next_key is None
+    
+    def __iter__(self):
+        while True:
+            while not self.buffer and not self.finished:
+                self.fetch()
+            if not self.buffer:
+                return
+            self.unconsumed += 1
+            yield self.buffer.popleft()
+    
+    def entries(self):
+        """(merge key, feed, item) for each row; the key drops the SENT#/RECEIVED# prefix"""
+        _, sort_key = FEED_KEYS[self.feed]
+        for item in self:
+            yield item[sort_key].split('#', 1)[1], self.feed, item
+    
+    def consume(self, item):
+        """Record that the merge output item"""
+        self.unconsumed -= 1
+        self.position = item[FEED_KEYS[self.feed][1]]
+    
+    def resume_position(self):
+        """Sort key to resume after; skips rows the filter already dropped"""
+        if not self.unconsumed and not self.buffer and self.next_key:
+            return self.next_key[FEED_KEYS[self.feed][1]]
+        return self.position
+    
+    def has_more(self):
+        """True if rows after position may remain"""
+        return bool(self.unconsumed or self.buffer or not self.finished)
+
+def decode_sort_value(feed, user_id, sort_value):
+    """ExclusiveStartKey for a feed GSI from its sort key value"""
+    partition_key, sort_key = FEED_KEYS[feed]
+    return {
+        'postcardId': sort_value.rsplit('#', 1)[1],
+        partition_key: f'USER#{user_id}',
+        sort_key: sort_value
+    }
+
+def get_postcard(table, user_id, postcard_id):
+    """Get one postcard in full; only its sender and recipient may read it"""
+    try:
+        if not postcard_id:
+            return error_response(400, 'Postcard ID is required')
+        
+        response = table.get_item(Key={'postcardId': postcard_id})
+        item = response.get('Item')
+        
+        # Don't reveal whether other users' postcards exist
+        if not item or user_id not in (item.get('senderId'), item.get('recipientId')):
+            return error_response(404, 'Postcard not found')
+        
+        return success_response(format_postcard(item))
+        
+    except Exception as e:
+        logger.error(f'Error getting postcard: {str(e)}')
+        return error_response(500, 'Failed to retrieve postcard')
+
+def feed_etag(feed, user_id, event, items, last_evaluated_key):
+    """ETag for a feed page: its first sort key, row count and whether more follow"""
+    # New postcards only ever land at the head of a feed, so these pin the page
+    first = items[0] if items else {}
+    query_params = event.get('queryStringParameters') or {}
+    return etag('feed', feed, user_id, query_params.get('lastKey'), first.get('sentAt'), first.get('postcardId'),
+                len(items), bool(last_evaluated_key))
+
+def received_sort_key(item):
+    """receivedSK of a summary row (the summary projection leaves the key out)"""
+    return f"RECEIVED#{item['sentAt']}#{item['postcardId']}"
+
+def hold_back(sort_value):
+    """sort_value, or the WATERMARK_LAG_SECONDS horizon if that is older"""
+    horizon = datetime.now(timezone.utc) - timedelta(seconds=WATERMARK_LAG_SECONDS)
+    return min(sort_value, f'RECEIVED#{horizon.isoformat()}')
+
+def encode_watermark(user_id, sort_value):
+    """Signed since= watermark for a receivedSK value"""
+    return cursors.encode(sort_value, f'postcards:watermark:{user_id}')
+
+def decode_watermark(user_id, watermark):
+    """receivedSK value of a since= watermark; raises InvalidCursor"""
+    sort_value = cursors.decode(watermark, f'postcards:watermark:{user_id}')
+    if not isinstance(sort_value, str) or not sort_value.startswith(EMPTY_WATERMARK):
+        raise cursors.InvalidCursor('Unexpected watermark payload')
+    return sort_value
+
+def encode_feed_cursor(feed, user_id, last_evaluated_key):
+    """Signed lastKey cursor; only the sort key is stored, the rest is derived"""
+    _, sort_key = FEED_KEYS[feed]
+    return cursors.encode(last_evaluated_key[sort_key], f'postcards:{feed}:{user_id}')
+
+def decode_feed_cursor(feed, user_id, cursor):
+    """ExclusiveStartKey for a lastKey cursor; raises InvalidCursor"""
+    sort_value = cursors.decode(cursor, f'postcards:{feed}:{user_id}')
+    if not isinstance(sort_value, str) or '#' not in sort_value:
+        raise cursors.InvalidCursor('Unexpected feed cursor payload')
+    return decode_sort_value(feed, user_id, sort_value)
+
 def format_postcard(item):
     """Format postcard item for API response"""
     return {
@@ -217,6 +747,7 @@ def format_postcard(item):
         'senderId': item.get('senderId'),
         'recipientId': item.get('recipientId'),
         'imageUrl': item.get('imageUrl'),
+        **uploads.variant_urls(item.get('imageUrl')),
         'message': item.get('message', ''),
         'location': item.get('location', {}),
         'sentAt': item.get('sentAt'),
@@ -225,31 +756,14 @@ def format_postcard(item):
         'updatedAt': item.get('updatedAt')
     }
 
-def success_response(data, status_code=200):
-    """Return successful API response"""
+def format_postcard_summary(item):
+    """Format a feed row; the full postcard comes from GET /postcards/{postcardId}"""
     return {
-        'statusCode': status_code,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-            'Access-Control-Allow-Headers': 'Content-Type, Authorization',
-        },
-        'body': json.dumps(data)
+        'postcardId': item.get('postcardId'),
+        'senderId': item.get('senderId'),
+        'recipientId': item.get('recipientId'),
+        'imageUrl': item.get('imageUrl'),
+        **uploads.variant_urls(item.get('imageUrl')),
+        'sentAt': item.get('sentAt'),
+        'status': item.get('status')
     }
-
-def error_response(status_code, message):
-    """Return error API response"""
-    return {
-        'statusCode': status_code,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-            'Access-Control-Allow-Headers': 'Content-Type, Authorization',
-        },
-        'body': json.dumps({
-            'error': message,
-            'statusCode': status_code
-        })
-    }
\ No newline at end of file
@@ -0,0 +1,3 @@
+"""
+Postii shared Lambda layer - helpers used by more than one handler
+"""
@@ -0,0 +1,52 @@
+"""
+Lazily created AWS handles, cached for the life of the container.
+
+Building a boto3 resource loads and parses the service model, which is
+a large share of a cold start, and a Table object is cheap but was
+being rebuilt on every invocation. Handlers ask for what they need here
+instead: nothing is built at import time, and everything is built at
+most once per container.
+"""
+import functools
+
+import boto3
+from botocore.config import Config
+
+
+@functools.lru_cache(maxsize=None)
+def dynamodb():
+    """The DynamoDB service resource, created on first use"""
+    return boto3.resource('dynamodb')
+
+
+@functools.lru_cache(maxsize=None)
+def client():
+    """A plain DynamoDB client (no resource type conversion); thread-safe"""
+    return boto3.client('dynamodb')
+
+
+@functools.lru_cache(maxsize=None)
+def s3():
+    """An S3 client; SigV4 and virtual-hosted URLs so presigned URLs work in every region"""
+    return boto3.client('s3', config=Config(signature_version='s3v4', s3={'addressing_style': 'virtual'}))
+
+
+@functools.lru_cache(maxsize=None)
+def sns():
+    """An SNS client"""
+    return boto3.client('sns')
+
+
+@functools.lru_cache(maxsize=None)
+def table(name):
+    """A cached Table resource for name"""
+    return dynamodb().Table(name)
+
+
+def reset():
+    """Drop cached handles, e.g. after the default boto3 session changes"""
+    dynamodb.cache_clear()
+    client.cache_clear()
+    s3.cache_clear()
+    sns.cache_clear()
+    table.cache_clear()
@@ -0,0 +1,65 @@
+"""
+Size-bounded LRU cache with a per-entry TTL.
+
+Meant to live at module level so it survives across invocations of a
+warm Lambda container. Each container keeps its own copy, so cached
+values can be up to ttl_seconds stale relative to writes made elsewhere.
+"""
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """LRU cache whose entries also expire ttl_seconds after being set"""
+
+    def __init__(self, max_size, ttl_seconds, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired"""
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > self.clock():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self.entries[key]
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        """Cache value under key, evicting the least recently used entry if full"""
+        if self.max_size <= 0:
+            return
+        self.entries[key] = (self.clock() + self.ttl_seconds, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        """Drop key from the cache"""
+        self.entries.pop(key, None)
+
+    def clear(self):
+        """Drop every entry and reset the counters"""
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Hit/miss counters since the container started (or the last clear)"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hitRate': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,27 @@
+"""
+Denormalized profile counters.
+
+postcardsCount (postcards sent) and friendsCount (accepted friendships)
+live on the user's profile so profile reads get them for free. The
+streams handler bumps them with ADD from the postcards and friendships
+table streams, shortly after the write they count, and exactly once
+per postcard/friendship; the reconcile_counters script recomputes them
+from the source tables.
+"""
+POSTCARDS_COUNT = 'postcardsCount'
+FRIENDS_COUNT = 'friendsCount'
+
+
+def increment(users_table_name, user_id, counter, amount=1):
+    """TransactWriteItems entry that atomically adds amount to a profile counter"""
+    return {
+        'Update': {
+            'TableName': users_table_name,
+            'Key': {'userId': user_id},
+            'UpdateExpression': 'ADD #counter :amount',
+            # ADD would otherwise create a bare item for a missing profile
+            'ConditionExpression': 'attribute_exists(userId)',
+            'ExpressionAttributeNames': {'#counter': counter},
+            'ExpressionAttributeValues': {':amount': amount}
+        }
+    }
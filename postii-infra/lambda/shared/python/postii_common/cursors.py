@@ -0,0 +1,87 @@
+"""
+Opaque pagination cursors.
+
+List endpoints hand out cursors instead of raw LastEvaluatedKeys. A
+cursor is the page position (as compact as the caller can make it),
+zlib-compressed when that helps, followed by a truncated HMAC-SHA256
+and base64url-encoded without padding. The MAC also covers a scope
+string (endpoint and user), so a cursor can't be edited, forged, or
+replayed against another user's feed. Anything that fails to verify
+raises InvalidCursor before the handler touches DynamoDB.
+
+The signing key comes from CURSOR_SIGNING_KEY, or from the Secrets
+Manager secret named by CURSOR_SIGNING_SECRET_ARN, fetched once per
+container on first use.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import zlib
+
+import boto3
+
+VERSION_RAW = 1
+VERSION_ZLIB = 2
+MAC_LENGTH = 16
+# Cursors larger than this are rejected without decoding
+MAX_CURSOR_LENGTH = 2048
+
+_signing_key = None
+
+
+class InvalidCursor(ValueError):
+    """Raised for cursors that are malformed, tampered with or out of scope"""
+
+
+def signing_key():
+    """The HMAC key, loaded lazily and kept for the life of the container"""
+    global _signing_key
+    if _signing_key is None:
+        key = os.environ.get('CURSOR_SIGNING_KEY')
+        if not key:
+            secret_arn = os.environ.get('CURSOR_SIGNING_SECRET_ARN')
+            if not secret_arn:
+                raise RuntimeError('CURSOR_SIGNING_KEY or CURSOR_SIGNING_SECRET_ARN must be set')
+            key = boto3.client('secretsmanager').get_secret_value(SecretId=secret_arn)['SecretString']
+        _signing_key = key.encode()
+    return _signing_key
+
+
+def _mac(scope, body):
+    return hmac.new(signing_key(), scope.encode() + b'\x00' + body, hashlib.sha256).digest()[:MAC_LENGTH]
+
+
+def encode(position, scope):
+    """Encode a JSON-serializable page position as a signed cursor for scope"""
+    raw = json.dumps(position, separators=(',', ':')).encode()
+    compressed = zlib.compress(raw, 9)
+    body = bytes([VERSION_ZLIB]) + compressed if len(compressed) < len(raw) else bytes([VERSION_RAW]) + raw
+    return base64.urlsafe_b64encode(body + _mac(scope, body)).rstrip(b'=').decode()
+
+
+def decode(cursor, scope):
+    """Verify a cursor issued for scope and return its page position"""
+    if not cursor or len(cursor) > MAX_CURSOR_LENGTH:
+        raise InvalidCursor('Cursor is empty or too long')
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    except (ValueError, TypeError):
+        raise InvalidCursor('Cursor is not base64url')
+    if len(data) <= 1 + MAC_LENGTH:
+        raise InvalidCursor('Cursor is truncated')
+
+    body, mac = data[:-MAC_LENGTH], data[-MAC_LENGTH:]
+    if not hmac.compare_digest(mac, _mac(scope, body)):
+        raise InvalidCursor('Cursor signature does not match')
+
+    version, payload = body[0], body[1:]
+    if version not in (VERSION_RAW, VERSION_ZLIB):
+        raise InvalidCursor('Unknown cursor version')
+    try:
+        if version == VERSION_ZLIB:
+            payload = zlib.decompress(payload)
+        return json.loads(payload)
+    except (zlib.error, ValueError):
+        raise InvalidCursor('Cursor payload is corrupt')
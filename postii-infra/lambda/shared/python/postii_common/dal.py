@@ -0,0 +1,97 @@
+"""
+Thin data access on the plain DynamoDB client.
+
+Table resources (and table.meta.client, which shares their hooks) run
+every attribute through boto3's TypeDeserializer, which builds a
+Decimal for each number and is a noticeable share of the CPU spent on
+a large page. List endpoints read through here instead: requests go to
+a plain client, and items come back as JSON-ready dicts (numbers as
+int or float, sets as lists) built in a single pass.
+
+Only the few values a request carries (key conditions, filters,
+ExclusiveStartKey) are serialized; they are plain strings and numbers.
+"""
+import base64
+
+from postii_common import aws
+
+
+def serialize(value):
+    """AttributeValue for a str, bool, int/float or None"""
+    if isinstance(value, str):
+        return {'S': value}
+    if isinstance(value, bool):
+        return {'BOOL': value}
+    if isinstance(value, (int, float)):
+        return {'N': str(value)}
+    if value is None:
+        return {'NULL': True}
+    raise TypeError(f'Unsupported key or expression value: {value!r}')
+
+
+def serialize_item(item):
+    """AttributeValue map for a flat dict of serialize()-able values"""
+    return {name: serialize(value) for name, value in item.items()}
+
+
+def _number(text):
+    # Integers are by far the common case (counters); anything with a
+    # fraction or exponent becomes a float, which json can encode
+    if '.' in text or 'e' in text or 'E' in text:
+        return float(text)
+    return int(text)
+
+
+def deserialize(value):
+    """JSON-ready Python value for one AttributeValue"""
+    (tag, raw), = value.items()
+    if tag == 'S':
+        return raw
+    if tag == 'N':
+        return _number(raw)
+    if tag == 'M':
+        return {name: deserialize(child) for name, child in raw.items()}
+    if tag == 'L':
+        return [deserialize(child) for child in raw]
+    if tag == 'BOOL':
+        return raw
+    if tag == 'NULL':
+        return None
+    if tag == 'SS':
+        return list(raw)
+    if tag == 'NS':
+        return [_number(text) for text in raw]
+    if tag == 'B':
+        return base64.b64encode(raw).decode()
+    if tag == 'BS':
+        return [base64.b64encode(child).decode() for child in raw]
+    raise TypeError(f'Unknown attribute value type: {tag}')
+
+
+def deserialize_item(item):
+    """JSON-ready dict for an AttributeValue map"""
+    # Most attributes are strings; skip the dispatch for them
+    return {name: value['S'] if 'S' in value else deserialize(value) for name, value in item.items()}
+
+
+def query(table_name, **kwargs):
+    """
+    One Query page on the plain client; returns (items, last_evaluated_key).
+
+    ExpressionAttributeValues and ExclusiveStartKey take plain values
+    and the results come back plain, so callers never see the wire
+    format. Safe to call from worker threads.
+    """
+    if 'ExpressionAttributeValues' in kwargs:
+        kwargs['ExpressionAttributeValues'] = serialize_item(kwargs['ExpressionAttributeValues'])
+    if kwargs.get('ExclusiveStartKey'):
+        kwargs['ExclusiveStartKey'] = serialize_item(kwargs['ExclusiveStartKey'])
+    else:
+        kwargs.pop('ExclusiveStartKey', None)
+
+    response = aws.client().query(TableName=table_name, **kwargs)
+    last_evaluated_key = response.get('LastEvaluatedKey')
+    return (
+        [deserialize_item(item) for item in response.get('Items', [])],
+        deserialize_item(last_evaluated_key) if last_evaluated_key else None
+    )
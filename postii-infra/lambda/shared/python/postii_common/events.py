@@ -0,0 +1,32 @@
+"""
+Reading API Gateway proxy events.
+
+The API is configured with binaryMediaTypes '*/*' so that compressed
+responses reach clients as bytes (see responses.compressible); the
+catch is that request bodies then arrive base64-encoded. body_text
+undoes that, and header looks headers up case-insensitively, since
+clients and API Gateway don't agree on casing.
+"""
+import base64
+
+
+def header(event, name, default=None):
+    """Value of request header name (case-insensitive), or default"""
+    headers = event.get('headers') or {}
+    value = headers.get(name)
+    if value is not None:
+        return value
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return default
+
+
+def body_text(event):
+    """The request body as text ('' if there is none)"""
+    body = event.get('body') or ''
+    if body and event.get('isBase64Encoded'):
+        # Invalid UTF-8 shows up as U+FFFD rather than failing the request
+        return base64.b64decode(body).decode('utf-8', errors='replace')
+    return body
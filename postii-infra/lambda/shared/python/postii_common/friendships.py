@@ -0,0 +1,26 @@
+STATUS_PENDING = 'pending'
+STATUS_ACCEPTED = 'accepted'
+
+
+def pair_key(user_id_1, user_id_2):
+    """
+    Order-independent friendship key for two users.
+
+    Used as the friendshipId of every friendship row, so the row for a
+    pair can be read with a single GetItem no matter who sent the request.
+    """
+    low, high = sorted((user_id_1, user_id_2))
+    return f'{low}#{high}'
+
+
+def is_pair_key(friendship_id):
+    """True if friendship_id is a pair key rather than a legacy UUID"""
+    return '#' in (friendship_id or '')
+
+
+def status_sort_key(status, created_at):
+    """
+    Sort key for the status GSIs: status first, so one begins_with key
+    condition selects e.g. only accepted friendships, newest last.
+    """
+    return f'{status}#{created_at}'
@@ -0,0 +1,168 @@
+"""
+Idempotency keys for writes that clients retry.
+
+Mobile clients retry POST /v1/postcards and POST /v1/friends/send-request
+when the network drops the response. A request sent with an
+Idempotency-Key header runs at most once per user, route and key: run
+claims the key with a conditional PutItem into the Idempotency table,
+runs the request, and keeps its response on the claim. A retry with the
+same key and body gets that response back, marked Idempotent-Replayed,
+without touching anything else.
+
+- a retry that arrives while the first attempt is still running is a
+  409 with Retry-After. A claim whose request died can be taken over
+  after IN_PROGRESS_SECONDS, longer than API Gateway waits for a Lambda
+- the same key with a different body is a 422
+- only 2xx responses are kept: after an error the claim is deleted, so
+  a retry runs the request again
+
+Records carry expiresAt, the table's TTL attribute. DynamoDB deletes
+them some time after that, so a record past it counts as absent.
+"""
+import hashlib
+import logging
+import os
+import time
+import uuid
+
+from botocore.exceptions import ClientError
+
+from postii_common import aws, dal, events
+from postii_common.responses import JSON_HEADERS, error_response
+
+logger = logging.getLogger()
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(24 * 60 * 60)))
+IN_PROGRESS_SECONDS = int(os.environ.get('IDEMPOTENCY_IN_PROGRESS_SECONDS', '30'))
+RETRY_AFTER_SECONDS = 1
+
+STATUS_IN_PROGRESS = 'in_progress'
+STATUS_COMPLETED = 'completed'
+
+
+def record_key(user_id, route, key):
+    """Idempotency table key of user_id's key for route"""
+    return {'idempotencyKey': {'S': f'{user_id}#{route}#{key}'}}
+
+
+def request_hash(event):
+    """Fingerprint of the request body, to catch a key reused for another request"""
+    return hashlib.sha256(events.body_text(event).encode('utf-8')).hexdigest()
+
+
+def run(table_name, event, user_id, route, handle):
+    """
+    handle()'s response to event, which calls handle at most once per
+    Idempotency-Key. Requests without the header just call handle.
+    """
+    key = events.header(event, HEADER)
+    if key is None:
+        return handle()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return error_response(400, f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters')
+
+    item_key = record_key(user_id, route, key)
+    fingerprint = request_hash(event)
+    claim_token, record = claim(table_name, item_key, fingerprint)
+    if record is not None:
+        return replay(record, fingerprint)
+
+    try:
+        response = handle()
+    except Exception:
+        release(table_name, item_key, claim_token)
+        raise
+
+    if 200 <= response['statusCode'] < 300:
+        complete(table_name, item_key, claim_token, response)
+    else:
+        release(table_name, item_key, claim_token)
+    return response
+
+
+def claim(table_name, item_key, fingerprint):
+    """(claim token, None) if the key is ours now, or (None, the record holding it)"""
+    claim_token = uuid.uuid4().hex
+    now = int(time.time())
+    try:
+        aws.client().put_item(
+            TableName=table_name,
+            Item={
+                **item_key,
+                'status': {'S': STATUS_IN_PROGRESS},
+                'requestHash': {'S': fingerprint},
+                'claimToken': {'S': claim_token},
+                'lockedUntil': {'N': str(now + IN_PROGRESS_SECONDS)},
+                'expiresAt': {'N': str(now + TTL_SECONDS)}
+            },
+            ConditionExpression='attribute_not_exists(idempotencyKey) OR expiresAt < :now '
+                                'OR (#status = :in_progress AND lockedUntil < :now)',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={
+                ':now': {'N': str(now)},
+                ':in_progress': {'S': STATUS_IN_PROGRESS}
+            },
+            ReturnValuesOnConditionCheckFailure='ALL_OLD'
+        )
+        return claim_token, None
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        item = e.response.get('Item')
+        if item is None:
+            item = aws.client().get_item(TableName=table_name, Key=item_key, ConsistentRead=True).get('Item', {})
+        return None, dal.deserialize_item(item)
+
+
+def replay(record, fingerprint):
+    """Response to a request whose key is already held by record"""
+    if record.get('requestHash') != fingerprint:
+        return error_response(422, f'{HEADER} was already used for a different request')
+    if record.get('status') != STATUS_COMPLETED:
+        response = error_response(409, 'A request with this Idempotency-Key is still in progress')
+        response['headers']['Retry-After'] = str(RETRY_AFTER_SECONDS)
+        return response
+
+    headers = JSON_HEADERS.copy()
+    headers[REPLAYED_HEADER] = 'true'
+    return {'statusCode': int(record['statusCode']), 'headers': headers, 'body': record['responseBody']}
+
+
+def complete(table_name, item_key, claim_token, response):
+    """Keep response on our claim for retries to replay"""
+    try:
+        aws.client().update_item(
+            TableName=table_name,
+            Key=item_key,
+            UpdateExpression='SET #status = :completed, statusCode = :status_code, responseBody = :body '
+                             'REMOVE lockedUntil',
+            ConditionExpression='claimToken = :claim_token',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={
+                ':completed': {'S': STATUS_COMPLETED},
+                ':status_code': {'N': str(response['statusCode'])},
+                ':body': {'S': response.get('body') or ''},
+                ':claim_token': {'S': claim_token}
+            }
+        )
+    except ClientError as e:
+        # The request itself succeeded; a retry runs it again once lockedUntil passes
+        logger.warning(f"Could not store idempotent response for {item_key['idempotencyKey']['S']}: {str(e)}")
+
+
+def release(table_name, item_key, claim_token):
+    """Drop our claim so a retry runs the request again"""
+    try:
+        aws.client().delete_item(
+            TableName=table_name,
+            Key=item_key,
+            ConditionExpression='claimToken = :claim_token',
+            ExpressionAttributeValues={':claim_token': {'S': claim_token}}
+        )
+    except ClientError as e:
+        # Left alone, the claim is taken over once lockedUntil passes
+        logger.warning(f"Could not release idempotency claim {item_key['idempotencyKey']['S']}: {str(e)}")
@@ -0,0 +1,45 @@
+"""
+Reference counts for content-addressed images.
+
+Uploads ticketed with a SHA-256 are stored once, at images/<sha256>.<ext>
+(see uploads.content_key), however many postcards use them. The Images
+table has one item per stored image, keyed by imageHash, holding its
+key and refCount: the number of postcards that point at it. The streams
+handler creates the item when the first postcard using the image lands
+(the send HeadObjects the upload first), so its presence means the
+object exists; tickets and later sends rely on that and skip S3
+entirely. refCount moves with postcard inserts and removals, so a
+cleanup job can find images nothing uses.
+"""
+from postii_common import aws, dal
+
+REF_COUNT = 'refCount'
+
+
+def get(images_table_name, image_hash):
+    """The Images table item for image_hash, or None if no postcard references it yet"""
+    response = aws.client().get_item(
+        TableName=images_table_name,
+        Key={'imageHash': {'S': image_hash}},
+        ProjectionExpression='imageHash, imageKey, refCount'
+    )
+    item = response.get('Item')
+    return dal.deserialize_item(item) if item else None
+
+
+def increment(images_table_name, image_hash, image_key, timestamp, amount=1):
+    """TransactWriteItems entry that adds amount (possibly negative) references"""
+    return {
+        'Update': {
+            'TableName': images_table_name,
+            'Key': {'imageHash': image_hash},
+            'UpdateExpression': 'ADD #count :amount SET imageKey = if_not_exists(imageKey, :key), '
+                                'createdAt = if_not_exists(createdAt, :timestamp)',
+            'ExpressionAttributeNames': {'#count': REF_COUNT},
+            'ExpressionAttributeValues': {
+                ':amount': amount,
+                ':key': image_key,
+                ':timestamp': timestamp
+            }
+        }
+    }
@@ -0,0 +1,102 @@
+"""
+User profile shaping and bulk lookup.
+
+List endpoints accept expand=profiles to return the referenced users'
+public profiles alongside their items, so clients don't fetch
+GET /v1/users/{userId} once per row.
+"""
+import logging
+import random
+import time
+
+from postii_common import aws, dal
+
+logger = logging.getLogger()
+
+# BatchGetItem accepts at most 100 keys per request
+BATCH_GET_CHUNK_SIZE = 100
+MAX_BATCH_GET_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 0.05
+
+# Attributes read for public profiles; email and updatedAt are self-only
+PUBLIC_PROFILE_FIELDS = (
+    'userId', 'username', 'fullName', 'bio', 'profilePictureUrl',
+    'isActive', 'createdAt', 'postcardsCount', 'friendsCount',
+)
+
+
+def format_user_profile(item, is_self=False):
+    """Format user profile for API response"""
+    base_profile = {
+        'userId': item.get('userId'),
+        'username': item.get('username'),
+        'fullName': item.get('fullName', ''),
+        'bio': item.get('bio', ''),
+        'profilePictureUrl': item.get('profilePictureUrl', ''),
+        'isActive': item.get('isActive', True),
+        'createdAt': item.get('createdAt'),
+        # Numbers come back from DynamoDB as Decimal
+        'postcardsCount': int(item.get('postcardsCount', 0)),
+        'friendsCount': int(item.get('friendsCount', 0))
+    }
+
+    # Include sensitive information only for the user's own profile
+    if is_self:
+        base_profile.update({
+            'email': item.get('email'),
+            'updatedAt': item.get('updatedAt')
+        })
+
+    return base_profile
+
+
+def wants_profiles(query_parameters):
+    """True if the request asked for expand=profiles"""
+    expand = (query_parameters or {}).get('expand') or ''
+    return 'profiles' in (value.strip() for value in expand.split(','))
+
+
+def get_public_profiles(users_table, user_ids):
+    """
+    Fetch public profiles for user_ids with chunked BatchGetItem.
+
+    Returns {userId: profile}. Users that don't exist, or whose keys are
+    still unprocessed after MAX_BATCH_GET_ATTEMPTS, are left out.
+    """
+    unique_ids = list(dict.fromkeys(user_id for user_id in user_ids if user_id))
+    profiles = {}
+
+    for start in range(0, len(unique_ids), BATCH_GET_CHUNK_SIZE):
+        chunk = unique_ids[start:start + BATCH_GET_CHUNK_SIZE]
+        for item in batch_get_users(users_table, chunk):
+            profiles[item['userId']] = format_user_profile(item, is_self=False)
+
+    return profiles
+
+
+def batch_get_users(users_table, user_ids):
+    """One BatchGetItem for up to 100 users, retrying unprocessed keys"""
+    # Plain client, so profiles come back JSON-ready (see dal)
+    client = aws.client()
+    request = {
+        users_table.name: {
+            'Keys': [{'userId': {'S': user_id}} for user_id in user_ids],
+            'ProjectionExpression': ', '.join(PUBLIC_PROFILE_FIELDS)
+        }
+    }
+    items = []
+
+    for attempt in range(MAX_BATCH_GET_ATTEMPTS):
+        response = client.batch_get_item(RequestItems=request)
+        items.extend(dal.deserialize_item(item) for item in response.get('Responses', {}).get(users_table.name, []))
+
+        request = response.get('UnprocessedKeys') or {}
+        if not request:
+            return items
+
+        # Throttled keys come back unprocessed; back off with full jitter
+        time.sleep(random.uniform(0, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+    unprocessed = len(request.get(users_table.name, {}).get('Keys', []))
+    logger.warning(f'Gave up on {unprocessed} unprocessed profile keys after {MAX_BATCH_GET_ATTEMPTS} attempts')
+    return items
@@ -0,0 +1,169 @@
+"""
+Per-user, per-route token buckets.
+
+Each (user, route) pair has a bucket in the RateLimits table holding
+tokens and refilledAt (epoch milliseconds). A request takes as many
+tokens as it costs (one, or one per postcard of a batch send); tokens
+come back at the route's rate up to its capacity (ROUTE_LIMITS).
+The bucket is updated with a conditional UpdateItem on the tokens and
+refilledAt the writer last saw, so concurrent containers can't both
+spend the same token: the loser gets the current item back (ALL_OLD)
+and tries again from it.
+
+Warm containers remember the last bucket state they saw, which saves
+most round trips:
+
+- tokens only grow by refill, which the container computes itself, so
+  its estimate is an upper bound. A bucket it estimates empty is empty,
+  and the request is rejected without a DynamoDB call
+- while a bucket is at least half full, a container takes LEASE_TOKENS
+  in one write and spends them locally for LEASE_SECONDS. Tokens left
+  when a lease lapses are forfeited, never handed out twice
+
+Rejected requests get a 429 with Retry-After (whole seconds until the
+request's tokens are due). Sends are checked inside idempotency.run, so
+a retry that replays a stored response spends no token and is never
+rejected. The limiter fails open: if DynamoDB can't be reached, or the
+bucket keeps changing under us, the request goes ahead. Buckets expire
+(the table's TTL attribute, expiresAt) once they would be full again
+anyway. Without RATE_LIMITS_TABLE nothing is limited.
+"""
+import logging
+import math
+import os
+import time
+
+from botocore.exceptions import ClientError
+
+from postii_common import aws
+from postii_common.cache import TTLCache
+from postii_common.responses import error_response
+
+logger = logging.getLogger()
+
+# route: (capacity, tokens refilled per second). A capacity must cover
+# the route's most expensive request: send-postcard costs one token per
+# recipient, and a batch send has up to 100
+ROUTE_LIMITS = {
+    'send-postcard': (100, 0.5),
+    'send-friend-request': (20, 0.2),
+    'search-friends': (30, 1.0),
+}
+
+LEASE_TOKENS = int(os.environ.get('RATE_LIMIT_LEASE_TOKENS', '5'))
+LEASE_SECONDS = float(os.environ.get('RATE_LIMIT_LEASE_SECONDS', '2'))
+MAX_ATTEMPTS = 3
+# Fractional tokens are stored rounded, so they compare equal when read back
+TOKEN_DIGITS = 6
+
+
+class TokenBuckets:
+    """This container's view of the buckets, and the tokens it has leased"""
+
+    def __init__(self, limits=None, clock=time.time, max_size=4096):
+        self.limits = limits or ROUTE_LIMITS
+        self.clock = clock
+        # A bucket state is worth keeping until the bucket would be full
+        refill_seconds = max(capacity / rate for capacity, rate in self.limits.values())
+        self.views = TTLCache(max_size=max_size, ttl_seconds=refill_seconds)
+        self.leases = TTLCache(max_size=max_size, ttl_seconds=LEASE_SECONDS)
+
+    def check(self, table_name, user_id, route, cost=1):
+        """None if user_id may call route now at cost tokens, otherwise a 429 response"""
+        if not table_name:
+            return None
+        retry_after = self.acquire(table_name, user_id, route, cost)
+        if retry_after is None:
+            return None
+        response = error_response(429, 'Too many requests')
+        response['headers']['Retry-After'] = str(retry_after)
+        return response
+
+    def acquire(self, table_name, user_id, route, cost=1):
+        """Take cost tokens: None if they were available, otherwise seconds until they are"""
+        capacity, rate = self.limits[route]
+        bucket_key = f'{user_id}#{route}'
+
+        lease = self.leases.get(bucket_key)
+        if lease and lease['tokens'] >= cost:
+            lease['tokens'] -= cost
+            return None
+
+        now = int(self.clock() * 1000)
+        view = self.views.get(bucket_key)
+        try:
+            for attempt in range(MAX_ATTEMPTS):
+                available = refilled(view, capacity, rate, now) if view else capacity
+                if available < cost:
+                    if attempt:
+                        self.views.set(bucket_key, view)
+                    return retry_after(available, rate, cost)
+
+                # A well-stocked bucket can spare a lease for this container
+                spare = LEASE_TOKENS - 1
+                if spare < 1 or available - cost - spare < capacity / 2:
+                    spare = 0
+                written = {'tokens': round(available - cost - spare, TOKEN_DIGITS), 'refilledAt': now}
+                stored, view = write_bucket(table_name, bucket_key, view, written, capacity / rate)
+                if stored:
+                    self.views.set(bucket_key, written)
+                    if spare:
+                        self.leases.set(bucket_key, {'tokens': spare})
+                    return None
+        except ClientError as e:
+            logger.warning(f'Rate limit check failed for {bucket_key}: {str(e)}')
+            return None
+
+        logger.warning(f'Rate limit bucket {bucket_key} is contended; letting the request through')
+        return None
+
+
+def write_bucket(table_name, bucket_key, seen, written, full_seconds):
+    """
+    Store written if the bucket is still as seen (None: absent). Returns
+    (True, written), or (False, the bucket's current state or None).
+    """
+    if seen:
+        condition = 'tokens = :seen_tokens AND refilledAt = :seen_at'
+        values = {':seen_tokens': number(seen['tokens']), ':seen_at': {'N': str(seen['refilledAt'])}}
+    else:
+        condition = 'attribute_not_exists(bucketKey)'
+        values = {}
+    try:
+        aws.client().update_item(
+            TableName=table_name,
+            Key={'bucketKey': {'S': bucket_key}},
+            UpdateExpression='SET tokens = :tokens, refilledAt = :now, expiresAt = :expires_at',
+            ConditionExpression=condition,
+            ExpressionAttributeValues={
+                ':tokens': number(written['tokens']),
+                ':now': {'N': str(written['refilledAt'])},
+                ':expires_at': {'N': str(math.ceil(written['refilledAt'] / 1000 + full_seconds))},
+                **values
+            },
+            ReturnValuesOnConditionCheckFailure='ALL_OLD'
+        )
+        return True, written
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        # No item means it expired since we saw it; the retry creates it
+        item = e.response.get('Item')
+        if not item:
+            return False, None
+        return False, {'tokens': float(item['tokens']['N']), 'refilledAt': int(item['refilledAt']['N'])}
+
+
+def number(tokens):
+    """tokens as a DynamoDB number; conditions compare it with what was written"""
+    return {'N': f'{tokens:.{TOKEN_DIGITS}f}'}
+
+
+def refilled(view, capacity, rate, now):
+    """Tokens in a bucket last seen as view, by now (epoch milliseconds)"""
+    return min(capacity, view['tokens'] + max(0, now - view['refilledAt']) / 1000 * rate)
+
+
+def retry_after(available, rate, cost=1):
+    """Whole seconds until a bucket holding available tokens has cost of them"""
+    return max(1, math.ceil((cost - available) / rate))
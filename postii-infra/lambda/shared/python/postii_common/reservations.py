@@ -0,0 +1,57 @@
+"""
+Uniqueness reservations for usernames and emails.
+
+A username (or email) is claimed by writing a reservation item into the
+Users table under userId = 'USERNAME#<username>' ('EMAIL#<email>') in
+the same transaction as the profile write, conditioned on it not
+existing yet. Unlike a query on username-index or email-index
+(eventually consistent, and racy between the check and the write) two
+concurrent claims can't both succeed.
+
+Reservation items carry only ownerId, so they never appear in the Users
+GSIs; scans over the Users table should skip them with is_reservation.
+"""
+USERNAME_PREFIX = 'USERNAME#'
+EMAIL_PREFIX = 'EMAIL#'
+
+
+def username_key(username):
+    """Users table key of the reservation for username"""
+    return {'userId': f'{USERNAME_PREFIX}{username}'}
+
+
+def email_key(email):
+    """Users table key of the reservation for email"""
+    return {'userId': f'{EMAIL_PREFIX}{email}'}
+
+
+def is_reservation(item_or_id):
+    """True if a Users table item (or its userId) is a reservation, not a profile"""
+    user_id = item_or_id.get('userId', '') if isinstance(item_or_id, dict) else (item_or_id or '')
+    return user_id.startswith((USERNAME_PREFIX, EMAIL_PREFIX))
+
+
+def claim(table_name, key, user_id):
+    """TransactWriteItems entry that reserves key for user_id"""
+    return {
+        'Put': {
+            'TableName': table_name,
+            'Item': {**key, 'ownerId': user_id},
+            # Re-claiming your own reservation is a no-op, not a conflict
+            'ConditionExpression': 'attribute_not_exists(userId) OR ownerId = :owner',
+            'ExpressionAttributeValues': {':owner': user_id}
+        }
+    }
+
+
+def release(table_name, key, user_id):
+    """TransactWriteItems entry that frees key if user_id holds it"""
+    return {
+        'Delete': {
+            'TableName': table_name,
+            'Key': key,
+            # Profiles created before reservations existed have none to release
+            'ConditionExpression': 'attribute_not_exists(userId) OR ownerId = :owner',
+            'ExpressionAttributeValues': {':owner': user_id}
+        }
+    }
@@ -0,0 +1,200 @@
+"""
+API Gateway proxy responses for every handler.
+
+Headers are built once per container as read-only maps, and each
+response gets its own shallow copy, so a handler can add a header to
+one response without touching the shared map. Bodies are compact JSON:
+orjson when the layer bundles it (see lambda/shared/requirements.txt),
+otherwise a preconfigured stdlib encoder. Either way Decimal (from the
+resource API) is encoded as a number, and datetime/date and sets are
+encoded too.
+
+Handlers decorated with compressible also honor Accept-Encoding: bodies
+of at least COMPRESSION_MIN_BYTES go out brotli- (if the layer bundles
+it) or gzip-compressed, base64-encoded with isBase64Encoded set, which
+API Gateway turns back into bytes because the API declares
+binaryMediaTypes '*/*'.
+
+GET handlers that can name their representation cheaply (a profile's
+updatedAt, a feed page's first sort key) tag it with etag and answer a
+matching If-None-Match with not_modified: a 304 with an empty body,
+before the page is formatted or serialized.
+"""
+import base64
+import datetime
+import decimal
+import functools
+import gzip
+import hashlib
+import json
+import os
+from types import MappingProxyType
+
+from postii_common import events
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CORS_HEADERS = MappingProxyType({
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization, If-None-Match, Idempotency-Key',
+    'Access-Control-Expose-Headers': 'ETag, Idempotent-Replayed, Retry-After',
+})
+JSON_HEADERS = MappingProxyType({'Content-Type': 'application/json', **CORS_HEADERS})
+
+ENCODER = 'orjson' if orjson else 'json'
+
+# Smaller bodies aren't worth the CPU (and may grow); -1 turns compression off
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '4'))
+
+# Content codings we can produce, most preferred first
+CONTENT_CODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+
+def _default(value):
+    """Encode the types the JSON encoders don't know"""
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+if orjson:
+    def dumps(data):
+        """Compact JSON text for data"""
+        return orjson.dumps(data, default=_default).decode()
+else:
+    _encoder = json.JSONEncoder(separators=(',', ':'), default=_default)
+
+    def dumps(data):
+        """Compact JSON text for data"""
+        return _encoder.encode(data)
+
+
+def json_response(status_code, body):
+    """Proxy response with body encoded as JSON"""
+    return {
+        'statusCode': status_code,
+        'headers': JSON_HEADERS.copy(),
+        'body': dumps(body)
+    }
+
+
+def success_response(data, status_code=200):
+    """Successful response carrying data"""
+    return json_response(status_code, data)
+
+
+def error_response(status_code, message):
+    """Error response in the {'error', 'statusCode'} shape"""
+    return json_response(status_code, {'error': message, 'statusCode': status_code})
+
+
+def etag(*parts):
+    """Strong entity tag for the representation identified by parts"""
+    digest = hashlib.blake2b('\x1f'.join(map(str, parts)).encode('utf-8'), digest_size=16)
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match, tag):
+    """Whether an If-None-Match header value matches tag (weak comparison, per RFC 9110)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = tag.removeprefix('W/')
+    return any(candidate.strip().removeprefix('W/') == opaque for candidate in if_none_match.split(','))
+
+
+def validator_headers(tag):
+    """ETag plus a Cache-Control that makes clients revalidate before reuse"""
+    return {'ETag': tag, 'Cache-Control': 'private, no-cache'}
+
+
+def not_modified(event, tag):
+    """304 response if the request's If-None-Match matches tag, otherwise None"""
+    if not etag_matches(events.header(event, 'If-None-Match'), tag):
+        return None
+    headers = JSON_HEADERS.copy()
+    headers.update(validator_headers(tag))
+    return {'statusCode': 304, 'headers': headers, 'body': ''}
+
+
+def with_etag(response, tag):
+    """Add tag and its Cache-Control to a response"""
+    response['headers'].update(validator_headers(tag))
+    return response
+
+
+def negotiate_encoding(accept_encoding):
+    """The preferred coding in CONTENT_CODINGS that accept_encoding allows, or None"""
+    weights = {}
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        params = params.strip().lower()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding] = weight
+
+    best, best_weight = None, 0.0
+    for coding in CONTENT_CODINGS:
+        weight = weights.get(coding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def compress(response, accept_encoding):
+    """Compress a proxy response's body in place if it's big enough and the client accepts it"""
+    body = response.get('body')
+    if COMPRESSION_MIN_BYTES < 0 or not body or response.get('isBase64Encoded'):
+        return response
+    data = body.encode('utf-8')
+    if len(data) < COMPRESSION_MIN_BYTES:
+        return response
+
+    # The representation depends on Accept-Encoding from here on
+    headers = response.setdefault('headers', {})
+    headers['Vary'] = 'Accept-Encoding'
+    coding = negotiate_encoding(accept_encoding)
+    if coding == 'br':
+        compressed = brotli.compress(data, quality=BROTLI_QUALITY)
+    elif coding == 'gzip':
+        compressed = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    else:
+        return response
+    if len(compressed) >= len(data):
+        return response
+
+    headers['Content-Encoding'] = coding
+    response['body'] = base64.b64encode(compressed).decode('ascii')
+    response['isBase64Encoded'] = True
+    return response
+
+
+def compressible(handler):
+    """Decorator for lambda_handler: compress responses per the request's Accept-Encoding"""
+    @functools.wraps(handler)
+    def lambda_handler(event, context):
+        return compress(handler(event, context), events.header(event, 'Accept-Encoding'))
+    return lambda_handler
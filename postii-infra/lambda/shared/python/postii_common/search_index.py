@@ -0,0 +1,138 @@
+import logging
+from boto3.dynamodb.conditions import Key
+
+logger = logging.getLogger()
+
+# Users are indexed under every prefix of their username/email (for
+# "starts with" matches) and every trigram (for "contains" matches).
+# Each index row carries the fields the search endpoints return, so a
+# search never has to go back to the Users table.
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_LENGTH = 20
+GRAM_LENGTH = 3
+INDEXED_FIELDS = ('username', 'email')
+PROJECTED_FIELDS = ('username', 'email', 'fullName')
+
+PREFIX_TERM = 'P#'
+GRAM_TERM = 'G#'
+
+
+def normalize(value):
+    """Normalize a username, email or search query for indexing"""
+    return (value or '').strip().lower()
+
+
+def index_terms(item):
+    """Return the set of index terms for a user item"""
+    terms = set()
+    for field in INDEXED_FIELDS:
+        value = normalize(item.get(field))
+        if not value:
+            continue
+        for length in range(MIN_PREFIX_LENGTH, min(len(value), MAX_PREFIX_LENGTH) + 1):
+            terms.add(PREFIX_TERM + value[:length])
+        for start in range(len(value) - GRAM_LENGTH + 1):
+            terms.add(GRAM_TERM + value[start:start + GRAM_LENGTH])
+    return terms
+
+
+def index_row(term, item):
+    """Build the index row stored for a single term"""
+    row = {'term': term, 'userId': item['userId']}
+    for field in PROJECTED_FIELDS:
+        row[field] = item.get(field, '')
+    return row
+
+
+def sync_user(index_table, old_item, new_item):
+    """
+    Bring the index rows for one user in line with their profile.
+
+    old_item is the profile before the write (None for a new user) and
+    new_item the profile after it (None for a deleted user).
+    """
+    old_terms = index_terms(old_item) if old_item else set()
+    new_terms = index_terms(new_item) if new_item else set()
+
+    # Every row carries projected fields, so if any of them changed all
+    # rows are rewritten; otherwise only newly added terms are written.
+    if old_item and new_item and all(old_item.get(f) == new_item.get(f) for f in PROJECTED_FIELDS):
+        terms_to_put = new_terms - old_terms
+    else:
+        terms_to_put = new_terms
+    terms_to_delete = old_terms - new_terms
+
+    if not terms_to_put and not terms_to_delete:
+        return
+
+    user_id = (new_item or old_item)['userId']
+    with index_table.batch_writer() as batch:
+        for term in terms_to_delete:
+            batch.delete_item(Key={'term': term, 'userId': user_id})
+        for term in terms_to_put:
+            batch.put_item(Item=index_row(term, new_item))
+
+    logger.info(f'Search index synced for user {user_id}: {len(terms_to_put)} written, {len(terms_to_delete)} removed')
+
+
+def query_grams(query):
+    """The distinct trigrams of a normalized query, in order"""
+    return list(dict.fromkeys(query[start:start + GRAM_LENGTH] for start in range(len(query) - GRAM_LENGTH + 1)))
+
+
+def search(index_table, query, limit, exclude_user_id=None):
+    """
+    Search the index for users whose username or email starts with or
+    contains the query.
+
+    Prefix matches come first. Queries of at least GRAM_LENGTH characters
+    are also matched as substrings: every user containing the query is in
+    the partition of each of its trigrams, so those partitions are read a
+    page at a time in turn, candidates verified against the projected
+    fields, until limit users matched or one partition ran out. The
+    rarest trigram's partition runs out first and has then been read in
+    full, so no match is missed, and a rare trigram anywhere in the query
+    keeps the cost small however common the others are.
+    """
+    query = normalize(query)
+    results = {}
+    page_size = max(limit, 25)
+
+    def collect(items, verify):
+        for item in items:
+            user_id = item['userId']
+            if user_id == exclude_user_id or user_id in results:
+                continue
+            if verify and not any(query in normalize(item.get(f)) for f in INDEXED_FIELDS):
+                continue
+            results[user_id] = item
+            if len(results) >= limit:
+                return True
+        return False
+
+    def read_page(term, start_key):
+        query_kwargs = {'KeyConditionExpression': Key('term').eq(term), 'Limit': page_size}
+        if start_key:
+            query_kwargs['ExclusiveStartKey'] = start_key
+        response = index_table.query(**query_kwargs)
+        return response.get('Items', []), response.get('LastEvaluatedKey')
+
+    # A prefix partition holds only matches, so it never reads past limit
+    if len(query) <= MAX_PREFIX_LENGTH:
+        start_key = None
+        while True:
+            items, start_key = read_page(PREFIX_TERM + query, start_key)
+            if collect(items, False):
+                return list(results.values())
+            if not start_key:
+                break
+
+    if len(query) >= GRAM_LENGTH:
+        start_keys = {GRAM_TERM + gram: None for gram in query_grams(query)}
+        while True:
+            for term, start_key in start_keys.items():
+                items, start_keys[term] = read_page(term, start_key)
+                if collect(items, True) or not start_keys[term]:
+                    return list(results.values())
+
+    return list(results.values())
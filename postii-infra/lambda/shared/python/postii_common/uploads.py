@@ -0,0 +1,251 @@
+"""
+Direct-to-S3 image uploads.
+
+Image bytes never pass through API Gateway or Lambda. A client asks for
+an upload ticket (content type and size), then PUTs the image straight
+to ASSETS_BUCKET with the presigned URLs in it:
+
+- up to MULTIPART_THRESHOLD_BYTES: one presigned PutObject URL. Content
+  type and length are signed, so S3 rejects anything else.
+- above that: a multipart upload, created here, with a presigned
+  UploadPart URL per PART_SIZE_BYTES part (each length signed) and
+  presigned CompleteMultipartUpload / AbortMultipartUpload URLs. The
+  bucket's lifecycle rule cleans up uploads that are never completed.
+
+A ticket request that includes the image's SHA-256 is content-addressed
+instead: the key is images/<sha256>.<ext>, shared by everyone who
+uploads the same bytes. If image_refs already knows the hash there is
+nothing to upload. Otherwise the ticket is a single presigned PUT (up to
+MAX_IMAGE_BYTES) with x-amz-checksum-sha256 signed, so S3 itself rejects
+bytes that don't match the hash.
+
+Other keys live under uploads/<userId>/, so a user can only reference
+their own uploads; check_upload enforces that and confirms with
+HeadObject that the object exists and is an acceptable image before a
+postcard points at it.
+
+The images lambda turns every stored image into fixed-size variants
+under derived/ (see derived_key). Their keys follow from the image's
+key, so variant_urls can name them from a postcard's imageUrl alone,
+and a content-addressed image gets one set of variants (and one set of
+CDN cache entries) however many postcards use it.
+"""
+import base64
+import math
+import os
+import re
+import uuid
+from urllib.parse import urlsplit
+
+from botocore.exceptions import ClientError
+
+from postii_common import aws, image_refs
+
+KEY_PREFIX = 'uploads'
+CONTENT_PREFIX = 'images'
+DERIVED_PREFIX = 'derived'
+
+# Variants the images lambda writes for every upload, and their format
+VARIANTS = ('thumb', 'display')
+VARIANT_FORMAT = os.environ.get('IMAGE_VARIANT_FORMAT', 'webp')
+VARIANT_SUFFIXES = {'webp': '.webp', 'jpeg': '.jpg'}
+
+# Content types we accept, and the key suffix for each
+CONTENT_TYPES = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/heic': '.heic',
+    'image/webp': '.webp',
+}
+
+MAX_IMAGE_BYTES = int(os.environ.get('MAX_IMAGE_BYTES', str(25 * 1024 * 1024)))
+MULTIPART_THRESHOLD_BYTES = int(os.environ.get('MULTIPART_THRESHOLD_BYTES', str(8 * 1024 * 1024)))
+# S3 requires at least 5 MiB for every part but the last
+PART_SIZE_BYTES = max(5 * 1024 * 1024, int(os.environ.get('PART_SIZE_BYTES', str(8 * 1024 * 1024))))
+URL_EXPIRES_SECONDS = int(os.environ.get('UPLOAD_URL_EXPIRES_SECONDS', '900'))
+
+SHA256_PATTERN = re.compile(r'[0-9a-f]{64}')
+CONTENT_KEY_PATTERN = re.compile(
+    rf"{CONTENT_PREFIX}/(?P<hash>[0-9a-f]{{64}})(?:{'|'.join(re.escape(suffix) for suffix in CONTENT_TYPES.values())})"
+)
+
+
+class InvalidUpload(ValueError):
+    """Raised for upload requests or references the caller can fix (a 400)"""
+
+
+def user_prefix(user_id):
+    """Key prefix every upload of user_id lives under"""
+    return f'{KEY_PREFIX}/{user_id}/'
+
+
+def content_key(image_hash, content_type):
+    """Content-addressed key for an image with SHA-256 image_hash (hex)"""
+    return f'{CONTENT_PREFIX}/{image_hash}{CONTENT_TYPES[content_type]}'
+
+
+def content_hash(key):
+    """SHA-256 (hex) of a content-addressed key, or None for other keys"""
+    match = CONTENT_KEY_PATTERN.fullmatch(key or '')
+    return match.group('hash') if match else None
+
+
+def create_ticket(bucket, user_id, content_type, size, sha256=None, images_table_name=None):
+    """
+    Presigned upload instructions for one image of size bytes.
+
+    Returns {'key', 'exists', 'method', 'url', 'headers', 'expiresIn'} for
+    a single PUT, or {'key', 'exists', 'uploadId', 'partSize', 'parts',
+    'completeUrl', 'abortUrl', 'expiresIn'} for a multipart upload. With
+    sha256, an image that is already stored comes back as just {'key',
+    'exists': True}. Raises InvalidUpload.
+    """
+    if content_type not in CONTENT_TYPES:
+        raise InvalidUpload(f"contentType must be one of {', '.join(CONTENT_TYPES)}")
+    if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+        raise InvalidUpload('size must be a positive number of bytes')
+    if size > MAX_IMAGE_BYTES:
+        raise InvalidUpload(f'Images may be at most {MAX_IMAGE_BYTES} bytes')
+
+    s3 = aws.s3()
+
+    if sha256 is not None:
+        if not isinstance(sha256, str) or not SHA256_PATTERN.fullmatch(sha256.lower()):
+            raise InvalidUpload('sha256 must be the hex SHA-256 of the image')
+        sha256 = sha256.lower()
+        image_ref = image_refs.get(images_table_name, sha256)
+        if image_ref:
+            # Stored under the extension it was first uploaded with
+            return {'key': image_ref['imageKey'], 'exists': True}
+
+        key = content_key(sha256, content_type)
+        checksum = base64.b64encode(bytes.fromhex(sha256)).decode('ascii')
+        url = s3.generate_presigned_url('put_object', Params={
+            'Bucket': bucket, 'Key': key, 'ContentType': content_type, 'ContentLength': size,
+            'ChecksumSHA256': checksum
+        }, ExpiresIn=URL_EXPIRES_SECONDS)
+        return {
+            'key': key,
+            'exists': False,
+            'method': 'PUT',
+            'url': url,
+            'headers': {'Content-Type': content_type, 'x-amz-checksum-sha256': checksum},
+            'expiresIn': URL_EXPIRES_SECONDS
+        }
+
+    key = f'{user_prefix(user_id)}{uuid.uuid4().hex}{CONTENT_TYPES[content_type]}'
+
+    if size <= MULTIPART_THRESHOLD_BYTES:
+        url = s3.generate_presigned_url('put_object', Params={
+            'Bucket': bucket, 'Key': key, 'ContentType': content_type, 'ContentLength': size
+        }, ExpiresIn=URL_EXPIRES_SECONDS)
+        return {
+            'key': key,
+            'exists': False,
+            'method': 'PUT',
+            'url': url,
+            'headers': {'Content-Type': content_type},
+            'expiresIn': URL_EXPIRES_SECONDS
+        }
+
+    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key, ContentType=content_type)['UploadId']
+    part_count = math.ceil(size / PART_SIZE_BYTES)
+    parts = []
+    for part_number in range(1, part_count + 1):
+        part_size = min(PART_SIZE_BYTES, size - (part_number - 1) * PART_SIZE_BYTES)
+        parts.append({
+            'partNumber': part_number,
+            'size': part_size,
+            'url': s3.generate_presigned_url('upload_part', Params={
+                'Bucket': bucket, 'Key': key, 'UploadId': upload_id,
+                'PartNumber': part_number, 'ContentLength': part_size
+            }, ExpiresIn=URL_EXPIRES_SECONDS)
+        })
+
+    multipart_params = {'Bucket': bucket, 'Key': key, 'UploadId': upload_id}
+    return {
+        'key': key,
+        'exists': False,
+        'uploadId': upload_id,
+        'partSize': PART_SIZE_BYTES,
+        'parts': parts,
+        'completeUrl': s3.generate_presigned_url('complete_multipart_upload', Params=multipart_params,
+                                                 ExpiresIn=URL_EXPIRES_SECONDS, HttpMethod='POST'),
+        'abortUrl': s3.generate_presigned_url('abort_multipart_upload', Params=multipart_params,
+                                              ExpiresIn=URL_EXPIRES_SECONDS, HttpMethod='DELETE'),
+        'expiresIn': URL_EXPIRES_SECONDS
+    }
+
+
+def key_from_reference(user_id, image_key=None, image_url=None):
+    """
+    The S3 key a send request refers to: imageKey from an upload ticket,
+    or (for older clients) an imageUrl whose path is such a key. Raises
+    InvalidUpload unless it is content-addressed or one of user_id's
+    uploads.
+    """
+    key = image_key
+    if not key and image_url:
+        key = urlsplit(image_url).path.lstrip('/')
+    if not key:
+        raise InvalidUpload('imageKey is required')
+    if not isinstance(key, str):
+        raise InvalidUpload('imageKey must be one of your uploads')
+    if content_hash(key):
+        return key
+    if not key.startswith(user_prefix(user_id)) or '..' in key:
+        raise InvalidUpload('imageKey must be one of your uploads')
+    return key
+
+
+def check_upload(bucket, key):
+    """HeadObject metadata for an uploaded image; raises InvalidUpload if it isn't usable"""
+    try:
+        head = aws.s3().head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            raise InvalidUpload('Image has not been uploaded') from e
+        raise
+
+    if head.get('ContentType') not in CONTENT_TYPES:
+        raise InvalidUpload('Uploaded file is not a supported image type')
+    if head.get('ContentLength', 0) > MAX_IMAGE_BYTES:
+        raise InvalidUpload(f'Images may be at most {MAX_IMAGE_BYTES} bytes')
+    return head
+
+
+def has_variants(key):
+    """True for keys the images lambda writes variants of"""
+    return key.startswith((f'{KEY_PREFIX}/', f'{CONTENT_PREFIX}/'))
+
+
+def derived_key(key, variant):
+    """Key of one variant of the image at key"""
+    stem = key.rsplit('.', 1)[0]
+    return f'{DERIVED_PREFIX}/{stem}/{variant}{VARIANT_SUFFIXES[VARIANT_FORMAT]}'
+
+
+def variant_urls(image_url):
+    """
+    {'thumbnailUrl', 'displayUrl'} for a postcard's imageUrl. Images that
+    weren't uploaded through a ticket have no variants, so both are the
+    original. A variant that isn't written yet is a 404, on which
+    clients fall back to imageUrl.
+    """
+    parts = urlsplit(image_url or '')
+    key = parts.path.lstrip('/')
+    if not has_variants(key):
+        return {'thumbnailUrl': image_url, 'displayUrl': image_url}
+    base = f'{parts.scheme}://{parts.netloc}/'
+    return {
+        'thumbnailUrl': base + derived_key(key, 'thumb'),
+        'displayUrl': base + derived_key(key, 'display')
+    }
+
+
+def image_url(bucket, key):
+    """URL clients load an uploaded image from: the CDN when one is configured"""
+    domain = os.environ.get('ASSETS_CDN_DOMAIN')
+    if domain:
+        return f'https://{domain}/{key}'
+    return f'https://{bucket}.s3.amazonaws.com/{key}'
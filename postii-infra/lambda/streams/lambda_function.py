@@ -0,0 +1,323 @@
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+from postii_common import aws, counters, dal, image_refs, profiles, reservations, search_index, uploads
+from postii_common.friendships import STATUS_ACCEPTED, STATUS_PENDING
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Ledger entries outlive the streams' 24-hour retention, so every
+# record Lambda can still redeliver finds its entry
+LEDGER_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# TransactWriteItems takes at most 100 items, PublishBatch 10 entries
+MAX_TRANSACTION_ITEMS = 100
+PUBLISH_BATCH_SIZE = 10
+# Each retry drops effects that were already applied or users that are gone
+MAX_TRANSACTION_ATTEMPTS = 5
+
+NOTIFY_POSTCARD_RECEIVED = 'postcard_received'
+NOTIFY_FRIEND_REQUEST = 'friend_request'
+NOTIFY_FRIEND_ACCEPTED = 'friend_accepted'
+
+# Actor fields copied into notifications
+ACTOR_FIELDS = ('userId', 'username', 'fullName', 'profilePictureUrl')
+
+def lambda_handler(event, context):
+    """
+    Postii Streams handler - applies the side effects of writes to the
+    postcards, friendships and users tables from their DynamoDB streams:
+    profile counters, image references, notifications and the friend
+    search index. Records it couldn't apply are returned as
+    batchItemFailures, so Lambda retries from the first of them
+    """
+    ledger_table_name = os.environ.get('EVENT_LEDGER_TABLE')
+    users_table_name = os.environ.get('USERS_TABLE')
+    images_table_name = os.environ.get('IMAGES_TABLE')
+    search_index_table_name = os.environ.get('SEARCH_INDEX_TABLE')
+    topic_arn = os.environ.get('NOTIFICATIONS_TOPIC_ARN')
+    if not all((ledger_table_name, users_table_name, images_table_name, search_index_table_name, topic_arn)):
+        # Nothing can be applied; fail the batch so it is retried once fixed
+        raise RuntimeError('Missing environment variables')
+
+    records = event.get('Records', [])
+    failed = []
+    effects = {}
+    for record in records:
+        sequence = record['dynamodb']['SequenceNumber']
+        try:
+            keys = record['dynamodb']['Keys']
+            old_item = dal.deserialize_item(record['dynamodb'].get('OldImage') or {}) or None
+            new_item = dal.deserialize_item(record['dynamodb'].get('NewImage') or {}) or None
+            if 'postcardId' in keys:
+                effect = postcard_effect(record['eventName'], old_item, new_item)
+            elif 'friendshipId' in keys:
+                effect = friendship_effect(old_item, new_item)
+            else:
+                sync_profile(aws.table(search_index_table_name), old_item, new_item)
+                effect = None
+        except Exception as e:
+            logger.error(f'Error handling stream record {sequence}: {str(e)}')
+            failed.append(sequence)
+            continue
+
+        # One effect per event, even if a record shows up twice
+        if effect and effect['eventId'] not in effects:
+            effect['sequence'] = sequence
+            effects[effect['eventId']] = effect
+
+    failed.extend(apply_effects(list(effects.values()), ledger_table_name, users_table_name, images_table_name,
+                                topic_arn))
+
+    logger.info(f'Streams handler: {len(records)} records, {len(effects)} effects, {len(failed)} failed')
+    return {'batchItemFailures': [{'itemIdentifier': sequence} for sequence in sorted(set(failed), key=int)]}
+
+def new_effect(event_id, notification=None):
+    """What one postcard or friendship event changes, keyed for the ledger"""
+    return {'eventId': event_id, 'counters': {}, 'images': {}, 'notification': notification}
+
+def postcard_effect(event_name, old_item, new_item):
+    """Count a sent (or removed) postcard and notify its recipient"""
+    if event_name == 'INSERT':
+        item, amount, action = new_item, 1, 'sent'
+    elif event_name == 'REMOVE':
+        item, amount, action = old_item, -1, 'removed'
+    else:
+        # Status changes (e.g. read receipts) count for nothing
+        return None
+
+    notification = None
+    if amount > 0:
+        notification = {
+            'type': NOTIFY_POSTCARD_RECEIVED,
+            'userId': item['recipientId'],
+            'actorId': item['senderId'],
+            'postcardId': item['postcardId']
+        }
+    effect = new_effect(f"postcard-{action}#{item['postcardId']}", notification)
+    effect['counters'][(item['senderId'], counters.POSTCARDS_COUNT)] = amount
+    image_hash = uploads.content_hash(item.get('imageKey'))
+    if image_hash:
+        effect['images'][image_hash] = (item['imageKey'], amount)
+    return effect
+
+def friendship_effect(old_item, new_item):
+    """Notify on a new friend request; count and notify on an accepted one"""
+    # Alias items left by scripts/migrate_friendship_keys.py aren't friendships
+    if not new_item or 'status' not in new_item or 'requesterId' not in new_item:
+        return None
+    # Nor is a row that migration copied onto its pair key a new event;
+    # reconcile_counters counts the rows it moved
+    if 'legacyFriendshipId' in new_item and 'legacyFriendshipId' not in (old_item or {}):
+        return None
+    old_status = (old_item or {}).get('status')
+    new_status = new_item['status']
+
+    # createdAt tells a re-sent request for the same pair from the last one
+    event_suffix = f"{new_item['friendshipId']}#{new_item['createdAt']}"
+    if new_status == STATUS_PENDING and old_status != STATUS_PENDING:
+        return new_effect(f'friend-request#{event_suffix}', {
+            'type': NOTIFY_FRIEND_REQUEST,
+            'userId': new_item['addresseeId'],
+            'actorId': new_item['requesterId'],
+            'friendshipId': new_item['friendshipId']
+        })
+    if new_status == STATUS_ACCEPTED and old_status == STATUS_PENDING:
+        effect = new_effect(f'friendship-accepted#{event_suffix}', {
+            'type': NOTIFY_FRIEND_ACCEPTED,
+            'userId': new_item['requesterId'],
+            'actorId': new_item['addresseeId'],
+            'friendshipId': new_item['friendshipId']
+        })
+        effect['counters'][(new_item['requesterId'], counters.FRIENDS_COUNT)] = 1
+        effect['counters'][(new_item['addresseeId'], counters.FRIENDS_COUNT)] = 1
+        return effect
+    # Rows migrated or written already accepted were counted by reconcile_counters
+    return None
+
+def sync_profile(search_index_table, old_item, new_item):
+    """Bring a user's search index rows in line with a profile write; idempotent"""
+    if reservations.is_reservation(new_item or old_item or {}):
+        return
+    search_index.sync_user(search_index_table, old_item, new_item)
+
+def apply_effects(effects, ledger_table_name, users_table_name, images_table_name, topic_arn):
+    """Apply effects in as few transactions as fit, then notify; returns sequence numbers that failed"""
+    failed = []
+    to_notify = []
+    for chunk in chunk_effects(effects):
+        try:
+            to_notify.extend(write_effects(chunk, ledger_table_name, users_table_name, images_table_name))
+        except Exception as e:
+            logger.error(f'Error applying {len(chunk)} stream effects: {str(e)}')
+            failed.extend(effect['sequence'] for effect in chunk)
+
+    failed.extend(notify(to_notify, ledger_table_name, users_table_name, topic_arn))
+    return failed
+
+def update_keys(effect):
+    """The counter and image items effect updates"""
+    return {('counter',) + key for key in effect['counters']} | {('image', key) for key in effect['images']}
+
+def chunk_effects(effects):
+    """Split effects into groups whose ledger entries and merged updates fit in one transaction"""
+    chunk, updates = [], set()
+    for effect in effects:
+        effect_updates = update_keys(effect)
+        if chunk and len(chunk) + 1 + len(updates | effect_updates) > MAX_TRANSACTION_ITEMS:
+            yield chunk
+            chunk, updates = [], set()
+        chunk.append(effect)
+        updates |= effect_updates
+    if chunk:
+        yield chunk
+
+def write_effects(chunk, ledger_table_name, users_table_name, images_table_name):
+    """
+    Apply one chunk in a single transaction: a ledger entry per effect,
+    conditioned on its event being new, plus the counter and image
+    updates of the whole chunk merged (a batch send of 100 postcards is
+    one ADD 100). Effects whose entry already exists were applied by an
+    earlier delivery and are left out of the retry; so are the counters
+    of users whose profile is gone. Returns the effects whose
+    notification still has to go out
+    """
+    client = aws.dynamodb().meta.client
+    timestamp = datetime.now(timezone.utc).isoformat()
+    to_notify = []
+    missing_users = set()
+
+    for _ in range(MAX_TRANSACTION_ATTEMPTS):
+        if not chunk:
+            return to_notify
+        ledger_entries = [ledger_entry(ledger_table_name, effect, timestamp) for effect in chunk]
+        updates = merged_updates(chunk, missing_users, users_table_name, images_table_name, timestamp)
+        try:
+            client.transact_write_items(TransactItems=ledger_entries + [entry for _, entry in updates])
+            return to_notify + [effect for effect in chunk if effect['notification']]
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                raise
+            reasons = e.response.get('CancellationReasons', [])
+            if not any(reason.get('Code') == 'ConditionalCheckFailed' for reason in reasons):
+                # Conflicts and throttling: let Lambda retry the records
+                raise
+
+        remaining = []
+        for effect, reason in zip(chunk, reasons):
+            if reason.get('Code') != 'ConditionalCheckFailed':
+                remaining.append(effect)
+                continue
+            # Applied before; its notification may not have gone out
+            entry = dal.deserialize_item(reason.get('Item') or {})
+            if effect['notification'] and not entry.get('notified'):
+                to_notify.append(effect)
+        for (key, _), reason in zip(updates, reasons[len(chunk):]):
+            if reason.get('Code') == 'ConditionalCheckFailed' and key[0] == 'counter':
+                logger.warning(f'Profile {key[1]} not found; not counting {key[2]}')
+                missing_users.add(key[1])
+        chunk = remaining
+
+    raise RuntimeError(f'Stream effects still failing conditions after {MAX_TRANSACTION_ATTEMPTS} attempts')
+
+def ledger_entry(ledger_table_name, effect, timestamp):
+    """Put that records effect's event as applied, failing if it already was"""
+    return {
+        'Put': {
+            'TableName': ledger_table_name,
+            'Item': ledger_item(effect, timestamp, notified=not effect['notification']),
+            'ConditionExpression': 'attribute_not_exists(eventId)',
+            'ReturnValuesOnConditionCheckFailure': 'ALL_OLD'
+        }
+    }
+
+def ledger_item(effect, timestamp, notified):
+    """Ledger item for effect's event"""
+    return {
+        'eventId': effect['eventId'],
+        'sequenceNumber': effect['sequence'],
+        'notified': notified,
+        'appliedAt': timestamp,
+        'expiresAt': int(time.time()) + LEDGER_TTL_SECONDS
+    }
+
+def merged_updates(chunk, missing_users, users_table_name, images_table_name, timestamp):
+    """[(update key, TransactWriteItems entry)] with every effect's amounts summed per item"""
+    counter_amounts, image_amounts = {}, {}
+    for effect in chunk:
+        for key, amount in effect['counters'].items():
+            if key[0] not in missing_users:
+                counter_amounts[key] = counter_amounts.get(key, 0) + amount
+        for image_hash, (image_key, amount) in effect['images'].items():
+            previous = image_amounts.get(image_hash, (image_key, 0))
+            image_amounts[image_hash] = (previous[0], previous[1] + amount)
+
+    updates = [
+        (('counter', user_id, counter), counters.increment(users_table_name, user_id, counter, amount))
+        for (user_id, counter), amount in counter_amounts.items() if amount
+    ]
+    updates.extend(
+        (('image', image_hash), image_refs.increment(images_table_name, image_hash, image_key, timestamp, amount))
+        for image_hash, (image_key, amount) in image_amounts.items() if amount
+    )
+    return updates
+
+def notify(effects, ledger_table_name, users_table_name, topic_arn):
+    """
+    Publish each effect's notification to the notifications topic, then
+    mark it sent in the ledger. Subscribers (push, email) filter on the
+    userId and type message attributes. Returns the sequence numbers of
+    effects that couldn't be published
+    """
+    if not effects:
+        return []
+
+    actors = profiles.get_public_profiles(aws.table(users_table_name),
+                                          [effect['notification']['actorId'] for effect in effects])
+    sns = aws.sns()
+    failed, sent = [], []
+    for start in range(0, len(effects), PUBLISH_BATCH_SIZE):
+        batch = effects[start:start + PUBLISH_BATCH_SIZE]
+        entries = [publish_entry(str(position), effect['notification'], actors)
+                   for position, effect in enumerate(batch)]
+        try:
+            response = sns.publish_batch(TopicArn=topic_arn, PublishBatchRequestEntries=entries)
+        except Exception as e:
+            logger.error(f'Error publishing {len(batch)} notifications: {str(e)}')
+            failed.extend(effect['sequence'] for effect in batch)
+            continue
+        failed_ids = {entry['Id'] for entry in response.get('Failed', [])}
+        for position, effect in enumerate(batch):
+            if str(position) in failed_ids:
+                failed.append(effect['sequence'])
+            else:
+                sent.append(effect)
+
+    # A redelivery before this lands notifies again; at-least-once is
+    # the right side to err on
+    try:
+        timestamp = datetime.now(timezone.utc).isoformat()
+        with aws.table(ledger_table_name).batch_writer() as batch:
+            for effect in sent:
+                batch.put_item(Item=ledger_item(effect, timestamp, notified=True))
+    except Exception as e:
+        logger.warning(f'Error marking {len(sent)} notifications sent: {str(e)}')
+
+    return failed
+
+def publish_entry(entry_id, notification, actors):
+    """PublishBatch entry for one notification, with the actor's public profile"""
+    actor = actors.get(notification['actorId'], {'userId': notification['actorId']})
+    message = {**notification, 'actor': {field: actor.get(field) for field in ACTOR_FIELDS}}
+    return {
+        'Id': entry_id,
+        'Message': json.dumps(message),
+        'MessageAttributes': {
+            'userId': {'DataType': 'String', 'StringValue': notification['userId']},
+            'type': {'DataType': 'String', 'StringValue': notification['type']}
+        }
+    }
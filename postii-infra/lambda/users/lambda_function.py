@@ -1,16 +1,31 @@
 import json
 import logging
-import boto3
 import os
 from datetime import datetime, timezone
 from botocore.exceptions import ClientError
+from postii_common import aws, events, reservations
+from postii_common.cache import TTLCache
+from postii_common.profiles import format_user_profile
+from postii_common.responses import compressible, error_response, etag, not_modified, success_response, with_etag
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-dynamodb = boto3.resource('dynamodb')
-s3_client = boto3.client('s3')
+# 409 messages for the items of the create transaction, in order
+CREATE_CONFLICT_MESSAGES = (
+    'User profile already exists',
+    'Username already taken',
+    'Email already registered',
+)
 
+# Formatted (self-view) profiles, kept across warm invocations. Other
+# containers only see this container's updates once entries expire.
+profile_cache = TTLCache(
+    max_size=int(os.environ.get('PROFILE_CACHE_SIZE', '1024')),
+    ttl_seconds=float(os.environ.get('PROFILE_CACHE_TTL_SECONDS', '30'))
+)
+
+@compressible
 def lambda_handler(event, context):
     """
     Postii Users handler - handles user profile management
@@ -25,7 +40,7 @@ def lambda_handler(event, context):
         if not users_table_name:
             return error_response(500, 'Missing environment variables')
         
-        users_table = dynamodb.Table(users_table_name)
+        users_table = aws.table(users_table_name)
         
         # Parse request
         http_method = event.get('httpMethod')
@@ -44,11 +59,11 @@ def lambda_handler(event, context):
         # Route requests
         if http_method == 'GET' and resource_path == '/v1/users':
             # Get current user's profile
-            return get_user_profile(users_table, authenticated_user_id)
+            return get_user_profile(users_table, authenticated_user_id, event)
         elif http_method == 'GET' and resource_path == '/v1/users/{userId}':
             # Get specific user by ID
             target_user_id = path_parameters.get('userId')
-            return get_user_by_id(users_table, target_user_id, authenticated_user_id)
+            return get_user_by_id(users_table, target_user_id, authenticated_user_id, event)
         elif http_method == 'PUT' and resource_path == '/v1/users':
             # Update current user's profile
             return update_user_profile(users_table, event, authenticated_user_id, assets_bucket)
@@ -65,47 +80,82 @@ def lambda_handler(event, context):
         logger.error(f'Error in users handler: {str(e)}')
         return error_response(500, 'Internal server error')
 
-def get_user_profile(table, user_id):
+def get_user_profile(table, user_id, event):
     """Get the authenticated user's profile"""
     try:
-        response = table.get_item(Key={'userId': user_id})
+        user_profile = get_cached_profile(table, user_id)
         
-        if 'Item' not in response:
+        if user_profile is None:
             return error_response(404, 'User profile not found')
         
-        user_profile = format_user_profile(response['Item'], is_self=True)
-        return success_response(user_profile)
+        tag = profile_etag(user_profile, is_self=True)
+        unchanged = not_modified(event, tag)
+        if unchanged:
+            return unchanged
+        
+        return with_etag(success_response(user_profile), tag)
         
     except Exception as e:
         logger.error(f'Error getting user profile: {str(e)}')
         return error_response(500, 'Failed to retrieve user profile')
 
-def get_user_by_id(table, target_user_id, authenticated_user_id):
+def get_user_by_id(table, target_user_id, authenticated_user_id, event):
     """Get a specific user's profile by ID"""
     try:
         if not target_user_id:
             return error_response(400, 'User ID is required')
         
-        response = table.get_item(Key={'userId': target_user_id})
+        # Reservation items share the Users table but aren't profiles
+        if reservations.is_reservation(target_user_id):
+            return error_response(404, 'User not found')
+        
+        user_profile = get_cached_profile(table, target_user_id)
         
-        if 'Item' not in response:
+        if user_profile is None:
             return error_response(404, 'User not found')
         
         # Check if viewing own profile or another user's profile
         is_self = target_user_id == authenticated_user_id
-        user_profile = format_user_profile(response['Item'], is_self=is_self)
+        tag = profile_etag(user_profile, is_self)
+        unchanged = not_modified(event, tag)
+        if unchanged:
+            return unchanged
         
-        return success_response(user_profile)
+        if not is_self:
+            user_profile = format_user_profile(user_profile, is_self=False)
+        
+        return with_etag(success_response(user_profile), tag)
         
     except Exception as e:
         logger.error(f'Error getting user by ID: {str(e)}')
         return error_response(500, 'Failed to retrieve user')
 
+def get_cached_profile(table, user_id):
+    """Self-view profile for user_id from the warm cache or DynamoDB; None if missing"""
+    user_profile = profile_cache.get(user_id)
+    if user_profile is not None:
+        return user_profile
+    
+    response = table.get_item(Key={'userId': user_id})
+    if 'Item' not in response:
+        return None
+    
+    user_profile = format_user_profile(response['Item'], is_self=True)
+    profile_cache.set(user_id, user_profile)
+    logger.info(f'Profile cache miss for {user_id}: {profile_cache.stats()}')
+    return user_profile
+
+def profile_etag(user_profile, is_self):
+    """ETag for a profile view, from a self-view profile"""
+    # The counters are bumped with ADD and leave updatedAt alone
+    return etag('profile', 'self' if is_self else 'public', user_profile['userId'], user_profile['updatedAt'],
+                user_profile['postcardsCount'], user_profile['friendsCount'])
+
 def create_user_profile(table, event, user_id, assets_bucket):
     """Create or initialize a user profile"""
     try:
         # Parse request body
-        body = json.loads(event.get('body', '{}'))
+        body = json.loads(events.body_text(event) or '{}')
         
         username = body.get('username', '').strip()
         email = body.get('email', '').strip()
@@ -117,40 +167,6 @@ def create_user_profile(table, event, user_id, assets_bucket):
         if not username or not email:
             return error_response(400, 'username and email are required')
         
-        # Check if user already exists
-        try:
-            existing_user = table.get_item(Key={'userId': user_id})
-            if 'Item' in existing_user:
-                return error_response(409, 'User profile already exists')
-        except Exception:
-            pass
-        
-        # Check if username is already taken
-        try:
-            username_response = table.query(
-                IndexName='username-index',
-                KeyConditionExpression='username = :username',
-                ExpressionAttributeValues={':username': username}
-            )
-            if username_response.get('Items'):
-                return error_response(409, 'Username already taken')
-        except Exception as e:
-            logger.error(f'Error checking username: {str(e)}')
-            return error_response(500, 'Failed to validate username')
-        
-        # Check if email is already taken
-        try:
-            email_response = table.query(
-                IndexName='email-index',
-                KeyConditionExpression='email = :email',
-                ExpressionAttributeValues={':email': email}
-            )
-            if email_response.get('Items'):
-                return error_response(409, 'Email already registered')
-        except Exception as e:
-            logger.error(f'Error checking email: {str(e)}')
-            return error_response(500, 'Failed to validate email')
-        
         current_time = datetime.now(timezone.utc).isoformat()
         
         # Create user profile
@@ -168,7 +184,29 @@ def create_user_profile(table, event, user_id, assets_bucket):
             'friendsCount': 0
         }
         
-        table.put_item(Item=user_item)
+        # One transaction writes the profile and claims its username and
+        # email, so concurrent signups can't both get either
+        try:
+            table.meta.client.transact_write_items(TransactItems=[
+                {
+                    'Put': {
+                        'TableName': table.name,
+                        'Item': user_item,
+                        'ConditionExpression': 'attribute_not_exists(userId)'
+                    }
+                },
+                reservations.claim(table.name, reservations.username_key(username), user_id),
+                reservations.claim(table.name, reservations.email_key(email), user_id)
+            ])
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                raise
+            reasons = [reason.get('Code') for reason in e.response.get('CancellationReasons', [])]
+            for reason, message in zip(reasons, CREATE_CONFLICT_MESSAGES):
+                if reason == 'ConditionalCheckFailed':
+                    return error_response(409, message)
+            raise
+        profile_cache.invalidate(user_id)
         
         logger.info(f'User profile created for user {user_id}')
         
@@ -193,14 +231,7 @@ def update_user_profile(table, event, user_id, assets_bucket):
     """Update the user's profile"""
     try:
         # Parse request body
-        body = json.loads(event.get('body', '{}'))
-        
-        # Get current user profile
-        response = table.get_item(Key={'userId': user_id})
-        if 'Item' not in response:
-            return error_response(404, 'User profile not found')
-        
-        current_user = response['Item']
+        body = json.loads(events.body_text(event) or '{}')
         
         # Fields that can be updated
         updatable_fields = {
@@ -211,25 +242,14 @@ def update_user_profile(table, event, user_id, assets_bucket):
         }
         
         # Remove None values
-        updatable_fields = {k: v for k, v in updatable_fields.items() if v is not None}
+        updatable_fields = {
+            k: v.strip() if isinstance(v, str) else v
+            for k, v in updatable_fields.items() if v is not None
+        }
         
         if not updatable_fields:
             return error_response(400, 'No valid fields to update')
         
-        # If updating username, check if it's already taken
-        if 'username' in updatable_fields and updatable_fields['username'] != current_user.get('username'):
-            try:
-                username_response = table.query(
-                    IndexName='username-index',
-                    KeyConditionExpression='username = :username',
-                    ExpressionAttributeValues={':username': updatable_fields['username']}
-                )
-                if username_response.get('Items'):
-                    return error_response(409, 'Username already taken')
-            except Exception as e:
-                logger.error(f'Error checking username: {str(e)}')
-                return error_response(500, 'Failed to validate username')
-        
         # Build update expression
         update_expression = "SET updatedAt = :updated_at"
         expression_attribute_values = {
@@ -237,28 +257,31 @@ def update_user_profile(table, event, user_id, assets_bucket):
         }
         
         for field, value in updatable_fields.items():
-            if isinstance(value, str):
-                value = value.strip()
             update_expression += f", {field} = :{field}"
             expression_attribute_values[f':{field}'] = value
         
-        # Update user profile
-        table.update_item(
-            Key={'userId': user_id},
-            UpdateExpression=update_expression,
-            ExpressionAttributeValues=expression_attribute_values
-        )
-        
-        # Get updated user profile
-        updated_response = table.get_item(Key={'userId': user_id})
-        updated_user = format_user_profile(updated_response['Item'], is_self=True)
-        
-        logger.info(f'User profile updated for user {user_id}')
+        if 'username' in updatable_fields:
+            return update_with_username_change(
+                table, user_id, updatable_fields,
+                update_expression, expression_attribute_values
+            )
         
-        return success_response({
-            **updated_user,
-            'message': 'Profile updated successfully'
-        })
+        # Common path: one conditional write that also returns the new item
+        try:
+            updated_item = table.update_item(
+                Key={'userId': user_id},
+                UpdateExpression=update_expression,
+                ConditionExpression='attribute_exists(userId)',
+                ExpressionAttributeValues=expression_attribute_values,
+                ReturnValues='ALL_NEW'
+            )['Attributes']
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return error_response(404, 'User profile not found')
+            raise
+        profile_cache.invalidate(user_id)
+        
+        return profile_updated_response(user_id, updated_item)
         
     except json.JSONDecodeError:
         return error_response(400, 'Invalid JSON in request body')
@@ -266,6 +289,84 @@ def update_user_profile(table, event, user_id, assets_bucket):
         logger.error(f'Error updating user profile: {str(e)}')
         return error_response(500, 'Failed to update user profile')
 
+def update_with_username_change(table, user_id, updatable_fields,
+                                update_expression, expression_attribute_values):
+    """Update a profile whose username may change, moving the username reservation atomically"""
+    
+    response = table.get_item(Key={'userId': user_id}, ConsistentRead=True)
+    if 'Item' not in response:
+        return error_response(404, 'User profile not found')
+    
+    current_user = response['Item']
+    old_username = current_user.get('username')
+    new_username = updatable_fields['username']
+    
+    try:
+        if new_username == old_username:
+            updated_item = table.update_item(
+                Key={'userId': user_id},
+                UpdateExpression=update_expression,
+                ConditionExpression='attribute_exists(userId)',
+                ExpressionAttributeValues=expression_attribute_values,
+                ReturnValues='ALL_NEW'
+            )['Attributes']
+        else:
+            transact_items = [
+                {
+                    'Update': {
+                        'TableName': table.name,
+                        'Key': {'userId': user_id},
+                        'UpdateExpression': update_expression,
+                        # Fails if the username changed since it was read
+                        'ConditionExpression': 'attribute_exists(userId) AND username = :old_username',
+                        'ExpressionAttributeValues': {
+                            **expression_attribute_values,
+                            ':old_username': old_username
+                        }
+                    }
+                },
+                reservations.claim(table.name, reservations.username_key(new_username), user_id)
+            ]
+            if old_username:
+                transact_items.append(
+                    reservations.release(table.name, reservations.username_key(old_username), user_id)
+                )
+            table.meta.client.transact_write_items(TransactItems=transact_items)
+            
+            # Transactions don't return items; the condition pins everything
+            # the update read, so apply the same SET locally
+            updated_item = {
+                **current_user,
+                **updatable_fields,
+                'updatedAt': expression_attribute_values[':updated_at']
+            }
+    except ClientError as e:
+        error_code = e.response['Error']['Code']
+        if error_code == 'ConditionalCheckFailedException':
+            return error_response(404, 'User profile not found')
+        if error_code != 'TransactionCanceledException':
+            raise
+        reasons = [reason.get('Code') for reason in e.response.get('CancellationReasons', [])]
+        if len(reasons) > 1 and reasons[1] == 'ConditionalCheckFailed':
+            return error_response(409, 'Username already taken')
+        if reasons and reasons[0] == 'ConditionalCheckFailed':
+            return error_response(409, 'Profile was modified concurrently, please retry')
+        raise
+    profile_cache.invalidate(user_id)
+    
+    return profile_updated_response(user_id, updated_item)
+
+def profile_updated_response(user_id, updated_item):
+    """Response for a successful profile update"""
+    updated_user = format_user_profile(updated_item, is_self=True)
+    
+    logger.info(f'User profile updated for user {user_id}')
+    
+    return success_response({
+        **updated_user,
+        'message': 'Profile updated successfully'
+    })
+
 def search_users(table, event, authenticated_user_id):
     """Search users by username or email"""
     try:
@@ -311,55 +412,3 @@ def search_users(table, event, authenticated_user_id):
     except Exception as e:
         logger.error(f'Error searching users: {str(e)}')
         return error_response(500, 'Failed to search users')
-
-def format_user_profile(item, is_self=False):
-    """Format user profile for API response"""
-    base_profile = {
-        'userId': item.get('userId'),
-        'username': item.get('username'),
-        'fullName': item.get('fullName', ''),
-        'bio': item.get('bio', ''),
-        'profilePictureUrl': item.get('profilePictureUrl', ''),
-        'isActive': item.get('isActive', True),
-        'createdAt': item.get('createdAt'),
-        'postcardsCount': item.get('postcardsCount', 0),
-        'friendsCount': item.get('friendsCount', 0)
-    }
-    
-    # Include sensitive information only for the user's own profile
-    if is_self:
-        base_profile.update({
-            'email': item.get('email'),
-            'updatedAt': item.get('updatedAt')
-        })
-    
-    return base_profile
-
-def success_response(data, status_code=200):
-    """Return successful API response"""
-    return {
-        'statusCode': status_code,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-            'Access-Control-Allow-Headers': 'Content-Type, Authorization',
-        },
-        'body': json.dumps(data)
-    }
-
-def error_response(status_code, message):
-    """Return error API response"""
-    return {
-        'statusCode': status_code,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-            'Access-Control-Allow-Headers': 'Content-Type, Authorization',
-        },
-        'body': json.dumps({
-            'error': message,
-            'statusCode': status_code
-        })
-    }
\ No newline at end of file
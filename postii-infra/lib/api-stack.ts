@@ -1,10 +1,15 @@
 import * as cdk from 'aws-cdk-lib';
 import * as apigateway from 'aws-cdk-lib/aws-apigateway';
 import * as lambda from 'aws-cdk-lib/aws-lambda';
+import * as lambdaEventSources from 'aws-cdk-lib/aws-lambda-event-sources';
 import * as iam from 'aws-cdk-lib/aws-iam';
 import * as cognito from 'aws-cdk-lib/aws-cognito';
 import * as dynamodb from 'aws-cdk-lib/aws-dynamodb';
 import * as s3 from 'aws-cdk-lib/aws-s3';
+import * as s3n from 'aws-cdk-lib/aws-s3-notifications';
+import * as secretsmanager from 'aws-cdk-lib/aws-secretsmanager';
+import * as sns from 'aws-cdk-lib/aws-sns';
+import * as sqs from 'aws-cdk-lib/aws-sqs';
 import { Construct } from 'constructs';
 
 export interface ApiStackProps extends cdk.StackProps {
@@ -13,7 +18,14 @@ export interface ApiStackProps extends cdk.StackProps {
   usersTable: dynamodb.Table;
   friendshipsTable: dynamodb.Table;
   postcardsTable: dynamodb.Table;
+  searchIndexTable: dynamodb.Table;
+  imagesTable: dynamodb.Table;
+  eventLedgerTable: dynamodb.Table;
+  idempotencyTable: dynamodb.Table;
+  rateLimitsTable: dynamodb.Table;
   assetsBucket: s3.Bucket;
+  // CloudFront domain serving assetsBucket; image URLs point here
+  assetsDomain: string;
 }
 
 export class ApiStack extends cdk.Stack {
@@ -22,16 +34,20 @@ export class ApiStack extends cdk.Stack {
   constructor(scope: Construct, id: string, props: ApiStackProps) {
     super(scope, id, props);
 
-    const { stage, userPool, usersTable, friendshipsTable, postcardsTable, assetsBucket } = props;
+    const { stage, userPool, usersTable, friendshipsTable, postcardsTable, searchIndexTable, imagesTable, eventLedgerTable, idempotencyTable, rateLimitsTable, assetsBucket, assetsDomain } = props;
 
     // Create API Gateway
     this.api = new apigateway.RestApi(this, 'PostiiApi', {
       restApiName: `postii-api-${stage}`,
       description: `Postii API - ${stage}`,
+      // Lets handlers return compressed (base64, isBase64Encoded) bodies;
+      // request bodies then reach them base64-encoded as well, and the
+      // CORS preflights need CONVERT_TO_TEXT (set below)
+      binaryMediaTypes: ['*/*'],
       defaultCorsPreflightOptions: {
         allowOrigins: apigateway.Cors.ALL_ORIGINS,
         allowMethods: apigateway.Cors.ALL_METHODS,
-        allowHeaders: ['Content-Type', 'Authorization'],
+        allowHeaders: ['Content-Type', 'Authorization', 'If-None-Match', 'Idempotency-Key'],
       },
     });
 
@@ -53,17 +69,68 @@ export class ApiStack extends cdk.Stack {
     usersTable.grantFullAccess(lambdaRole);
     friendshipsTable.grantFullAccess(lambdaRole);
     postcardsTable.grantFullAccess(lambdaRole);
+    searchIndexTable.grantFullAccess(lambdaRole);
+    imagesTable.grantFullAccess(lambdaRole);
+    eventLedgerTable.grantFullAccess(lambdaRole);
+    idempotencyTable.grantFullAccess(lambdaRole);
+    rateLimitsTable.grantFullAccess(lambdaRole);
     assetsBucket.grantReadWrite(lambdaRole);
 
+    // HMAC key for the opaque pagination cursors; handlers fetch it once
+    // per container. Rotating it invalidates outstanding cursors.
+    const cursorSigningSecret = new secretsmanager.Secret(this, 'CursorSigningSecret', {
+      secretName: `postii-cursor-signing-key-${stage}`,
+      generateSecretString: {
+        passwordLength: 64,
+        excludePunctuation: true,
+      },
+    });
+    cursorSigningSecret.grantRead(lambdaRole);
+
+    // Postcard and friend notifications, published by the streams
+    // handler; push/email subscribers filter on the userId and type
+    // message attributes
+    const notificationsTopic = new sns.Topic(this, 'NotificationsTopic', {
+      topicName: `postii-notifications-${stage}`,
+    });
+    notificationsTopic.grantPublish(lambdaRole);
+
     // Environment variables for all Lambdas
     const commonEnvironment = {
       USERS_TABLE: usersTable.tableName,
       FRIENDSHIPS_TABLE: friendshipsTable.tableName,
       POSTCARDS_TABLE: postcardsTable.tableName,
+      SEARCH_INDEX_TABLE: searchIndexTable.tableName,
+      IMAGES_TABLE: imagesTable.tableName,
+      EVENT_LEDGER_TABLE: eventLedgerTable.tableName,
+      IDEMPOTENCY_TABLE: idempotencyTable.tableName,
+      RATE_LIMITS_TABLE: rateLimitsTable.tableName,
+      NOTIFICATIONS_TOPIC_ARN: notificationsTopic.topicArn,
       ASSETS_BUCKET: assetsBucket.bucketName,
+      ASSETS_CDN_DOMAIN: assetsDomain,
+      CURSOR_SIGNING_SECRET_ARN: cursorSigningSecret.secretArn,
+      // Format of the derived image variants; postcards name them, images writes them
+      IMAGE_VARIANT_FORMAT: 'webp',
       STAGE: stage,
     };
 
+    // Shared Python code (lambda/shared/python) for all handlers, bundled
+    // with the packages in lambda/shared/requirements.txt (needs Docker)
+    const sharedLayer = new lambda.LayerVersion(this, 'SharedLayer', {
+      code: lambda.Code.fromAsset('lambda/shared', {
+        exclude: ['**/__pycache__'],
+        bundling: {
+          image: lambda.Runtime.PYTHON_3_12.bundlingImage,
+          command: [
+            'bash', '-c',
+            'pip install --no-cache-dir -r requirements.txt -t /asset-output/python && cp -r python/. /asset-output/python',
+          ],
+        },
+      }),
+      compatibleRuntimes: [lambda.Runtime.PYTHON_3_12],
+      description: 'Postii shared Python modules',
+    });
+
     // Create Lambda functions
     const authHandler = new lambda.Function(this, 'AuthHandler', {
       runtime: lambda.Runtime.PYTHON_3_12,
@@ -71,6 +138,7 @@ export class ApiStack extends cdk.Stack {
       code: lambda.Code.fromAsset('lambda/auth'),
       role: lambdaRole,
       environment: commonEnvironment,
+      layers: [sharedLayer],
     });
 
     const usersHandler = new lambda.Function(this, 'UsersHandler', {
@@ -79,6 +147,7 @@ export class ApiStack extends cdk.Stack {
       code: lambda.Code.fromAsset('lambda/users'),
       role: lambdaRole,
       environment: commonEnvironment,
+      layers: [sharedLayer],
     });
 
     const friendsHandler = new lambda.Function(this, 'FriendsHandler', {
@@ -87,6 +156,7 @@ export class ApiStack extends cdk.Stack {
       code: lambda.Code.fromAsset('lambda/friends'),
       role: lambdaRole,
       environment: commonEnvironment,
+      layers: [sharedLayer],
     });
 
     const postcardsHandler = new lambda.Function(this, 'PostcardsHandler', {
@@ -95,8 +165,78 @@ export class ApiStack extends cdk.Stack {
       code: lambda.Code.fromAsset('lambda/postcards'),
       role: lambdaRole,
       environment: commonEnvironment,
+      layers: [sharedLayer],
     });
 
+    // Thumbnail and display variants for every upload, bundled with
+    // Pillow (lambda/images/requirements.txt). Decoding is CPU-bound and
+    // Lambda's CPU scales with memory.
+    const imagesHandler = new lambda.Function(this, 'ImagesHandler', {
+      runtime: lambda.Runtime.PYTHON_3_12,
+      handler: 'lambda_function.lambda_handler',
+      code: lambda.Code.fromAsset('lambda/images', {
+        exclude: ['**/__pycache__'],
+        bundling: {
+          image: lambda.Runtime.PYTHON_3_12.bundlingImage,
+          command: [
+            'bash', '-c',
+            'pip install --no-cache-dir -r requirements.txt -t /asset-output && cp -au . /asset-output',
+          ],
+        },
+      }),
+      role: lambdaRole,
+      environment: commonEnvironment,
+      layers: [sharedLayer],
+      memorySize: 1536,
+      timeout: cdk.Duration.seconds(60),
+    });
+
+    // The bucket lives in the storage stack; notifying through an imported
+    // reference keeps the notification here and avoids a stack cycle
+    const uploadsBucket = s3.Bucket.fromBucketName(this, 'UploadsBucket', assetsBucket.bucketName);
+    // Content-addressed images/ objects are written once per distinct
+    // image, so their variants are rendered once however often they're sent
+    for (const prefix of ['uploads/', 'images/']) {
+      uploadsBucket.addEventNotification(
+        s3.EventType.OBJECT_CREATED,
+        new s3n.LambdaDestination(imagesHandler),
+        { prefix },
+      );
+    }
+
+    // Side effects of postcard, friendship and profile writes (counters,
+    // image references, notifications, search index), applied from the
+    // table streams so each write path stays a single write. Records that
+    // fail are reported individually and retried; ones that keep failing
+    // go to the dead-letter queue.
+    const streamsHandler = new lambda.Function(this, 'StreamsHandler', {
+      runtime: lambda.Runtime.PYTHON_3_12,
+      handler: 'lambda_function.lambda_handler',
+      code: lambda.Code.fromAsset('lambda/streams'),
+      role: lambdaRole,
+      environment: commonEnvironment,
+      layers: [sharedLayer],
+      timeout: cdk.Duration.seconds(60),
+    });
+
+    const streamsDeadLetterQueue = new sqs.Queue(this, 'StreamsDeadLetterQueue', {
+      queueName: `postii-streams-dlq-${stage}`,
+      retentionPeriod: cdk.Duration.days(14),
+    });
+
+    for (const table of [postcardsTable, friendshipsTable, usersTable]) {
+      streamsHandler.addEventSource(new lambdaEventSources.DynamoEventSource(table, {
+        startingPosition: lambda.StartingPosition.TRIM_HORIZON,
+        batchSize: 100,
+        // Lets a batch send's records arrive together, so its counter
+        // updates merge into one
+        maxBatchingWindow: cdk.Duration.seconds(1),
+        reportBatchItemFailures: true,
+        retryAttempts: 10,
+        onFailure: new lambdaEventSources.SqsDlq(streamsDeadLetterQueue),
+      }));
+    }
+
     // API Routes
     const v1 = this.api.root.addResource('v1');
 
@@ -134,6 +274,29 @@ export class ApiStack extends cdk.Stack {
     const postCardsReceived = postcards.addResource('received');
     postCardsReceived.addMethod('GET', new apigateway.LambdaIntegration(postcardsHandler), { authorizer });
 
+    // Sent and received merged into one timeline (?withUser= for a thread)
+    const postCardsInbox = postcards.addResource('inbox');
+    postCardsInbox.addMethod('GET', new apigateway.LambdaIntegration(postcardsHandler), { authorizer });
+
+    // Presigned S3 upload URLs; image bytes go straight to the bucket
+    const postCardsUploads = postcards.addResource('uploads');
+    postCardsUploads.addMethod('POST', new apigateway.LambdaIntegration(postcardsHandler), { authorizer });
+
+    // Full postcard (message, location) for the summary rows above
+    const postcardById = postcards.addResource('{postcardId}');
+    postcardById.addMethod('GET', new apigateway.LambdaIntegration(postcardsHandler), { authorizer });
+
+    // With binaryMediaTypes '*/*' the MOCK integrations behind the CORS
+    // preflights (defaultCorsPreflightOptions) treat the browser's OPTIONS
+    // request as binary and fail with a 500 unless told to convert it to
+    // text. Runs last, once every resource has its OPTIONS method.
+    this.api.methods
+      .filter(method => method.httpMethod === 'OPTIONS')
+      .forEach(method => {
+        const cfnMethod = method.node.defaultChild as apigateway.CfnMethod;
+        cfnMethod.addPropertyOverride('Integration.ContentHandling', 'CONVERT_TO_TEXT');
+      });
+
     // Outputs
     new cdk.CfnOutput(this, 'ApiUrl', {
       value: this.api.url,
@@ -10,17 +10,33 @@ export class DatabaseStack extends cdk.Stack {
   public readonly usersTable: dynamodb.Table;
   public readonly friendshipsTable: dynamodb.Table;
   public readonly postcardsTable: dynamodb.Table;
+  public readonly searchIndexTable: dynamodb.Table;
+  public readonly imagesTable: dynamodb.Table;
+  public readonly eventLedgerTable: dynamodb.Table;
+  public readonly idempotencyTable: dynamodb.Table;
+  public readonly rateLimitsTable: dynamodb.Table;
 
   constructor(scope: Construct, id: string, props: DatabaseStackProps) {
     super(scope, id, props);
 
     const { stage } = props;
 
+    // A CloudFormation update can create only one GSI per table. Where a
+    // table gains two at once, the second is held back when this is set:
+    // deploy this stack alone with `-c postii:holdBackIndexes=true`, then
+    // deploy everything as usual once the first index is ACTIVE. Unset
+    // (the default) every index is defined, so a deploy without the flag
+    // never drops one. See "Adding GSIs to existing tables" in
+    // AWS-CDK-Deployment-Guide.md.
+    const holdBackIndexes = ['true', true].includes(this.node.tryGetContext('postii:holdBackIndexes'));
+
     // Users Table
     this.usersTable = new dynamodb.Table(this, 'UsersTable', {
       tableName: `postii-users-${stage}`,
       partitionKey: { name: 'userId', type: dynamodb.AttributeType.STRING },
       billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      // Changes feed the streams handler (counters, notifications, search index)
+      stream: dynamodb.StreamViewType.NEW_AND_OLD_IMAGES,
       encryption: dynamodb.TableEncryption.AWS_MANAGED,
       pointInTimeRecoverySpecification: {
         pointInTimeRecoveryEnabled: stage === 'prod',
@@ -44,6 +60,8 @@ export class DatabaseStack extends cdk.Stack {
       tableName: `postii-friendships-${stage}`,
       partitionKey: { name: 'friendshipId', type: dynamodb.AttributeType.STRING },
       billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      // Changes feed the streams handler (counters, notifications, search index)
+      stream: dynamodb.StreamViewType.NEW_AND_OLD_IMAGES,
       encryption: dynamodb.TableEncryption.AWS_MANAGED,
       pointInTimeRecoverySpecification: {
         pointInTimeRecoveryEnabled: stage === 'prod',
@@ -64,11 +82,34 @@ export class DatabaseStack extends cdk.Stack {
       sortKey: { name: 'createdAt', type: dynamodb.AttributeType.STRING },
     });
 
+    // Status-prefixed indexes for the paginated friend list. statusSK is
+    // '<status>#<createdAt>', so one begins_with query reads a single
+    // status in creation order.
+    this.friendshipsTable.addGlobalSecondaryIndex({
+      indexName: 'requester-status-index',
+      partitionKey: { name: 'requesterId', type: dynamodb.AttributeType.STRING },
+      sortKey: { name: 'statusSK', type: dynamodb.AttributeType.STRING },
+      projectionType: dynamodb.ProjectionType.INCLUDE,
+      nonKeyAttributes: ['addresseeId', 'status', 'createdAt'],
+    });
+
+    if (!holdBackIndexes) {
+      this.friendshipsTable.addGlobalSecondaryIndex({
+        indexName: 'addressee-status-index',
+        partitionKey: { name: 'addresseeId', type: dynamodb.AttributeType.STRING },
+        sortKey: { name: 'statusSK', type: dynamodb.AttributeType.STRING },
+        projectionType: dynamodb.ProjectionType.INCLUDE,
+        nonKeyAttributes: ['requesterId', 'status', 'createdAt'],
+      });
+    }
+
     // Postcards Table
     this.postcardsTable = new dynamodb.Table(this, 'PostcardsTable', {
       tableName: `postii-postcards-${stage}`,
       partitionKey: { name: 'postcardId', type: dynamodb.AttributeType.STRING },
       billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      // Changes feed the streams handler (counters, notifications, search index)
+      stream: dynamodb.StreamViewType.NEW_AND_OLD_IMAGES,
       encryption: dynamodb.TableEncryption.AWS_MANAGED,
       pointInTimeRecoverySpecification: {
         pointInTimeRecoveryEnabled: stage === 'prod',
@@ -76,7 +117,11 @@ export class DatabaseStack extends cdk.Stack {
       removalPolicy: stage === 'prod' ? cdk.RemovalPolicy.RETAIN : cdk.RemovalPolicy.DESTROY,
     });
 
-    // Add GSIs for Postcards table
+    // Add GSIs for Postcards table. No handler queries these two any more
+    // (see the summary indexes below), but each still copies every
+    // postcard write in full: they are removed one per deploy, following
+    // "Retiring sender-sent-index and recipient-received-index" in
+    // AWS-CDK-Deployment-Guide.md
     this.postcardsTable.addGlobalSecondaryIndex({
       indexName: 'sender-sent-index',
       partitionKey: { name: 'senderPK', type: dynamodb.AttributeType.STRING },
@@ -88,5 +133,88 @@ export class DatabaseStack extends cdk.Stack {
       partitionKey: { name: 'recipientPK', type: dynamodb.AttributeType.STRING },
       sortKey: { name: 'receivedSK', type: dynamodb.AttributeType.STRING },
     });
+
+    // Feed list pages read these instead of the ALL-projected indexes
+    // above: they carry only the summary fields a list row shows, so a
+    // page costs a fraction of the RCUs. message/location are read from
+    // the base table by GET /postcards/{postcardId}. The second is held
+    // back with the flag above.
+    this.postcardsTable.addGlobalSecondaryIndex({
+      indexName: 'sender-summary-index',
+      partitionKey: { name: 'senderPK', type: dynamodb.AttributeType.STRING },
+      sortKey: { name: 'sentSK', type: dynamodb.AttributeType.STRING },
+      projectionType: dynamodb.ProjectionType.INCLUDE,
+      nonKeyAttributes: ['senderId', 'recipientId', 'imageUrl', 'sentAt', 'status'],
+    });
+
+    if (!holdBackIndexes) {
+      this.postcardsTable.addGlobalSecondaryIndex({
+        indexName: 'recipient-summary-index',
+        partitionKey: { name: 'recipientPK', type: dynamodb.AttributeType.STRING },
+        sortKey: { name: 'receivedSK', type: dynamodb.AttributeType.STRING },
+        projectionType: dynamodb.ProjectionType.INCLUDE,
+        nonKeyAttributes: ['senderId', 'recipientId', 'imageUrl', 'sentAt', 'status'],
+      });
+    }
+
+    // Search Index Table - username/email prefix and trigram terms,
+    // maintained by the streams handler from the users table stream and read
+    // by friend search
+    this.searchIndexTable = new dynamodb.Table(this, 'SearchIndexTable', {
+      tableName: `postii-search-index-${stage}`,
+      partitionKey: { name: 'term', type: dynamodb.AttributeType.STRING },
+      sortKey: { name: 'userId', type: dynamodb.AttributeType.STRING },
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      encryption: dynamodb.TableEncryption.AWS_MANAGED,
+      removalPolicy: stage === 'prod' ? cdk.RemovalPolicy.RETAIN : cdk.RemovalPolicy.DESTROY,
+    });
+
+    // Images Table - one item per content-addressed image (keyed by its
+    // SHA-256) with the number of postcards that reference it
+    this.imagesTable = new dynamodb.Table(this, 'ImagesTable', {
+      tableName: `postii-images-${stage}`,
+      partitionKey: { name: 'imageHash', type: dynamodb.AttributeType.STRING },
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      encryption: dynamodb.TableEncryption.AWS_MANAGED,
+      pointInTimeRecoverySpecification: {
+        pointInTimeRecoveryEnabled: stage === 'prod',
+      },
+      removalPolicy: stage === 'prod' ? cdk.RemovalPolicy.RETAIN : cdk.RemovalPolicy.DESTROY,
+    });
+
+    // Event Ledger Table - one item per postcard/friendship event the
+    // streams handler has applied, so redelivered records apply once.
+    // Entries expire well after the streams' 24-hour retention.
+    this.eventLedgerTable = new dynamodb.Table(this, 'EventLedgerTable', {
+      tableName: `postii-event-ledger-${stage}`,
+      partitionKey: { name: 'eventId', type: dynamodb.AttributeType.STRING },
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      encryption: dynamodb.TableEncryption.AWS_MANAGED,
+      timeToLiveAttribute: 'expiresAt',
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+    });
+
+    // Idempotency Table - the response to each write sent with an
+    // Idempotency-Key, keyed by user, route and key, so a client's
+    // retries get it back instead of writing again. Expires after a day.
+    this.idempotencyTable = new dynamodb.Table(this, 'IdempotencyTable', {
+      tableName: `postii-idempotency-${stage}`,
+      partitionKey: { name: 'idempotencyKey', type: dynamodb.AttributeType.STRING },
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      encryption: dynamodb.TableEncryption.AWS_MANAGED,
+      timeToLiveAttribute: 'expiresAt',
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+    });
+
+    // Rate Limits Table - a token bucket per user and route (userId#route);
+    // buckets expire once they would have refilled
+    this.rateLimitsTable = new dynamodb.Table(this, 'RateLimitsTable', {
+      tableName: `postii-rate-limits-${stage}`,
+      partitionKey: { name: 'bucketKey', type: dynamodb.AttributeType.STRING },
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      encryption: dynamodb.TableEncryption.AWS_MANAGED,
+      timeToLiveAttribute: 'expiresAt',
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+    });
   }
-}
\ No newline at end of file
+}
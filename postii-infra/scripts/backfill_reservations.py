@@ -0,0 +1,97 @@
+"""
+Backfill username and email reservations for existing user profiles.
+
+The users handler claims USERNAME#<username> and EMAIL#<email>
+reservation items whenever a profile is created (and the username one
+on renames), and relies on them to keep usernames and emails unique.
+Profiles created before reservations existed have none, so run this
+once after deploying: it scans the Users table and claims the
+reservations every profile lacks. Safe to re-run.
+
+Two profiles that already share a username or email can't both hold
+it; the first one scanned keeps it and the other is reported as a
+conflict to be resolved by hand.
+
+Usage:
+    python scripts/backfill_reservations.py --stage dev [--dry-run]
+"""
+import argparse
+import logging
+import os
+import sys
+
+import boto3
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'shared', 'python'))
+
+from postii_common import reservations  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+
+def reservation_keys(user):
+    """Reservation keys a profile should hold"""
+    keys = []
+    if user.get('username'):
+        keys.append(reservations.username_key(user['username']))
+    if user.get('email'):
+        keys.append(reservations.email_key(user['email']))
+    return keys
+
+
+def backfill(users_table, dry_run=False, page_size=500):
+    """Claim missing reservations for every profile; returns counts per outcome"""
+    counts = {'claimed': 0, 'conflicts': 0}
+    scan_kwargs = {'ProjectionExpression': 'userId, username, email', 'Limit': page_size}
+
+    while True:
+        response = users_table.scan(**scan_kwargs)
+        for user in response.get('Items', []):
+            if reservations.is_reservation(user):
+                continue
+            for key in reservation_keys(user):
+                if dry_run:
+                    counts['claimed'] += 1
+                    continue
+                claim = reservations.claim(users_table.name, key, user['userId'])['Put']
+                try:
+                    users_table.put_item(
+                        Item=claim['Item'],
+                        ConditionExpression=claim['ConditionExpression'],
+                        ExpressionAttributeValues=claim['ExpressionAttributeValues']
+                    )
+                    counts['claimed'] += 1
+                except ClientError as e:
+                    if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                        raise
+                    logger.warning(f"{key['userId']} is already held by another user; "
+                                   f"not reserved for {user['userId']}")
+                    counts['conflicts'] += 1
+
+        if 'LastEvaluatedKey' not in response:
+            return counts
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill Postii username and email reservations')
+    parser.add_argument('--stage', default='dev')
+    parser.add_argument('--users-table')
+    parser.add_argument('--region')
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    dynamodb = boto3.resource('dynamodb', region_name=args.region)
+    users_table = dynamodb.Table(args.users_table or f'postii-users-{args.stage}')
+
+    counts = backfill(users_table, dry_run=args.dry_run, page_size=args.page_size)
+    prefix = 'Dry run' if args.dry_run else 'Backfill complete'
+    logger.info(f"{prefix}: {counts['claimed']} reservations claimed, {counts['conflicts']} conflicts")
+
+
+if __name__ == '__main__':
+    main()
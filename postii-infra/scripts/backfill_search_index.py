@@ -0,0 +1,73 @@
+"""
+Backfill the friend search index from the Users table.
+
+Scans every user profile (following LastEvaluatedKey, so nothing past the
+first 1 MB page is missed) and writes the prefix/trigram rows the users
+handler maintains on create and update. Safe to re-run: rows are
+overwritten in place.
+
+Usage:
+    python scripts/backfill_search_index.py --stage dev
+    python scripts/backfill_search_index.py --users-table postii-users-dev \
+        --search-index-table postii-search-index-dev
+"""
+import argparse
+import logging
+import os
+import sys
+
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'shared', 'python'))
+
+from postii_common import search_index  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+
+def backfill(users_table, index_table, page_size=500):
+    """Index every user in users_table; returns the number of users indexed"""
+    scan_kwargs = {
+        'ProjectionExpression': 'userId, username, email, fullName',
+        'Limit': page_size
+    }
+    indexed = 0
+
+    while True:
+        response = users_table.scan(**scan_kwargs)
+        with index_table.batch_writer(overwrite_by_pkeys=['term', 'userId']) as batch:
+            for user in response.get('Items', []):
+                if not user.get('username') and not user.get('email'):
+                    continue
+                for term in search_index.index_terms(user):
+                    batch.put_item(Item=search_index.index_row(term, user))
+                indexed += 1
+
+        logger.info(f'Indexed {indexed} users so far')
+
+        if 'LastEvaluatedKey' not in response:
+            return indexed
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill the Postii friend search index')
+    parser.add_argument('--stage', default='dev')
+    parser.add_argument('--users-table')
+    parser.add_argument('--search-index-table')
+    parser.add_argument('--region')
+    parser.add_argument('--page-size', type=int, default=500)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    dynamodb = boto3.resource('dynamodb', region_name=args.region)
+    users_table = dynamodb.Table(args.users_table or f'postii-users-{args.stage}')
+    index_table = dynamodb.Table(args.search_index_table or f'postii-search-index-{args.stage}')
+
+    total = backfill(users_table, index_table, page_size=args.page_size)
+    logger.info(f'Backfill complete: {total} users indexed into {index_table.name}')
+
+
+if __name__ == '__main__':
+    main()
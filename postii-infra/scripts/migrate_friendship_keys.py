@@ -0,0 +1,165 @@
+"""
+Re-key legacy friendship rows onto the canonical pair key.
+
+Friendships used to be stored under a random UUID friendshipId; the
+friends handler now keys them by pair_key(userA, userB) so that every
+existence check is a single GetItem. For each legacy row this job:
+
+1. writes a copy under the pair key (keeping the old ID in
+   legacyFriendshipId), unless the pair already has a row that ranks
+   higher (accepted > pending > anything else, then the oldest wins), and
+2. replaces the legacy row with a small alias item
+   ({friendshipId: <uuid>, aliasOf: <pair key>}) so friendship IDs that
+   clients already hold can still be accepted. Alias items carry no
+   requesterId/addresseeId, so they drop out of the GSIs.
+
+It also sets statusSK ('<status>#<createdAt>') on any friendship row that
+lacks it, so rows written before the status GSIs existed show up in the
+paginated friend list.
+
+Run it once right after deploying the pair-key handler (and again after
+deploying the status indexes); it is safe to re-run and skips rows that
+are already migrated.
+
+Usage:
+    python scripts/migrate_friendship_keys.py --stage dev [--dry-run]
+"""
+import argparse
+import logging
+import os
+import sys
+
+import boto3
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'shared', 'python'))
+
+from postii_common.friendships import (  # noqa: E402
+    pair_key, is_pair_key, status_sort_key, STATUS_ACCEPTED, STATUS_PENDING
+)
+
+logger = logging.getLogger(__name__)
+
+STATUS_RANK = {STATUS_ACCEPTED: 2, STATUS_PENDING: 1}
+
+
+def outranks(candidate, existing):
+    """True if candidate should replace existing as the pair's row"""
+    candidate_rank = STATUS_RANK.get(candidate.get('status'), 0)
+    existing_rank = STATUS_RANK.get(existing.get('status'), 0)
+    if candidate_rank != existing_rank:
+        return candidate_rank > existing_rank
+    return candidate.get('createdAt', '') < existing.get('createdAt', '')
+
+
+def migrate_row(table, row, dry_run=False):
+    """Move one legacy row onto its pair key; returns what was done"""
+    legacy_id = row['friendshipId']
+    new_id = pair_key(row['requesterId'], row['addresseeId'])
+    migrated = {
+        **row,
+        'friendshipId': new_id,
+        'legacyFriendshipId': legacy_id,
+        'statusSK': status_sort_key(row.get('status'), row.get('createdAt')),
+    }
+
+    existing = table.get_item(Key={'friendshipId': new_id}).get('Item')
+    write_pair_row = existing is None or outranks(row, existing)
+
+    if dry_run:
+        return 'migrated' if write_pair_row else 'merged'
+
+    client = table.meta.client
+    transact_items = [{
+        'Put': {
+            'TableName': table.name,
+            'Item': {'friendshipId': legacy_id, 'aliasOf': new_id},
+            # Don't clobber a row that changed since it was scanned
+            'ConditionExpression': '#status = :status',
+            'ExpressionAttributeNames': {'#status': 'status'},
+            'ExpressionAttributeValues': {':status': row.get('status')},
+        }
+    }]
+    if write_pair_row:
+        put = {'TableName': table.name, 'Item': migrated}
+        if existing is None:
+            put['ConditionExpression'] = 'attribute_not_exists(friendshipId)'
+        else:
+            put['ConditionExpression'] = 'updatedAt = :updated'
+            put['ExpressionAttributeValues'] = {':updated': existing.get('updatedAt')}
+        transact_items.append({'Put': put})
+
+    client.transact_write_items(TransactItems=transact_items)
+    return 'migrated' if write_pair_row else 'merged'
+
+
+def backfill_status_key(table, row, dry_run=False):
+    """Set statusSK on a pair-keyed row written before it existed"""
+    if dry_run:
+        return 'backfilled'
+
+    table.update_item(
+        Key={'friendshipId': row['friendshipId']},
+        UpdateExpression='SET statusSK = :status_sk',
+        # The handler sets statusSK on every status change from now on
+        ConditionExpression='attribute_not_exists(statusSK) AND #status = :status',
+        ExpressionAttributeNames={'#status': 'status'},
+        ExpressionAttributeValues={
+            ':status_sk': status_sort_key(row['status'], row['createdAt']),
+            ':status': row['status'],
+        }
+    )
+    return 'backfilled'
+
+
+def migrate(table, dry_run=False, page_size=500):
+    """Migrate every legacy row in table; returns counts per outcome"""
+    counts = {'migrated': 0, 'merged': 0, 'backfilled': 0, 'conflicts': 0}
+    scan_kwargs = {'Limit': page_size}
+
+    while True:
+        response = table.scan(**scan_kwargs)
+        for row in response.get('Items', []):
+            if 'aliasOf' in row or 'requesterId' not in row:
+                continue
+            if is_pair_key(row['friendshipId']) and 'statusSK' in row:
+                continue
+            try:
+                if is_pair_key(row['friendshipId']):
+                    counts[backfill_status_key(table, row, dry_run=dry_run)] += 1
+                else:
+                    counts[migrate_row(table, row, dry_run=dry_run)] += 1
+            except ClientError as e:
+                if e.response['Error']['Code'] not in ('TransactionCanceledException', 'ConditionalCheckFailedException'):
+                    raise
+                # Concurrent change; a re-run picks the row up again
+                logger.warning(f"Skipped {row['friendshipId']}: changed during migration")
+                counts['conflicts'] += 1
+
+        if 'LastEvaluatedKey' not in response:
+            return counts
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-key Postii friendships onto pair keys')
+    parser.add_argument('--stage', default='dev')
+    parser.add_argument('--friendships-table')
+    parser.add_argument('--region')
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    dynamodb = boto3.resource('dynamodb', region_name=args.region)
+    table = dynamodb.Table(args.friendships_table or f'postii-friendships-{args.stage}')
+
+    counts = migrate(table, dry_run=args.dry_run, page_size=args.page_size)
+    prefix = 'Dry run' if args.dry_run else 'Migration complete'
+    logger.info(f"{prefix}: {counts['migrated']} re-keyed, {counts['merged']} merged into an "
+                f"existing pair row, {counts['backfilled']} given a statusSK, {counts['conflicts']} skipped")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Recompute the denormalized profile counters from the source tables.
+
+postcardsCount and friendsCount are maintained with atomic ADDs as
+postcards are sent and friend requests accepted, but rows written before
+that (or by hand) are not reflected in them. For every profile this job
+counts:
+
+- postcardsCount: postcards on sender-summary-index for the user
+- friendsCount:   accepted rows on requester-status-index and
+                  addressee-status-index for the user
+
+with Select=COUNT queries, and writes back any counter that is off. The
+write is conditioned on the counter still holding the value read at the
+start, so a live increment that lands mid-count is never overwritten;
+such profiles are reported as conflicts and picked up by a re-run.
+
+Usage:
+    python scripts/reconcile_counters.py --stage dev [--dry-run] [--workers 8]
+"""
+import argparse
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'shared', 'python'))
+
+from postii_common import counters, reservations  # noqa: E402
+from postii_common.friendships import STATUS_ACCEPTED  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+
+def count(table, **query_kwargs):
+    """Count the items matching a query, following every page"""
+    total = 0
+    while True:
+        # Workers share tables; the low-level client is thread-safe, Table resources are not
+        response = table.meta.client.query(TableName=table.name, Select='COUNT', **query_kwargs)
+        total += response['Count']
+        if 'LastEvaluatedKey' not in response:
+            return total
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def actual_counts(postcards_table, friendships_table, user_id):
+    """Counter values recomputed from the postcards and friendships tables"""
+    friends = sum(
+        count(friendships_table, IndexName=index_name,
+              KeyConditionExpression=Key(partition_key).eq(user_id) & Key('statusSK').begins_with(f'{STATUS_ACCEPTED}#'))
+        for index_name, partition_key in (('requester-status-index', 'requesterId'),
+                                          ('addressee-status-index', 'addresseeId'))
+    )
+    postcards = count(postcards_table, IndexName='sender-summary-index',
+                      KeyConditionExpression=Key('senderPK').eq(f'USER#{user_id}'))
+    return {counters.POSTCARDS_COUNT: postcards, counters.FRIENDS_COUNT: friends}
+
+
+def reconcile_user(users_table, postcards_table, friendships_table, user, dry_run=False):
+    """Fix one profile's counters; returns 'ok', 'fixed' or 'conflict'"""
+    actual = actual_counts(postcards_table, friendships_table, user['userId'])
+    stale = {name: value for name, value in actual.items() if user.get(name) != value}
+    if not stale:
+        return 'ok'
+    if dry_run:
+        return 'fixed'
+
+    names = {}
+    values = {}
+    sets = []
+    conditions = []
+    for i, (name, value) in enumerate(stale.items()):
+        names[f'#c{i}'] = name
+        values[f':actual{i}'] = value
+        sets.append(f'#c{i} = :actual{i}')
+        if name in user:
+            values[f':seen{i}'] = user[name]
+            conditions.append(f'#c{i} = :seen{i}')
+        else:
+            conditions.append(f'attribute_not_exists(#c{i})')
+
+    try:
+        users_table.meta.client.update_item(
+            TableName=users_table.name,
+            Key={'userId': user['userId']},
+            UpdateExpression='SET ' + ', '.join(sets),
+            ConditionExpression='attribute_exists(userId) AND ' + ' AND '.join(conditions),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return 'conflict'
+
+    logger.info(f"{user['userId']}: {', '.join(f'{name} {user.get(name)} -> {value}' for name, value in stale.items())}")
+    return 'fixed'
+
+
+def reconcile(users_table, postcards_table, friendships_table, dry_run=False, page_size=500, workers=8):
+    """Reconcile every profile; returns counts per outcome"""
+    outcomes = {'ok': 0, 'fixed': 0, 'conflict': 0}
+    scan_kwargs = {
+        'ProjectionExpression': 'userId, #postcards, #friends',
+        'ExpressionAttributeNames': {'#postcards': counters.POSTCARDS_COUNT, '#friends': counters.FRIENDS_COUNT},
+        'Limit': page_size
+    }
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            response = users_table.scan(**scan_kwargs)
+            users = [user for user in response.get('Items', []) if not reservations.is_reservation(user)]
+            for outcome in executor.map(
+                lambda user: reconcile_user(users_table, postcards_table, friendships_table, user, dry_run),
+                users
+            ):
+                outcomes[outcome] += 1
+
+            if 'LastEvaluatedKey' not in response:
+                return outcomes
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recompute Postii profile counters')
+    parser.add_argument('--stage', default='dev')
+    parser.add_argument('--users-table')
+    parser.add_argument('--postcards-table')
+    parser.add_argument('--friendships-table')
+    parser.add_argument('--region')
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    dynamodb = boto3.resource('dynamodb', region_name=args.region)
+    users_table = dynamodb.Table(args.users_table or f'postii-users-{args.stage}')
+    postcards_table = dynamodb.Table(args.postcards_table or f'postii-postcards-{args.stage}')
+    friendships_table = dynamodb.Table(args.friendships_table or f'postii-friendships-{args.stage}')
+
+    outcomes = reconcile(users_table, postcards_table, friendships_table, dry_run=args.dry_run,
+                         page_size=args.page_size, workers=args.workers)
+    prefix = 'Dry run' if args.dry_run else 'Reconciliation complete'
+    logger.info(f"{prefix}: {outcomes['fixed']} profiles fixed, {outcomes['ok']} already correct, "
+                f"{outcomes['conflict']} changed during the run")
+
+
+if __name__ == '__main__':
+    main()